@@ -0,0 +1,36 @@
+"""Add HNSW index on cars.embedding (cosine) for ANN vector search
+
+Revision ID: 12
+Revises: 11
+Create Date: 2026-10-18
+
+Без индекса векторный поиск (ORDER BY embedding <=> :qv) — полный проход по cars
+на каждое сообщение чата. Индекс строится CONCURRENTLY (без блокировки записи в cars).
+Параметры поиска (hnsw.ef_search) задаются per-query из настроек, см. src/services/vector_index.py.
+Пересоздание / переключение на IVFFlat: scripts/rebuild_vector_index.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "12"
+down_revision: Union[str, None] = "11"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции миграции
+    with op.get_context().autocommit_block():
+        # Построение HNSW на большом каталоге дольше statement_timeout из alembic/env.py
+        op.execute("SET statement_timeout = 0")
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cars_embedding_hnsw "
+            "ON cars USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_cars_embedding_hnsw")
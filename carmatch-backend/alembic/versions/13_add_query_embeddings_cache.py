@@ -0,0 +1,40 @@
+"""Add query_embeddings table (persistent cache of search query embeddings)
+
+Revision ID: 13
+Revises: 12
+Create Date: 2026-10-18
+
+Эмбеддинг запроса чата (text-search-query) кэшируется по (model_uri, sha256 нормализованного текста):
+повторяющиеся запросы compose_search_query не ходят в Yandex API. Таблица общая для всех воркеров,
+записи старше EMBEDDING_CACHE_DB_TTL_SECONDS не используются. См. src/services/embedding_cache.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "13"
+down_revision: Union[str, None] = "12"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS query_embeddings (
+            model_uri VARCHAR(200) NOT NULL,
+            text_hash VARCHAR(64) NOT NULL,
+            query_text TEXT NOT NULL,
+            embedding vector(256) NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (model_uri, text_hash)
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_query_embeddings_created_at ON query_embeddings (created_at)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS query_embeddings")
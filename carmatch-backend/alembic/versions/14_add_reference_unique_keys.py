@@ -0,0 +1,37 @@
+"""Add unique keys on reference tables for bulk seeding (ON CONFLICT DO NOTHING)
+
+Revision ID: 14
+Revises: 13
+Create Date: 2026-10-18
+
+src/utils/xml_seeder.py пишет справочник пачками INSERT ... ON CONFLICT DO NOTHING RETURNING —
+для этого нужны уникальные ключи уровней (раньше уникальность держалась на SELECT перед каждой вставкой):
+  car_models (brand_id, name), car_generations (model_id, external_id),
+  car_modifications (generation_id, external_id), car_complectations (modification_id, external_id).
+Если в таблицах уже есть дубликаты этих ключей, миграция упадёт — их нужно удалить вручную.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "14"
+down_revision: Union[str, None] = "13"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_KEYS = (
+    ("uq_car_models_brand_name", "car_models", "brand_id, name"),
+    ("uq_car_generations_model_external", "car_generations", "model_id, external_id"),
+    ("uq_car_modifications_generation_external", "car_modifications", "generation_id, external_id"),
+    ("uq_car_complectations_modification_external", "car_complectations", "modification_id, external_id"),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in UNIQUE_KEYS:
+        op.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    for name, _, _ in UNIQUE_KEYS:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,37 @@
+"""Add reference_sync_state table (incremental sync of the XML catalog)
+
+Revision ID: 15
+Revises: 14
+Create Date: 2026-10-18
+
+sha256 поддерева cars.xml для каждого узла справочника (марка, папка, поколение, модификация, комплектация).
+Инкрементальная синхронизация (python seed_db.py --incremental) пропускает поддеревья с тем же хэшем
+и удаляет узлы, пропавшие из изменившихся родителей. См. src/utils/xml_seeder.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "15"
+down_revision: Union[str, None] = "14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS reference_sync_state (
+            level VARCHAR(20) NOT NULL,
+            external_key VARCHAR(250) NOT NULL,
+            parent_key VARCHAR(250),
+            content_hash VARCHAR(64) NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT now(),
+            PRIMARY KEY (level, external_key)
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS reference_sync_state")
@@ -0,0 +1,35 @@
+"""Add (sort column, id) indexes for keyset pagination in admin lists
+
+Revision ID: 16
+Revises: 15
+Create Date: 2026-10-18
+
+Списки админки (src/services/pagination.py) листаются курсором WHERE (sort, id) > (:sort, :id)
+ORDER BY sort, id LIMIT n — составной индекс отдаёт страницу без сортировки и без OFFSET.
+Сортировки: cars по mark_name / model_name / year (+ id), sessions по created_at DESC (+ id).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "16"
+down_revision: Union[str, None] = "15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+KEYSET_INDEXES = (
+    ("idx_cars_mark_name_id", "cars", "mark_name, id"),
+    ("idx_cars_model_name_id", "cars", "model_name, id"),
+    ("idx_cars_year_id", "cars", "year, id"),
+    ("idx_sessions_created_at_id", "sessions", "created_at, id"),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in KEYSET_INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade() -> None:
+    for name, _, _ in KEYSET_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,50 @@
+"""Add pg_trgm GIN indexes for substring (ILIKE '%x%') filters on cars and reference names
+
+Revision ID: 17
+Revises: 16
+Create Date: 2026-10-18
+
+sql_search_cars, фильтрованный векторный поиск, search_cars и список машин в админке фильтруют
+по ILIKE '%значение%' — btree такие условия не обслуживает, каждый фильтр был полным проходом по cars.
+GIN (gin_trgm_ops) отвечает на ILIKE '%...%' (от 3 символов) по индексу, а на car_brands / car_models —
+ещё и на similarity-операторы pg_trgm (%, <->). Опечатки в марке/модели сначала приводятся к именам
+справочника (src/services/reference_data/fuzzy_match.py), затем уже идут в эти фильтры.
+Индексы строятся CONCURRENTLY (без блокировки записи).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "17"
+down_revision: Union[str, None] = "16"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRGM_INDEXES = (
+    ("idx_cars_mark_name_trgm", "cars", "mark_name"),
+    ("idx_cars_model_name_trgm", "cars", "model_name"),
+    ("idx_cars_country_trgm", "cars", "country"),
+    ("idx_cars_body_type_trgm", "cars", "body_type"),
+    ("idx_cars_fuel_type_trgm", "cars", "fuel_type"),
+    ("idx_cars_transmission_trgm", "cars", "transmission"),
+    ("idx_cars_modification_trgm", "cars", "modification"),
+    ("idx_car_brands_name_trgm", "car_brands", "name"),
+    ("idx_car_models_name_trgm", "car_models", "name"),
+)
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции миграции
+    with op.get_context().autocommit_block():
+        op.execute("SET statement_timeout = 0")
+        for name, table, column in TRGM_INDEXES:
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in TRGM_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,91 @@
+"""Add canonical search codes to cars (body_class, fuel_code, gearbox_code) and backfill brand_id
+
+Revision ID: 18
+Revises: 17
+Create Date: 2026-10-18
+
+Коды считаются src/utils/car_canonical.py — той же функцией, что нормализует параметры поиска,
+поэтому search_cars / sql_search_cars / векторный фильтр ищут равенством по индексу вместо
+OR из нескольких ILIKE. Новые и изменённые строки заполняются в models.py (before_insert / before_update).
+Здесь — заполнение существующих строк пачками по id и brand_id по mark_name там, где он пуст.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import text
+
+from src.utils import car_canonical
+
+revision: str = "18"
+down_revision: Union[str, None] = "17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH = 5000
+
+CODE_INDEXES = (
+    ("idx_cars_body_class", "body_class"),
+    ("idx_cars_fuel_code", "fuel_code"),
+    ("idx_cars_gearbox_code", "gearbox_code"),
+    ("idx_cars_brand_body_class", "brand_id, body_class"),
+)
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS body_class VARCHAR(20) NULL")
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS fuel_code VARCHAR(20) NULL")
+    op.execute("ALTER TABLE cars ADD COLUMN IF NOT EXISTS gearbox_code VARCHAR(10) NULL")
+
+    conn = op.get_bind()
+    update = text(
+        "UPDATE cars SET body_class = :body_class, fuel_code = :fuel_code, gearbox_code = :gearbox_code "
+        "WHERE id = :car_id"
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, body_type, fuel_type, transmission, modification FROM cars "
+                "WHERE id > :last ORDER BY id LIMIT :lim"
+            ),
+            {"last": last_id, "lim": BATCH},
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            update,
+            [
+                {
+                    "car_id": car_id,
+                    "body_class": car_canonical.body_class(body_type),
+                    "fuel_code": car_canonical.fuel_code(fuel_type),
+                    "gearbox_code": car_canonical.gearbox_code(transmission)
+                    or car_canonical.gearbox_code(modification),
+                }
+                for car_id, body_type, fuel_type, transmission, modification in rows
+            ],
+        )
+        last_id = rows[-1][0]
+
+    # brand_id гарантирован для машин, чья марка есть в справочнике
+    op.execute(
+        """
+        UPDATE cars SET brand_id = b.id
+        FROM (
+            SELECT DISTINCT ON (lower(name)) id, lower(name) AS lname
+            FROM car_brands ORDER BY lower(name), id
+        ) b
+        WHERE cars.brand_id IS NULL AND lower(trim(cars.mark_name)) = b.lname
+        """
+    )
+
+    for name, columns in CODE_INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON cars ({columns})")
+
+
+def downgrade() -> None:
+    for name, _ in CODE_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS gearbox_code")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS fuel_code")
+    op.execute("ALTER TABLE cars DROP COLUMN IF EXISTS body_class")
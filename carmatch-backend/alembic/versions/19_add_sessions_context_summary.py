@@ -0,0 +1,29 @@
+"""Add context summary to sessions (context_summary, context_summary_upto)
+
+Revision ID: 19
+Revises: 18
+Create Date: 2026-10-18
+
+История для LLM — последние CHAT_CONTEXT_MESSAGES сообщений + сводка более ранних
+(src/services/conversation_context.py). Сводка хранится в сессии, чтобы после рестарта или на другом
+воркере не перечитывать весь диалог: читаются только сообщения с sequence_order > context_summary_upto.
+Существующие сессии начинают с пустой сводкой — она соберётся на первом ходе.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "19"
+down_revision: Union[str, None] = "18"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS context_summary TEXT NULL")
+    op.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS context_summary_upto INTEGER NOT NULL DEFAULT 0")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE sessions DROP COLUMN IF EXISTS context_summary_upto")
+    op.execute("ALTER TABLE sessions DROP COLUMN IF EXISTS context_summary")
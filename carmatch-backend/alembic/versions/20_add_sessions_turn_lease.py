@@ -0,0 +1,38 @@
+"""Add sessions.turn_started_at and align message_count with sequence_order
+
+Revision ID: 20
+Revises: 19
+Create Date: 2026-10-18
+
+Номера сообщений хода выделяются атомарно: UPDATE sessions SET message_count = message_count + 2
+... RETURNING message_count вместо COUNT(*) по chat_messages. turn_started_at — аренда хода:
+параллельный запрос в ту же сессию отклоняется (409), пока ход не завершён или аренда не истекла.
+Раньше message_count записывался в конце хода, и после сбоя между сохранением сообщения пользователя
+и ответом мог отставать от сообщений — выравниваем по max(sequence_order), чтобы номера не повторились.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "20"
+down_revision: Union[str, None] = "19"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS turn_started_at TIMESTAMP NULL")
+    op.execute(
+        """
+        UPDATE sessions SET message_count = m.max_order
+        FROM (
+            SELECT session_id, max(sequence_order) AS max_order
+            FROM chat_messages GROUP BY session_id
+        ) m
+        WHERE sessions.id = m.session_id AND sessions.message_count < m.max_order
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE sessions DROP COLUMN IF EXISTS turn_started_at")
@@ -71,6 +71,12 @@ CREATE INDEX IF NOT EXISTS ix_car_complectations_id ON car_complectations(id);
 CREATE INDEX IF NOT EXISTS idx_car_complectations_modification ON car_complectations(modification_id);
 CREATE INDEX IF NOT EXISTS idx_car_complectations_external_id ON car_complectations(external_id);
 
+-- Unique keys for bulk seeding with ON CONFLICT DO NOTHING (src/utils/xml_seeder.py, migration 14)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_car_models_brand_name ON car_models(brand_id, name);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_car_generations_model_external ON car_generations(model_id, external_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_car_modifications_generation_external ON car_modifications(generation_id, external_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_car_complectations_modification_external ON car_complectations(modification_id, external_id);
+
 -- Add foreign key columns to cars table
 ALTER TABLE cars ADD COLUMN IF NOT EXISTS brand_id INTEGER REFERENCES car_brands(id) ON DELETE SET NULL;
 ALTER TABLE cars ADD COLUMN IF NOT EXISTS model_id INTEGER REFERENCES car_models(id) ON DELETE SET NULL;
@@ -1,10 +1,21 @@
+import asyncio
 import logging
+import sys
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from src.config import settings
-from src.routers import auth, chat, chat_sessions, cars, admin_cars, admin_sessions, admin_users
+from src.routers import auth, chat, chat_sessions, cars, admin_cars, admin_sessions, admin_stats, admin_users
+from src.database import async_engine
+from src.deps import require_metrics_token
+from src.services import http_clients, metrics
+
+# psycopg3 в async-режиме не работает с ProactorEventLoop (по умолчанию на Windows)
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,8 +23,28 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
+
+def _log_routes(app: FastAPI):
+    """При старте выводит все зарегистрированные пути (для проверки, что chat подключён)."""
+    for route in app.routes:
+        if hasattr(route, "path") and hasattr(route, "methods"):
+            for method in route.methods:
+                if method != "HEAD":
+                    print(f"  {method:6} {route.path}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    _log_routes(app)
+    yield
+    # Закрываем общие keep-alive клиенты AI-провайдеров (Yandex, GenAPI, GigaChat)
+    await http_clients.aclose_all()
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title="CarMatch API",
+    lifespan=lifespan,
     version="1.0.0",
     openapi_tags=[
         {"name": "auth", "description": "Регистрация и вход"},
@@ -37,13 +68,12 @@ app.include_router(cars.router, prefix="/api/v1")
 app.include_router(admin_cars.router, prefix="/api/v1")
 app.include_router(admin_sessions.router, prefix="/api/v1")
 app.include_router(admin_users.router, prefix="/api/v1")
+app.include_router(admin_stats.router, prefix="/api/v1")
 
 
-@app.on_event("startup")
-def _log_routes():
-    """При старте выводит все зарегистрированные пути (для проверки, что chat подключён)."""
-    for route in app.routes:
-        if hasattr(route, "path") and hasattr(route, "methods"):
-            for method in route.methods:
-                if method != "HEAD":
-                    print(f"  {method:6} {route.path}")
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+def prometheus_metrics():
+    """Метрики Prometheus: этапы чата, вызовы AI-провайдеров, время SQL-запросов, кэши (METRICS_ENABLED, METRICS_TOKEN)."""
+    if not metrics.enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,163 @@
+"""
+Бенчмарк: новый httpx.Client на каждый вызов vs общий keep-alive клиент (src/services/http_clients.py).
+
+Поднимает локальный HTTPS-стаб (самоподписанный сертификат, ответ как у Yandex textEmbedding)
+и делает N POST-запросов двумя способами:
+  - per-call — как было: SSL-контекст + TCP + TLS handshake на каждый запрос;
+  - pooled   — один клиент, соединение переиспользуется.
+Печатает среднее / p50 / p95 на вызов и экономию. Реальные провайдеры дальше localhost,
+поэтому на проде выигрыш больше (каждый handshake — ещё 1–2 RTT до Yandex/GenAPI).
+
+Запуск из корня carmatch-backend:
+  python scripts/benchmark_http_clients.py
+  python scripts/benchmark_http_clients.py --requests 500
+"""
+import argparse
+import datetime
+import json
+import os
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import certifi
+import httpx
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from src.config import settings
+from src.services.yandex_embeddings import EMBEDDING_DIMENSION
+
+RESPONSE_BODY = json.dumps({"embedding": [0.01] * EMBEDDING_DIMENSION}).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # иначе delayed ACK добавляет ~40 мс к каждому ответу
+
+    def do_POST(self):  # noqa: N802
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def _self_signed_cert(directory: str) -> tuple[str, str]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "stub.crt")
+    key_path = os.path.join(directory, "stub.key")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return cert_path, key_path
+
+
+def _client_context(cert_path: str) -> ssl.SSLContext:
+    """Как httpx по умолчанию: системные корни certifi + наш самоподписанный сертификат."""
+    ctx = ssl.create_default_context(cafile=certifi.where())
+    ctx.load_verify_locations(cert_path)
+    return ctx
+
+
+def _summary(label: str, latencies: list[float]) -> float:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    mean = statistics.mean(latencies)
+    print(f"| {label:<8} | {mean:>8.2f} | {statistics.median(latencies):>8.2f} | {p95:>8.2f} |")
+    return mean
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-call httpx.Client vs общий keep-alive клиент")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path, key_path = _self_signed_cert(tmp)
+        server = ThreadingHTTPServer(("localhost", 0), StubHandler)
+        server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_ctx.load_cert_chain(cert_path, key_path)
+        server.socket = server_ctx.wrap_socket(server.socket, server_side=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"https://localhost:{server.server_address[1]}/foundationModels/v1/textEmbedding"
+        payload = {"modelUri": "emb://folder/text-search-query/latest", "text": "Toyota Camry, седан, 2020 год"}
+
+        def per_call() -> None:
+            with httpx.Client(timeout=30.0, verify=_client_context(cert_path)) as client:
+                client.post(url, json=payload).raise_for_status()
+
+        pooled_client = httpx.Client(
+            timeout=30.0,
+            verify=_client_context(cert_path),
+            limits=httpx.Limits(
+                max_connections=settings.http_client_max_connections,
+                max_keepalive_connections=settings.http_client_max_keepalive,
+                keepalive_expiry=settings.http_client_keepalive_expiry,
+            ),
+        )
+
+        def pooled() -> None:
+            pooled_client.post(url, json=payload).raise_for_status()
+
+        results: dict[str, list[float]] = {}
+        for label, fn in (("per-call", per_call), ("pooled", pooled)):
+            for _ in range(args.warmup):
+                fn()
+            latencies = []
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                fn()
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            results[label] = latencies
+
+        pooled_client.close()
+        server.shutdown()
+
+    print(f"\n{args.requests} запросов к локальному HTTPS-стабу, мс на вызов")
+    print(f"| {'клиент':<8} | {'среднее':>8} | {'p50':>8} | {'p95':>8} |")
+    print(f"|{'-' * 10}|{'-' * 10}|{'-' * 10}|{'-' * 10}|")
+    per_call_mean = _summary("per-call", results["per-call"])
+    pooled_mean = _summary("pooled", results["pooled"])
+    print(
+        f"\nЭкономия на вызов: {per_call_mean - pooled_mean:.2f} мс "
+        f"({per_call_mean / pooled_mean if pooled_mean else 0:.1f}x); ход чата делает 2–3 таких вызова."
+    )
+
+
+if __name__ == "__main__":
+    main()
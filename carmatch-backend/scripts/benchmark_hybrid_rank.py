@@ -0,0 +1,188 @@
+"""
+Бенчмарк hybrid_rank: пакетный скоринг на массивах NumPy (src/services/vector_search.py) vs прежний построчный.
+
+Генерирует пул несохранённых Car (марки, кузова, топливо, коробки, год, мощность, объём — часть полей
+пустая, как в реальном каталоге) и ранжирует его обоими способами с одинаковыми параметрами запроса:
+  - legacy — как было: для каждой машины и каждого параметра getattr, lower(), разбор чисел через str();
+  - numpy  — как сейчас: колонки пула разбираются один раз, доли совпадений — маски над массивами.
+Проверяет, что порядок и score совпадают, и печатает p50 / p95 на вызов для каждого размера пула.
+БД не нужна.
+
+Запуск из корня carmatch-backend:
+  python scripts/benchmark_hybrid_rank.py
+  python scripts/benchmark_hybrid_rank.py --pool 100,500,2000 --repeat 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models import Car
+from src.services import vector_search
+from src.utils import car_canonical
+
+BRANDS = ["Toyota", "Kia", "Hyundai", "Volkswagen", "Skoda", "BMW", "Lada", "Renault", "Haval", "Geely"]
+MODELS = ["Camry", "Rio", "Solaris", "Polo", "Octavia", "X5", "Vesta", "Logan", "Jolion", "Coolray"]
+BODIES = ["Седан", "Хэтчбек 5 дв.", "Универсал", "Внедорожник 5 дв.", "Кроссовер", "Лифтбек", None]
+FUELS = ["Бензин", "Дизель", "Гибрид", "Электро", None]
+GEARBOXES = ["AT", "MT", "AMT", "CVT", None]
+COUNTRIES = ["Япония", "Корея", "Германия", "Чехия", "Россия", "Франция", "Китай", None]
+
+PARAMS = {
+    "brand": "Toyota",
+    "body_type": "седан",
+    "fuel_type": "бензин",
+    "transmission": "автомат",
+    "year": 2019,
+    "horsepower": 150,
+    "engine_volume": "2.0",
+    "country": "Япония",
+}
+
+
+def _legacy_parse_int(value):
+    try:
+        return None if value is None else int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def _legacy_parse_float(value):
+    try:
+        return None if value is None else float(str(value).strip().replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+
+
+def _legacy_checks(params: dict) -> list:
+    """Проверки по одной машине — реализация compute_param_match_fraction до пакетного скоринга."""
+    norm, parse_int, parse_float = vector_search._normalize_str, _legacy_parse_int, _legacy_parse_float
+    checks = []
+    for key, field in vector_search._MATCH_TEXT_FIELDS:
+        value = norm(params.get(key))
+        if value:
+            checks.append(lambda car, v=value, f=field: v in norm(getattr(car, f, None)))
+    for key, code_field, text_field, to_code in vector_search._MATCH_CODE_FIELDS:
+        value = norm(params.get(key))
+        if not value:
+            continue
+        code = to_code(value)
+        if code is not None:
+            checks.append(
+                lambda car, c=code, cf=code_field, tf=text_field, fn=to_code:
+                (getattr(car, cf, None) or fn(getattr(car, tf, None))) == c
+            )
+        else:
+            checks.append(lambda car, v=value, f=text_field: v in norm(getattr(car, f, None)))
+    year = parse_int(params.get("year"))
+    if year is not None:
+        checks.append(lambda car, y=year: (v := parse_int(getattr(car, "year", None))) is not None and abs(v - y) <= 1)
+    horsepower = parse_int(params.get("horsepower"))
+    if horsepower is not None:
+        delta = max(5, int(horsepower * 0.1))
+        checks.append(
+            lambda car, hp=horsepower, d=delta:
+            (v := parse_int(getattr(car, "horsepower", None))) is not None and abs(v - hp) <= d
+        )
+    engine_volume = parse_float(params.get("engine_volume"))
+    if engine_volume is not None:
+        checks.append(
+            lambda car, ev=engine_volume:
+            (v := parse_float(getattr(car, "engine_volume", None))) is not None and abs(v - ev) <= 0.1
+        )
+    return checks
+
+
+def legacy_hybrid_rank(semantic_results, sql_cars, params, w1=0.6, w2=0.4, threshold=0.6):
+    id_to_sem_sim, id_to_car = {}, {}
+    for car, sim in semantic_results:
+        id_to_sem_sim[int(car.id)] = float(sim)
+        id_to_car[int(car.id)] = car
+    for car in sql_cars:
+        id_to_car.setdefault(int(car.id), car)
+    checks = _legacy_checks(params)
+    ranked = []
+    for cid, car in id_to_car.items():
+        fraction = sum(1 for check in checks if check(car)) / len(checks) if checks else 0.0
+        score = w1 * id_to_sem_sim.get(cid, 0.0) + w2 * fraction
+        if score >= threshold:
+            ranked.append((car, score))
+    ranked.sort(key=lambda x: x[1], reverse=True)
+    return ranked
+
+
+def make_pool(size: int, rng: random.Random) -> list:
+    cars = []
+    for i in range(size):
+        body, fuel, gearbox = rng.choice(BODIES), rng.choice(FUELS), rng.choice(GEARBOXES)
+        cars.append(
+            Car(
+                id=i + 1,
+                mark_name=rng.choice(BRANDS),
+                model_name=rng.choice(MODELS),
+                body_type=body,
+                fuel_type=fuel,
+                transmission=gearbox,
+                body_class=car_canonical.body_class(body),
+                fuel_code=car_canonical.fuel_code(fuel),
+                gearbox_code=car_canonical.gearbox_code(gearbox),
+                year=rng.choice([None, *range(2010, 2025)]),
+                horsepower=rng.choice([None, *range(90, 300, 5)]),
+                engine_volume=rng.choice([None, 1.4, 1.6, 2.0, 2.5, 3.0]),
+                country=rng.choice(COUNTRIES),
+                specs={},
+            )
+        )
+    return cars
+
+
+def _timed(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _p95(samples: list) -> float:
+    return sorted(samples)[max(0, int(len(samples) * 0.95) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="hybrid_rank: NumPy vs построчный скоринг")
+    parser.add_argument("--pool", default="50,200,1000,5000", help="Размеры пула кандидатов через запятую")
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"| {'пул':>6} | {'legacy p50, мс':>14} | {'legacy p95':>10} | {'numpy p50, мс':>13} | {'numpy p95':>9} | {'ускорение':>9} |")
+    print(f"|{'-' * 8}|{'-' * 16}|{'-' * 12}|{'-' * 15}|{'-' * 11}|{'-' * 11}|")
+    for size in [int(v) for v in args.pool.split(",") if v.strip()]:
+        cars = make_pool(size, rng)
+        # Половина пула — из векторного поиска (с близостью), остальное — только из SQL
+        semantic = [(car, rng.uniform(0.3, 1.0)) for car in cars[: size // 2]]
+        sql_cars = cars[size // 4:]
+
+        legacy = legacy_hybrid_rank(semantic, sql_cars, PARAMS)
+        current = vector_search.hybrid_rank(semantic, sql_cars, PARAMS)
+        if [(c.id, s) for c, s in legacy] != [(c.id, s) for c, s in current]:
+            print(f"Ошибка: результаты расходятся на пуле {size}")
+            sys.exit(1)
+
+        old = _timed(lambda: legacy_hybrid_rank(semantic, sql_cars, PARAMS), args.repeat)
+        new = _timed(lambda: vector_search.hybrid_rank(semantic, sql_cars, PARAMS), args.repeat)
+        old_p50, new_p50 = statistics.median(old), statistics.median(new)
+        print(
+            f"| {size:>6} | {old_p50:>14.3f} | {_p95(old):>10.3f} | {new_p50:>13.3f} | {_p95(new):>9.3f} "
+            f"| {old_p50 / new_p50:>8.1f}x |"
+        )
+
+
+if __name__ == "__main__":
+    main()
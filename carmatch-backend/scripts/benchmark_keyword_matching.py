@@ -0,0 +1,272 @@
+"""
+Бенчмарк определения намерения и параметров по ключевым словам (src/utils/keyword_matcher.py) vs прежний разбор.
+
+На каждое сообщение пользователя чат вызывает _is_greeting_only, _looks_like_greeting_only,
+_message_mentions_car_or_params, _override_params_from_last_message и extract_params_fallback:
+  - legacy — как было: каждое ключевое слово — отдельный `in` или re.search (сотни проходов по тексту),
+    регулярки разбираются на каждом вызове, нормализация приветствия — дважды;
+  - matcher — как сейчас: все ключевые слова — один скомпилированный при импорте регэксп-префиксное дерево,
+    один проход по тексту, результат сканирования и нормализация кэшируются на сообщение.
+Проверяет, что результаты совпадают на всём корпусе, и печатает p50 / p95 CPU-времени на сообщение (мкс).
+Кэши сбрасываются перед каждым сообщением — сообщения в чате не повторяются. БД и LLM не нужны.
+
+Запуск из корня carmatch-backend:
+  python scripts/benchmark_keyword_matching.py
+  python scripts/benchmark_keyword_matching.py --messages 2000 --repeat 5
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services import chat, deepseek
+
+BRAND_REFERENCE = ["Toyota", "Kia", "Hyundai", "Volkswagen", "Skoda", "BMW", "Lada", "Renault", "Haval", "Geely",
+                   "Chery", "Exeed", "Land Rover", "Mini", "Mazda", "Subaru", "Porsche", "Audi", "Volvo", "Tank"]
+BODY_TYPE_REFERENCE = ["Седан", "Хэтчбек 5 дв.", "Универсал", "Внедорожник 5 дв.", "Кроссовер", "Лифтбек",
+                       "Купе", "Минивэн", "Пикап двойная кабина"]
+FRAGMENTS = [
+    "привет", "Здравствуйте!", "добрый день", "hello", "хочу", "ищу", "подбери", "машину", "авто", "тачку",
+    "бэху", "тойота", "Toyota", "мерс", "kia", "haval", "geely", "седан", "кроссовер", "хэтчбек", "универсал",
+    "на бензине", "дизель", "гибрид", "автомат", "механика", "вариатор", "2018 года", "не старше 7 лет",
+    "1.6 л", "150 л.с.", "до 2 млн", "для семьи", "чтобы в город", "а что посоветуешь?", "спасибо", "и",
+    "с большим багажником", "экономичную", "не старше 2015 года", "для поездок на дачу", "полный привод",
+]
+
+
+def _legacy_normalize_for_greeting(text):
+    if not text:
+        return ""
+    t = text.strip().lower()
+    for ch in ("​", "‌", "‍", "﻿", "­", "⁠", "᠎", "͏"):
+        t = t.replace(ch, "")
+    if re.search(r"[Ѐ-ӿ]", t):
+        for lat, cyr in (("e", "е"), ("a", "а"), ("o", "о"), ("p", "р"), ("c", "с"), ("y", "у"), ("x", "х")):
+            t = t.replace(lat, cyr)
+    t = re.sub(r"[!.,?()\-–—]+", " ", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+
+def legacy_looks_like_greeting_only(text):
+    if not text or not text.strip():
+        return False
+    t = _legacy_normalize_for_greeting(text)
+    if not t or len(t) > 50:
+        return False
+    greetings_any = (
+        "привет", "здравствуй", "здравствуйте", "добрый день", "добрый вечер", "доброе утро",
+        "hi", "hello", "hey", "хай", "салют", "здарова", "прив",
+    )
+    return t in greetings_any or any(t == g or t.startswith(g + " ") for g in greetings_any)
+
+
+def legacy_is_greeting_only(text):
+    if not text:
+        return False
+    t = _legacy_normalize_for_greeting(text)
+    greetings = ("привет", "здравствуй", "здравствуйте", "добрый день", "добрый вечер", "доброе утро",
+                 "hi", "hello", "hey")
+    if t in set(greetings):
+        return True
+    if len(t) <= 40 and any(t.startswith(g) for g in greetings):
+        rest = t
+        for g in greetings:
+            if rest.startswith(g):
+                rest = rest[len(g):].strip()
+                break
+        car_hints = ("машин", "авто", "подбор", "ищу", "хочу", "марк", "модел", "кузов", "бюджет")
+        if not any(h in rest for h in car_hints):
+            return True
+    return False
+
+
+def legacy_message_mentions_car_or_params(text):
+    if not text or not text.strip():
+        return False
+    t = " " + text.strip().lower() + " "
+    if "машин" in t or "автомобил" in t or " тачк" in t or "тачка" in t or " авто " in t:
+        return True
+    if any(b in t for b in chat._CAR_BRAND_WORDS):
+        return True
+    if any(k in t for k in chat._CAR_PARAM_WORDS):
+        return True
+    if re.search(r"\b(19\d{2}|20[0-2]\d)\s*(?:года|г\.?)\b", t):
+        return True
+    return bool(re.search(r"\b\d\.\d{1,2}\s*(?:л|литр|литра)\b", t))
+
+
+def legacy_override_params_from_last_message(last_user_message, params):
+    if not last_user_message or not last_user_message.strip():
+        return params
+    text = " " + last_user_message.strip().lower() + " "
+    for needle, canonical in chat._LAST_MESSAGE_BODY_TYPES:
+        if needle in text:
+            params["body_type"] = canonical
+    for key, groups in (("fuel_type", chat._LAST_MESSAGE_FUEL_TYPES), ("transmission", chat._LAST_MESSAGE_TRANSMISSIONS)):
+        for words, canonical in groups:
+            if any(w in text for w in words):
+                params[key] = canonical
+                break
+    for words, canonical in chat._LAST_MESSAGE_BRANDS:
+        if re.search(r"\b(" + "|".join(words) + r")\b", text):
+            params["brand"] = canonical
+    year_match = re.search(r"\b(19\d{2}|20[0-2]\d)\b", text)
+    if year_match:
+        params["year"] = year_match.group(1)
+        params.pop("year_min", None)
+        params.pop("year_max", None)
+    vol_match = re.search(r"\b(\d{1}\.\d{1,2})\s*(?:л|литр|литра)?", text)
+    if vol_match:
+        params["engine_volume"] = vol_match.group(1)
+    hp_match = re.search(r"(\d{2,3})\s*л\.?\s*с", text)
+    if hp_match:
+        params["horsepower"] = hp_match.group(1)
+    return params
+
+
+def _legacy_first_group(text, groups):
+    for words, canonical in groups:
+        if re.search(r"\b(" + "|".join(words) + r")\b", text, re.IGNORECASE):
+            return canonical
+    return None
+
+
+def legacy_extract_params_fallback(user_texts, body_type_reference, brand_reference=None):
+    if not user_texts:
+        return {}
+    text = " ".join(t for t in user_texts if t).lower()
+    if not text.strip():
+        return {}
+    result = {}
+    brand = _legacy_first_group(text, deepseek.FALLBACK_BRAND_KEYWORDS)
+    if brand:
+        result["brand"] = brand
+    else:
+        for name in brand_reference or []:
+            name_lower = (name or "").strip().lower()
+            if len(name_lower) >= 3 and re.search(r"\b" + re.escape(name_lower) + r"\b", text):
+                result["brand"] = name.strip()
+                break
+    for key, groups in (
+        ("fuel_type", deepseek.FALLBACK_FUEL_TYPE_KEYWORDS),
+        ("transmission", deepseek.FALLBACK_TRANSMISSION_KEYWORDS),
+    ):
+        value = _legacy_first_group(text, groups)
+        if value:
+            result[key] = value
+    year_match = re.search(r"\b(19\d{2}|20[0-2]\d)\b", text)
+    if year_match:
+        result["year"] = year_match.group(1)
+    current_year = datetime.utcnow().year
+    not_older_matches = list(re.finditer(r"не\s+старше\s+(\d{1,2})\s+лет", text))
+    if not_older_matches:
+        result["year_min"] = str(current_year - int(not_older_matches[-1].group(1)))
+    older_matches = list(re.finditer(r"старше\s+(\d{1,2})\s+лет", text))
+    if older_matches:
+        result["year_max"] = str(current_year - int(older_matches[-1].group(1)))
+    not_newer_year_matches = list(re.finditer(r"не\s+новее\s+(19\d{2}|20[0-2]\d)", text))
+    if not_newer_year_matches:
+        result["year_max"] = not_newer_year_matches[-1].group(1)
+    not_older_year_matches = list(re.finditer(r"не\s+старше\s+(19\d{2}|20[0-2]\d)", text))
+    if not_older_year_matches:
+        result["year_min"] = not_older_year_matches[-1].group(1)
+    vol_match = re.search(r"\b(\d{1}\.\d{1,2})\s*(?:л|литр|литра)?", text)
+    if vol_match:
+        result["engine_volume"] = vol_match.group(1)
+    hp_match = re.search(r"(\d{2,3})\s*л\.?\s*с", text, re.IGNORECASE)
+    if hp_match:
+        result["horsepower"] = hp_match.group(1)
+    for bt in body_type_reference or []:
+        if not bt or not bt.strip():
+            continue
+        bt_lower = bt.strip().lower()
+        if bt_lower in text:
+            result["body_type"] = bt.strip()
+            break
+        first_word = bt_lower.split()[0]
+        if len(first_word) >= 3 and first_word in text:
+            result["body_type"] = bt.strip()
+            break
+    if "body_type" not in result:
+        body_type = _legacy_first_group(text, deepseek.FALLBACK_BODY_TYPE_KEYWORDS)
+        if body_type:
+            result["body_type"] = body_type
+    return result
+
+
+def legacy_turn(message: str) -> tuple:
+    return (
+        legacy_is_greeting_only(message),
+        legacy_looks_like_greeting_only(message),
+        legacy_message_mentions_car_or_params(message),
+        legacy_override_params_from_last_message(message, {"year_min": "2010"}),
+        legacy_extract_params_fallback([message], BODY_TYPE_REFERENCE, BRAND_REFERENCE),
+    )
+
+
+def matcher_turn(message: str) -> tuple:
+    return (
+        chat._is_greeting_only(message),
+        chat._looks_like_greeting_only(message),
+        chat._message_mentions_car_or_params(message),
+        chat._override_params_from_last_message(message, {"year_min": "2010"}),
+        deepseek.extract_params_fallback([message], BODY_TYPE_REFERENCE, BRAND_REFERENCE),
+    )
+
+
+def _clear_caches() -> None:
+    chat._normalize_for_greeting.cache_clear()
+    chat._message_keywords.cache_clear()
+
+
+def make_corpus(size: int, rng: random.Random) -> list:
+    return [" ".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 12))) for _ in range(size)]
+
+
+def _timed_per_message(turn, corpus: list, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        for message in corpus:
+            _clear_caches()
+            started = time.process_time_ns()
+            turn(message)
+            samples.append((time.process_time_ns() - started) / 1000)
+    return samples
+
+
+def _p95(samples: list) -> float:
+    return sorted(samples)[max(0, int(len(samples) * 0.95) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ключевые слова сообщения: один проход vs последовательные re.search")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.messages, random.Random(args.seed))
+    for message in corpus:
+        _clear_caches()
+        if legacy_turn(message) != matcher_turn(message):
+            print(f"Ошибка: результаты расходятся на сообщении {message!r}")
+            sys.exit(1)
+
+    old = _timed_per_message(legacy_turn, corpus, args.repeat)
+    new = _timed_per_message(matcher_turn, corpus, args.repeat)
+    old_p50, new_p50 = statistics.median(old), statistics.median(new)
+    print(f"| {'вариант':>8} | {'p50, мкс':>9} | {'p95, мкс':>9} |")
+    print(f"|{'-' * 10}|{'-' * 11}|{'-' * 11}|")
+    print(f"| {'legacy':>8} | {old_p50:>9.1f} | {_p95(old):>9.1f} |")
+    print(f"| {'matcher':>8} | {new_p50:>9.1f} | {_p95(new):>9.1f} |")
+    print(f"Ускорение p50: {old_p50 / new_p50:.1f}x на {len(corpus)} сообщениях")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Бенчмарк ANN-индекса pgvector: recall@k и задержка относительно точного поиска.
+
+Создаёт синтетический каталог (по умолчанию 200 000 «машин», vector(256), кластеры вокруг
+случайных центроидов — как у реальных эмбеддингов похожих моделей), строит HNSW и/или IVFFlat
+и для каждого значения ef_search / probes меряет:
+  - recall@k — доля совпавших id с точным поиском (seq scan, индекс отключён);
+  - p50 / p95 задержки запроса, мс;
+  - время построения индекса.
+Результат — таблица, по которой выбираются VECTOR_HNSW_EF_SEARCH / VECTOR_IVFFLAT_PROBES.
+
+Таблицу cars не трогает: данные в отдельной таблице ann_bench_cars (удаляется в конце, если не --keep).
+
+Запуск из корня carmatch-backend (нужен PostgreSQL с pgvector):
+  python scripts/benchmark_vector_index.py
+  python scripts/benchmark_vector_index.py --rows 50000 --queries 100 --types hnsw
+  python scripts/benchmark_vector_index.py --ef-search 20,40,80,160 --probes 1,5,10,20
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+from src.config import settings
+from src.services import vector_index
+from src.services.yandex_embeddings import EMBEDDING_DIMENSION
+
+BENCH_TABLE = "ann_bench_cars"
+CENTROIDS_TABLE = "ann_bench_centroids"
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _vec_literal(values: list[float]) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in values) + "]"
+
+
+def _normalize(values: list[float]) -> list[float]:
+    norm = math.sqrt(sum(x * x for x in values)) or 1.0
+    return [x / norm for x in values]
+
+
+def prepare_data(conn, rows: int, clusters: int, noise: float, seed: int) -> list[list[float]]:
+    """Синтетические эмбеддинги: centroid + равномерный шум. Возвращает центроиды (для запросов)."""
+    rnd = random.Random(seed)
+    centroids = [
+        _normalize([rnd.uniform(-1.0, 1.0) for _ in range(EMBEDDING_DIMENSION)])
+        for _ in range(clusters)
+    ]
+    conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {CENTROIDS_TABLE}"))
+    conn.execute(text(f"CREATE TABLE {CENTROIDS_TABLE} (id integer PRIMARY KEY, v float8[] NOT NULL)"))
+    conn.execute(
+        text(f"INSERT INTO {CENTROIDS_TABLE} (id, v) VALUES (:id, :v)"),
+        [{"id": i, "v": c} for i, c in enumerate(centroids)],
+    )
+    conn.execute(
+        text(f"CREATE TABLE {BENCH_TABLE} (id serial PRIMARY KEY, embedding vector({EMBEDDING_DIMENSION}) NOT NULL)")
+    )
+    started = time.perf_counter()
+    conn.execute(text("SELECT setseed(:s)"), {"s": (seed % 1000) / 1000.0})
+    # Коррелированный подзапрос по c.v — пересчитывается для каждой строки
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {BENCH_TABLE} (embedding)
+            SELECT (
+                SELECT array_agg(c.v[i] + (random() - 0.5) * :noise ORDER BY i)
+                FROM generate_series(1, {EMBEDDING_DIMENSION}) AS i
+            )::vector
+            FROM generate_series(1, :rows) AS g
+            JOIN {CENTROIDS_TABLE} c ON c.id = g % :clusters
+            """
+        ),
+        {"rows": rows, "clusters": clusters, "noise": noise},
+    )
+    conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+    print(f"Данные: {rows} строк, {clusters} кластеров, {time.perf_counter() - started:.1f} с")
+    return centroids
+
+
+def make_queries(centroids: list[list[float]], count: int, noise: float, seed: int) -> list[str]:
+    rnd = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        c = rnd.choice(centroids)
+        queries.append(_vec_literal([x + rnd.uniform(-0.5, 0.5) * noise for x in c]))
+    return queries
+
+
+def run_queries(conn, queries: list[str], k: int, setup_sql: list[str]) -> tuple[list[list[int]], list[float]]:
+    """Выполняет запросы (каждый в своей транзакции с SET LOCAL), возвращает id и задержки в мс."""
+    results: list[list[int]] = []
+    latencies: list[float] = []
+    for qv in queries:
+        with conn.begin():
+            for stmt in setup_sql:
+                conn.execute(text(stmt))
+            started = time.perf_counter()
+            rows = conn.execute(
+                text(
+                    f"SELECT id FROM {BENCH_TABLE} "
+                    "ORDER BY embedding <=> CAST(:qv AS vector) LIMIT :k"
+                ),
+                {"qv": qv, "k": k},
+            ).fetchall()
+            latencies.append((time.perf_counter() - started) * 1000.0)
+        results.append([r[0] for r in rows])
+    return results, latencies
+
+
+def recall(exact: list[list[int]], approx: list[list[int]]) -> float:
+    hits = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+    total = sum(len(e) for e in exact) or 1
+    return hits / total
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def _print_row(label: str, rec: float | None, lat: list[float]) -> None:
+    rec_str = f"{rec:.4f}" if rec is not None else "1.0000"
+    print(
+        f"| {label:<24} | {rec_str:>9} | {statistics.median(lat):>8.2f} | {_percentile(lat, 0.95):>8.2f} |"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall vs latency для ANN-индекса pgvector")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.15)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="Размер выдачи (как CHAT_VECTOR_SEARCH_LIMIT/лимит поиска)")
+    parser.add_argument("--types", default="hnsw,ivfflat")
+    parser.add_argument("--ef-search", default="10,20,40,80,160,320")
+    parser.add_argument("--probes", default="1,3,5,10,20,50")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Не удалять таблицу ann_bench_cars после прогона")
+    args = parser.parse_args()
+
+    db_url = settings.get_database_url()
+    if "postgresql" not in db_url:
+        print("Ошибка: нужен PostgreSQL с pgvector.")
+        sys.exit(1)
+
+    engine = create_engine(db_url)
+    with engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text("SET statement_timeout = 0"))
+            centroids = prepare_data(conn, args.rows, args.clusters, args.noise, args.seed)
+        queries = make_queries(centroids, args.queries, args.noise, args.seed)
+
+        exact, exact_lat = run_queries(
+            conn, queries, args.k, ["SET LOCAL enable_indexscan = off", "SET LOCAL statement_timeout = 0"]
+        )
+        print()
+        print(f"| {'конфигурация':<24} | {'recall@' + str(args.k):>9} | {'p50, мс':>8} | {'p95, мс':>8} |")
+        print(f"|{'-' * 26}|{'-' * 11}|{'-' * 10}|{'-' * 10}|")
+        _print_row("exact (seq scan)", None, exact_lat)
+
+        for kind in [t.strip() for t in args.types.split(",") if t.strip()]:
+            name = f"{BENCH_TABLE}_{kind}"
+            lists = vector_index.auto_ivfflat_lists(args.rows) if kind == "ivfflat" else None
+            with conn.begin():
+                conn.execute(text("SET LOCAL statement_timeout = 0"))
+                conn.execute(text("SET LOCAL maintenance_work_mem = '512MB'"))
+                started = time.perf_counter()
+                conn.execute(
+                    text(vector_index.index_ddl(kind, lists=lists, table=BENCH_TABLE, index_name=name))
+                )
+                build_s = time.perf_counter() - started
+            extra = f", lists={lists}" if lists else ""
+            print(f"| {kind} build: {build_s:.1f} с{extra}")
+
+            if kind == "hnsw":
+                sweep = [("hnsw.ef_search", v) for v in _int_list(args.ef_search)]
+            else:
+                sweep = [("ivfflat.probes", v) for v in _int_list(args.probes)]
+            for guc, value in sweep:
+                approx, lat = run_queries(
+                    conn, queries, args.k, [f"SET LOCAL {guc} = {int(value)}"]
+                )
+                _print_row(f"{kind} {guc.split('.')[1]}={value}", recall(exact, approx), lat)
+
+            with conn.begin():
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+        if not args.keep:
+            with conn.begin():
+                conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {CENTROIDS_TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
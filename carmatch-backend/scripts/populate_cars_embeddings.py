@@ -5,6 +5,13 @@
 из mark_name, model_name, modification, body_type, year, description и получает
 вектор эмбеддинга (256) от Yandex, затем обновляет запись в БД.
 
+Машины обрабатываются пачками (--batch-size) по возрастанию id:
+  - эмбеддинги пачки запрашиваются параллельно (--concurrency) с ограничением частоты (--rps)
+    и повторами на 429/5xx — см. aembed_batch в src/services/yandex_embeddings.py;
+  - запись — одним UPDATE ... FROM (VALUES ...) на пачку, пока запрашивается следующая;
+  - после каждой записанной пачки сохраняется контрольная точка (--checkpoint): при перезапуске
+    обработка продолжается с последнего записанного id (--restart — начать заново).
+
 Требуется в .env:
   YANDEX_FOLDER_ID=...   # ID каталога в Yandex Cloud
   YANDEX_API_KEY=...    # API-ключ сервисного аккаунта с ролью ai.languageModels.user
@@ -14,8 +21,11 @@
   python scripts/populate_cars_embeddings.py
   python scripts/populate_cars_embeddings.py --limit 100
   python scripts/populate_cars_embeddings.py --force   # перезаписать все эмбеддинги
+  python scripts/populate_cars_embeddings.py --concurrency 16 --rps 20
 """
 import argparse
+import asyncio
+import json
 import os
 import sys
 import time
@@ -28,9 +38,11 @@ from sqlalchemy import text
 from src.config import settings
 from src.database import SessionLocal
 from src.models import Car
-from src.services.yandex_embeddings import get_embedding
+from src.services.yandex_embeddings import TokenBucket, aembed_batch
 from src.utils.car_display import format_car_description
 
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".populate_embeddings_checkpoint.json")
+
 
 def text_for_embedding(car: Car) -> str:
     """Текст для эмбеддинга: описание авто (марка, модель, модификация, кузов, год, описание)."""
@@ -41,6 +53,132 @@ def text_for_embedding(car: Car) -> str:
     return " ".join(p for p in parts if p).strip() or "Автомобиль"
 
 
+def load_checkpoint(path: str, force: bool) -> dict:
+    """Контрольная точка прошлого запуска (last_id, счётчики); пустая, если режим --force другой."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if bool(data.get("force")) != force:
+        return {}
+    return data
+
+
+def save_checkpoint(path: str, data: dict) -> None:
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def load_batch(after_id: int, batch_size: int, force: bool) -> list[tuple[int, str]]:
+    """Следующая пачка (id, текст) по keyset-пагинации: id > after_id ORDER BY id."""
+    session = SessionLocal()
+    try:
+        q = session.query(Car).filter(Car.is_active == True, Car.id > after_id)  # noqa: E712
+        if not force:
+            q = q.filter(Car.embedding.is_(None))
+        cars = q.order_by(Car.id).limit(batch_size).all()
+        return [(car.id, text_for_embedding(car)) for car in cars]
+    finally:
+        session.close()
+
+
+def write_embeddings(pairs: list[tuple[int, list[float]]]) -> None:
+    """
+    Один UPDATE ... FROM (VALUES ...) на пачку вместо UPDATE + COMMIT на каждую строку.
+    Вектор передаётся строкой и приводится CAST(... AS vector) — как раньше, чтобы избежать
+    ошибки pgvector "posting list tuple cannot be split".
+    """
+    if not pairs:
+        return
+    values_sql = []
+    params: dict = {}
+    for i, (car_id, emb) in enumerate(pairs):
+        values_sql.append(f"(CAST(:id{i} AS integer), CAST(:e{i} AS vector))")
+        params[f"id{i}"] = car_id
+        params[f"e{i}"] = "[" + ",".join(str(x) for x in emb) + "]"
+    session = SessionLocal()
+    try:
+        session.execute(
+            text(
+                "UPDATE cars AS c SET embedding = v.emb, updated_at = now() "
+                f"FROM (VALUES {', '.join(values_sql)}) AS v(id, emb) "
+                "WHERE c.id = v.id"
+            ),
+            params,
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+async def run(args: argparse.Namespace) -> tuple[int, int]:
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint, args.force)
+    last_id = int(checkpoint.get("last_id", 0))
+    ok = int(checkpoint.get("ok", 0))
+    err = int(checkpoint.get("err", 0))
+    if last_id:
+        print(f"Продолжаем с id > {last_id} (контрольная точка {args.checkpoint}; --restart — начать заново)")
+
+    limiter = TokenBucket(args.rps)
+    started = time.perf_counter()
+    processed = 0
+    pending_write: asyncio.Task | None = None
+
+    while True:
+        size = args.batch_size
+        if args.limit:
+            size = min(size, args.limit - processed)
+            if size <= 0:
+                break
+        batch = await asyncio.to_thread(load_batch, last_id, size, args.force)
+        if not batch:
+            break
+
+        vectors = await aembed_batch(
+            [t for _, t in batch],
+            concurrency=args.concurrency,
+            limiter=limiter,
+        )
+        pairs = [(car_id, emb) for (car_id, _), emb in zip(batch, vectors) if emb is not None]
+        batch_err = len(batch) - len(pairs)
+        for (car_id, _), emb in zip(batch, vectors):
+            if emb is None:
+                print(f"  id={car_id} — ошибка получения эмбеддинга")
+
+        # Запись предыдущей пачки идёт, пока запрашивались эмбеддинги этой; дожидаемся её перед следующей
+        if pending_write is not None:
+            await pending_write
+        batch_last_id = batch[-1][0]
+        counters = {"ok": ok + len(pairs), "err": err + batch_err}
+
+        async def _write(pairs=pairs, batch_last_id=batch_last_id, counters=counters) -> None:
+            await asyncio.to_thread(write_embeddings, pairs)
+            save_checkpoint(args.checkpoint, {"last_id": batch_last_id, "force": args.force, **counters})
+
+        pending_write = asyncio.create_task(_write())
+        ok, err = counters["ok"], counters["err"]
+        last_id = batch_last_id
+        processed += len(batch)
+
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        print(f"  Обработано {processed} (id <= {last_id}), OK: {ok}, ошибок: {err}, {rate:.1f} машин/с")
+
+    if pending_write is not None:
+        await pending_write
+    elapsed = time.perf_counter() - started
+    if processed:
+        print(f"Время: {elapsed:.1f} с, {processed / elapsed:.1f} машин/с")
+    return ok, err
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Заполнить cars.embedding через Yandex Embeddings API")
     parser.add_argument(
@@ -54,12 +192,21 @@ def main() -> None:
         action="store_true",
         help="Обновить эмбеддинги даже там, где они уже заполнены",
     )
+    parser.add_argument("--batch-size", type=int, default=200, help="Машин в пачке (одна запись в БД на пачку)")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.yandex_embeddings_concurrency,
+        help="Одновременных запросов к API",
+    )
     parser.add_argument(
-        "--delay",
+        "--rps",
         type=float,
-        default=0.2,
-        help="Задержка между запросами к API в секундах (по умолчанию 0.2)",
+        default=settings.yandex_embeddings_rps,
+        help="Максимум запросов к API в секунду (квота Yandex Cloud)",
     )
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Файл контрольной точки ('' — не сохранять)")
+    parser.add_argument("--restart", action="store_true", help="Игнорировать контрольную точку и начать с начала")
     args = parser.parse_args()
 
     if not settings.yandex_folder_id or not settings.yandex_api_key:
@@ -72,55 +219,17 @@ def main() -> None:
         print("Ошибка: скрипт предназначен для PostgreSQL с pgvector. DATABASE_URL:", db_url[:50], "...")
         sys.exit(1)
 
-    session = SessionLocal()
-    try:
-        q = session.query(Car).filter(Car.is_active == True)
-        if not args.force:
-            q = q.filter(Car.embedding.is_(None))
-        q = q.order_by(Car.id)
-        if args.limit:
-            q = q.limit(args.limit)
-        cars = q.all()
-    finally:
-        session.close()
-
-    total = len(cars)
-    if total == 0:
+    print(f"Пачка: {args.batch_size}, параллельно: {args.concurrency}, лимит: {args.rps} запросов/с")
+    ok, err = asyncio.run(run(args))
+    if ok == 0 and err == 0:
         print("Нет записей для обработки (все уже с эмбеддингами или нет активных cars).")
         print("Используйте --force чтобы перезаписать все эмбеддинги.")
         return
 
-    print(f"Будет обработано записей: {total}")
-    print(f"Задержка между запросами: {args.delay} с")
-    ok = 0
-    err = 0
-    session = SessionLocal()
-    try:
-        for i, car in enumerate(cars, 1):
-            text_to_embed = text_for_embedding(car)
-            emb = get_embedding(text_to_embed)
-            if emb is None:
-                err += 1
-                print(f"  [{i}/{total}] id={car.id} — ошибка получения эмбеддинга")
-                if args.delay:
-                    time.sleep(args.delay)
-                continue
-            # Обновляем через raw SQL, чтобы избежать ошибки pgvector "posting list tuple cannot be split"
-            emb_str = "[" + ",".join(str(x) for x in emb) + "]"
-            session.execute(
-                text("UPDATE cars SET embedding = CAST(:emb AS vector), updated_at = now() WHERE id = :id"),
-                {"emb": emb_str, "id": car.id},
-            )
-            session.commit()
-            ok += 1
-            if i % 50 == 0 or i == total:
-                print(f"  Обработано {i}/{total}, OK: {ok}, ошибок: {err}")
-            if args.delay:
-                time.sleep(args.delay)
-    finally:
-        session.close()
-
     print(f"Готово. Успешно: {ok}, ошибок: {err}")
+    # Все пачки записаны — контрольная точка больше не нужна (при --limit оставляем для продолжения)
+    if not args.limit and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
 
 
 if __name__ == "__main__":
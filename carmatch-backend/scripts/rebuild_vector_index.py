@@ -0,0 +1,95 @@
+"""
+Обслуживание ANN-индекса по cars.embedding (pgvector).
+
+Команды:
+  status   — показать существующие HNSW/IVFFlat индексы, размер и валидность
+  create   — создать индекс (по умолчанию тип из VECTOR_INDEX_TYPE, CONCURRENTLY)
+  rebuild  — удалить и создать заново (например, смена m/ef_construction или lists)
+  reindex  — REINDEX CONCURRENTLY (после массового пересчёта эмбеддингов)
+  drop     — удалить индекс
+
+Запуск из корня carmatch-backend:
+  python scripts/rebuild_vector_index.py status
+  python scripts/rebuild_vector_index.py rebuild --type hnsw
+  python scripts/rebuild_vector_index.py rebuild --type ivfflat --drop-other
+  python scripts/rebuild_vector_index.py reindex
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+from src.config import settings
+from src.services import vector_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Управление ANN-индексом cars.embedding")
+    parser.add_argument("command", choices=["status", "create", "rebuild", "reindex", "drop"])
+    parser.add_argument(
+        "--type",
+        dest="index_type",
+        default=settings.vector_index_type,
+        choices=list(vector_index.INDEX_TYPES),
+        help="Тип индекса (по умолчанию из настроек VECTOR_INDEX_TYPE)",
+    )
+    parser.add_argument(
+        "--drop-other",
+        action="store_true",
+        help="Удалить индекс другого типа (чтобы планировщик не выбирал между двумя)",
+    )
+    parser.add_argument(
+        "--no-concurrently",
+        action="store_true",
+        help="Строить без CONCURRENTLY (быстрее, но блокирует запись в cars)",
+    )
+    parser.add_argument(
+        "--maintenance-work-mem",
+        default="512MB",
+        help="maintenance_work_mem на время построения (HNSW строится быстрее, если граф помещается в память)",
+    )
+    args = parser.parse_args()
+
+    db_url = settings.get_database_url()
+    if "postgresql" not in db_url:
+        print("Ошибка: скрипт предназначен для PostgreSQL с pgvector.")
+        sys.exit(1)
+
+    concurrently = not args.no_concurrently
+    engine = create_engine(db_url, isolation_level="AUTOCOMMIT")
+    with engine.connect() as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :m, false)"), {"m": args.maintenance_work_mem})
+
+        if args.command in ("create", "rebuild", "reindex", "drop"):
+            started = time.perf_counter()
+            if args.command == "drop":
+                vector_index.drop_index(conn, args.index_type, concurrently=concurrently)
+            elif args.command == "reindex":
+                vector_index.reindex(conn, args.index_type, concurrently=concurrently)
+            else:
+                if args.command == "rebuild":
+                    vector_index.drop_index(conn, args.index_type, concurrently=concurrently)
+                if args.drop_other:
+                    for other in vector_index.INDEX_TYPES:
+                        if other != args.index_type:
+                            vector_index.drop_index(conn, other, concurrently=concurrently)
+                vector_index.create_index(conn, args.index_type, concurrently=concurrently)
+            print(f"{args.command} ({args.index_type}): {time.perf_counter() - started:.1f} с")
+
+        status = vector_index.index_status(conn)
+        if not status:
+            print("ANN-индексов по cars.embedding нет — векторный поиск выполняет полный проход.")
+            return
+        for idx in status:
+            valid = "valid" if idx["is_valid"] else "INVALID (пересоздайте: rebuild)"
+            print(f"{idx['name']}: {idx['method']}, {idx['size']}, {valid}")
+            print(f"  {idx['definition']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -69,56 +69,10 @@ def run_seed():
 
 
 def copy_cars():
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    from src.models import Car
-
-    engine_local = create_engine(LOCAL_URL, pool_pre_ping=True)
-    engine_remote = create_engine(REMOTE_URL, pool_pre_ping=True)
-    SessionLocal = sessionmaker(bind=engine_local)
-    SessionRemote = sessionmaker(bind=engine_remote)
-    local = SessionLocal()
-    remote = SessionRemote()
-    try:
-        total = local.query(Car).count()
-        print(f"Записей в cars (локально): {total}")
-        if total == 0:
-            print("Локально cars пустая — не копируем.")
-            return
-        BATCH = 500
-        copied = 0
-        for offset in range(0, total, BATCH):
-            rows = local.query(Car).order_by(Car.id).offset(offset).limit(BATCH).all()
-            for r in rows:
-                c = Car(
-                    source=r.source,
-                    source_id=r.source_id,
-                    mark_name=r.mark_name,
-                    model_name=r.model_name,
-                    body_type=r.body_type,
-                    year=r.year,
-                    price_rub=r.price_rub,
-                    fuel_type=r.fuel_type,
-                    engine_volume=r.engine_volume,
-                    horsepower=r.horsepower,
-                    modification=r.modification,
-                    transmission=r.transmission,
-                    specs=r.specs or {},
-                    images=r.images,
-                    description=r.description,
-                    is_active=r.is_active,
-                    brand_id=None,
-                    model_id=None,
-                    generation_id=None,
-                    modification_id=None,
-                )
-                remote.add(c)
-            remote.commit()
-            copied += len(rows)
-            print(f"  скопировано {copied} / {total}")
-    finally:
-        local.close()
-        remote.close()
+    # COPY пачками по id с продолжением после max(id) на Render (см. scripts/copy_cars_to_render.py)
+    from copy_cars_to_render import copy_cars as copy_cars_table
+
+    copy_cars_table(LOCAL_URL, REMOTE_URL)
 
 
 def main():
@@ -23,8 +23,13 @@ def main():
     print("Starting database seeding process...")
     print(f"Using XML file: {xml_file_path}")
     
+    # --incremental: только изменения относительно прошлого запуска (хэши поддеревьев, см. xml_seeder.py)
+    incremental = "--incremental" in sys.argv[1:]
+    if incremental:
+        print("Incremental sync mode")
+
     try:
-        parse_xml_and_seed_database(xml_file_path)
+        parse_xml_and_seed_database(xml_file_path, incremental=incremental)
         print("Seeding completed successfully!")
     except FileNotFoundError:
         print(f"Error: XML file not found at {xml_file_path}")
@@ -10,6 +10,10 @@ class Settings(BaseSettings):
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 60
+    # Кэш пользователей для проверки токена (is_active, is_admin): при попадании — без запроса к users;
+    # изменения из админки сбрасывают запись сразу, на других воркерах — не позже TTL
+    auth_principal_cache_size: int = 10000  # 0 — кэш выключен
+    auth_principal_cache_ttl_seconds: int = 60
     cors_origins: str = DEFAULT_CORS_ORIGINS
     # GigaChat API (authorization key from https://developers.sber.ru/studio/)
     gigachat_credentials: str = ""
@@ -17,11 +21,66 @@ class Settings(BaseSettings):
     # Эмбеддинги Яндекса (Yandex Cloud Foundation Models) — для векторного поиска по cars
     yandex_folder_id: str = ""  # ID каталога в Yandex Cloud
     yandex_api_key: str = ""   # API-ключ сервисного аккаунта (роль ai.languageModels.user)
+    # Пакетное получение эмбеддингов (scripts/populate_cars_embeddings.py): параллельность и квота API
+    yandex_embeddings_concurrency: int = 8
+    yandex_embeddings_rps: float = 10.0  # запросов в секунду (квота Foundation Models на textEmbedding)
+    yandex_embeddings_max_retries: int = 5  # повторы при 429 / 5xx / сетевых ошибках
     # LLM через GenAPI (https://gen-api.ru) — DeepSeek Reasoner (используется для сессий подбора авто)
     genapi_api_key: str = ""  # API-ключ из личного кабинета GenAPI
     genapi_generate_url: str = ""  # Полный URL "запроса на генерацию" из документации GenAPI
     genapi_model_id: str = "deepseek-reasoner"
     genapi_sync_mode: bool = True  # Использовать режим "Сразу ответ" (is_sync=true), если модель поддерживает
+    # Общие HTTP-клиенты AI-провайдеров (src/services/http_clients.py): пул keep-alive соединений на процесс
+    http_client_http2: bool = True  # HTTP/2, если установлен h2 (httpx[http2])
+    http_client_max_connections: int = 20
+    http_client_max_keepalive: int = 10
+    http_client_keepalive_expiry: float = 60.0  # сек простоя до закрытия соединения
+    http_client_connect_timeout: float = 10.0
+    http_client_timeout: float = 30.0  # чтение ответа (эмбеддинги); LLM-запросы — http_client_llm_timeout
+    http_client_llm_timeout: float = 90.0
+    # ANN-индекс по cars.embedding (pgvector): тип индекса и параметры точности/скорости поиска.
+    # Подбирать по scripts/benchmark_vector_index.py (recall vs latency относительно точного поиска).
+    vector_index_type: str = "hnsw"  # hnsw | ivfflat
+    vector_hnsw_m: int = 16
+    vector_hnsw_ef_construction: int = 64
+    vector_hnsw_ef_search: int = 40  # применяется к каждому запросу (SET LOCAL hnsw.ef_search)
+    vector_ivfflat_lists: int = 0  # 0 = авто: rows / 1000 (не меньше 10)
+    vector_ivfflat_probes: int = 10  # применяется к каждому запросу (SET LOCAL ivfflat.probes)
+    # Фильтрованный векторный поиск (WHERE по brand/body_type/... + ORDER BY embedding <=>):
+    # итеративный скан индекса pgvector >= 0.8 (relaxed_order | strict_order; "" — выключен для старых версий)
+    vector_iterative_scan: str = "relaxed_order"
+    # ef_search при фильтрах не меньше limit * overfetch (запас кандидатов под отброшенные фильтром)
+    vector_filter_overfetch: int = 10
+    # Кэш эмбеддингов поисковых запросов: LRU в процессе + таблица query_embeddings (общая для воркеров)
+    embedding_cache_size: int = 2048  # 0 — in-process кэш выключен
+    embedding_cache_ttl_seconds: int = 6 * 3600
+    embedding_cache_persist: bool = True  # читать/писать query_embeddings (только PostgreSQL)
+    embedding_cache_db_ttl_seconds: int = 30 * 24 * 3600
+    # Кэш справочников (кузова, коробки, марки, модели) для чата и search_cars; сбрасывается из админки
+    reference_cache_ttl_seconds: int = 300  # 0 — кэш выключен
+    # Нечёткое сопоставление марок/моделей по триграммам («тоёта» → Toyota): минимальное сходство, 0 — выключено
+    fuzzy_match_threshold: float = 0.4
+    # Списки админки: точный count() только если оценка планировщика меньше порога (или exact_count=true)
+    admin_exact_count_threshold: int = 10000
+    # Спекулятивный векторный поиск в чате: стартует параллельно с извлечением параметров LLM
+    # (по прошлым параметрам сессии + резервному парсеру) и переиспользуется, если запрос не изменился
+    chat_speculative_search: bool = True
+    # История для LLM: последние N сообщений сессии + сводка более ранних (не длиннее summary_chars, 0 — без сводки)
+    chat_context_messages: int = 20
+    chat_context_summary_chars: int = 1500
+    # Кэш контекста диалога в процессе (LRU по сессиям): при попадании история не читается из БД
+    chat_context_cache_size: int = 1000  # 0 — кэш выключен
+    chat_context_cache_ttl_seconds: int = 3600
+    # Аренда хода в сессии: пока ход не завершён, параллельный запрос в ту же сессию получает 409;
+    # если процесс упал посреди хода, аренда истекает через столько секунд
+    chat_turn_lease_seconds: int = 300
+    # Чистые приветствие / спасибо / до свидания — готовый ответ из шаблонов без вызова LLM
+    chat_template_replies: bool = True
+    # Метрики Prometheus (GET /metrics): этапы чата, вызовы провайдеров, время SQL-запросов
+    metrics_enabled: bool = True
+    # Доступ к GET /metrics: Authorization: Bearer <токен>; пустой — эндпоинт выключен (404), метрики при этом
+    # собираются и видны в GET /api/v1/admin/stats
+    metrics_token: str = ""
 
     class Config:
         env_file = ".env"
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.types import JSON, TypeDecorator
 from sqlalchemy.dialects.postgresql import ARRAY as PG_ARRAY, JSONB as PG_JSONB
@@ -6,6 +7,7 @@ from sqlalchemy import Text
 from sqlalchemy.exc import ArgumentError
 
 from src.config import settings
+from src.services import metrics, vector_index
 
 
 class JSONBCompat(TypeDecorator):
@@ -39,6 +41,17 @@ except ArgumentError as e:
         "В Railway: Variables → добавьте DATABASE_URL из сервиса pgvector (Reference)."
     ) from e
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async-движок для чата (POST /chat/sessions/{id}/messages): ожидание LLM не держит поток из пула.
+# psycopg3 поддерживает asyncio с тем же URL postgresql+psycopg://.
+# expire_on_commit=False — после commit атрибуты ORM-объектов читаются без ленивой загрузки (в async её нет).
+async_engine = create_async_engine(_db_url, pool_pre_ping=True)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+# Время SQL-запросов в метрики (carmatch_db_query_seconds); при METRICS_ENABLED=false хуки не ставятся
+metrics.install_db_hooks(engine)
+metrics.install_db_hooks(async_engine)
+# Эмбеддинг запроса в векторном поиске — бинарный параметр vector (см. vector_index.query_vector)
+vector_index.install_vector_adapters(engine)
+vector_index.install_vector_adapters(async_engine)
 Base = declarative_base()
 
 
@@ -48,3 +61,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,3 +1,5 @@
+import hmac
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
@@ -5,46 +7,82 @@ from sqlalchemy.orm import Session
 
 from src.config import settings
 from src.database import get_db
-from src.models import User
+from src.services import principal_cache
+from src.services.principal_cache import Principal
 
 security = HTTPBearer()
+# /metrics: без заголовка — 401 от require_metrics_token, а не 403 от HTTPBearer
+metrics_security = HTTPBearer(auto_error=False)
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
-    token = credentials.credentials
+def _unauthorized() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Неверный или истёкший токен",
+    )
+
+
+def _forbidden() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Требуется доступ администратора",
+    )
+
+
+def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Проверенные claims токена (sub, email); подпись и срок — без обращения к БД."""
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверный или истёкший токен",
-            )
-        user = db.query(User).filter(User.id == int(user_id)).first()
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Неверный или истёкший токен",
-            )
-        return user
+        payload = jwt.decode(credentials.credentials, settings.secret_key, algorithms=[settings.algorithm])
     except JWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Неверный или истёкший токен",
-        )
+        raise _unauthorized()
+    if payload.get("sub") is None:
+        raise _unauthorized()
+    return payload
+
+
+def _principal(claims: dict, db: Session) -> Principal:
+    try:
+        user_id = int(claims["sub"])
+    except (TypeError, ValueError):
+        raise _unauthorized()
+    user = principal_cache.get(db, user_id)
+    # Нет пользователя или он заблокирован
+    if user is None or not user.is_active:
+        raise _unauthorized()
+    return user
+
 
+def get_current_user(
+    claims: dict = Depends(get_token_claims),
+    db: Session = Depends(get_db),
+) -> Principal:
+    """Текущий пользователь: claims токена + состояние из кэша principal (БД — только при промахе)."""
+    return _principal(claims, db)
 
-def get_current_admin(user: User = Depends(get_current_user)) -> User:
+
+def get_current_admin(
+    claims: dict = Depends(get_token_claims),
+    db: Session = Depends(get_db),
+) -> Principal:
     """
     Возвращает текущего пользователя, если он администратор.
     Используется только в админ-роутерах.
     """
+    # Права — только по текущему состоянию пользователя (кэш principal), а не по claims токена:
+    # назначение и снятие администратора действуют без перевыпуска токена
+    user = _principal(claims, db)
     if not user.is_admin:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Требуется доступ администратора",
-        )
+        raise _forbidden()
     return user
+
+
+def require_metrics_token(
+    credentials: HTTPAuthorizationCredentials | None = Depends(metrics_security),
+) -> None:
+    """GET /metrics: Bearer-токен из METRICS_TOKEN; токен не задан — эндпоинта нет (404)."""
+    if not settings.metrics_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), settings.metrics_token.encode()
+    ):
+        raise _unauthorized()
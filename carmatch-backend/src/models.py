@@ -11,18 +11,27 @@ from sqlalchemy import (
     BigInteger,
     String,
     Text,
+    event,
+    func,
+    inspect,
+    select,
     text,
 )
 from sqlalchemy.dialects.postgresql import UUID
 from pgvector.sqlalchemy import Vector
 
 from src.database import Base, ArrayTextCompat, JSONBCompat
+from src.utils import car_canonical
 
 
 def utcnow():
     return datetime.utcnow()
 
 
+# BIGSERIAL в PostgreSQL; в SQLite (тесты) автоинкремент есть только у INTEGER PRIMARY KEY
+BigIntegerPK = BigInteger().with_variant(Integer, "sqlite")
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -53,22 +62,30 @@ class Session(Base):
     created_at = Column(DateTime, default=utcnow, nullable=False)
     updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
     completed_at = Column(DateTime, nullable=True)
+    # Последний выделенный sequence_order: ход атомарно увеличивает на 2 (сообщение + ответ)
     message_count = Column(Integer, default=0, nullable=False)
     parameters_count = Column(Integer, default=0, nullable=False)
     cars_found = Column(Integer, default=0, nullable=False)
     title = Column(String(200), nullable=True)
+    # Сводка сообщений, вытесненных из окна истории LLM (src/services/conversation_context.py),
+    # и sequence_order последнего свёрнутого в неё сообщения
+    context_summary = Column(Text, nullable=True)
+    context_summary_upto = Column(Integer, default=0, nullable=False)
+    # Начало текущего хода чата (аренда): пока не NULL и не истекла, новый ход в сессию не начинается
+    turn_started_at = Column(DateTime, nullable=True)
 
     __table_args__ = (
         Index("idx_sessions_user_id", "user_id"),
         Index("idx_sessions_status", "status"),
         Index("idx_sessions_created_at", "created_at"),
+        Index("idx_sessions_created_at_id", "created_at", "id"),
     )
 
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True, autoincrement=True)
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
     role = Column(String(20), nullable=False)
     content = Column(Text, nullable=False)
@@ -110,6 +127,8 @@ class CarModel(Base):
         Index("idx_car_models_brand", "brand_id"),
         Index("idx_car_models_name", "name"),
         Index("idx_car_models_external_id", "external_id"),
+        # Ключ ON CONFLICT для загрузки справочника (src/utils/xml_seeder.py, миграция 14)
+        Index("uq_car_models_brand_name", "brand_id", "name", unique=True),
     )
 
 
@@ -127,6 +146,7 @@ class CarGeneration(Base):
     __table_args__ = (
         Index("idx_car_generations_model", "model_id"),
         Index("idx_car_generations_external_id", "external_id"),
+        Index("uq_car_generations_model_external", "model_id", "external_id", unique=True),
     )
 
 
@@ -144,6 +164,7 @@ class CarModification(Base):
     __table_args__ = (
         Index("idx_car_modifications_generation", "generation_id"),
         Index("idx_car_modifications_external_id", "external_id"),
+        Index("uq_car_modifications_generation_external", "generation_id", "external_id", unique=True),
     )
 
 
@@ -160,9 +181,22 @@ class CarComplectation(Base):
     __table_args__ = (
         Index("idx_car_complectations_modification", "modification_id"),
         Index("idx_car_complectations_external_id", "external_id"),
+        Index("uq_car_complectations_modification_external", "modification_id", "external_id", unique=True),
     )
 
 
+class ReferenceSyncState(Base):
+    """Хэш поддерева cars.xml по узлу справочника — для инкрементальной синхронизации (src/utils/xml_seeder.py)."""
+
+    __tablename__ = "reference_sync_state"
+
+    level = Column(String(20), primary_key=True)  # brands | models | generations | modifications | complectations
+    external_key = Column(String(250), primary_key=True)  # external_id (марка — имя; комплектация — "mod/comp")
+    parent_key = Column(String(250), nullable=True)
+    content_hash = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, nullable=False)
+
+
 class Car(Base):
     __tablename__ = "cars"
 
@@ -195,9 +229,17 @@ class Car(Base):
     generation_id = Column(Integer, ForeignKey("car_generations.id", ondelete="SET NULL"), nullable=True, index=True)
     modification_id = Column(Integer, ForeignKey("car_modifications.id", ondelete="SET NULL"), nullable=True, index=True)
 
+    # Канонические коды для поиска равенством (src/utils/car_canonical.py); заполняются при записи, см. ниже
+    body_class = Column(String(20), nullable=True)  # sedan, hatchback, suv, ...
+    fuel_code = Column(String(20), nullable=True)  # petrol, diesel, hybrid, electric, gas
+    gearbox_code = Column(String(10), nullable=True)  # MT, AT, AMT, CVT
+
     __table_args__ = (
         Index("idx_cars_mark_model", "mark_name", "model_name"),
         Index("idx_cars_year", "year"),
+        Index("idx_cars_mark_name_id", "mark_name", "id"),
+        Index("idx_cars_model_name_id", "model_name", "id"),
+        Index("idx_cars_year_id", "year", "id"),
         Index("idx_cars_price", "price_rub"),
         Index("idx_cars_body_type", "body_type"),
         Index("idx_cars_fuel_type", "fuel_type"),
@@ -206,13 +248,35 @@ class Car(Base):
         Index("idx_cars_model", "model_id"),
         Index("idx_cars_generation", "generation_id"),
         Index("idx_cars_modification", "modification_id"),
+        Index("idx_cars_body_class", "body_class"),
+        Index("idx_cars_fuel_code", "fuel_code"),
+        Index("idx_cars_gearbox_code", "gearbox_code"),
+        Index("idx_cars_brand_body_class", "brand_id", "body_class"),
     )
 
 
+@event.listens_for(Car, "before_insert")
+@event.listens_for(Car, "before_update")
+def _fill_car_search_codes(mapper, connection, car: Car) -> None:
+    """Коды поиска из текстовых полей и brand_id по mark_name — при каждой вставке/обновлении через ORM."""
+    car.body_class = car_canonical.body_class(car.body_type)
+    car.fuel_code = car_canonical.fuel_code(car.fuel_type)
+    car.gearbox_code = car_canonical.gearbox_code(car.transmission) or car_canonical.gearbox_code(car.modification)
+    state = inspect(car)
+    mark_changed = state.attrs.mark_name.history.has_changes() and not state.attrs.brand_id.history.has_changes()
+    if car.mark_name and (car.brand_id is None or mark_changed):
+        car.brand_id = connection.execute(
+            select(CarBrand.id)
+            .where(func.lower(CarBrand.name) == car.mark_name.strip().lower())
+            .order_by(CarBrand.id)
+            .limit(1)
+        ).scalar()
+
+
 class SearchParameter(Base):
     __tablename__ = "search_parameters"
 
-    id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True, autoincrement=True)
     session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
     param_type = Column(String(50), nullable=False)
     param_value = Column(String(255), nullable=True)
@@ -221,3 +285,16 @@ class SearchParameter(Base):
     created_at = Column(DateTime, default=utcnow, nullable=False)
 
     __table_args__ = (Index("idx_search_parameters_session_id", "session_id"),)
+
+
+class QueryEmbedding(Base):
+    """Кэш эмбеддингов поисковых запросов (src/services/embedding_cache.py): общий для всех воркеров, переживает рестарт."""
+    __tablename__ = "query_embeddings"
+
+    model_uri = Column(String(200), primary_key=True)
+    text_hash = Column(String(64), primary_key=True)  # sha256 нормализованного текста
+    query_text = Column(Text, nullable=False)
+    embedding = Column(Vector(256), nullable=False)
+    created_at = Column(DateTime, default=utcnow, nullable=False)
+
+    __table_args__ = (Index("idx_query_embeddings_created_at", "created_at"),)
@@ -1,16 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from src.database import get_db
-from src.deps import get_current_admin
-from src.models import Car, User
+from src.deps import Principal, get_current_admin
+from src.models import Car
 from src.schemas import (
     AdminCarItem,
     AdminCarListResponse,
     AdminCarCreate,
     AdminCarUpdate,
 )
+from src.services import pagination
+from src.services.reference_data import reference_cache
 from src.services.yandex_embeddings import get_embedding
 
 
@@ -88,7 +89,7 @@ def _update_car_embedding(db: Session, car: Car) -> None:
 
 @router.get("", response_model=AdminCarListResponse)
 def list_cars(
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=100),
@@ -103,13 +104,16 @@ def list_cars(
     is_active: bool | None = Query(None),
     sort_by: str | None = Query(None, pattern="^(mark_name|model_name|year)$"),
     sort_dir: str = Query("asc", pattern="^(asc|desc)$"),
+    cursor: str | None = Query(None, description="next_cursor предыдущей страницы (keyset вместо OFFSET)"),
+    exact_count: bool = Query(False, description="Точный count() вместо оценки для больших списков"),
 ):
     query = db.query(Car)
 
+    # ILIKE без lower(): по колонке работает GIN-индекс gin_trgm_ops (миграция 17)
     if mark_name:
-        query = query.filter(func.lower(Car.mark_name).ilike(f"%{mark_name.lower()}%"))
+        query = query.filter(Car.mark_name.ilike(f"%{mark_name}%"))
     if model_name:
-        query = query.filter(func.lower(Car.model_name).ilike(f"%{model_name.lower()}%"))
+        query = query.filter(Car.model_name.ilike(f"%{model_name}%"))
     if body_type:
         query = query.filter(Car.body_type == body_type)
     if year_from is not None:
@@ -125,41 +129,42 @@ def list_cars(
     if is_active is not None:
         query = query.filter(Car.is_active == is_active)
 
-    total = query.count()
-    pages = (total + per_page - 1) // per_page if total else 0
+    total, total_is_estimate = pagination.count_rows(
+        db, query, "cars", filtered=query.whereclause is not None, exact=exact_count
+    )
 
+    descending = sort_dir == "desc"
+    order = [(Car.id, descending)]
     if sort_by == "mark_name":
-        order_column = Car.mark_name
+        order.insert(0, (Car.mark_name, descending))
     elif sort_by == "model_name":
-        order_column = Car.model_name
+        order.insert(0, (Car.model_name, descending))
     elif sort_by == "year":
-        order_column = Car.year
-    else:
-        order_column = Car.id
-
-    if sort_dir == "desc":
-        order_column = order_column.desc()
-
-    items = (
-        query.order_by(order_column)
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
-    )
+        order.insert(0, (Car.year, descending))
+
+    try:
+        items, following = pagination.fetch_page(
+            query, order, page, per_page, cursor,
+            lambda car: [getattr(car, column.key) for column, _ in order],
+        )
+    except pagination.InvalidCursor as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
 
     return AdminCarListResponse(
         items=[_car_to_admin_item(c) for c in items],
         total=total,
         page=page,
         per_page=per_page,
-        pages=pages,
+        pages=pagination.pages_for(total, per_page),
+        total_is_estimate=total_is_estimate,
+        next_cursor=following,
     )
 
 
 @router.get("/{car_id}", response_model=AdminCarItem)
 def get_car(
     car_id: int,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     car = db.query(Car).filter(Car.id == car_id).first()
@@ -174,7 +179,7 @@ def get_car(
 @router.post("", response_model=AdminCarItem, status_code=status.HTTP_201_CREATED)
 def create_car(
     body: AdminCarCreate,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     data = body.model_dump()
@@ -185,6 +190,7 @@ def create_car(
     db.add(car)
     db.commit()
     db.refresh(car)
+    reference_cache.invalidate()
 
     # Обновляем эмбеддинг после сохранения машины
     _update_car_embedding(db, car)
@@ -196,7 +202,7 @@ def create_car(
 def update_car(
     car_id: int,
     body: AdminCarUpdate,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     car = db.query(Car).filter(Car.id == car_id).first()
@@ -213,6 +219,7 @@ def update_car(
         car.images = images
     db.commit()
     db.refresh(car)
+    reference_cache.invalidate()
 
     # Пересчитываем эмбеддинг после обновления полей машины
     _update_car_embedding(db, car)
@@ -223,7 +230,7 @@ def update_car(
 @router.delete("/{car_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_car(
     car_id: int,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     car = db.query(Car).filter(Car.id == car_id).first()
@@ -234,5 +241,6 @@ def delete_car(
         )
     db.delete(car)
     db.commit()
+    reference_cache.invalidate()
     return None
 
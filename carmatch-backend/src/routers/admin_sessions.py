@@ -5,8 +5,9 @@ from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from src.database import get_db
-from src.deps import get_current_admin
+from src.deps import Principal, get_current_admin
 from src.models import Session as SessionModel, ChatMessage, User
+from src.services import conversation_context, pagination
 from src.schemas import (
     AdminSessionListItem,
     AdminSessionListResponse,
@@ -45,7 +46,7 @@ def _build_params_summary(extracted_params: dict | None) -> str:
 
 @router.get("", response_model=AdminSessionListResponse)
 def list_sessions(
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=100),
@@ -55,6 +56,8 @@ def list_sessions(
     ),
     date_from: datetime | None = Query(None),
     date_to: datetime | None = Query(None),
+    cursor: str | None = Query(None, description="next_cursor предыдущей страницы (keyset вместо OFFSET)"),
+    exact_count: bool = Query(False, description="Точный count() вместо оценки для больших списков"),
 ):
     query = (
         db.query(SessionModel, User)
@@ -70,16 +73,19 @@ def list_sessions(
     if date_to is not None:
         query = query.filter(SessionModel.created_at <= date_to)
 
-    total = query.count()
-    pages = (total + per_page - 1) // per_page if total else 0
-
-    rows = (
-        query.order_by(SessionModel.created_at.desc())
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
+    total, total_is_estimate = pagination.count_rows(
+        db, query, "sessions", filtered=query.whereclause is not None, exact=exact_count
     )
 
+    order = [(SessionModel.created_at, True), (SessionModel.id, True)]
+    try:
+        rows, following = pagination.fetch_page(
+            query, order, page, per_page, cursor,
+            lambda row: [row[0].created_at, row[0].id],
+        )
+    except pagination.InvalidCursor as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
     items: list[AdminSessionListItem] = []
     for session, user in rows:
         display_status = _compute_display_status(session)
@@ -103,14 +109,16 @@ def list_sessions(
         total=total,
         page=page,
         per_page=per_page,
-        pages=pages,
+        pages=pagination.pages_for(total, per_page),
+        total_is_estimate=total_is_estimate,
+        next_cursor=following,
     )
 
 
 @router.get("/{session_id}", response_model=AdminSessionDetailResponse)
 def get_session_detail(
     session_id: UUID,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     row = (
@@ -173,7 +181,7 @@ def get_session_detail(
 )
 def get_session_messages(
     session_id: UUID,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     exists = (
@@ -213,7 +221,7 @@ def get_session_messages(
 )
 def delete_session(
     session_id: UUID,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     """
@@ -232,4 +240,5 @@ def delete_session(
 
     db.delete(session)
     db.commit()
+    conversation_context.discard(session_id)
 
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+
+from src.deps import Principal, get_current_admin
+from src.services import metrics
+
+
+router = APIRouter(prefix="/admin/stats", tags=["admin-stats"])
+
+
+@router.get("")
+def get_stats(admin: Principal = Depends(get_current_admin)):
+    """
+    Счётчики кэшей и оптимизаций чата одним ответом — те же значения, что gauge в GET /metrics:
+    embedding_cache, context_cache, principal_cache, reference_cache, speculative_search, template_replies.
+    """
+    return metrics.gauge_snapshot()
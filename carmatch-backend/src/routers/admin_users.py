@@ -3,8 +3,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from src.database import get_db
-from src.deps import get_current_admin
+from src.deps import Principal, get_current_admin
 from src.models import User, Session as SessionModel
+from src.services import pagination, principal_cache
 from src.schemas import (
     AdminUserListItem,
     AdminUserListResponse,
@@ -18,7 +19,7 @@ router = APIRouter(prefix="/admin/users", tags=["admin-users"])
 
 @router.get("", response_model=AdminUserListResponse)
 def list_users(
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=100),
@@ -26,6 +27,8 @@ def list_users(
         None, description="Поиск по email (substring, case-insensitive)"
     ),
     is_active: bool | None = Query(None),
+    cursor: str | None = Query(None, description="next_cursor предыдущей страницы (keyset вместо OFFSET)"),
+    exact_count: bool = Query(False, description="Точный count() вместо оценки для больших списков"),
 ):
     base_query = db.query(User)
 
@@ -35,16 +38,18 @@ def list_users(
     if is_active is not None:
         base_query = base_query.filter(User.is_active == is_active)
 
-    total = base_query.count()
-    pages = (total + per_page - 1) // per_page if total else 0
-
-    users = (
-        base_query.order_by(User.id.asc())
-        .offset((page - 1) * per_page)
-        .limit(per_page)
-        .all()
+    total, total_is_estimate = pagination.count_rows(
+        db, base_query, "users", filtered=base_query.whereclause is not None, exact=exact_count
     )
 
+    order = [(User.id, False)]
+    try:
+        users, following = pagination.fetch_page(
+            base_query, order, page, per_page, cursor, lambda u: [u.id]
+        )
+    except pagination.InvalidCursor as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+
     # Посчитать количество сессий на пользователя одним запросом
     counts = (
         db.query(SessionModel.user_id, func.count(SessionModel.id))
@@ -73,7 +78,9 @@ def list_users(
         total=total,
         page=page,
         per_page=per_page,
-        pages=pages,
+        pages=pagination.pages_for(total, per_page),
+        total_is_estimate=total_is_estimate,
+        next_cursor=following,
     )
 
 
@@ -83,7 +90,7 @@ def list_users(
 )
 def list_user_sessions(
     user_id: int,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
     per_page: int = Query(25, ge=1, le=100),
@@ -141,7 +148,7 @@ def list_user_sessions(
 )
 def delete_user(
     user_id: int,
-    admin: User = Depends(get_current_admin),
+    admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
     """
@@ -161,4 +168,6 @@ def delete_user(
 
     db.delete(user)
     db.commit()
+    # Токены удалённого пользователя перестают действовать сразу, не дожидаясь TTL кэша
+    principal_cache.invalidate(user_id)
 
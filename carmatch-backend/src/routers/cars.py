@@ -3,9 +3,8 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
-from src.deps import get_current_user
+from src.deps import Principal, get_current_user
 from src.database import get_db
-from src.models import User
 from src.schemas import CarResult, CarSearchResponse
 from src.services.reference_data.car_reference_service import search_cars as search_cars_service
 
@@ -37,7 +36,7 @@ def _car_to_result(c):
 
 @router.get("/search", response_model=CarSearchResponse)
 def search_cars(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
     brand: str | None = Query(None, description="Марка (из справочника car_brands)"),
     model: str | None = Query(None, description="Модель (из справочника car_models)"),
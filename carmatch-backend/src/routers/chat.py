@@ -6,8 +6,7 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
-from src.deps import get_current_user
-from src.models import User
+from src.deps import Principal, get_current_user
 from src.schemas import ChatCompleteRequest, ChatCompleteResponse
 from src.services import deepseek as chat_service
 
@@ -17,7 +16,7 @@ router = APIRouter(prefix="/chat", tags=["chat"])
 @router.post("/complete", response_model=ChatCompleteResponse)
 def chat_complete(
     body: ChatCompleteRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Отправляет историю сообщений в GigaChat и возвращает ответ ассистента.
@@ -1,13 +1,18 @@
 """Роутер чат-сессий: создание сессии, отправка и получение сообщений."""
 
-import re
+import json
+import logging
 from uuid import UUID
 
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.deps import get_current_user
-from src.models import ChatMessage, User
+from src.deps import Principal, get_current_user
+from src.models import ChatMessage
 from src.schemas import (
     ChatSessionListItem,
     ChatSessionResponse,
@@ -20,20 +25,6 @@ from src.schemas import (
 )
 
 
-def _extract_country_from_description(description: str | None) -> str | None:
-    """Из текста описания извлекает страну («Выпускается в X», «Производство — X»)."""
-    if not description or not description.strip():
-        return None
-    d = description.strip()
-    m = re.search(r"\bВыпускается\s+в\s+([^.]+?)(?:\.|$)", d, re.IGNORECASE)
-    if m:
-        return m.group(1).strip() or None
-    m = re.search(r"Производство\s*[—\-]\s*([^.]+?)(?:\.|$)", d)
-    if m:
-        return m.group(1).strip() or None
-    return None
-
-
 def _message_search_results(extra_metadata):
     """Достаёт и валидирует search_results из extra_metadata сообщения."""
     if not extra_metadata or not isinstance(extra_metadata, dict):
@@ -47,7 +38,7 @@ def _message_search_results(extra_metadata):
             continue
         item = dict(item)
         if not item.get("country") and item.get("description"):
-            extracted = _extract_country_from_description(item["description"])
+            extracted = extract_country_from_description(item["description"])
             if extracted:
                 item["country"] = extracted
         try:
@@ -55,43 +46,53 @@ def _message_search_results(extra_metadata):
         except Exception:
             continue
     return result
-from src.database import get_db
-from src.services.chat import add_message, create_session
+from src.database import AsyncSessionLocal, get_async_db, get_db
+from src.services import conversation_context
+from src.services.car_cards import CarCard, extract_country_from_description
+from src.services.chat import (
+    abort_message,
+    add_message,
+    create_session,
+    start_message,
+    stream_message_reply,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
-def _car_to_result(car) -> CarResult:
-    """Преобразует ORM Car в схему CarResult для ответа (все поля из БД)."""
-    country = getattr(car, "country", None) or None
-    description = getattr(car, "description", None)
-    if not country and description:
-        country = _extract_country_from_description(description)
-    return CarResult(
-        id=car.id,
-        mark_name=car.mark_name,
-        model_name=car.model_name,
-        year=car.year,
-        price_rub=float(car.price_rub) if car.price_rub is not None else None,
-        body_type=car.body_type,
-        fuel_type=car.fuel_type,
-        engine_volume=float(car.engine_volume) if car.engine_volume is not None else None,
-        horsepower=car.horsepower,
-        modification=getattr(car, "modification", None) or None,
-        transmission=car.transmission,
-        country=country,
-        images=list(car.images) if car.images else [],
-        description=getattr(car, "description", None) or None,
-        brand_id=car.brand_id,
-        model_id=car.model_id,
-        generation_id=car.generation_id,
-        modification_id=car.modification_id,
+def _extracted_params(merged_params: dict | None) -> list[ExtractedParam]:
+    """Накопленные за весь диалог параметры (не только из последнего сообщения)."""
+    return [
+        ExtractedParam(type=k, value=v, confidence=0.9)
+        for k, v in (merged_params or {}).items()
+        if v and str(v).strip()
+    ]
+
+
+def _message_response(assistant_msg, merged_params, ready_for_search, search_results) -> MessageResponse:
+    return MessageResponse(
+        id=assistant_msg.id,
+        session_id=assistant_msg.session_id,
+        role=assistant_msg.role,
+        content=assistant_msg.content,
+        sequence_order=assistant_msg.sequence_order,
+        created_at=assistant_msg.created_at,
+        extracted_params=_extracted_params(merged_params),
+        ready_for_search=ready_for_search,
+        search_results=[_car_to_result(c) for c in search_results],
     )
 
 
+def _car_to_result(card: CarCard) -> CarResult:
+    """Карточка поиска (CarCard) → схема CarResult для ответа."""
+    return CarResult(**card.to_dict())
+
+
 @router.post("/sessions", response_model=ChatSessionResponse)
 def post_create_session(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Создать новую сессию чата."""
@@ -109,7 +110,7 @@ def post_create_session(
 
 @router.get("/sessions/current", response_model=ChatSessionResponse)
 def get_current_session(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
@@ -152,7 +153,7 @@ def get_current_session(
 
 @router.get("/sessions")
 def get_sessions(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Список сессий текущего пользователя (по updated_at DESC)."""
@@ -179,52 +180,115 @@ def get_sessions(
     }
 
 
+def _turn_error(e: ValueError) -> HTTPException:
+    """Ошибка начала хода → HTTP: нет сессии — 404, в сессии уже идёт ход — 409."""
+    if str(e) == "session_not_found":
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Сессия не найдена или доступ запрещён",
+        )
+    if str(e) == "turn_in_progress":
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Предыдущее сообщение ещё обрабатывается. Дождитесь ответа.",
+        )
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail=str(e),
+    )
+
+
 @router.post("/sessions/{session_id}/messages", response_model=MessageResponse)
-def post_message(
+async def post_message(
     session_id: UUID,
     body: MessageCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Отправить сообщение в сессию; вернуть ответ с накопленными extracted_params, ready_for_search и search_results."""
+    """
+    Отправить сообщение в сессию; вернуть ответ с накопленными extracted_params, ready_for_search и search_results.
+    Асинхронный: пока ход ждёт LLM / эмбеддинги / БД, воркер обслуживает другие запросы.
+    """
     try:
-        assistant_msg, merged_params, ready_for_search, search_results = add_message(
+        assistant_msg, merged_params, ready_for_search, search_results = await add_message(
             db, session_id, current_user.id, body.content.strip()
         )
     except ValueError as e:
-        if str(e) == "session_not_found":
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Сессия не найдена или доступ запрещён",
-            ) from e
-        raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=str(e),
-        ) from e
-    # Накопленные за весь диалог параметры (не только из последнего сообщения)
-    params = [
-        ExtractedParam(type=k, value=v, confidence=0.9)
-        for k, v in (merged_params or {}).items()
-        if v and str(v).strip()
-    ]
-    car_results = [_car_to_result(c) for c in search_results]
-    return MessageResponse(
-        id=assistant_msg.id,
-        session_id=assistant_msg.session_id,
-        role=assistant_msg.role,
-        content=assistant_msg.content,
-        sequence_order=assistant_msg.sequence_order,
-        created_at=assistant_msg.created_at,
-        extracted_params=params,
-        ready_for_search=ready_for_search,
-        search_results=car_results,
+        raise _turn_error(e) from e
+    return _message_response(assistant_msg, merged_params, ready_for_search, search_results)
+
+
+def _sse(event: str, data) -> str:
+    """Одно событие Server-Sent Events (data — JSON в одну строку)."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+@router.post("/sessions/{session_id}/messages/stream")
+async def post_message_stream(
+    session_id: UUID,
+    body: MessageCreate,
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    То же, что POST /sessions/{id}/messages, но ответ приходит потоком (text/event-stream):
+    событие params (накопленные параметры), затем cards (карточки из поиска), затем token
+    (фрагменты ответа LLM по мере генерации) и в конце done — сохранённое сообщение
+    в формате MessageResponse (итоговый текст и карточки берутся из него). При сбое — событие error.
+    """
+    # Своя сессия БД, а не Depends: поток живёт дольше обработчика, сессия закрывается в конце потока
+    db = AsyncSessionLocal()
+    try:
+        turn = await start_message(db, session_id, current_user.id, body.content.strip())
+    except ValueError as e:
+        await db.close()
+        raise _turn_error(e) from e
+    except BaseException:
+        await db.close()
+        raise
+
+    async def events():
+        finished = False
+        try:
+            async for event, data in stream_message_reply(db, turn):
+                if event == "params":
+                    merged_params, ready_for_search = data
+                    yield _sse(
+                        "params",
+                        {"extracted_params": _extracted_params(merged_params), "ready_for_search": ready_for_search},
+                    )
+                elif event == "cards":
+                    yield _sse("cards", {"search_results": [_car_to_result(c) for c in data]})
+                elif event == "token":
+                    yield _sse("token", {"text": data})
+                else:
+                    finished = True
+                    yield _sse("done", _message_response(*data))
+        except Exception as e:  # noqa: BLE001
+            logger.exception("post_message_stream failed: %s", e)
+            yield _sse("error", {"detail": "Не удалось обработать запрос. Попробуйте ещё раз."})
+        finally:
+            # Ход не сохранён (ошибка или клиент закрыл поток) — вернуть номера и снять аренду сессии.
+            # При разрыве Starlette отменяет поток: без shield первый же await отката снова получит
+            # CancelledError, аренда останется висеть, а соединение с БД не вернётся в пул
+            with anyio.CancelScope(shield=True):
+                try:
+                    if not finished:
+                        await abort_message(db, turn)
+                finally:
+                    await db.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx/прокси не должны буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 @router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_session(
     session_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Удалить диалог (сессию) текущего пользователя. Сообщения удаляются каскадно."""
@@ -242,13 +306,14 @@ def delete_session(
         )
     db.delete(session)
     db.commit()
+    conversation_context.discard(session_id)
     return None
 
 
 @router.get("/sessions/{session_id}/messages", response_model=MessagesListResponse)
 def get_messages(
     session_id: UUID,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Получить историю сообщений сессии."""
@@ -296,6 +296,8 @@ class AdminCarListResponse(BaseModel):
     page: int
     per_page: int
     pages: int
+    total_is_estimate: bool = False  # total — оценка планировщика, а не count()
+    next_cursor: str | None = None  # курсор следующей страницы (keyset); None — страница последняя
 
 
 class AdminSessionListItem(BaseModel):
@@ -342,6 +344,8 @@ class AdminSessionListResponse(BaseModel):
     page: int
     per_page: int
     pages: int
+    total_is_estimate: bool = False
+    next_cursor: str | None = None
 
 
 class AdminUserListItem(BaseModel):
@@ -360,6 +364,8 @@ class AdminUserListResponse(BaseModel):
     page: int
     per_page: int
     pages: int
+    total_is_estimate: bool = False
+    next_cursor: str | None = None
 
 
 # Разрешить forward reference в MessageResponse и MessageListItem.search_results
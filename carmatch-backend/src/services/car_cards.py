@@ -0,0 +1,147 @@
+"""
+Карточка автомобиля для чата: лёгкая проекция cars вместо ORM-объекта Car.
+
+Поиск в чате раньше загружал Car целиком (db.query(Car)...all()) — со всеми колонками, включая
+embedding на 256 чисел, служебные поля и отслеживание изменений в identity map сессии, — а потом
+разбирал каждую машину ещё трижды: _car_to_metadata (extra_metadata сообщения), _car_to_result
+(ответ API) и _format_car_for_prompt (промпт LLM).
+Теперь поиск выбирает только CARD_COLUMNS (тем же запросом, что и кандидатов) и строит CarCard:
+  - производные значения (float цены и объёма, список фото, страна из описания) считаются один раз;
+  - CarCard.to_dict() — формат CarResult: и для extra_metadata, и для ответа API;
+  - канонические коды (body_class, fuel_code, gearbox_code) — для hybrid_rank.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Mapping
+
+from src.models import Car
+
+# Колонки cars, которые нужны карточке, ранжированию и промпту (без embedding и служебных полей)
+CARD_COLUMNS = (
+    Car.id,
+    Car.mark_name,
+    Car.model_name,
+    Car.year,
+    Car.price_rub,
+    Car.body_type,
+    Car.fuel_type,
+    Car.engine_volume,
+    Car.horsepower,
+    Car.modification,
+    Car.transmission,
+    Car.country,
+    Car.images,
+    Car.description,
+    Car.specs,
+    Car.brand_id,
+    Car.model_id,
+    Car.generation_id,
+    Car.modification_id,
+    Car.body_class,
+    Car.fuel_code,
+    Car.gearbox_code,
+)
+
+CARD_COLUMN_NAMES = tuple(c.key for c in CARD_COLUMNS)
+
+# Поля CarResult (src/schemas.py) — то, что уходит в API и в extra_metadata сообщения
+_RESULT_FIELDS = (
+    "id",
+    "mark_name",
+    "model_name",
+    "year",
+    "price_rub",
+    "body_type",
+    "fuel_type",
+    "engine_volume",
+    "horsepower",
+    "modification",
+    "transmission",
+    "country",
+    "images",
+    "description",
+    "brand_id",
+    "model_id",
+    "generation_id",
+    "modification_id",
+)
+
+
+def extract_country_from_description(description: str | None) -> str | None:
+    """Из текста описания извлекает страну («Выпускается в X», «Производство — X»)."""
+    if not description or not description.strip():
+        return None
+    d = description.strip()
+    m = re.search(r"\bВыпускается\s+в\s+([^.]+?)(?:\.|$)", d, re.IGNORECASE)
+    if m:
+        return m.group(1).strip() or None
+    m = re.search(r"Производство\s*[—\-]\s*([^.]+?)(?:\.|$)", d)
+    if m:
+        return m.group(1).strip() or None
+    return None
+
+
+@dataclass(slots=True)
+class CarCard:
+    """Машина в выдаче чата: только поля карточки, промпта и ранжирования; не привязана к сессии БД."""
+
+    id: int
+    mark_name: str = ""
+    model_name: str = ""
+    year: int | None = None
+    price_rub: float | None = None
+    body_type: str | None = None
+    fuel_type: str | None = None
+    engine_volume: float | None = None
+    horsepower: int | None = None
+    modification: str | None = None
+    transmission: str | None = None
+    country: str | None = None
+    images: list[str] = field(default_factory=list)
+    description: str | None = None
+    specs: dict = field(default_factory=dict)
+    brand_id: int | None = None
+    model_id: int | None = None
+    generation_id: int | None = None
+    modification_id: int | None = None
+    body_class: str | None = None
+    fuel_code: str | None = None
+    gearbox_code: str | None = None
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any]) -> CarCard:
+        """Строка запроса с колонками CARD_COLUMN_NAMES (row._mapping / RowMapping) → карточка."""
+        price = row["price_rub"]
+        volume = row["engine_volume"]
+        description = row["description"] or None
+        return cls(
+            id=int(row["id"]),
+            mark_name=row["mark_name"] or "",
+            model_name=row["model_name"] or "",
+            year=row["year"],
+            price_rub=float(price) if price is not None else None,
+            body_type=row["body_type"],
+            fuel_type=row["fuel_type"],
+            engine_volume=float(volume) if volume is not None else None,
+            horsepower=row["horsepower"],
+            modification=row["modification"] or None,
+            transmission=row["transmission"],
+            country=row["country"] or extract_country_from_description(description),
+            images=list(row["images"] or []),
+            description=description,
+            specs=row["specs"] if isinstance(row["specs"], dict) else {},
+            brand_id=row["brand_id"],
+            model_id=row["model_id"],
+            generation_id=row["generation_id"],
+            modification_id=row["modification_id"],
+            body_class=row["body_class"],
+            fuel_code=row["fuel_code"],
+            gearbox_code=row["gearbox_code"],
+        )
+
+    def to_dict(self) -> dict:
+        """Поля CarResult: extra_metadata сообщения ассистента и ответ API."""
+        return {name: getattr(self, name) for name in _RESULT_FIELDS}
@@ -2,39 +2,41 @@
 
 from __future__ import annotations
 
+import asyncio
 import logging
 import re
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
 from uuid import UUID
 
+import anyio
+from sqlalchemy import case, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 logger = logging.getLogger(__name__)
 
 
-def _extract_country_from_description(description: str | None) -> str | None:
-    """Из текста описания извлекает страну («Выпускается в X», «Производство — X»)."""
-    if not description or not description.strip():
-        return None
-    d = description.strip()
-    m = re.search(r"\bВыпускается\s+в\s+([^.]+?)(?:\.|$)", d, re.IGNORECASE)
-    if m:
-        return m.group(1).strip() or None
-    m = re.search(r"Производство\s*[—\-]\s*([^.]+?)(?:\.|$)", d)
-    if m:
-        return m.group(1).strip() or None
-    return None
-
-from src.database import SessionLocal
-from src.models import Car, ChatMessage, SearchParameter, Session
+from src.config import settings
+from src.models import ChatMessage, SearchParameter, Session, utcnow
+from src.services import conversation_context
 from src.services import deepseek as deepseek_service
-from src.services.reference_data.car_reference_service import get_body_type_reference
+from src.services import metrics
+from src.services import reply_templates
+from src.services.car_cards import CarCard
+from src.services.reference_data import reference_cache
 from src.services.vector_search import (
     compose_search_query,
     hybrid_rank,
-    sql_search_cars,
+    sql_search_cards,
     vector_search_cars_with_scores,
+    vector_search_signature,
 )
+from src.services.yandex_embeddings import aget_query_embedding
+from src.utils.keyword_matcher import KeywordGroups, KeywordHits, KeywordMatcher
 
 # Лимит кандидатов векторного поиска в чате (меньше = быстрее ответ)
 CHAT_VECTOR_SEARCH_LIMIT = 12
@@ -50,34 +52,39 @@ _BODY_TYPE_MATCH = [
 _TRANSMISSION_MATCH = {"автомат": "at", "механика": "mt", "вариатор": "cvt", "робот": "amt", "акпп": "at", "мкпп": "mt"}
 
 
+# Невидимые символы (zero-width, soft hyphen, BOM и т.п.) — удаляются при нормализации приветствий
+_INVISIBLE_CHARS = str.maketrans("", "", "\u200b\u200c\u200d\ufeff\u00ad\u2060\u180e\u034f")
+# Латинские гомоглифы -> кириллица (привет/привет)
+_HOMOGLYPHS = str.maketrans("eaopcyx", "\u0435\u0430\u043e\u0440\u0441\u0443\u0445")
+_CYRILLIC_RE = re.compile(r"[\u0400-\u04ff]")
+_GREETING_PUNCT_RE = re.compile(r"[!.,?()\-–—]+")
+_SPACES_RE = re.compile(r"\s+")
+
+_GREETINGS = (
+    "привет", "здравствуй", "здравствуйте", "добрый день", "добрый вечер", "доброе утро", "hi", "hello", "hey",
+)
+_GREETINGS_SET = frozenset(_GREETINGS)
+_GREETINGS_ANY = _GREETINGS[:6] + ("hi", "hello", "hey", "хай", "салют", "здарова", "прив")
+_GREETING_CAR_HINTS = ("машин", "авто", "подбор", "ищу", "хочу", "марк", "модел", "кузов", "бюджет")
+
+
+@lru_cache(maxsize=1024)
 def _normalize_for_greeting(text: str) -> str:
     """
     Нормализует строку для сравнения с приветствиями:
     - нижний регистр, пробелы и пунктуация по правилам _is_greeting_only;
     - замена латинских букв-гомоглифов на кириллицу (привет/привет);
     - удаление невидимых символов (zero-width, BOM и т.п.).
+    Результат кэшируется: одно сообщение проверяют и _is_greeting_only, и _looks_like_greeting_only.
     """
     if not text:
         return ""
-    # Удаляем невидимые и нулевой ширины символы
-    invisible = (
-        "\u200b", "\u200c", "\u200d", "\ufeff", "\u00ad",  # zero-width, soft hyphen, BOM
-        "\u2060", "\u180e", "\u034f",
-    )
-    t = text.strip().lower()
-    for ch in invisible:
-        t = t.replace(ch, "")
-    # Латинские гомоглифы -> кириллица только если в тексте уже есть кириллица (чтобы не ломать "hello")
-    if re.search(r"[\u0400-\u04ff]", t):
-        homographs = (
-            ("e", "\u0435"), ("a", "\u0430"), ("o", "\u043e"), ("p", "\u0440"),
-            ("c", "\u0441"), ("y", "\u0443"), ("x", "\u0445"),
-        )
-        for lat, cyr in homographs:
-            t = t.replace(lat, cyr)
-    t = re.sub(r"[!.,?()\-–—]+", " ", t)
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
+    t = text.strip().lower().translate(_INVISIBLE_CHARS)
+    # Гомоглифы заменяем только если в тексте уже есть кириллица (чтобы не ломать "hello")
+    if _CYRILLIC_RE.search(t):
+        t = t.translate(_HOMOGLYPHS)
+    t = _GREETING_PUNCT_RE.sub(" ", t)
+    return _SPACES_RE.sub(" ", t).strip()
 
 
 def _looks_like_greeting_only(text: str | None) -> bool:
@@ -90,11 +97,7 @@ def _looks_like_greeting_only(text: str | None) -> bool:
     t = _normalize_for_greeting(text)
     if not t or len(t) > 50:
         return False
-    greetings_any = (
-        "привет", "здравствуй", "здравствуйте", "добрый день", "добрый вечер", "доброе утро",
-        "hi", "hello", "hey", "хай", "салют", "здарова", "прив",
-    )
-    return t in greetings_any or any(t == g or t.startswith(g + " ") for g in greetings_any)
+    return any(t == g or t.startswith(g + " ") for g in _GREETINGS_ANY)
 
 
 def _is_greeting_only(text: str | None) -> bool:
@@ -105,34 +108,118 @@ def _is_greeting_only(text: str | None) -> bool:
     if not text:
         return False
     t = _normalize_for_greeting(text)
-    greetings = {
-        "привет",
-        "здравствуй",
-        "здравствуйте",
-        "добрый день",
-        "добрый вечер",
-        "доброе утро",
-        "hi",
-        "hello",
-        "hey",
-    }
-    if t in greetings:
+    if t in _GREETINGS_SET:
         return True
     # Короткое сообщение, которое только начинается с приветствия (без явного запроса про авто)
-    if len(t) <= 40 and any(t.startswith(g) for g in ("привет", "здравствуй", "здравствуйте", "добрый день",
-                                                       "добрый вечер", "доброе утро", "hi", "hello", "hey")):
-        rest = t
-        for g in ("привет", "здравствуй", "здравствуйте", "добрый день", "добрый вечер",
-                  "доброе утро", "hi", "hello", "hey"):
-            if rest.startswith(g):
-                rest = rest[len(g):].strip()
-                break
-        car_hints = ("машин", "авто", "подбор", "ищу", "хочу", "марк", "модел", "кузов", "бюджет")
-        if not any(h in rest for h in car_hints):
-            return True
+    if len(t) <= 40:
+        for g in _GREETINGS:
+            if t.startswith(g):
+                rest = t[len(g):].strip()
+                return not any(h in rest for h in _GREETING_CAR_HINTS)
     return False
 
 
+# Ключевые слова сообщения пользователя. Все проверки ниже идут по тексту " " + text.strip().lower() + " "
+# (пробелы по краям — для слов вида " авто "), вхождения находятся одним проходом (_message_keywords).
+# Упоминание машины: машина, авто, автомобиль, тачка и словоформы
+_CAR_WORDS = ("машин", "автомобил", " тачк", "тачка", " авто ")
+# Распространённые бренды — тоже контекст про авто.
+# «бэха»/«бэху» — разговорное для BMW, без этого «хочу бэху» уходило в small talk;
+# американские бренды — чтобы запросы вроде «шевроле импала» однозначно считались контекстом про авто.
+_CAR_BRAND_WORDS = (
+    " renault ", " рено ", " toyota ", " тойота ", " bmw ", " бмв ", " бэх", " mercedes ", " мерседес ", " мерс ",
+    " kia ", " киа ", " nissan ", " ниссан ", " volkswagen ", " вольксваген ", " фольксваген ", " lada ", " лада ",
+    " hyundai ", " хёндай ", " хендай ", " skoda ", " шкода ", " chevrolet ", " шевроле ", " ford ", " форд ",
+    " dodge ", " додж ",
+)
+# Ключевые слова параметров, которые с высокой вероятностью относятся к машине
+_CAR_PARAM_WORDS = (
+    "родстер", "седан", "хэтчбек", "универсал", "кроссовер", "suv", "кабриолет", "купе", "минивэн", "лифтбек",
+    "пикап", "дизель", "бензин", "гибрид", "электро", "акпп", "мкпп", "автомат", "механика", "вариатор", "робот",
+    "л.с.", "л. с.",
+)
+# Кузов в последнем сообщении (слово целиком, между пробелами) -> каноническое значение
+_LAST_MESSAGE_BODY_TYPES = tuple(
+    (f" {needle} ", canonical)
+    for needle, canonical in (
+        ("хэтчбек", "хэтчбек"), ("хетчбек", "хэтчбек"), ("hatchback", "хэтчбек"),
+        ("седан", "седан"), ("sedan", "седан"),
+        ("универсал", "универсал"), ("wagon", "универсал"),
+        ("внедорожник", "внедорожник"), ("suv", "внедорожник"),
+        ("кроссовер", "кроссовер"), ("crossover", "кроссовер"),
+        ("купе", "купе"), ("coupe", "купе"),
+        ("минивэн", "минивэн"), ("минивен", "минивэн"), ("minivan", "минивэн"),
+        ("лифтбек", "лифтбек"), ("liftback", "лифтбек"),
+        ("кабриолет", "кабриолет"), ("cabriolet", "кабриолет"),
+        ("пикап", "пикап"), ("pickup", "пикап"),
+    )
+)
+# Топливо и коробка (подстрока): первая подходящая группа
+_LAST_MESSAGE_FUEL_TYPES = (
+    (("бензин", "на бензине", "бензиновый"), "бензин"),
+    (("дизель", "на дизеле", "дизельный"), "дизель"),
+    (("гибрид", "гибридный"), "гибрид"),
+    (("электро", "электрический", "электромобиль"), "электро"),
+)
+_LAST_MESSAGE_TRANSMISSIONS = (
+    (("автомат", "автоматическая", "акпп"), "автомат"),
+    (("механика", "механическая", "мкпп", "ручная"), "механика"),
+    (("вариатор", "cvt"), "вариатор"),
+    (("робот", "роботизированная"), "робот"),
+)
+# Марка (слово целиком): побеждает последняя в списке из упомянутых
+_LAST_MESSAGE_BRANDS = (
+    (("renault", "рено"), "Renault"),
+    (("toyota", "тойота"), "Toyota"),
+    (("bmw", "бмв"), "BMW"),
+    (("mercedes", "мерседес", "мерс"), "Mercedes-Benz"),
+    (("lada", "лада"), "Lada"),
+    (("volkswagen", "вольксваген", "фольксваген"), "Volkswagen"),
+    (("hyundai", "хёндай", "хендай"), "Hyundai"),
+    (("kia", "киа"), "Kia"),
+    (("nissan", "ниссан"), "Nissan"),
+    (("skoda", "шкода"), "Škoda"),
+    (("chevrolet", "шевроле"), "Chevrolet"),
+    (("ford", "форд"), "Ford"),
+    (("dodge", "додж"), "Dodge"),
+)
+_CAR_WORDS_SET = frozenset(_CAR_WORDS)
+_CAR_OR_PARAM_WORDS_SET = frozenset(_CAR_WORDS + _CAR_BRAND_WORDS + _CAR_PARAM_WORDS)
+# Кузов и марка — побеждает последнее правило из сработавших, топливо и коробка — первое (как if/elif)
+_LAST_MESSAGE_BODY_GROUPS = KeywordGroups(((needle,), canonical) for needle, canonical in _LAST_MESSAGE_BODY_TYPES)
+_LAST_MESSAGE_FUEL_GROUPS = KeywordGroups(_LAST_MESSAGE_FUEL_TYPES)
+_LAST_MESSAGE_TRANSMISSION_GROUPS = KeywordGroups(_LAST_MESSAGE_TRANSMISSIONS)
+_LAST_MESSAGE_BRAND_GROUPS = KeywordGroups(_LAST_MESSAGE_BRANDS, whole_word=True)
+_MESSAGE_MATCHER = KeywordMatcher(
+    _CAR_OR_PARAM_WORDS_SET.union(
+        *(
+            groups.words
+            for groups in (
+                _LAST_MESSAGE_BODY_GROUPS,
+                _LAST_MESSAGE_FUEL_GROUPS,
+                _LAST_MESSAGE_TRANSMISSION_GROUPS,
+                _LAST_MESSAGE_BRAND_GROUPS,
+            )
+        )
+    )
+)
+# «2000 года», «2015 г.» и т.п. — обычно про год выпуска; объём вида «1.6 л», «2.0 литра»
+_YEAR_MENTION_RE = re.compile(r"\b(19\d{2}|20[0-2]\d)\s*(?:года|г\.?)\b")
+_VOLUME_MENTION_RE = re.compile(r"\b\d\.\d{1,2}\s*(?:л|литр|литра)\b")
+_YEAR_RE = re.compile(r"\b(19\d{2}|20[0-2]\d)\b")
+_VOLUME_RE = re.compile(r"\b(\d{1}\.\d{1,2})\s*(?:л|литр|литра)?")
+_HORSEPOWER_RE = re.compile(r"(\d{2,3})\s*л\.?\s*с")
+
+
+@lru_cache(maxsize=1024)
+def _message_keywords(text: str) -> KeywordHits:
+    """
+    Все ключевые слова сообщения за один проход по " " + text.strip().lower() + " ".
+    Кэш: одно и то же сообщение за ход проверяют несколько раз (small talk, спекулятивный и итоговый merge).
+    """
+    return _MESSAGE_MATCHER.scan(" " + text.strip().lower() + " ")
+
+
 def _message_mentions_car(text: str | None) -> bool:
     """
     Проверяет, есть ли в тексте упоминание машины или синонимов (авто, автомобиль, тачка и т.п.).
@@ -140,13 +227,7 @@ def _message_mentions_car(text: str | None) -> bool:
     """
     if not text or not text.strip():
         return False
-    t = " " + text.strip().lower() + " "
-    # Синонимы и словоформы: машина, авто, автомобиль, тачка
-    if "машин" in t or "автомобил" in t or " тачк" in t or "тачка" in t:
-        return True
-    if " авто " in t:
-        return True
-    return False
+    return _message_keywords(text).has_any(_CAR_WORDS_SET)
 
 
 def _message_mentions_car_or_params(text: str | None) -> bool:
@@ -157,84 +238,10 @@ def _message_mentions_car_or_params(text: str | None) -> bool:
     """
     if not text or not text.strip():
         return False
-    # Явное упоминание машины / авто
-    if _message_mentions_car(text):
-        return True
-    t = " " + text.strip().lower() + " "
-    # Явное упоминание распространённых брендов — тоже считаем контекстом про авто
-    # «бэха»/«бэху» — разговорное для BMW, без этого «хочу бэху» уходило в small talk
-    brand_keywords = [
-        " renault ",
-        " рено ",
-        " toyota ",
-        " тойота ",
-        " bmw ",
-        " бмв ",
-        " бэх",  # бэха, бэху, бэху — сленг для BMW
-        " mercedes ",
-        " мерседес ",
-        " мерс ",
-        " kia ",
-        " киа ",
-        " nissan ",
-        " ниссан ",
-        " volkswagen ",
-        " вольксваген ",
-        " фольксваген ",
-        " lada ",
-        " лада ",
-        " hyundai ",
-        " хёндай ",
-        " хендай ",
-        " skoda ",
-        " шкода ",
-        # Американские бренды, чтобы запросы вроде «шевроле импала»
-        # тоже однозначно считались контекстом про авто.
-        " chevrolet ",
-        " шевроле ",
-        " ford ",
-        " форд ",
-        " dodge ",
-        " додж ",
-    ]
-    if any(b in t for b in brand_keywords):
+    hits = _message_keywords(text)
+    if hits.has_any(_CAR_OR_PARAM_WORDS_SET):
         return True
-
-    # Ключевые слова параметров, которые с высокой вероятностью относятся к машине
-    keywords = [
-        "родстер",
-        "седан",
-        "хэтчбек",
-        "универсал",
-        "кроссовер",
-        "suv",
-        "кабриолет",
-        "купе",
-        "минивэн",
-        "лифтбек",
-        "пикап",
-        "дизель",
-        "бензин",
-        "гибрид",
-        "электро",
-        "акпп",
-        "мкпп",
-        "автомат",
-        "механика",
-        "вариатор",
-        "робот",
-        "л.с.",
-        "л. с.",
-    ]
-    if any(k in t for k in keywords):
-        return True
-    # Паттерн «2000 года», «2015 г.» и т.п. — обычно про год выпуска
-    if re.search(r"\b(19\d{2}|20[0-2]\d)\s*(?:года|г\.?)\b", t):
-        return True
-    # Простой объём двигателя вида «1.6 л», «2.0 литра»
-    if re.search(r"\b\d\.\d{1,2}\s*(?:л|литр|литра)\b", t):
-        return True
-    return False
+    return bool(_YEAR_MENTION_RE.search(hits.text) or _VOLUME_MENTION_RE.search(hits.text))
 
 
 def _clear_year_constraints_if_any_year_mentioned(
@@ -280,79 +287,23 @@ def _override_params_from_last_message(last_user_message: str | None, params: di
     """
     if not last_user_message or not last_user_message.strip() or not isinstance(params, dict):
         return params
-    text = " " + last_user_message.strip().lower() + " "
+    hits = _message_keywords(last_user_message)
+    text = hits.text
 
     # Кузов: последние явные указания «седан», «кроссовер», «универсал» и т.п.
-    body_type_map = [
-        ("хэтчбек", "хэтчбек"),
-        ("хетчбек", "хэтчбек"),
-        ("hatchback", "хэтчбек"),
-        ("седан", "седан"),
-        ("sedan", "седан"),
-        ("универсал", "универсал"),
-        ("wagon", "универсал"),
-        ("внедорожник", "внедорожник"),
-        ("suv", "внедорожник"),
-        ("кроссовер", "кроссовер"),
-        ("crossover", "кроссовер"),
-        ("купе", "купе"),
-        ("coupe", "купе"),
-        ("минивэн", "минивэн"),
-        ("минивен", "минивэн"),
-        ("minivan", "минивэн"),
-        ("лифтбек", "лифтбек"),
-        ("liftback", "лифтбек"),
-        ("кабриолет", "кабриолет"),
-        ("cabriolet", "кабриолет"),
-        ("пикап", "пикап"),
-        ("pickup", "пикап"),
-    ]
-    for needle, canonical in body_type_map:
-        if f" {needle} " in text:
-            params["body_type"] = canonical
-
-    # Топливо: бензин / дизель / гибрид / электро
-    if "бензин" in text or "на бензине" in text or "бензиновый" in text:
-        params["fuel_type"] = "бензин"
-    elif "дизель" in text or "на дизеле" in text or "дизельный" in text:
-        params["fuel_type"] = "дизель"
-    elif "гибрид" in text or "гибридный" in text:
-        params["fuel_type"] = "гибрид"
-    elif "электро" in text or "электрический" in text or "электромобиль" in text:
-        params["fuel_type"] = "электро"
-
-    # Коробка: автомат / механика / вариатор / робот
-    if "автомат" in text or "автоматическая" in text or "акпп" in text:
-        params["transmission"] = "автомат"
-    elif "механика" in text or "механическая" in text or "мкпп" in text or "ручная" in text:
-        params["transmission"] = "механика"
-    elif "вариатор" in text or "cvt" in text:
-        params["transmission"] = "вариатор"
-    elif "робот" in text or "роботизированная" in text:
-        params["transmission"] = "робот"
-
+    # Топливо: бензин / дизель / гибрид / электро; коробка: автомат / механика / вариатор / робот.
     # Марка: даём приоритет последнему явному упоминанию
-    brand_map = [
-        (r"\b(renault|рено)\b", "Renault"),
-        (r"\b(toyota|тойота)\b", "Toyota"),
-        (r"\b(bmw|бмв)\b", "BMW"),
-        (r"\b(mercedes|мерседес|мерс)\b", "Mercedes-Benz"),
-        (r"\b(lada|лада)\b", "Lada"),
-        (r"\b(volkswagen|вольксваген|фольксваген)\b", "Volkswagen"),
-        (r"\b(hyundai|хёндай|хендай)\b", "Hyundai"),
-        (r"\b(kia|киа)\b", "Kia"),
-        (r"\b(nissan|ниссан)\b", "Nissan"),
-        (r"\b(skoda|шкода)\b", "Škoda"),
-        (r"\b(chevrolet|шевроле)\b", "Chevrolet"),
-        (r"\b(ford|форд)\b", "Ford"),
-        (r"\b(dodge|додж)\b", "Dodge"),
-    ]
-    for pattern, canonical in brand_map:
-        if re.search(pattern, text):
-            params["brand"] = canonical
+    for key, value in (
+        ("body_type", _LAST_MESSAGE_BODY_GROUPS.last(hits)),
+        ("fuel_type", _LAST_MESSAGE_FUEL_GROUPS.first(hits)),
+        ("transmission", _LAST_MESSAGE_TRANSMISSION_GROUPS.first(hits)),
+        ("brand", _LAST_MESSAGE_BRAND_GROUPS.last(hits)),
+    ):
+        if value is not None:
+            params[key] = value
 
     # Конкретный год в последнем сообщении
-    year_match = re.search(r"\b(19\d{2}|20[0-2]\d)\b", text)
+    year_match = _YEAR_RE.search(text)
     if year_match:
         year_val = year_match.group(1)
         params["year"] = year_val
@@ -361,45 +312,17 @@ def _override_params_from_last_message(last_user_message: str | None, params: di
         params.pop("year_max", None)
 
     # Объём двигателя и мощность — если явно указаны в последнем сообщении
-    vol_match = re.search(r"\b(\d{1}\.\d{1,2})\s*(?:л|литр|литра)?", text)
+    vol_match = _VOLUME_RE.search(text)
     if vol_match:
         params["engine_volume"] = vol_match.group(1)
 
-    hp_match = re.search(r"(\d{2,3})\s*л\.?\s*с", text)
+    hp_match = _HORSEPOWER_RE.search(text)
     if hp_match:
         params["horsepower"] = hp_match.group(1)
 
     return params
 
 
-def _car_to_metadata(car) -> dict:
-    """Сериализует Car в dict для сохранения в extra_metadata (формат как у CarResult)."""
-    country = getattr(car, "country", None) or None
-    description = getattr(car, "description", None)
-    if not country and description:
-        country = _extract_country_from_description(description)
-    return {
-        "id": car.id,
-        "mark_name": getattr(car, "mark_name", None) or "",
-        "model_name": getattr(car, "model_name", None) or "",
-        "year": getattr(car, "year", None),
-        "price_rub": float(car.price_rub) if getattr(car, "price_rub", None) is not None else None,
-        "body_type": getattr(car, "body_type", None),
-        "fuel_type": getattr(car, "fuel_type", None),
-        "engine_volume": float(car.engine_volume) if getattr(car, "engine_volume", None) is not None else None,
-        "horsepower": getattr(car, "horsepower", None),
-        "modification": getattr(car, "modification", None),
-        "transmission": getattr(car, "transmission", None),
-        "country": country,
-        "images": list(car.images) if getattr(car, "images", None) else [],
-        "description": description,
-        "brand_id": getattr(car, "brand_id", None),
-        "model_id": getattr(car, "model_id", None),
-        "generation_id": getattr(car, "generation_id", None),
-        "modification_id": getattr(car, "modification_id", None),
-    }
-
-
 def _prioritize_aston_for_bond_query(
     last_user_message: str,
     cars: list,
@@ -417,7 +340,7 @@ def _prioritize_aston_for_bond_query(
     aston = []
     others = []
     for c in cars:
-        if isinstance(c, Car) and getattr(c, "mark_name", "") == "Aston Martin":
+        if getattr(c, "mark_name", "") == "Aston Martin":
             aston.append(c)
         else:
             others.append(c)
@@ -560,157 +483,66 @@ def create_session(db: Session, user_id: int) -> Session:
     return session
 
 
-def add_message(
-    db: Session,
-    session_id: UUID,
-    user_id: int,
-    content: str,
-) -> tuple[ChatMessage, list[dict], bool]:
-    """
-    Сохраняет сообщение пользователя. Логика:
-    (1) По запросу пользователя выполняется векторный поиск — получаем топ-10 наиболее подходящих машин.
-    (2) LLM извлекает параметры из диалога и при нехватке информации задаёт уточняющие вопросы.
-    (3) Поиск/выбор машины ведётся только среди этих 10 кандидатов: фильтрация по параметрам + LLM выбирает лучшие.
-    (4) SQL-поиск по всей БД не используется — только векторный поиск и выбор из топ-10.
-    Возвращает (assistant_message, merged_params_dict, ready_for_search, search_results).
-    """
-    session = db.query(Session).filter(Session.id == session_id, Session.user_id == user_id).first()
-    if not session:
-        raise ValueError("session_not_found")
-
-    # Сохраняем сообщение пользователя
-    max_order = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.session_id == session_id)
-        .count()
-    )
-    user_msg = ChatMessage(
-        session_id=session_id,
-        role="user",
-        content=content,
-        sequence_order=max_order + 1,
-    )
-    db.add(user_msg)
-    db.commit()
-    db.refresh(user_msg)
+# Допустимые типы параметров в накопленных extracted_params сессии.
+# year_min / year_max приходят только из fallback-парсера (относительные ограничения по году).
+ALLOWED_PARAM_TYPES = (
+    "brand",
+    "model",
+    "body_type",
+    "year",
+    "year_min",
+    "year_max",
+    "modification",
+    "transmission",
+    "fuel_type",
+    "engine_volume",
+    "horsepower",
+)
 
-    # Заголовок диалога из первого сообщения пользователя
-    if max_order == 0 and getattr(session, "title", None) is None:
-        title = (content or "").strip()
-        if len(title) > 60:
-            title = title[:57] + "..."
-        if title:
-            session.title = title
-            db.commit()
-
-    # История для LLM
-    history = (
-        db.query(ChatMessage)
-        .filter(ChatMessage.session_id == session_id)
-        .order_by(ChatMessage.sequence_order)
-        .limit(20)
-        .all()
-    )
-    messages = [
-        {"role": "user" if m.role == "user" else "assistant", "content": m.content}
-        for m in history
-    ]
+_GREETING_REPLY_FALLBACK = (
+    "Привет! Я Моторчик Тёма. Давай подберём тебе машину. "
+    "Расскажи, пожалуйста, какую примерно ищешь — марку, тип кузова или для каких задач?"
+)
+_NO_CAR_REPLY_FALLBACK = (
+    "Спасибо за обращение! Это Моторчик Тёма, консультант по подбору авто. "
+    "Если захочешь, помогу с выбором — расскажи, какую марку, тип кузова или бюджет рассматриваешь."
+)
 
-    # Последнее пользовательское сообщение — для отдельной обработки «привет» без контекста
-    last_user_msg = ""
+_FUEL_IN_TRANSMISSION = (
+    ("бензин", "бензин"), ("на бензине", "бензин"), ("бензиновый", "бензин"),
+    ("дизель", "дизель"), ("на дизеле", "дизель"), ("дизельный", "дизель"),
+    ("гибрид", "гибрид"), ("гибридный", "гибрид"),
+    ("электро", "электро"), ("электрический", "электро"),
+)
+
+_REFUSAL_RE = re.compile(
+    r"я не могу обсуждать эту тему|я не могу помочь с этим|это нарушает правила",
+    flags=re.IGNORECASE,
+)
+_ASSISTANT_GREETING_RE = re.compile(
+    r"Здравствуйте!\s*Меня зовут Моторчик Тёма[^.]*\.\s*",
+    flags=re.IGNORECASE | re.DOTALL,
+)
+
+
+def _last_user_message(messages: list[dict]) -> str:
     for m in reversed(messages):
         if m.get("role") == "user":
-            last_user_msg = (m.get("content") or "").strip()
-            break
+            return (m.get("content") or "").strip()
+    return ""
 
-    # Если пользователь просто поздоровался («привет» и т.п.) —
-    # всегда отвечаем вежливым small talk без поиска и списка машин.
-    # Двойная проверка: строгая _is_greeting_only и мягкая _looks_like_greeting_only.
-    if _is_greeting_only(last_user_msg) or _looks_like_greeting_only(last_user_msg):
-        try:
-            response_text = deepseek_service.generate_response_small_talk(messages)
-        except Exception as e:
-            logger.exception("generate_response_small_talk (greeting only) failed: %s", e)
-            response_text = (
-                "Привет! Я Моторчик Тёма. Давай подберём тебе машину. "
-                "Расскажи, пожалуйста, какую примерно ищешь — марку, тип кузова или для каких задач?"
-            )
-        assistant_msg = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=response_text,
-            sequence_order=max_order + 2,
-            extra_metadata={"search_results": []},
-        )
-        db.add(assistant_msg)
-        session.message_count = max_order + 2
-        db.commit()
-        db.refresh(assistant_msg)
-        db.refresh(session)
-        return assistant_msg, session.extracted_params or {}, False, []
-
-    # Если в ПОСЛЕДНЕМ сообщении пользователя нет упоминания машины или её параметров —
-    # считаем такое сообщение small talk без поиска и без карточек.
-    # Ветка подбора авто включается ТОЛЬКО если именно последнее сообщение явно про авто/параметры.
-    is_about_car = _message_mentions_car_or_params(last_user_msg)
-
-    if not is_about_car:
-        try:
-            response_text = deepseek_service.generate_response_small_talk(messages)
-        except Exception as e:  # noqa: BLE001
-            logger.exception("generate_response_small_talk (no car context) failed: %s", e)
-            response_text = (
-                "Спасибо за обращение! Это Моторчик Тёма, консультант по подбору авто. "
-                "Если захочешь, помогу с выбором — расскажи, какую марку, тип кузова или бюджет рассматриваешь."
-            )
-        assistant_msg = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=response_text,
-            sequence_order=max_order + 2,
-            extra_metadata={"search_results": []},
-        )
-        db.add(assistant_msg)
-        session.message_count = max_order + 2
-        db.commit()
-        db.refresh(assistant_msg)
-        db.refresh(session)
-        return assistant_msg, session.extracted_params or {}, False, []
-
-    # При каждом сообщении, которое связано с подбором авто (и не является только приветствием), —
-    # сценарий поиска: извлечение параметров, векторный поиск, ответ с результатами.
-    try:
-        body_type_reference = get_body_type_reference(db)
-    except Exception as e:
-        logger.exception("get_body_type_reference failed: %s", e)
-        body_type_reference = []
-    try:
-        extracted_params = deepseek_service.extract_params(
-            messages,
-            current_params=session.extracted_params or {},
-            body_type_reference=body_type_reference,
-        )
-    except Exception as e:
-        logger.exception("deepseek extract_params failed: %s", e)
-        extracted_params = []
-
-    # Мержим: уже собранные + что вернул LLM + резервное извлечение по ключевым словам (если LLM что-то пропустил)
-    # Дополнительно поддерживаем относительные ограничения по году (year_min, year_max),
-    # которые приходят только из fallback-парсера.
-    allowed_types = (
-        "brand",
-        "model",
-        "body_type",
-        "year",
-        "year_min",
-        "year_max",
-        "modification",
-        "transmission",
-        "fuel_type",
-        "engine_volume",
-        "horsepower",
-    )
-    merged = dict(session.extracted_params or {})
+
+def _merge_params(
+    current_params: dict | None,
+    extracted_params: list[dict],
+    fallback: dict,
+    last_user_msg: str,
+) -> dict:
+    """
+    Мержим: уже собранные + что вернул LLM + резервное извлечение по ключевым словам (если LLM что-то пропустил),
+    затем исправления и приоритет последнего сообщения.
+    """
+    merged = dict(current_params or {})
     for p in extracted_params:
         t = p.get("type")
         val = (p.get("value") or "").strip()
@@ -719,16 +551,14 @@ def add_message(
         # LLM иногда возвращает "mark" вместо "brand" — считаем одним и тем же
         if t == "mark":
             t = "brand"
-        if t in allowed_types:
+        if t in ALLOWED_PARAM_TYPES:
             merged[t] = val
     # Резерв: по ключевым словам из всех сообщений пользователя (топливо, коробка, год, объём, мощность, кузов).
     # Отсюда может появиться body_type=хэтчбек/седан и т.д., если пользователь написал «хэтчбек»/«седан»,
     # или если в справочнике body_type из БД есть «Хэтчбек 3 дв.» и в тексте есть слово «хэтчбек».
-    user_texts = [m.get("content") or "" for m in messages if m.get("role") == "user"]
-    fallback = deepseek_service.extract_params_fallback(user_texts, body_type_reference)
     fallback_added: list[str] = []
     for key, value in fallback.items():
-        if key in allowed_types and value and (not merged.get(key) or not str(merged.get(key)).strip()):
+        if key in ALLOWED_PARAM_TYPES and value and (not merged.get(key) or not str(merged.get(key)).strip()):
             merged[key] = value
             fallback_added.append(f"{key}={value}")
             logger.info("extract_params_fallback: added %s=%s (LLM не вернул)", key, value)
@@ -740,14 +570,8 @@ def add_message(
             merged,
         )
     # Исправление: если LLM записал топливо в transmission — переносим в fuel_type и чистим transmission
-    _fuel_to_type = (
-        ("бензин", "бензин"), ("на бензине", "бензин"), ("бензиновый", "бензин"),
-        ("дизель", "дизель"), ("на дизеле", "дизель"), ("дизельный", "дизель"),
-        ("гибрид", "гибрид"), ("гибридный", "гибрид"),
-        ("электро", "электро"), ("электрический", "электро"),
-    )
     tr_val = (merged.get("transmission") or "").strip().lower()
-    for fuel_phrase, fuel_norm in _fuel_to_type:
+    for fuel_phrase, fuel_norm in _FUEL_IN_TRANSMISSION:
         if fuel_phrase in tr_val or tr_val == fuel_phrase:
             if not merged.get("fuel_type") or not str(merged.get("fuel_type")).strip():
                 merged["fuel_type"] = fuel_norm
@@ -760,13 +584,17 @@ def add_message(
     # Приоритет последнего сообщения: если пользователь сначала сказал «рено», потом «бмв» —
     # перезаписываем brand (и то же для body_type, fuel_type, transmission, year, engine_volume, horsepower).
     # Для model/modification перезапись обеспечивается промптом LLM («последнее значение по типу») и порядком в merge.
-    merged = _override_params_from_last_message(last_user_msg, merged)
+    return _override_params_from_last_message(last_user_msg, merged)
 
-    # Снимок параметров на момент этого сообщения (для админки):
-    # один объект на каждый тип параметра, с финальным значением после merge/fallback/override.
+
+def _params_snapshot(merged: dict, extracted_params: list[dict], fallback: dict) -> list[dict]:
+    """
+    Снимок параметров на момент сообщения (для админки):
+    один объект на каждый тип параметра, с финальным значением после merge/fallback/override.
+    """
     llm_types = {p.get("type") for p in extracted_params if isinstance(p, dict)}
     snapshot_params: list[dict] = []
-    for t in allowed_types:
+    for t in ALLOWED_PARAM_TYPES:
         raw_val = merged.get(t)
         val = (raw_val or "").strip() if raw_val is not None else ""
         if not val:
@@ -784,139 +612,12 @@ def add_message(
         if t in fallback and t not in llm_types:
             conf = 0.9
         snapshot_params.append({"type": t, "value": val, "confidence": conf})
+    return snapshot_params
 
-    # Сохраняем снимок в extra_metadata последнего пользовательского сообщения
-    try:
-        user_msg.extra_metadata = {
-            "extracted_params": snapshot_params,
-            "extracted_params_raw": extracted_params,
-        }
-        db.commit()
-        db.refresh(user_msg)
-    except Exception as e:  # noqa: BLE001
-        logger.exception(
-            "failed to store extracted_params snapshot in user_msg.extra_metadata: %s",
-            e,
-        )
-
-    session.extracted_params = merged
-    session.parameters_count = sum(1 for v in merged.values() if v and str(v).strip())
-    # На этом этапе ready_for_search оцениваем только по количеству параметров.
-    # После выполнения поиска ниже мы дополнительно учтём факт наличия результатов.
-    ready_for_search = session.parameters_count >= MIN_PARAMS_FOR_SEARCH
-
-    # Последнее сообщение пользователя — для формирования запроса к векторному поиску
-    last_user_msg = ""
-    for m in reversed(messages):
-        if m.get("role") == "user":
-            last_user_msg = (m.get("content") or "").strip()
-            break
 
-    # Страховка: если последнее сообщение — только приветствие, не делаем поиск (на случай сбоя проверки выше)
-    if _is_greeting_only(last_user_msg):
-        try:
-            response_text = deepseek_service.generate_response_small_talk(messages)
-        except Exception as e:
-            logger.exception("generate_response_small_talk (greeting safety) failed: %s", e)
-            response_text = (
-                "Привет! Я Моторчик Тёма. Давай подберём тебе машину. "
-                "Расскажи, пожалуйста, какую примерно ищешь — марку, тип кузова или для каких задач?"
-            )
-        assistant_msg = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=response_text,
-            sequence_order=max_order + 2,
-            extra_metadata={"search_results": []},
-        )
-        db.add(assistant_msg)
-        session.message_count = max_order + 2
-        db.commit()
-        db.refresh(assistant_msg)
-        db.refresh(session)
-        return assistant_msg, session.extracted_params or {}, False, []
-
-    # Страховка: если последнее сообщение — только приветствие, не делаем поиск (на случай продолжения диалога с уже накопленными параметрами)
-    if _is_greeting_only(last_user_msg):
-        try:
-            response_text = deepseek_service.generate_response_small_talk(messages)
-        except Exception as e:
-            logger.exception("generate_response_small_talk (greeting safety) failed: %s", e)
-            response_text = "Привет! Давай подберём тебе машину. Расскажи, пожалуйста, какую примерно ищешь — марку, тип кузова или для каких задач?"
-        assistant_msg = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=response_text,
-            sequence_order=max_order + 2,
-            extra_metadata={"search_results": []},
-        )
-        db.add(assistant_msg)
-        session.message_count = max_order + 2
-        db.commit()
-        db.refresh(assistant_msg)
-        db.refresh(session)
-        return assistant_msg, session.extracted_params or {}, False, []
-
-    # Векторный поиск и SQL‑фильтрация при любом упоминании машины:
-    # используем гибридное ранжирование; векторный и SQL-поиск запускаем параллельно.
-    search_results: list[Car] = []
-    query_text = compose_search_query(merged, last_user_msg)
-    if not query_text or not query_text.strip():
-        query_text = (last_user_msg or "автомобиль").strip() or "автомобиль"
-
-    has_params = session.parameters_count > 0
-    semantic_results: list = []
-    sql_cars: list = []
-
-    def _run_vector_search() -> list:
-        session_local = SessionLocal()
-        try:
-            return vector_search_cars_with_scores(
-                session_local, query_text, limit=CHAT_VECTOR_SEARCH_LIMIT
-            )
-        finally:
-            session_local.close()
-
-    def _run_sql_search() -> list:
-        session_local = SessionLocal()
-        try:
-            return sql_search_cars(session_local, merged)
-        finally:
-            session_local.close()
-
-    if query_text:
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            future_vec = executor.submit(_run_vector_search)
-            future_sql = executor.submit(_run_sql_search) if has_params else None
-            try:
-                semantic_results = future_vec.result()
-            except Exception as e:  # noqa: BLE001
-                logger.exception("vector_search_cars_with_scores failed: %s", e)
-            if future_sql:
-                try:
-                    sql_cars = future_sql.result()
-                except Exception as e:  # noqa: BLE001
-                    logger.exception("sql_search_cars failed: %s", e)
-
-    if semantic_results:
-        logger.info(
-            "chat vector search: query=%r, candidates=%d",
-            query_text[:100],
-            len(semantic_results),
-        )
-    else:
-        logger.warning(
-            "chat vector search: 0 кандидатов (query=%r). Проверьте: YANDEX_FOLDER_ID/YANDEX_API_KEY, наличие embedding у машин в БД.",
-            query_text[:80],
-        )
-
-    if not sql_cars and has_params:
-        logger.warning(
-            "chat sql_search: 0 машин по параметрам merged=%s. Проверьте данные в таблице cars.",
-            merged,
-        )
-
-    ranked_results: list[tuple[Car, float]] = []
+def _rank_search_results(semantic_results: list, sql_cars: list, merged: dict) -> list[CarCard]:
+    """Гибридное ранжирование кандидатов, пост-фильтр по году и фоллбек на топ векторного поиска."""
+    ranked_results: list[tuple[CarCard, float]] = []
     if semantic_results or sql_cars:
         try:
             ranked_results = hybrid_rank(semantic_results, sql_cars, merged)
@@ -969,9 +670,7 @@ def add_message(
 
     # Фоллбек: если ни одна машина не прошла порог score >= 0.6,
     # но векторный поиск вернул кандидатов, показываем топ‑N наиболее близких.
-    no_strict_matches = False
     if not search_results and semantic_results:
-        no_strict_matches = True
         top_n = 5
         logger.info(
             "chat hybrid_rank: ни одного авто с score >= 0.6, "
@@ -980,21 +679,441 @@ def add_message(
             len(semantic_results),
         )
         search_results = [car for car, _score in semantic_results[:top_n]]
+    return search_results
+
+
+def _finalize_response_text(
+    response_text: str,
+    messages: list[dict],
+    search_results: list,
+    first_answer: bool,
+) -> tuple[str, list]:
+    """
+    Постобработка ответа LLM с карточками: уведомление про DB5, отказ модели (карточки убираются),
+    фраза «я подобрал…» в начале ответа (после приветствия — только в первом ответе сессии).
+    Возвращает (текст, search_results).
+    """
+    # Раньше при отсутствии точных совпадений по score к ответу добавлялась фраза
+    # «По вашему запросу точных совпадений не найдено. Вот наиболее близкие варианты:».
+    # По просьбе пользователя мы больше не добавляем этот префикс и оставляем только ответ LLM.
+    # Спец‑логика под запросы про Aston Martin DB5
+    response_text = _maybe_prepend_db5_notice(messages, search_results, response_text)
+
+    # Если модель по какой‑то причине вернула отказ вроде
+    # «Я не могу обсуждать эту тему. Давайте поговорим о чём-нибудь ещё.»,
+    # считаем, что фактически подбор не выполнен: не показываем карточки
+    # и не добавляем фразу «я подобрал для вас...».
+    if _REFUSAL_RE.search(response_text or ""):
+        logger.info("generate_response: detected refusal answer from LLM, clearing search_results")
+        search_results = []
+
+    # Если есть результаты поиска, в ответе всегда должна быть фраза
+    # в духе «я подобрал для вас наиболее подходящие автомобили».
+    # Порядок:
+    # - в первом ответе ассистента сохраняем приветствие (если оно есть),
+    #   а фразу про подбор вставляем ПОСЛЕ приветствия;
+    # - в последующих ответах с результатами убираем повторное представление
+    #   («Здравствуйте! Меня зовут Моторчик Тёма…») и добавляем фразу про подбор в начало.
+    if search_results:
+        prefix_line = "Я подобрал для вас наиболее подходящие автомобили.\n\n"
+        text = response_text or ""
+
+        if first_answer:
+            # Первый ответ ассистента в сессии: оставляем приветствие,
+            # а фразу про подбор вставляем сразу после него.
+            m = _ASSISTANT_GREETING_RE.match(text.strip())
+            if m:
+                greeting = m.group(0).strip()
+                rest = text[text.index(m.group(0)) + len(m.group(0)) :].lstrip()
+                rest = _strip_selection_prefix_from_start(rest)
+                response_text = greeting + "\n\n" + prefix_line + rest
+            else:
+                # Если LLM не начал с приветствия, просто добавляем префикс в начало
+                text = _strip_selection_prefix_from_start(text)
+                response_text = prefix_line + text
+        else:
+            # Не первый ответ: приветствие убираем везде, префикс добавляем в начало
+            text_wo_greeting = _ASSISTANT_GREETING_RE.sub("", text).lstrip()
+            text_wo_greeting = _strip_selection_prefix_from_start(text_wo_greeting)
+            response_text = prefix_line + text_wo_greeting
+        # Страховка от дублей: если модель всё же повторила фразу — оставляем одно вхождение
+        response_text = _dedupe_selection_prefix(response_text)
+    return response_text, search_results
+
+
+@dataclass
+class ChatTurn:
+    """
+    Состояние одного хода чата между этапами: сообщение пользователя → параметры → поиск → ответ LLM → сохранение.
+    Общее для обычного ответа (add_message) и потокового (stream_message_reply).
+    """
+
+    session: Session
+    session_id: UUID
+    user_msg: ChatMessage
+    messages: list[dict]
+    max_order: int
+    last_user_msg: str
+    # Не None — ход без поиска (приветствие / сообщение не про авто); текст — ответ при сбое LLM
+    small_talk_fallback: str | None = None
+    small_talk_reason: str = ""
+    # Не None — ответ из шаблонов без LLM (reply_templates: greeting / thanks / goodbye), текст — в small_talk_fallback
+    template_kind: str | None = None
+    merged: dict = field(default_factory=dict)
+    extracted_params: list[dict] = field(default_factory=list)
+    parameters_count: int = 0
+    ready_for_search: bool = False
+    criteria_fulfilled: bool = False
+    search_results: list = field(default_factory=list)
+    # Результат спекулятивного векторного поиска: (сигнатура запроса, кандидаты) или None
+    speculative: tuple | None = None
+    # Заголовок диалога из первого сообщения пользователя (пишется в finish_message)
+    title: str | None = None
+    # Начало аренды хода (sessions.turn_started_at): finish_message / abort_message снимают только свою
+    claimed_at: datetime | None = None
+    # Окно истории + сводка сессии; дополняется ответом ассистента в finish_message
+    context: conversation_context.ConversationContext | None = None
+
+    @property
+    def is_small_talk(self) -> bool:
+        return self.small_talk_fallback is not None
+
+
+async def _release(db: AsyncSession) -> None:
+    """
+    Завершает читающую транзакцию: соединение возвращается в пул на время LLM / эмбеддингов.
+    Изменений в сессии на этом этапе нет — все записи хода делает finish_message одним коммитом.
+    """
+    if db.in_transaction():
+        await db.commit()
+
+
+async def start_message(
+    db: AsyncSession,
+    session_id: UUID,
+    user_id: int,
+    content: str,
+) -> ChatTurn:
+    """
+    Первый этап хода: захват хода в сессии (номера сообщений + аренда), история для LLM и решение,
+    нужен ли подбор (иначе small talk). Сообщение пользователя сохраняется вместе с ответом в finish_message.
+    ValueError("session_not_found") — сессии нет; ValueError("turn_in_progress") — в сессии уже идёт ход.
+    """
+    # Номера сообщений хода — атомарно из счётчика сессии (без COUNT(*) по chat_messages).
+    # turn_started_at — аренда хода: второй параллельный запрос в ту же сессию (двойная отправка,
+    # вторая вкладка) отклоняется сразу, а не получает тот же sequence_order и не платит за LLM ещё раз.
+    # Аренда снимается в finish_message / abort_message, после сбоя процесса — истекает сама.
+    claimed_at = utcnow()
+    lease_expired = claimed_at - timedelta(seconds=settings.chat_turn_lease_seconds)
+    message_count = (
+        await db.execute(
+            update(Session)
+            .where(
+                Session.id == session_id,
+                Session.user_id == user_id,
+                or_(Session.turn_started_at.is_(None), Session.turn_started_at < lease_expired),
+            )
+            .values(message_count=Session.message_count + 2, turn_started_at=claimed_at)
+            .returning(Session.message_count)
+        )
+    ).scalar_one_or_none()
+    if message_count is None:
+        exists = (
+            await db.execute(select(Session.id).where(Session.id == session_id, Session.user_id == user_id))
+        ).first()
+        await db.rollback()
+        raise ValueError("turn_in_progress" if exists else "session_not_found")
+    max_order = message_count - 2
+
+    session = (await db.execute(select(Session).where(Session.id == session_id))).scalars().one()
+    # История для LLM: последние сообщения + сводка более ранних (из кэша, если сессия не менялась)
+    with metrics.stage("load_history"):
+        context = await conversation_context.aload(db, session, max_order)
+    with metrics.stage("commit"):
+        await db.commit()
+
+    user_msg = ChatMessage(
+        session_id=session_id,
+        role="user",
+        content=content,
+        sequence_order=max_order + 1,
+    )
+    context.append(user_msg.sequence_order, "user", content)
+    messages = context.messages()
+
+    # Заголовок диалога из первого сообщения пользователя
+    title = None
+    if max_order == 0 and getattr(session, "title", None) is None:
+        title = (content or "").strip()
+        if len(title) > 60:
+            title = title[:57] + "..."
+
+    # Последнее пользовательское сообщение — для отдельной обработки «привет» без контекста
+    last_user_msg = _last_user_message(messages)
+    turn = ChatTurn(
+        session=session,
+        session_id=session_id,
+        user_msg=user_msg,
+        messages=messages,
+        max_order=max_order,
+        last_user_msg=last_user_msg,
+        claimed_at=claimed_at,
+        context=context,
+        title=title or None,
+        merged=dict(session.extracted_params or {}),
+        parameters_count=session.parameters_count or 0,
+    )
+
+    with metrics.stage("greeting_detection"):
+        # Сообщение целиком из приветствия / спасибо / до свидания (reply_templates.classify) —
+        # готовый ответ из шаблонов, без вызова LLM.
+        template_kind = (
+            reply_templates.classify(_normalize_for_greeting(last_user_msg)) if settings.chat_template_replies else None
+        )
+        if template_kind is not None:
+            turn.template_kind = template_kind
+            turn.small_talk_fallback = reply_templates.reply(template_kind, max_order // 2)
+            turn.small_talk_reason = f"template {template_kind}"
+        # Если пользователь просто поздоровался («привет» и т.п.) —
+        # всегда отвечаем вежливым small talk без поиска и списка машин.
+        # Двойная проверка: строгая _is_greeting_only и мягкая _looks_like_greeting_only.
+        elif _is_greeting_only(last_user_msg) or _looks_like_greeting_only(last_user_msg):
+            turn.small_talk_fallback = _GREETING_REPLY_FALLBACK
+            turn.small_talk_reason = "greeting only"
+        # Если в ПОСЛЕДНЕМ сообщении пользователя нет упоминания машины или её параметров —
+        # считаем такое сообщение small talk без поиска и без карточек.
+        # Ветка подбора авто включается ТОЛЬКО если именно последнее сообщение явно про авто/параметры.
+        elif not _message_mentions_car_or_params(last_user_msg):
+            turn.small_talk_fallback = _NO_CAR_REPLY_FALLBACK
+            turn.small_talk_reason = "no car context"
+    return turn
+
+
+def _search_query(merged: dict, last_user_msg: str) -> str:
+    query_text = compose_search_query(merged, last_user_msg)
+    if not query_text or not query_text.strip():
+        query_text = (last_user_msg or "автомобиль").strip() or "автомобиль"
+    return query_text
+
+
+def _search_filters(merged: dict) -> dict | None:
+    """Фильтры векторного поиска: накопленные параметры, если хоть один заполнен."""
+    if any(v and str(v).strip() for v in merged.values()):
+        return merged
+    return None
+
+
+async def _vector_search(
+    db: AsyncSession, query_text: str, filters: dict | None, stage: str = "vector_search"
+) -> list:
+    """Эмбеддинг запроса (async) + векторный поиск с фильтрами на соединении сессии."""
+    with metrics.stage("embedding"):
+        embedding = await aget_query_embedding(query_text)
+    if embedding is None:
+        return []
+    try:
+        with metrics.stage(stage):
+            return await db.run_sync(
+                lambda s: vector_search_cars_with_scores(
+                    s,
+                    query_text,
+                    limit=CHAT_VECTOR_SEARCH_LIMIT,
+                    filters=filters,
+                    embedding=embedding,
+                )
+            )
+    except Exception as e:  # noqa: BLE001
+        logger.exception("vector_search_cars_with_scores failed: %s", e)
+        await db.rollback()
+        return []
+
+
+class SpeculationStats:
+    """Счётчики спекулятивного поиска: hits — результат переиспользован, misses — параметры LLM изменили запрос."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_speculation = SpeculationStats()
+
+
+def speculation_stats() -> dict:
+    """Как часто спекулятивный векторный поиск совпал с итоговым (см. _extract_turn_params)."""
+    return _speculation.stats()
+
+
+metrics.register_gauges("carmatch_speculative_search", "Спекулятивный векторный поиск в чате", speculation_stats)
+
+
+async def _extract_turn_params(db: AsyncSession, turn: ChatTurn) -> None:
+    """Извлечение параметров (LLM + резервный парсер), накопление в turn.merged и снимок для админки."""
+    current_params = dict(turn.merged)
+    try:
+        with metrics.stage("body_type_reference"):
+            reference = await reference_cache.aget(db)
+        body_type_reference = list(reference.body_types)
+        brand_reference = list(reference.brand_names)
+    except Exception as e:
+        logger.exception("reference_cache failed: %s", e)
+        reference = None
+        body_type_reference = []
+        brand_reference = []
+
+    user_texts = [m.get("content") or "" for m in turn.messages if m.get("role") == "user"]
+    fallback = deepseek_service.extract_params_fallback(user_texts, body_type_reference, brand_reference)
+
+    # Спекуляция: пока LLM извлекает параметры (секунды), ищем по тому, что известно без него —
+    # прошлые параметры сессии + резервный парсер по ключевым словам. LLM в сессию не ходит,
+    # поэтому поиск на том же соединении идёт параллельно; дожидаемся его до следующей операции с БД.
+    speculative_task = None
+    if settings.chat_speculative_search:
+        guess = _merge_params(current_params, [], fallback, turn.last_user_msg)
+        if reference is not None:
+            guess = reference.canonicalize(guess)
+        guess_query = _search_query(guess, turn.last_user_msg)
+        guess_filters = _search_filters(guess)
+
+        async def _speculate() -> list:
+            try:
+                return await _vector_search(db, guess_query, guess_filters, stage="speculative_vector_search")
+            finally:
+                # Поиск быстрее LLM: соединение не держим, пока ждём извлечение параметров
+                await _release(db)
+
+        speculative_task = asyncio.create_task(_speculate())
+    else:
+        await _release(db)
+    try:
+        try:
+            with metrics.stage("extract_params"):
+                extracted_params = await deepseek_service.aextract_params(
+                    turn.messages,
+                    current_params=current_params,
+                    body_type_reference=body_type_reference,
+                )
+        except Exception as e:
+            logger.exception("deepseek extract_params failed: %s", e)
+            extracted_params = []
+    finally:
+        if speculative_task is not None:
+            try:
+                results = await speculative_task
+            except Exception as e:  # noqa: BLE001
+                logger.exception("speculative vector search failed: %s", e)
+            else:
+                turn.speculative = (vector_search_signature(guess_query, guess_filters), results)
+
+    merged = _merge_params(current_params, extracted_params, fallback, turn.last_user_msg)
+    # Опечатки и кириллица в марке/модели («тоёта камри») → имена справочника для фильтров поиска
+    if reference is not None:
+        merged = reference.canonicalize(merged)
+
+    # Сохраняем снимок в extra_metadata последнего пользовательского сообщения
+    turn.user_msg.extra_metadata = {
+        "extracted_params": _params_snapshot(merged, extracted_params, fallback),
+        "extracted_params_raw": extracted_params,
+    }
+    parameters_count = sum(1 for v in merged.values() if v and str(v).strip())
+    # В сессию параметры пишет finish_message. Если упадёт сам запрос поиска, его транзакция откатывается
+    # (db.rollback) и объекты сессии протухают, а ленивая загрузка в async недоступна — поэтому дальше
+    # только поля ChatTurn.
+    turn.merged = merged
+    turn.extracted_params = extracted_params
+    turn.parameters_count = parameters_count
+    # На этом этапе ready_for_search оцениваем только по количеству параметров.
+    # После выполнения поиска дополнительно учитывается факт наличия результатов.
+    turn.ready_for_search = parameters_count >= MIN_PARAMS_FOR_SEARCH
+
+
+async def _search_turn(db: AsyncSession, turn: ChatTurn) -> None:
+    """Поиск кандидатов по накопленным параметрам: векторный с фильтрами, SQL-фоллбек, ранжирование."""
+    merged = turn.merged
+    last_user_msg = turn.last_user_msg
+    # Векторный поиск при любом упоминании машины: параметры из merged (марка, кузов, топливо,
+    # год, мощность) уходят в WHERE того же запроса к pgvector — один round trip возвращает
+    # до CHAT_VECTOR_SEARCH_LIMIT ближайших машин, уже удовлетворяющих фильтрам.
+    # SQL-поиск по параметрам — только фоллбек (нет эмбеддингов / недоступен Yandex API).
+    query_text = _search_query(merged, last_user_msg)
+
+    has_params = turn.parameters_count > 0
+    filters = merged if has_params else None
+    sql_cars: list = []
+
+    # Спекулятивный поиск (запущен параллельно с извлечением параметров) переиспользуем,
+    # если итоговые параметры дали тот же текст запроса и те же фильтры
+    speculative_hit = False
+    if turn.speculative is not None:
+        signature, speculative_results = turn.speculative
+        speculative_hit = signature == vector_search_signature(query_text, filters)
+        _speculation.record(speculative_hit)
+        logger.info(
+            "chat speculative search: %s (hit_rate=%.2f)",
+            "hit" if speculative_hit else "miss",
+            _speculation.stats()["hit_rate"],
+        )
+    if speculative_hit:
+        semantic_results = speculative_results
+    else:
+        semantic_results = await _vector_search(db, query_text, filters)
+
+    if not semantic_results and has_params:
+        try:
+            with metrics.stage("sql_search"):
+                sql_cars = await db.run_sync(lambda s: sql_search_cards(s, merged))
+        except Exception as e:  # noqa: BLE001
+            logger.exception("sql_search_cards failed: %s", e)
+            await db.rollback()
+
+    if semantic_results:
+        logger.info(
+            "chat vector search: query=%r, candidates=%d",
+            query_text[:100],
+            len(semantic_results),
+        )
+    else:
+        logger.warning(
+            "chat vector search: 0 кандидатов (query=%r). Проверьте: YANDEX_FOLDER_ID/YANDEX_API_KEY, наличие embedding у машин в БД.",
+            query_text[:80],
+        )
+
+    if not semantic_results and not sql_cars and has_params:
+        logger.warning(
+            "chat sql_search: 0 машин по параметрам merged=%s. Проверьте данные в таблице cars.",
+            merged,
+        )
+
+    with metrics.stage("hybrid_rank"):
+        search_results = _rank_search_results(semantic_results, sql_cars, merged)
 
     # Фоллбек: векторный и SQL по параметрам ничего не вернули — показываем хотя бы несколько машин из каталога.
     if not search_results:
         try:
-            session_fallback = SessionLocal()
-            try:
-                fallback_cars = sql_search_cars(session_fallback, {}, limit=10)
-                if fallback_cars:
-                    search_results = fallback_cars
-                    logger.info(
-                        "chat fallback: вектор/SQL по параметрам вернули 0, показываем %d машин из каталога (без фильтров)",
-                        len(fallback_cars),
-                    )
-            finally:
-                session_fallback.close()
+            with metrics.stage("catalog_fallback"):
+                fallback_cars = await db.run_sync(lambda s: sql_search_cards(s, {}, limit=10))
+            if fallback_cars:
+                search_results = fallback_cars
+                logger.info(
+                    "chat fallback: вектор/SQL по параметрам вернули 0, показываем %d машин из каталога (без фильтров)",
+                    len(fallback_cars),
+                )
         except Exception as e:  # noqa: BLE001
             logger.exception("chat fallback sql_search(пустые параметры) failed: %s", e)
 
@@ -1002,120 +1121,236 @@ def add_message(
     # поднимаем Aston Martin в начало списка кандидатов.
     search_results = _prioritize_aston_for_bond_query(last_user_msg, search_results)
 
-    # Финальная страховка: если последнее сообщение — приветствие, никогда не показываем список машин
-    if _is_greeting_only(last_user_msg) or _looks_like_greeting_only(last_user_msg):
-        try:
-            response_text = deepseek_service.generate_response_small_talk(messages)
-        except Exception as e:
-            logger.exception("generate_response_small_talk (final gate) failed: %s", e)
-            response_text = (
-                "Привет! Я Моторчик Тёма. Давай подберём тебе машину. "
-                "Расскажи, какую ищешь — марку, тип кузова или для каких задач?"
-            )
-        search_results = []
-        search_results_serialized = []
-    else:
-        # Если есть результаты — считаем, что пользователь уже «готов к показу карточек»,
-        # даже если параметров пока меньше трёх.
-        if search_results:
-            ready_for_search = True
+    # Если есть результаты — считаем, что пользователь уже «готов к показу карточек»,
+    # даже если параметров пока меньше трёх.
+    if search_results:
+        turn.ready_for_search = True
+
+    # Критериев достаточно: есть кандидаты ИЛИ набрано 3+ параметров (для ответа «ничего не найдено»)
+    turn.criteria_fulfilled = bool(search_results) or turn.parameters_count >= MIN_PARAMS_FOR_SEARCH
+    turn.search_results = search_results
+    await _release(db)
+
+
+async def prepare_reply(db: AsyncSession, turn: ChatTurn) -> None:
+    """Второй этап хода (только для подбора): параметры и кандидаты. Для small talk ничего не делает."""
+    if turn.is_small_talk:
+        return
+    await _extract_turn_params(db, turn)
+    await _search_turn(db, turn)
+
+
+def _store_context(turn: ChatTurn, assistant_msg: ChatMessage) -> dict:
+    """Ответ ассистента — в контекст сессии; возвращает поля сводки для UPDATE sessions (если изменилась)."""
+    if turn.context is None:
+        return {}
+    turn.context.append(
+        assistant_msg.sequence_order,
+        "assistant",
+        assistant_msg.content,
+        assistant_msg.extra_metadata.get("search_results"),
+    )
+    return conversation_context.store(turn.context)
 
-        # Критериев достаточно: есть кандидаты ИЛИ набрано 3+ параметров (для ответа «ничего не найдено»)
-        criteria_fulfilled = bool(search_results) or session.parameters_count >= MIN_PARAMS_FOR_SEARCH
-        try:
-            response_text = deepseek_service.generate_response(
-                messages,
-                params=merged,
-                search_results=search_results,
-                criteria_fulfilled=criteria_fulfilled,
-                parameters_count=session.parameters_count,
-            )
-        except Exception as e:
-            logger.exception("deepseek generate_response failed: %s", e)
-            response_text = "Не удалось обработать запрос. Попробуйте ещё раз."
-        # Раньше при отсутствии точных совпадений по score к ответу добавлялась фраза
-        # «По вашему запросу точных совпадений не найдено. Вот наиболее близкие варианты:».
-        # По просьбе пользователя мы больше не добавляем этот префикс и оставляем только ответ LLM.
-        # Спец‑логика под запросы про Aston Martin DB5
-        response_text = _maybe_prepend_db5_notice(messages, search_results, response_text)
-
-        # Если модель по какой‑то причине вернула отказ вроде
-        # «Я не могу обсуждать эту тему. Давайте поговорим о чём-нибудь ещё.»,
-        # считаем, что фактически подбор не выполнен: не показываем карточки
-        # и не добавляем фразу «я подобрал для вас...».
-        refusal_pattern = re.compile(
-            r"я не могу обсуждать эту тему|я не могу помочь с этим|это нарушает правила",
-            flags=re.IGNORECASE,
+
+async def finish_message(
+    db: AsyncSession,
+    turn: ChatTurn,
+    response_text: str,
+) -> tuple[ChatMessage, dict, bool, list[CarCard]]:
+    """
+    Последний этап хода — пишущая транзакция: сообщения пользователя и ассистента (с карточками
+    в extra_metadata), search_parameters, параметры сессии и снятие аренды хода одним коммитом.
+    Возвращает (assistant_message, merged_params_dict, ready_for_search, search_results).
+    """
+    if turn.is_small_talk:
+        search_results: list = []
+        ready_for_search = False
+    else:
+        response_text, search_results = _finalize_response_text(
+            response_text, turn.messages, turn.search_results, first_answer=turn.max_order == 0
         )
-        is_refusal = bool(refusal_pattern.search(response_text or ""))
-        if is_refusal:
-            logger.info("generate_response: detected refusal answer from LLM, clearing search_results")
-            search_results = []
-
-        # Если есть результаты поиска, в ответе всегда должна быть фраза
-        # в духе «я подобрал для вас наиболее подходящие автомобили».
-        # Порядок:
-        # - в первом ответе ассистента сохраняем приветствие (если оно есть),
-        #   а фразу про подбор вставляем ПОСЛЕ приветствия;
-        # - в последующих ответах с результатами убираем повторное представление
-        #   («Здравствуйте! Меня зовут Моторчик Тёма…») и добавляем фразу про подбор в начало.
-        if search_results:
-            prefix_line = "Я подобрал для вас наиболее подходящие автомобили.\n\n"
-            text = response_text or ""
-
-            # Регулярка для приветствия ассистента
-            greeting_pattern = re.compile(
-                r"Здравствуйте!\s*Меня зовут Моторчик Тёма[^.]*\.\s*",
-                flags=re.IGNORECASE | re.DOTALL,
-            )
+        turn.search_results = search_results
+        ready_for_search = turn.ready_for_search
 
-            if max_order == 0:
-                # Первый ответ ассистента в сессии: оставляем приветствие,
-                # а фразу про подбор вставляем сразу после него.
-                m = greeting_pattern.match(text.strip())
-                if m:
-                    greeting = m.group(0).strip()
-                    rest = text[text.index(m.group(0)) + len(m.group(0)) :].lstrip()
-                    rest = _strip_selection_prefix_from_start(rest)
-                    response_text = greeting + "\n\n" + prefix_line + rest
-                else:
-                    # Если LLM не начал с приветствия, просто добавляем префикс в начало
-                    text = _strip_selection_prefix_from_start(text)
-                    response_text = prefix_line + text
-            else:
-                # Не первый ответ: приветствие убираем везде, префикс добавляем в начало
-                text_wo_greeting = greeting_pattern.sub("", text).lstrip()
-                text_wo_greeting = _strip_selection_prefix_from_start(text_wo_greeting)
-                response_text = prefix_line + text_wo_greeting
-            # Страховка от дублей: если модель всё же повторила фразу — оставляем одно вхождение
-            response_text = _dedupe_selection_prefix(response_text)
-        search_results_serialized = [_car_to_metadata(c) for c in search_results]
-
-        # Сохраняем ответ ассистента (с карточками в extra_metadata)
     assistant_msg = ChatMessage(
-        session_id=session_id,
+        session_id=turn.session_id,
         role="assistant",
         content=response_text,
-        sequence_order=max_order + 2,
-        extra_metadata={"search_results": search_results_serialized},
+        sequence_order=turn.max_order + 2,
+        extra_metadata={"search_results": [c.to_dict() for c in search_results]},
     )
-    db.add(assistant_msg)
-    db.commit()
-    db.refresh(assistant_msg)
-
-    # Записываем search_parameters
-    for p in extracted_params:
-        sp = SearchParameter(
-            session_id=session_id,
-            param_type=p.get("type", ""),
-            param_value=p.get("value", ""),
-            confidence=p.get("confidence"),
-            message_id=assistant_msg.id,
+    session_values: dict = {"turn_started_at": _released_lease(turn)}
+    if turn.title:
+        session_values["title"] = turn.title
+    if not turn.is_small_talk:
+        session_values["extracted_params"] = turn.merged
+        session_values["parameters_count"] = turn.parameters_count
+    session_values.update(_store_context(turn, assistant_msg))
+
+    with metrics.stage("commit"):
+        db.add_all([turn.user_msg, assistant_msg])
+        # id ответа нужен search_parameters.message_id; оба сообщения — одним INSERT ... RETURNING
+        await db.flush()
+        db.add_all(
+            [
+                SearchParameter(
+                    session_id=turn.session_id,
+                    param_type=p.get("type", ""),
+                    param_value=p.get("value", ""),
+                    confidence=p.get("confidence"),
+                    message_id=assistant_msg.id,
+                )
+                for p in turn.extracted_params
+            ]
         )
-        db.add(sp)
-    session.message_count = max_order + 2
-    db.commit()
-    db.refresh(session)
+        await db.execute(update(Session).where(Session.id == turn.session_id).values(**session_values))
+        await db.commit()
 
     # Возвращаем накопленные параметры (merged), а не только что извлечённые из последнего сообщения
-    return assistant_msg, merged, ready_for_search, search_results
+    return assistant_msg, turn.merged, ready_for_search, search_results
+
+
+def _released_lease(turn: ChatTurn):
+    """turn_started_at после хода: NULL, если аренда ещё наша (не истекла и не перехвачена другим ходом)."""
+    return case((Session.turn_started_at == turn.claimed_at, None), else_=Session.turn_started_at)
+
+
+async def abort_message(db: AsyncSession, turn: ChatTurn) -> None:
+    """
+    Ход не завершён (ошибка, клиент закрыл поток): откат несохранённого, возврат номеров сообщений
+    и снятие аренды, если сессию с тех пор никто не продолжил. Ошибки только логируются.
+    """
+    try:
+        await db.rollback()
+        await db.execute(
+            update(Session)
+            .where(
+                Session.id == turn.session_id,
+                Session.turn_started_at == turn.claimed_at,
+                Session.message_count == turn.max_order + 2,
+            )
+            .values(message_count=turn.max_order, turn_started_at=None)
+        )
+        await db.commit()
+    except Exception as e:  # noqa: BLE001
+        logger.exception("abort_message failed: %s", e)
+    conversation_context.discard(turn.session_id)
+
+
+_REPLY_FAILED_TEXT = "Не удалось обработать запрос. Попробуйте ещё раз."
+
+
+async def _reply(db: AsyncSession, turn: ChatTurn) -> tuple[ChatMessage, dict, bool, list[CarCard]]:
+    """Подбор и ответ LLM для add_message (без потока), затем сохранение хода."""
+    await prepare_reply(db, turn)
+    if turn.template_kind is not None:
+        reply_templates.record(turn.template_kind)
+        response_text = turn.small_talk_fallback
+    elif turn.is_small_talk:
+        try:
+            with metrics.stage("small_talk"):
+                response_text = await deepseek_service.agenerate_response_small_talk(turn.messages)
+        except Exception as e:  # noqa: BLE001
+            logger.exception("generate_response_small_talk (%s) failed: %s", turn.small_talk_reason, e)
+            response_text = turn.small_talk_fallback
+    else:
+        try:
+            with metrics.stage("generate_response"):
+                response_text = await deepseek_service.agenerate_response(
+                    turn.messages,
+                    params=turn.merged,
+                    search_results=turn.search_results,
+                    criteria_fulfilled=turn.criteria_fulfilled,
+                    parameters_count=turn.parameters_count,
+                )
+        except Exception as e:
+            logger.exception("deepseek generate_response failed: %s", e)
+            response_text = _REPLY_FAILED_TEXT
+    return await finish_message(db, turn, response_text)
+
+
+async def add_message(
+    db: AsyncSession,
+    session_id: UUID,
+    user_id: int,
+    content: str,
+) -> tuple[ChatMessage, dict, bool, list[CarCard]]:
+    """
+    Сохраняет сообщение пользователя и формирует ответ ассистента. Логика:
+    (1) Приветствие / сообщение не про авто — small talk без поиска.
+    (2) LLM извлекает параметры из диалога (+ резервный парсер по ключевым словам), параметры копятся в сессии.
+    (3) Векторный поиск с фильтрами по параметрам (pgvector), SQL-поиск — фоллбек; гибридное ранжирование.
+    (4) LLM отвечает по найденным кандидатам или задаёт уточняющие вопросы.
+    Полностью асинхронный: ожидание LLM / эмбеддингов / БД не занимает поток, синхронный код поиска
+    выполняется на соединении сессии через db.run_sync.
+    Возвращает (assistant_message, merged_params_dict, ready_for_search, search_results).
+    """
+    with metrics.stage("turn"):
+        turn = await start_message(db, session_id, user_id, content)
+        try:
+            return await _reply(db, turn)
+        except BaseException:
+            # Отмена (таймаут, остановка воркера) — без shield откат сам получит CancelledError на первом await
+            with anyio.CancelScope(shield=True):
+                await abort_message(db, turn)
+            raise
+
+
+async def _template_stream(text: str):
+    """Шаблонный ответ в формате потока LLM: один фрагмент и итоговый текст."""
+    yield "token", text
+    yield "done", text
+
+
+async def stream_message_reply(db: AsyncSession, turn: ChatTurn):
+    """
+    Потоковый ответ на сообщение пользователя, принятое start_message (сохраняется вместе с ответом).
+    Async-генератор событий (имя, данные) в порядке:
+      ("params", (merged_params, ready_for_search)) — сразу после извлечения параметров;
+      ("cards", search_results) — кандидаты гибридного поиска (список CarCard);
+      ("token", фрагмент) — текст LLM по мере генерации (черновик);
+      ("done", (assistant_message, merged_params, ready_for_search, search_results)) — после сохранения.
+    Итоговый текст и карточки — в "done" (постобработка может изменить черновик и убрать карточки при отказе модели).
+    """
+    if turn.is_small_talk:
+        yield "params", (turn.merged, False)
+        yield "cards", []
+        if turn.template_kind is not None:
+            reply_templates.record(turn.template_kind)
+            stream = _template_stream(turn.small_talk_fallback)
+        else:
+            stream = deepseek_service.astream_response_small_talk(turn.messages)
+        failed_text = turn.small_talk_fallback
+    else:
+        await _extract_turn_params(db, turn)
+        yield "params", (turn.merged, turn.ready_for_search)
+        await _search_turn(db, turn)
+        yield "cards", turn.search_results
+        stream = deepseek_service.astream_response(
+            turn.messages,
+            params=turn.merged,
+            search_results=turn.search_results,
+            criteria_fulfilled=turn.criteria_fulfilled,
+            parameters_count=turn.parameters_count,
+        )
+        failed_text = _REPLY_FAILED_TEXT
+
+    response_text = ""
+    stream_started = time.perf_counter()
+    first_token = True
+    try:
+        async for kind, value in stream:
+            if kind == "token":
+                if first_token:
+                    # Время до первого токена — то, ради чего поток: сколько пользователь ждёт начала ответа
+                    metrics.observe_stage("stream_first_token", time.perf_counter() - stream_started)
+                    first_token = False
+                yield "token", value
+            else:
+                response_text = value
+    except Exception as e:  # noqa: BLE001
+        logger.exception("stream response failed: %s", e)
+    if not response_text:
+        response_text = failed_text
+    yield "done", await finish_message(db, turn, response_text)
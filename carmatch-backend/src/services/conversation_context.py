@@ -0,0 +1,198 @@
+"""
+Контекст диалога для LLM: скользящее окно последних сообщений + сжатая сводка более ранних.
+
+Раньше на каждый ход история читалась из chat_messages заново — ORDER BY sequence_order LIMIT 20,
+то есть первые 20 сообщений сессии, а не последние: в длинном диалоге LLM видела устаревший контекст.
+Теперь:
+  - в промпт идут последние CHAT_CONTEXT_MESSAGES сообщений (окно);
+  - вытесненные из окна сообщения сворачиваются в сводку — по строке на сообщение: реплика
+    пользователя (обрезанная) или что показал ассистент (марки/модели карточек); сводка ограничена
+    CHAT_CONTEXT_SUMMARY_CHARS, старые строки отбрасываются. Размер промпта не растёт с длиной сессии;
+  - контекст сессии хранится в LRU процесса и дополняется на каждом сообщении (append) — при попадании
+    история из БД не читается. Ключ актуальности — sequence_order последнего сообщения: если сессию
+    продолжил другой воркер, контекст собирается заново из БД;
+  - сводка сохраняется в sessions.context_summary / context_summary_upto (миграция 19), поэтому после
+    рестарта или на другом воркере перечитываются только сообщения после сводки.
+
+Сводка передаётся первым сообщением с role="system" (deepseek дописывает её в системный промпт).
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, List
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.models import ChatMessage, Session
+from src.services import metrics
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Краткое содержание начала диалога (эти сообщения в истории ниже не показаны):"
+# Длина реплики пользователя / ответа без карточек в строке сводки
+_USER_LINE_CHARS = 200
+_ASSISTANT_LINE_CHARS = 150
+# Сколько машин из карточек ответа упоминать в строке сводки
+_SUMMARY_CARS = 5
+
+
+@dataclass
+class _Entry:
+    order: int
+    role: str
+    content: str
+    # Для ответа ассистента с карточками — «Toyota Camry 2020, Kia Rio» (для строки сводки)
+    cars: str = ""
+
+
+def _cars_line(search_results) -> str:
+    names = []
+    for item in (search_results or [])[:_SUMMARY_CARS]:
+        get = item.get if isinstance(item, dict) else lambda k, _i=item: getattr(_i, k, None)
+        name = " ".join(str(v) for v in (get("mark_name"), get("model_name"), get("year")) if v)
+        if name:
+            names.append(name)
+    return ", ".join(names)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[: limit - 1].rstrip() + "…"
+
+
+@dataclass
+class ConversationContext:
+    session_id: UUID
+    window_size: int
+    summary_chars: int
+    window: Deque[_Entry] = field(default_factory=deque)
+    summary: List[str] = field(default_factory=list)
+    # sequence_order последнего сообщения, свёрнутого в сводку, и последнего добавленного
+    summary_upto: int = 0
+    last_order: int = 0
+    # summary_upto, уже сохранённый в sessions.context_summary_upto
+    persisted_upto: int = 0
+
+    def append(self, order: int, role: str, content: str, search_results=None) -> None:
+        """Добавляет сообщение в окно; вытесненные сообщения сворачиваются в сводку."""
+        self.window.append(_Entry(order, role, content or "", _cars_line(search_results)))
+        self.last_order = max(self.last_order, order)
+        while len(self.window) > max(1, self.window_size):
+            self._fold(self.window.popleft())
+
+    def _fold(self, entry: _Entry) -> None:
+        self.summary_upto = max(self.summary_upto, entry.order)
+        if self.summary_chars <= 0:
+            return
+        if entry.role == "user":
+            line = f"- Пользователь: «{_clip(entry.content, _USER_LINE_CHARS)}»"
+        elif entry.cars:
+            line = f"- Ассистент показал: {entry.cars}"
+        else:
+            line = f"- Ассистент: {_clip(entry.content, _ASSISTANT_LINE_CHARS)}"
+        self.summary.append(line)
+        # Старые строки отбрасываются; «…» в начале — признак, что сводка сокращена
+        while len(self.summary) > 2 and sum(len(s) + 1 for s in self.summary) > self.summary_chars:
+            del self.summary[1 if self.summary[0] == "…" else 0]
+            if self.summary[0] != "…":
+                self.summary.insert(0, "…")
+
+    @property
+    def summary_text(self) -> str:
+        return "\n".join(self.summary)
+
+    def messages(self) -> list[dict]:
+        """История для LLM: сводка (role=system, если есть) + окно последних сообщений."""
+        result: list[dict] = []
+        if self.summary:
+            result.append({"role": "system", "content": SUMMARY_HEADER + "\n" + self.summary_text})
+        result.extend(
+            {"role": "user" if e.role == "user" else "assistant", "content": e.content} for e in self.window
+        )
+        return result
+
+
+# session_id → ConversationContext
+_cache: TTLCache[UUID, ConversationContext] = TTLCache(
+    settings.chat_context_cache_size, settings.chat_context_cache_ttl_seconds
+)
+
+
+def _new_context(session: Session) -> ConversationContext:
+    summary_upto = int(getattr(session, "context_summary_upto", None) or 0)
+    summary_text = getattr(session, "context_summary", None) or ""
+    return ConversationContext(
+        session_id=session.id,
+        window_size=settings.chat_context_messages,
+        summary_chars=settings.chat_context_summary_chars,
+        summary=[line for line in summary_text.split("\n") if line] if summary_upto else [],
+        summary_upto=summary_upto,
+        last_order=summary_upto,
+        persisted_upto=summary_upto,
+    )
+
+
+async def aload(db: AsyncSession, session: Session, upto: int) -> ConversationContext:
+    """
+    Контекст сессии по сообщение с sequence_order = upto включительно.
+    Из кэша, если он заканчивается на upto; иначе — сводка из sessions + сообщения после неё из БД.
+    """
+    ctx = _cache.get(session.id)
+    if ctx is not None and ctx.last_order == upto:
+        _cache.record("hits")
+        return ctx
+    _cache.record("misses")
+    ctx = _new_context(session)
+    rows = (
+        await db.execute(
+            select(ChatMessage.sequence_order, ChatMessage.role, ChatMessage.content, ChatMessage.extra_metadata)
+            .where(
+                ChatMessage.session_id == session.id,
+                ChatMessage.sequence_order > ctx.summary_upto,
+                ChatMessage.sequence_order <= upto,
+            )
+            .order_by(ChatMessage.sequence_order)
+        )
+    ).all()
+    for order, role, content, extra in rows:
+        cars = extra.get("search_results") if isinstance(extra, dict) else None
+        ctx.append(order, role, content, cars)
+    ctx.last_order = upto
+    _cache.put(ctx.session_id, ctx)
+    return ctx
+
+
+def store(ctx: ConversationContext) -> dict:
+    """
+    Кэширует контекст. Возвращает поля sessions со сводкой, если она изменилась с последнего
+    сохранения ({} — писать нечего); их пишет тот же коммит, что и сообщения хода.
+    """
+    _cache.put(ctx.session_id, ctx)
+    if ctx.persisted_upto == ctx.summary_upto:
+        return {}
+    ctx.persisted_upto = ctx.summary_upto
+    return {"context_summary": ctx.summary_text or None, "context_summary_upto": ctx.summary_upto}
+
+
+def discard(session_id: UUID) -> None:
+    _cache.discard(session_id)
+
+
+def clear() -> None:
+    """Сброс кэша (тесты)."""
+    _cache.clear()
+
+
+def stats() -> dict:
+    """Счётчики кэша контекста: hits — история не читалась из БД, misses — сборка из БД, size."""
+    return _cache.stats()
+
+
+metrics.register_gauges("carmatch_context_cache", "Кэш контекста диалога", stats)
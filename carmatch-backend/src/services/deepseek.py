@@ -7,15 +7,16 @@ import logging
 import re
 from typing import Any, Dict, List
 from datetime import datetime
+from functools import lru_cache
 
-import httpx
-from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 
 logger = logging.getLogger(__name__)
 
 from src.config import settings
+from src.services import http_clients, metrics
 from src.services import yandex_llm as yandex_llm_service
+from src.utils.keyword_matcher import KeywordGroups, KeywordMatcher
 
 MIN_PARAMS_FOR_SEARCH = 3
 EXTRACTED_PARAM_TYPES = {
@@ -50,6 +51,22 @@ def _with_style_instructions(base_prompt: str) -> str:
     """Добавляет единые стилевые инструкции ассистента к системному промпту."""
     return f"{ASSISTANT_STYLE_INSTRUCTIONS}\n\n{base_prompt}"
 
+
+def _api_messages(system_content: str, messages: list[dict]) -> list[dict[str, str]]:
+    """
+    Системный промпт + история диалога для LLM. Сообщения role="system" в истории — сводка начала
+    длинного диалога (src/services/conversation_context.py): дописываются в конец системного промпта.
+    """
+    notes = [m.get("content") or "" for m in messages if m.get("role") == "system" and m.get("content")]
+    if notes:
+        system_content = system_content + "\n\n" + "\n\n".join(notes)
+    api_messages = [{"role": "system", "content": system_content}]
+    for m in messages:
+        role = m.get("role", "user")
+        if role in ("user", "assistant"):
+            api_messages.append({"role": role, "content": m.get("content") or ""})
+    return api_messages
+
 PROMPT_EXTRACT_PARAMS = """Ты — система извлечения параметров подбора автомобиля. Язык диалога — русский.
 
 ИСТОЧНИК ПАРАМЕТРОВ — ТОЛЬКО СООБЩЕНИЯ ПОЛЬЗОВАТЕЛЯ (роль "user"). Сообщения ассистента (роль "assistant") — только для контекста (понять, на какой вопрос отвечает пользователь). Из текста ассистента НИ ОДИН параметр не извлекай. Значения brand, model, body_type, year и т.д. бери исключительно из того, что написал сам пользователь.
@@ -245,9 +262,14 @@ def _call_genapi(messages: List[Dict[str, str]]) -> str:
     if settings.genapi_sync_mode:
         payload["is_sync"] = True
 
-    with httpx.Client(timeout=LLM_REQUEST_TIMEOUT) as client:
-        resp = client.post(settings.genapi_generate_url, headers=headers, json=payload)
-    resp.raise_for_status()
+    with metrics.provider_call(metrics.GENAPI, "completion"):
+        resp = http_clients.get_client(http_clients.GENAPI).post(
+            settings.genapi_generate_url,
+            headers=headers,
+            json=payload,
+            timeout=http_clients.request_timeout(LLM_REQUEST_TIMEOUT),
+        )
+        resp.raise_for_status()
 
     try:
         data = resp.json()
@@ -259,6 +281,33 @@ def _call_genapi(messages: List[Dict[str, str]]) -> str:
     return text
 
 
+def _to_giga_chat(messages: List[Dict[str, str]]) -> Chat | None:
+    giga_messages: list[Messages] = []
+    for m in messages:
+        role = m.get("role", "user")
+        content = (m.get("content") or "").strip()
+        if not content:
+            continue
+        if role == "system":
+            msg_role = MessagesRole.SYSTEM
+        elif role == "assistant":
+            msg_role = MessagesRole.ASSISTANT
+        else:
+            msg_role = MessagesRole.USER
+        giga_messages.append(Messages(role=msg_role, content=content))
+    if not giga_messages:
+        return None
+    return Chat(messages=giga_messages)
+
+
+def _giga_response_text(response) -> str:
+    if not getattr(response, "choices", None):
+        return ""
+    message = response.choices[0].message
+    content = getattr(message, "content", "") or ""
+    return content.strip()
+
+
 def _llm_chat(messages: List[Dict[str, str]], max_tokens: int | None = None) -> str:
     """
     Унифицированный вызов LLM: при наличии Yandex (YANDEX_FOLDER_ID + YANDEX_API_KEY)
@@ -285,40 +334,144 @@ def _llm_chat(messages: List[Dict[str, str]], max_tokens: int | None = None) ->
                      "или GigaChat (gigachat_credentials)")
         return ""
 
-    giga_messages: list[Messages] = []
-    for m in messages:
-        role = m.get("role", "user")
-        content = (m.get("content") or "").strip()
-        if not content:
-            continue
-        if role == "system":
-            msg_role = MessagesRole.SYSTEM
-        elif role == "assistant":
-            msg_role = MessagesRole.ASSISTANT
-        else:
-            msg_role = MessagesRole.USER
-        giga_messages.append(Messages(role=msg_role, content=content))
-
-    if not giga_messages:
+    chat = _to_giga_chat(messages)
+    if chat is None:
         return ""
 
     try:
-        client = GigaChat(
-            credentials=settings.gigachat_credentials,
-            verify_ssl_certs=getattr(settings, "gigachat_verify_ssl_certs", True),
-        )
-        chat = Chat(messages=giga_messages)
-        with client:
-            response = client.chat(chat)
+        with metrics.provider_call(metrics.GIGACHAT, "completion"):
+            response = http_clients.get_gigachat().chat(chat)
     except Exception as e:  # noqa: BLE001
         logger.exception("GigaChat call failed: %s", e)
         return ""
+    return _giga_response_text(response)
 
-    if not getattr(response, "choices", None):
+
+async def _allm_chat(messages: List[Dict[str, str]], max_tokens: int | None = None) -> str:
+    """Асинхронный вариант _llm_chat (YandexGPT → fallback GigaChat) для async-пайплайна чата."""
+    if not messages:
         return ""
-    message = response.choices[0].message
-    content = getattr(message, "content", "") or ""
-    return content.strip()
+
+    if settings.yandex_folder_id and settings.yandex_api_key:
+        try:
+            max_tok = max_tokens if max_tokens is not None else 2000
+            text = await yandex_llm_service.acompletion(messages, max_tokens=max_tok)
+            if text:
+                return text
+        except Exception as e:  # noqa: BLE001
+            logger.exception("Yandex LLM failed, fallback to GigaChat: %s", e)
+
+    if not settings.gigachat_credentials:
+        logger.error("LLM не настроен: задайте Yandex (yandex_folder_id, yandex_api_key) "
+                     "или GigaChat (gigachat_credentials)")
+        return ""
+
+    chat = _to_giga_chat(messages)
+    if chat is None:
+        return ""
+
+    try:
+        with metrics.provider_call(metrics.GIGACHAT, "completion"):
+            response = await http_clients.get_gigachat().achat(chat)
+    except Exception as e:  # noqa: BLE001
+        logger.exception("GigaChat call failed: %s", e)
+        return ""
+    return _giga_response_text(response)
+
+
+async def _astream_llm_chat(messages: List[Dict[str, str]], max_tokens: int | None = None):
+    """
+    Потоковый вариант _allm_chat: async-генератор фрагментов текста (YandexGPT stream → fallback GigaChat astream).
+    Переключение на GigaChat возможно только пока не отдан ни один фрагмент.
+    """
+    if not messages:
+        return
+
+    if settings.yandex_folder_id and settings.yandex_api_key:
+        streamed = False
+        try:
+            max_tok = max_tokens if max_tokens is not None else 2000
+            async for delta in yandex_llm_service.astream_completion(messages, max_tokens=max_tok):
+                streamed = True
+                yield delta
+        except Exception as e:  # noqa: BLE001
+            if streamed:
+                raise
+            logger.exception("Yandex LLM stream failed, fallback to GigaChat: %s", e)
+        if streamed:
+            return
+
+    if not settings.gigachat_credentials:
+        logger.error("LLM не настроен: задайте Yandex (yandex_folder_id, yandex_api_key) "
+                     "или GigaChat (gigachat_credentials)")
+        return
+
+    chat = _to_giga_chat(messages)
+    if chat is None:
+        return
+
+    with metrics.provider_call(metrics.GIGACHAT, "stream"):
+        async for chunk in http_clients.get_gigachat().astream(chat):
+            if not getattr(chunk, "choices", None):
+                continue
+            delta = getattr(chunk.choices[0].delta, "content", "") or ""
+            if delta:
+                yield delta
+
+
+# Функции подбора (small talk, извлечение параметров, ответ) написаны как генераторы шагов:
+# генератор собирает промпт, отдаёт yield (api_messages, max_tokens) и получает обратно текст LLM
+# (или исключение вызова — в точке yield), затем разбирает ответ и возвращает результат.
+# Один и тот же код выполняется синхронно (_run_llm_steps) и асинхронно (_arun_llm_steps).
+
+def _run_llm_steps(steps):
+    try:
+        request = next(steps)
+        while True:
+            try:
+                text = _llm_chat(*request)
+            except Exception as e:  # noqa: BLE001
+                request = steps.throw(e)
+            else:
+                request = steps.send(text)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _arun_llm_steps(steps):
+    try:
+        request = next(steps)
+        while True:
+            try:
+                text = await _allm_chat(*request)
+            except Exception as e:  # noqa: BLE001
+                request = steps.throw(e)
+            else:
+                request = steps.send(text)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _astream_llm_steps(steps):
+    """
+    Как _arun_llm_steps, но текст LLM отдаётся по мере генерации: yield ("token", фрагмент),
+    последним — ("text", итоговый ответ после постобработки в генераторе шагов).
+    Фрагменты — черновик ответа; итоговый текст может отличаться (иконки, добавленный вопрос и т.п.).
+    """
+    try:
+        request = next(steps)
+        while True:
+            parts: list[str] = []
+            try:
+                async for delta in _astream_llm_chat(*request):
+                    parts.append(delta)
+                    yield "token", delta
+            except Exception as e:  # noqa: BLE001
+                request = steps.throw(e)
+            else:
+                request = steps.send("".join(parts).strip())
+    except StopIteration as stop:
+        yield "text", stop.value
 
 
 def classify_message_about_car(messages: list[dict[str, str]]) -> bool:
@@ -348,11 +501,7 @@ def classify_message_about_car(messages: list[dict[str, str]]) -> bool:
     return "ДА" in answer or "YES" in answer
 
 
-def generate_response_small_talk(messages: list[dict[str, str]]) -> str:
-    """
-    Ответ, когда сообщение не про автомобиль: вежливо пообщаться и задать уточняющие вопросы про авто.
-    Векторный поиск не выполняется.
-    """
+def _small_talk_steps(messages: list[dict[str, str]]):
     # Если пользователь явно спрашивает, как зовут ассистента — отвечаем детерминированно,
     # не полагаясь на LLM, чтобы не появлялись шаблоны вроде «[Ваше имя]».
     last_user = ""
@@ -372,14 +521,9 @@ def generate_response_small_talk(messages: list[dict[str, str]]) -> str:
         )
 
     system_content = _with_style_instructions(PROMPT_SMALL_TALK_NO_CAR)
-    api_messages = [{"role": "system", "content": system_content}]
-    for m in messages:
-        role = m.get("role", "user")
-        content = m.get("content") or ""
-        if role in ("user", "assistant"):
-            api_messages.append({"role": role, "content": content})
+    api_messages = _api_messages(system_content, messages)
     try:
-        text = _llm_chat(api_messages)
+        text = yield api_messages, None
     except Exception as e:  # noqa: BLE001
         logger.exception("generate_response_small_talk failed: %s", e)
         return "Спасибо за обращение! Подскажите, какой автомобиль вы ищете — марку, тип кузова или цель использования?"
@@ -390,6 +534,24 @@ def generate_response_small_talk(messages: list[dict[str, str]]) -> str:
     return text
 
 
+def generate_response_small_talk(messages: list[dict[str, str]]) -> str:
+    """
+    Ответ, когда сообщение не про автомобиль: вежливо пообщаться и задать уточняющие вопросы про авто.
+    Векторный поиск не выполняется.
+    """
+    return _run_llm_steps(_small_talk_steps(messages))
+
+
+async def agenerate_response_small_talk(messages: list[dict[str, str]]) -> str:
+    """Асинхронный вариант generate_response_small_talk."""
+    return await _arun_llm_steps(_small_talk_steps(messages))
+
+
+def astream_response_small_talk(messages: list[dict[str, str]]):
+    """Потоковый вариант generate_response_small_talk: события ("token", фрагмент) и в конце ("text", ответ)."""
+    return _astream_llm_steps(_small_talk_steps(messages))
+
+
 def chat_complete(messages: list[dict[str, str]]) -> str:
     """Свободный чат: отправляет историю в DeepSeek и возвращает ответ ассистента."""
     if not messages:
@@ -444,39 +606,107 @@ def _extract_json_block(text: str) -> str | None:
 
 
 # Ключевые слова типа кузова для fallback, когда справочник из БД пустой (напр. на Render нет cars)
-# Регулярка -> каноническое значение для search_cars (car_reference_service._body_type_filter_condition)
+# Слова (целиком) -> каноническое значение для search_cars (car_reference_service._body_type_filter_condition)
 FALLBACK_BODY_TYPE_KEYWORDS = [
-    (r"\b(хэтчбек|хетчбек|hatchback)\b", "хэтчбек"),
-    (r"\b(седан|sedan)\b", "седан"),
-    (r"\b(универсал|wagon)\b", "универсал"),
-    (r"\b(внедорожник|suv)\b", "внедорожник"),
-    (r"\b(кроссовер|crossover)\b", "кроссовер"),
-    (r"\b(купе|coupe)\b", "купе"),
-    (r"\b(минивэн|минивен|minivan)\b", "минивэн"),
-    (r"\b(лифтбек|liftback)\b", "лифтбек"),
-    (r"\b(кабриолет|cabriolet)\b", "кабриолет"),
-    (r"\b(пикап|pickup)\b", "пикап"),
+    (("хэтчбек", "хетчбек", "hatchback"), "хэтчбек"),
+    (("седан", "sedan"), "седан"),
+    (("универсал", "wagon"), "универсал"),
+    (("внедорожник", "suv"), "внедорожник"),
+    (("кроссовер", "crossover"), "кроссовер"),
+    (("купе", "coupe"), "купе"),
+    (("минивэн", "минивен", "minivan"), "минивэн"),
+    (("лифтбек", "liftback"), "лифтбек"),
+    (("кабриолет", "cabriolet"), "кабриолет"),
+    (("пикап", "pickup"), "пикап"),
 ]
 
 # Ключевые слова для извлечения марки в fallback (как пользователь мог написать -> имя в БД)
 FALLBACK_BRAND_KEYWORDS = [
-    (r"\b(renault|рено)\b", "Renault"),
-    (r"\b(toyota|тойота)\b", "Toyota"),
-    (r"\b(bmw|бмв|бэха|бэху)\b", "BMW"),
-    (r"\b(mercedes|мерседес|мерс)\b", "Mercedes-Benz"),
-    (r"\b(lada|лада)\b", "Lada"),
-    (r"\b(volkswagen|вольксваген|фольксваген|ву)\b", "Volkswagen"),
-    (r"\b(hyundai|хёндай|хендай)\b", "Hyundai"),
-    (r"\b(kia|киа)\b", "Kia"),
-    (r"\b(nissan|ниссан)\b", "Nissan"),
-    (r"\b(skoda|шкода)\b", "Škoda"),
+    (("renault", "рено"), "Renault"),
+    (("toyota", "тойота"), "Toyota"),
+    (("bmw", "бмв", "бэха", "бэху"), "BMW"),
+    (("mercedes", "мерседес", "мерс"), "Mercedes-Benz"),
+    (("lada", "лада"), "Lada"),
+    (("volkswagen", "вольксваген", "фольксваген", "ву"), "Volkswagen"),
+    (("hyundai", "хёндай", "хендай"), "Hyundai"),
+    (("kia", "киа"), "Kia"),
+    (("nissan", "ниссан"), "Nissan"),
+    (("skoda", "шкода"), "Škoda"),
 ]
 
+# Топливо и коробка (слово целиком): первая подходящая группа
+FALLBACK_FUEL_TYPE_KEYWORDS = [
+    (("бензин", "на бензине", "бензиновый"), "бензин"),
+    (("дизель", "на дизеле", "дизельный"), "дизель"),
+    (("гибрид", "гибридный"), "гибрид"),
+    (("электро", "электрический", "электромобиль"), "электро"),
+]
+FALLBACK_TRANSMISSION_KEYWORDS = [
+    (("автомат", "автоматическая", "акпп"), "автомат"),
+    (("механика", "механическая", "мкпп", "ручная"), "механика"),
+    (("вариатор", "cvt"), "вариатор"),
+    (("робот", "роботизированная"), "робот"),
+]
+
+# Все группы — слова целиком (как \b...\b), первая подходящая по порядку; один проход по тексту на все группы
+_FALLBACK_BRAND_GROUPS = KeywordGroups(FALLBACK_BRAND_KEYWORDS, whole_word=True)
+_FALLBACK_FUEL_TYPE_GROUPS = KeywordGroups(FALLBACK_FUEL_TYPE_KEYWORDS, whole_word=True)
+_FALLBACK_TRANSMISSION_GROUPS = KeywordGroups(FALLBACK_TRANSMISSION_KEYWORDS, whole_word=True)
+_FALLBACK_BODY_TYPE_GROUPS = KeywordGroups(FALLBACK_BODY_TYPE_KEYWORDS, whole_word=True)
+_FALLBACK_MATCHER = KeywordMatcher(
+    w
+    for groups in (
+        _FALLBACK_BRAND_GROUPS,
+        _FALLBACK_FUEL_TYPE_GROUPS,
+        _FALLBACK_TRANSMISSION_GROUPS,
+        _FALLBACK_BODY_TYPE_GROUPS,
+    )
+    for w in groups.words
+)
+_FALLBACK_YEAR_RE = re.compile(r"\b(19\d{2}|20[0-2]\d)\b")
+_FALLBACK_NOT_OLDER_RE = re.compile(r"не\s+старше\s+(\d{1,2})\s+лет")
+_FALLBACK_OLDER_RE = re.compile(r"старше\s+(\d{1,2})\s+лет")
+_FALLBACK_NOT_NEWER_YEAR_RE = re.compile(r"не\s+новее\s+(19\d{2}|20[0-2]\d)")
+_FALLBACK_NOT_OLDER_YEAR_RE = re.compile(r"не\s+старше\s+(19\d{2}|20[0-2]\d)")
+_FALLBACK_VOLUME_RE = re.compile(r"\b(\d{1}\.\d{1,2})\s*(?:л|литр|литра)?")
+_FALLBACK_HORSEPOWER_RE = re.compile(r"(\d{2,3})\s*л\.?\s*с", re.IGNORECASE)
+
+
+@lru_cache(maxsize=8)
+def _brand_reference_groups(brand_reference: tuple[str, ...]) -> tuple[KeywordMatcher, KeywordGroups]:
+    """Марки справочника (слово целиком, короче 3 символов — не ищем); справочник меняется редко — кэш по содержимому."""
+    entries = []
+    for name in brand_reference:
+        name_lower = (name or "").strip().lower()
+        if len(name_lower) >= 3:
+            entries.append(((name_lower,), name.strip()))
+    groups = KeywordGroups(entries, whole_word=True)
+    return KeywordMatcher(groups.words), groups
+
+
+@lru_cache(maxsize=8)
+def _body_type_reference_groups(body_type_reference: tuple[str, ...]) -> tuple[KeywordMatcher, KeywordGroups]:
+    """Типы кузова справочника: весь тип или его первое слово от 3 символов (подстрокой)."""
+    entries = []
+    for bt in body_type_reference:
+        if not bt or not bt.strip():
+            continue
+        bt_lower = bt.strip().lower()
+        first_word = bt_lower.split()[0]
+        entries.append(((bt_lower, first_word) if len(first_word) >= 3 else (bt_lower,), bt.strip()))
+    groups = KeywordGroups(entries)
+    return KeywordMatcher(groups.words), groups
+
 
-def extract_params_fallback(user_texts: list[str], body_type_reference: list[str]) -> dict[str, str]:
+def extract_params_fallback(
+    user_texts: list[str],
+    body_type_reference: list[str],
+    brand_reference: list[str] | None = None,
+) -> dict[str, str]:
     """
     Резервное извлечение параметров по ключевым словам из текста сообщений пользователя.
     Используется, когда LLM вернул неполный список. Возвращает dict param_type -> value.
+    brand_reference — марки из справочника (reference_cache): находит марки, которых нет в ключевых словах.
     """
     if not user_texts:
         return {}
@@ -484,38 +714,30 @@ def extract_params_fallback(user_texts: list[str], body_type_reference: list[str
     if not text.strip():
         return {}
     result = {}
-    # Марка — по ключевым словам
-    for pattern, canonical in FALLBACK_BRAND_KEYWORDS:
-        if re.search(pattern, text, re.IGNORECASE):
-            result["brand"] = canonical
-            break
-    # Топливо
-    if re.search(r"\b(бензин|на бензине|бензиновый)\b", text):
-        result["fuel_type"] = "бензин"
-    elif re.search(r"\b(дизель|на дизеле|дизельный)\b", text):
-        result["fuel_type"] = "дизель"
-    elif re.search(r"\b(гибрид|гибридный)\b", text):
-        result["fuel_type"] = "гибрид"
-    elif re.search(r"\b(электро|электрический|электромобиль)\b", text):
-        result["fuel_type"] = "электро"
-    # Коробка
-    if re.search(r"\b(автомат|автоматическая|акпп)\b", text):
-        result["transmission"] = "автомат"
-    elif re.search(r"\b(механика|механическая|мкпп|ручная)\b", text):
-        result["transmission"] = "механика"
-    elif re.search(r"\b(вариатор|cvt)\b", text):
-        result["transmission"] = "вариатор"
-    elif re.search(r"\b(робот|роботизированная)\b", text):
-        result["transmission"] = "робот"
+    hits = _FALLBACK_MATCHER.scan(text)
+    # Марка — по ключевым словам, затем по справочнику
+    brand = _FALLBACK_BRAND_GROUPS.first(hits)
+    if brand is None and brand_reference:
+        matcher, groups = _brand_reference_groups(tuple(brand_reference))
+        brand = groups.first(matcher.scan(text))
+    if brand is not None:
+        result["brand"] = brand
+    # Топливо и коробка
+    fuel_type = _FALLBACK_FUEL_TYPE_GROUPS.first(hits)
+    if fuel_type is not None:
+        result["fuel_type"] = fuel_type
+    transmission = _FALLBACK_TRANSMISSION_GROUPS.first(hits)
+    if transmission is not None:
+        result["transmission"] = transmission
     # Год (конкретное значение, если явно указали)
-    year_match = re.search(r"\b(19\d{2}|20[0-2]\d)\b", text)
+    year_match = _FALLBACK_YEAR_RE.search(text)
     if year_match:
         result["year"] = year_match.group(1)
     # Относительные ограничения по возрасту: «не старше 15 лет», «старше 10 лет» и т.п.
     current_year = datetime.utcnow().year
     # «не старше 15 лет» → машина не старше N лет → год не меньше (current_year - N).
     # Если пользователь менял мнение несколько раз, берём ПОСЛЕДНЕЕ упоминание.
-    not_older_matches = list(re.finditer(r"не\s+старше\s+(\d{1,2})\s+лет", text))
+    not_older_matches = list(_FALLBACK_NOT_OLDER_RE.finditer(text))
     if not_older_matches:
         try:
             years = int(not_older_matches[-1].group(1))
@@ -524,7 +746,7 @@ def extract_params_fallback(user_texts: list[str], body_type_reference: list[str
         except ValueError:
             pass
     # «старше 15 лет» → машина старше N лет → год не больше (current_year - N)
-    older_matches = list(re.finditer(r"старше\s+(\d{1,2})\s+лет", text))
+    older_matches = list(_FALLBACK_OLDER_RE.finditer(text))
     if older_matches:
         try:
             years = int(older_matches[-1].group(1))
@@ -533,41 +755,34 @@ def extract_params_fallback(user_texts: list[str], body_type_reference: list[str
         except ValueError:
             pass
     # «не новее 2015 года» → год выпуска не новее → year_max = 2015
-    not_newer_year_matches = list(re.finditer(r"не\s+новее\s+(19\d{2}|20[0-2]\d)", text))
+    not_newer_year_matches = list(_FALLBACK_NOT_NEWER_YEAR_RE.finditer(text))
     if not_newer_year_matches:
         result["year_max"] = not_newer_year_matches[-1].group(1)
     # «не старше 2015 года» → год не старше → year_min = 2015
-    not_older_year_matches = list(re.finditer(r"не\s+старше\s+(19\d{2}|20[0-2]\d)", text))
+    not_older_year_matches = list(_FALLBACK_NOT_OLDER_YEAR_RE.finditer(text))
     if not_older_year_matches:
         result["year_min"] = not_older_year_matches[-1].group(1)
     # Объём двигателя (1.6, 2.0)
-    vol_match = re.search(r"\b(\d{1}\.\d{1,2})\s*(?:л|литр|литра)?", text)
+    vol_match = _FALLBACK_VOLUME_RE.search(text)
     if vol_match:
         result["engine_volume"] = vol_match.group(1)
     # Мощность (90 л.с., 150 л.с.)
-    hp_match = re.search(r"(\d{2,3})\s*л\.?\s*с", text, re.IGNORECASE)
+    hp_match = _FALLBACK_HORSEPOWER_RE.search(text)
     if hp_match:
         result["horsepower"] = hp_match.group(1)
-    # Тип кузова: сначала по справочнику из БД (если есть записи cars с body_type)
-    for bt in body_type_reference or []:
-        if not bt or not bt.strip():
-            continue
-        bt_lower = bt.strip().lower()
-        if bt_lower in text:
-            result["body_type"] = bt.strip()
-            break
-        # Совпадение по первому слову (хэтчбек, седан, универсал и т.д.)
-        first_word = bt_lower.split()[0] if bt_lower.split() else bt_lower
-        if len(first_word) >= 3 and first_word in text:
-            result["body_type"] = bt.strip()
-            break
+    # Тип кузова: сначала по справочнику из БД (если есть записи cars с body_type) —
+    # весь тип или его первое слово (хэтчбек, седан, универсал и т.д.), первый подходящий по порядку справочника
+    if body_type_reference:
+        matcher, groups = _body_type_reference_groups(tuple(body_type_reference))
+        body_type = groups.first(matcher.scan(text))
+        if body_type is not None:
+            result["body_type"] = body_type
     # Если справочник пустой (напр. на Render нет данных в cars) — распознаём по ключевым словам.
     # search_cars принимает «хэтчбек»/«седан» и т.д. и сам сопоставляет с БД.
     if "body_type" not in result:
-        for keyword, canonical in FALLBACK_BODY_TYPE_KEYWORDS:
-            if re.search(keyword, text):
-                result["body_type"] = canonical
-                break
+        body_type = _FALLBACK_BODY_TYPE_GROUPS.first(hits)
+        if body_type is not None:
+            result["body_type"] = body_type
     return result
 
 
@@ -604,15 +819,11 @@ def _parse_extract_params_response(raw: str) -> list[dict]:
     return extracted
 
 
-def extract_params(
+def _extract_params_steps(
     messages: list[dict[str, str]],
     current_params: dict | None,
     body_type_reference: list[str],
-) -> list[dict]:
-    """
-    Извлечение параметров подбора из истории диалога. Возвращает список
-    [{"type": ..., "value": str, "confidence": float}, ...] — все найденные параметры.
-    """
+):
     if not body_type_reference:
         body_list = "седан, внедорожник 5 дв., хэтчбек (если справочник пуст — используй эти примеры)"
     else:
@@ -636,14 +847,9 @@ def extract_params(
             + ("»" if len(last_user_content) <= 500 else "» (обрезано). ")
             + " Включи в extracted_params только то, что пользователь здесь или в предыдущих своих сообщениях явно написал."
         )
-    api_messages = [{"role": "system", "content": system_content}]
-    for m in messages:
-        role = m.get("role", "user")
-        content = m.get("content") or ""
-        if role in ("user", "assistant"):
-            api_messages.append({"role": role, "content": content})
+    api_messages = _api_messages(system_content, messages)
     try:
-        raw = _llm_chat(api_messages, max_tokens=800)
+        raw = yield api_messages, 800
     except Exception as e:  # noqa: BLE001
         logger.exception("DeepSeek extract_params failed: %s", e)
         return []
@@ -669,6 +875,27 @@ def extract_params(
     return parsed
 
 
+def extract_params(
+    messages: list[dict[str, str]],
+    current_params: dict | None,
+    body_type_reference: list[str],
+) -> list[dict]:
+    """
+    Извлечение параметров подбора из истории диалога. Возвращает список
+    [{"type": ..., "value": str, "confidence": float}, ...] — все найденные параметры.
+    """
+    return _run_llm_steps(_extract_params_steps(messages, current_params, body_type_reference))
+
+
+async def aextract_params(
+    messages: list[dict[str, str]],
+    current_params: dict | None,
+    body_type_reference: list[str],
+) -> list[dict]:
+    """Асинхронный вариант extract_params."""
+    return await _arun_llm_steps(_extract_params_steps(messages, current_params, body_type_reference))
+
+
 def _format_car_for_prompt(car) -> str:
     """Форматирует одну машину для ответа: все поля из БД, только реальные данные."""
     lines: list[str] = []
@@ -887,20 +1114,13 @@ def _normalize_car_response_icons(text: str) -> str:
     return t
 
 
-def generate_response(
+def _generate_response_steps(
     messages: list[dict[str, str]],
     params: dict,
     search_results: list,
     criteria_fulfilled: bool = False,
     parameters_count: int = 0,
-) -> str:
-    """
-    Генерация ответа пользователю.
-    - Если есть search_results: LLM выбирает из топ-10 только кандидатов с соответствием >= 60%,
-      выводит их в заданном формате и в конце задаёт уточняющие вопросы, если параметров < 3.
-    - Если критериев было достаточно, но поиск вернул 0 — сообщение «в базе не найдено» + вопрос.
-    - Если параметров мало и поиска не было — один уточняющий вопрос.
-    """
+):
     if search_results:
         # Есть топ-10 кандидатов: LLM отбирает >= 60%, выводит их и при необходимости задаёт вопросы
         candidates_text = _format_cars_full_for_llm(search_results)
@@ -910,14 +1130,9 @@ def generate_response(
             .replace("CURRENT_PARAMS_PLACEHOLDER", current_params_str)
             .replace("PARAMS_COUNT_PLACEHOLDER", str(parameters_count))
         )
-        api_messages = [{"role": "system", "content": system_content}]
-        for m in messages:
-            role = m.get("role", "user")
-            content = m.get("content") or ""
-            if role in ("user", "assistant"):
-                api_messages.append({"role": role, "content": content})
+        api_messages = _api_messages(system_content, messages)
         try:
-            text = _llm_chat(api_messages)
+            text = yield api_messages, None
         except Exception as e:  # noqa: BLE001
             logger.exception("DeepSeek generate_response (select 60%% + ask) failed: %s", e)
             return _format_cars_for_user_answer(search_results[:6])
@@ -951,14 +1166,9 @@ def generate_response(
         system_content = _with_style_instructions(
             PROMPT_NO_CARS_ASK_ANOTHER + "\n\nТекущие собранные параметры: " + current_str
         )
-        api_messages = [{"role": "system", "content": system_content}]
-        for m in messages:
-            role = m.get("role", "user")
-            content = m.get("content") or ""
-            if role in ("user", "assistant"):
-                api_messages.append({"role": role, "content": content})
+        api_messages = _api_messages(system_content, messages)
         try:
-            text = _llm_chat(api_messages)
+            text = yield api_messages, None
         except Exception as e:  # noqa: BLE001
             logger.exception("DeepSeek generate_response (no cars) failed: %s", e)
             return (
@@ -979,14 +1189,9 @@ def generate_response(
     system_content = _with_style_instructions(
         PROMPT_GENERATE_RESPONSE_CLARIFY.replace("CURRENT_PARAMS_PLACEHOLDER", current_str)
     )
-    api_messages = [{"role": "system", "content": system_content}]
-    for m in messages:
-        role = m.get("role", "user")
-        content = m.get("content") or ""
-        if role in ("user", "assistant"):
-            api_messages.append({"role": role, "content": content})
+    api_messages = _api_messages(system_content, messages)
     try:
-        text = _llm_chat(api_messages)
+        text = yield api_messages, None
     except Exception as e:  # noqa: BLE001
         logger.exception("DeepSeek generate_response (clarify) failed: %s", e)
         return "Не удалось обработать запрос. Попробуйте ещё раз."
@@ -1012,3 +1217,48 @@ def generate_response(
             )
             text = (text or "").rstrip() + extra_q
     return text
+
+
+def generate_response(
+    messages: list[dict[str, str]],
+    params: dict,
+    search_results: list,
+    criteria_fulfilled: bool = False,
+    parameters_count: int = 0,
+) -> str:
+    """
+    Генерация ответа пользователю.
+    - Если есть search_results: LLM выбирает из топ-10 только кандидатов с соответствием >= 60%,
+      выводит их в заданном формате и в конце задаёт уточняющие вопросы, если параметров < 3.
+    - Если критериев было достаточно, но поиск вернул 0 — сообщение «в базе не найдено» + вопрос.
+    - Если параметров мало и поиска не было — один уточняющий вопрос.
+    """
+    return _run_llm_steps(
+        _generate_response_steps(messages, params, search_results, criteria_fulfilled, parameters_count)
+    )
+
+
+async def agenerate_response(
+    messages: list[dict[str, str]],
+    params: dict,
+    search_results: list,
+    criteria_fulfilled: bool = False,
+    parameters_count: int = 0,
+) -> str:
+    """Асинхронный вариант generate_response."""
+    return await _arun_llm_steps(
+        _generate_response_steps(messages, params, search_results, criteria_fulfilled, parameters_count)
+    )
+
+
+def astream_response(
+    messages: list[dict[str, str]],
+    params: dict,
+    search_results: list,
+    criteria_fulfilled: bool = False,
+    parameters_count: int = 0,
+):
+    """Потоковый вариант generate_response: события ("token", фрагмент) и в конце ("text", ответ)."""
+    return _astream_llm_steps(
+        _generate_response_steps(messages, params, search_results, criteria_fulfilled, parameters_count)
+    )
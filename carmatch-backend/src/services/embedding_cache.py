@@ -0,0 +1,158 @@
+"""
+Кэш эмбеддингов поисковых запросов (Yandex text-search-query).
+
+compose_search_query даёт сильно повторяющиеся строки («Toyota Camry, седан, 2020 год...»),
+а каждый вызов Yandex API — 100–400 мс и платный запрос. Ключ кэша — (model_uri, sha256 нормализованного текста):
+  1) LRU в памяти процесса с TTL (EMBEDDING_CACHE_SIZE / EMBEDDING_CACHE_TTL_SECONDS);
+  2) таблица query_embeddings в PostgreSQL — общая для воркеров, переживает рестарт
+     (EMBEDDING_CACHE_PERSIST / EMBEDDING_CACHE_DB_TTL_SECONDS).
+
+Счётчики попаданий/промахов — stats().
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+from typing import List, Tuple
+
+from sqlalchemy import text as sa_text
+
+from src.config import settings
+from src.services import metrics
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+
+CacheKey = Tuple[str, str]
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста для ключа: пробелы схлопываются, регистр не важен."""
+    return _WS_RE.sub(" ", (text or "").strip()).lower()
+
+
+def cache_key(model_uri: str, text: str) -> CacheKey:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return model_uri, digest
+
+
+# Потокобезопасный (чат вызывает поиск из пула потоков FastAPI); db_hits — попадания в query_embeddings
+_cache: TTLCache[CacheKey, List[float]] = TTLCache(
+    settings.embedding_cache_size, settings.embedding_cache_ttl_seconds, counters=("hits", "db_hits", "misses")
+)
+
+
+def _persist_enabled() -> bool:
+    if not settings.embedding_cache_persist:
+        return False
+    from src.database import engine
+
+    return engine.dialect.name == "postgresql"
+
+
+def _db_get(key: CacheKey) -> List[float] | None:
+    from src.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        row = db.execute(
+            sa_text(
+                """
+                SELECT embedding::text FROM query_embeddings
+                WHERE model_uri = :m AND text_hash = :h
+                  AND created_at > now() - make_interval(secs => :ttl)
+                """
+            ),
+            {"m": key[0], "h": key[1], "ttl": int(settings.embedding_cache_db_ttl_seconds)},
+        ).first()
+    finally:
+        db.close()
+    if row is None or not row[0]:
+        return None
+    # vector::text — '[0.1,0.2,...]', валидный JSON
+    return [float(x) for x in json.loads(row[0])]
+
+
+def _db_put(key: CacheKey, text: str, vector: List[float]) -> None:
+    from src.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.execute(
+            sa_text(
+                """
+                INSERT INTO query_embeddings (model_uri, text_hash, query_text, embedding, created_at)
+                VALUES (:m, :h, :t, CAST(:emb AS vector), now())
+                ON CONFLICT (model_uri, text_hash)
+                DO UPDATE SET embedding = EXCLUDED.embedding, created_at = EXCLUDED.created_at
+                """
+            ),
+            {
+                "m": key[0],
+                "h": key[1],
+                "t": normalize_text(text)[:2000],
+                "emb": "[" + ",".join(str(x) for x in vector) + "]",
+            },
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_cached(model_uri: str, text: str) -> List[float] | None:
+    """Только in-process LRU (без обращения к БД): попадание учитывается в счётчиках, промах — нет."""
+    vector = _cache.get(cache_key(model_uri, text))
+    if vector is not None:
+        _cache.record("hits")
+    return vector
+
+
+def get(model_uri: str, text: str) -> List[float] | None:
+    """Эмбеддинг из кэша (память, затем query_embeddings) или None; обновляет счётчики."""
+    key = cache_key(model_uri, text)
+    vector = _cache.get(key)
+    if vector is not None:
+        _cache.record("hits")
+        return vector
+    if _persist_enabled():
+        try:
+            vector = _db_get(key)
+        except Exception as e:  # noqa: BLE001
+            # Таблицы ещё нет (миграция 13 не применена) или БД недоступна — просто промах
+            logger.warning("embedding_cache: чтение query_embeddings не удалось: %s", e)
+            vector = None
+        if vector is not None:
+            _cache.record("db_hits")
+            _cache.put(key, vector)
+            return vector
+    _cache.record("misses")
+    return None
+
+
+def put(model_uri: str, text: str, vector: List[float]) -> None:
+    """Сохраняет эмбеддинг в память и (если включено) в query_embeddings."""
+    key = cache_key(model_uri, text)
+    _cache.put(key, vector)
+    if _persist_enabled():
+        try:
+            _db_put(key, text, vector)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("embedding_cache: запись в query_embeddings не удалась: %s", e)
+
+
+def stats() -> dict:
+    """Счётчики кэша: hits (память), db_hits (query_embeddings), misses (запрос в Yandex API), size."""
+    return _cache.stats()
+
+
+def clear() -> None:
+    """Очищает in-process кэш и счётчики (таблицу query_embeddings не трогает)."""
+    _cache.clear()
+
+
+metrics.register_gauges("carmatch_embedding_cache", "Кэш эмбеддингов поисковых запросов", stats)
@@ -5,17 +5,12 @@ from __future__ import annotations
 from gigachat import GigaChat
 from gigachat.models import Chat, Messages, MessagesRole
 
-from src.config import settings
+from src.services import http_clients, metrics
 
 
 def _get_client() -> GigaChat:
-    """Создаёт клиент GigaChat с учётом конфига."""
-    if not settings.gigachat_credentials:
-        raise ValueError("GIGACHAT_CREDENTIALS не заданы")
-    return GigaChat(
-        credentials=settings.gigachat_credentials,
-        verify_ssl_certs=settings.gigachat_verify_ssl_certs,
-    )
+    """Общий клиент GigaChat процесса (keep-alive соединение и OAuth-токен переиспользуются)."""
+    return http_clients.get_gigachat()
 
 
 def chat_complete(messages: list[dict[str, str]]) -> str:
@@ -36,9 +31,8 @@ def chat_complete(messages: list[dict[str, str]]) -> str:
                 Messages(role=MessagesRole.ASSISTANT, content=content)
             )
     chat = Chat(messages=gigachat_messages)
-    client = _get_client()
-    with client:
-        response = client.chat(chat)
+    with metrics.provider_call(metrics.GIGACHAT, "completion"):
+        response = _get_client().chat(chat)
     if not response.choices:
         return "Пустой ответ от модели."
     return (response.choices[0].message.content or "").strip()
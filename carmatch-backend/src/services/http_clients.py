@@ -0,0 +1,153 @@
+"""
+Общие HTTP-клиенты для внешних AI-провайдеров (Yandex Foundation Models, GenAPI, GigaChat).
+
+Раньше каждый вызов создавал новый httpx.Client (и GigaChat — новый клиент с повторной
+OAuth-авторизацией): каждый запрос платил TCP + TLS handshake и загрузку SSL-контекста,
+а один ход чата делает 2–3 таких запроса. Здесь клиенты создаются один раз на процесс
+(лениво, потокобезопасно) и переиспользуют keep-alive соединения; HTTP/2 — если установлен h2.
+
+Асинхронный чат (add_message) использует httpx.AsyncClient из get_async_client — они привязаны
+к event loop приложения. Все клиенты закрываются в lifespan FastAPI (main.py) через aclose_all().
+Сравнение с клиентом на каждый вызов: scripts/benchmark_http_clients.py.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+
+import httpx
+from gigachat import GigaChat
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Имена пулов: по одному на провайдера (у каждого свой хост и свои лимиты соединений)
+YANDEX = "yandex"
+GENAPI = "genapi"
+
+_clients: dict[str, httpx.Client] = {}
+_async_clients: dict[str, httpx.AsyncClient] = {}
+_gigachat: GigaChat | None = None
+_lock = threading.Lock()
+
+
+def http2_available() -> bool:
+    """HTTP/2 в httpx требует пакет h2 (httpx[http2])."""
+    if not settings.http_client_http2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _timeout(read: float | None = None) -> httpx.Timeout:
+    return httpx.Timeout(
+        read if read is not None else settings.http_client_timeout,
+        connect=settings.http_client_connect_timeout,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.http_client_max_connections,
+        max_keepalive_connections=settings.http_client_max_keepalive,
+        keepalive_expiry=settings.http_client_keepalive_expiry,
+    )
+
+
+def _build_client() -> httpx.Client:
+    return httpx.Client(http2=http2_available(), timeout=_timeout(), limits=_limits())
+
+
+def get_client(name: str) -> httpx.Client:
+    """Общий httpx.Client провайдера name (YANDEX, GENAPI). Таймаут запроса можно передать в post(timeout=...)."""
+    client = _clients.get(name)
+    if client is not None and not client.is_closed:
+        return client
+    with _lock:
+        client = _clients.get(name)
+        if client is None or client.is_closed:
+            client = _build_client()
+            _clients[name] = client
+        return client
+
+
+def get_async_client(name: str) -> httpx.AsyncClient:
+    """Общий httpx.AsyncClient провайдера name — для async-пайплайна чата (один event loop приложения)."""
+    client = _async_clients.get(name)
+    if client is not None and not client.is_closed:
+        return client
+    with _lock:
+        client = _async_clients.get(name)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(http2=http2_available(), timeout=_timeout(), limits=_limits())
+            _async_clients[name] = client
+        return client
+
+
+def request_timeout(read: float) -> httpx.Timeout:
+    """Таймаут для отдельного запроса (например, долгий ответ LLM) при общем connect-таймауте."""
+    return _timeout(read)
+
+
+def get_gigachat() -> GigaChat:
+    """
+    Общий клиент GigaChat: держит соединение и OAuth-токен (обновляет сам по истечении),
+    вместо авторизации на каждый вызов.
+    """
+    global _gigachat
+    if not settings.gigachat_credentials:
+        raise ValueError("GIGACHAT_CREDENTIALS не заданы")
+    if _gigachat is not None:
+        return _gigachat
+    with _lock:
+        if _gigachat is None:
+            _gigachat = GigaChat(
+                credentials=settings.gigachat_credentials,
+                verify_ssl_certs=settings.gigachat_verify_ssl_certs,
+                timeout=settings.http_client_llm_timeout,
+                max_connections=settings.http_client_max_connections,
+            )
+        return _gigachat
+
+
+def close_all() -> None:
+    """Закрывает все клиенты (shutdown приложения). Следующий get_client создаст новый."""
+    global _gigachat
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        giga, _gigachat = _gigachat, None
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("http_clients: ошибка при закрытии клиента: %s", e)
+    if giga is not None:
+        try:
+            giga.close()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("http_clients: ошибка при закрытии GigaChat: %s", e)
+
+
+async def aclose_all() -> None:
+    """Закрывает синхронные и асинхронные клиенты (shutdown приложения в lifespan)."""
+    with _lock:
+        async_clients = list(_async_clients.values())
+        _async_clients.clear()
+        giga = _gigachat
+    for client in async_clients:
+        try:
+            await client.aclose()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("http_clients: ошибка при закрытии async-клиента: %s", e)
+    if giga is not None:
+        try:
+            await giga.aclose()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("http_clients: ошибка при закрытии async GigaChat: %s", e)
+    close_all()
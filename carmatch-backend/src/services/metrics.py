@@ -0,0 +1,308 @@
+"""
+Метрики чата в формате Prometheus (GET /metrics в main.py).
+
+  - carmatch_chat_stage_seconds{stage=...} — гистограммы этапов хода чата (add_message / поток SSE):
+    извлечение параметров, эмбеддинг, pgvector, SQL-поиск, hybrid_rank, ответ LLM, commit и т.д.;
+  - carmatch_provider_request_seconds / carmatch_provider_errors_total{provider, operation} —
+    вызовы внешних провайдеров (Yandex GPT / Embeddings, GigaChat, GenAPI);
+  - carmatch_db_query_seconds{statement=SELECT|INSERT|...} — время SQL-запросов (события SQLAlchemy);
+  - gauge-значения из зарегистрированных источников (кэши, спекулятивный поиск, шаблонные ответы);
+    те же значения в JSON — GET /api/v1/admin/stats (gauge_snapshot).
+
+Без зависимостей (prometheus_client не нужен): счётчики в памяти процесса, text exposition format 0.0.4.
+При METRICS_ENABLED=false stage()/provider_call() возвращают общий no-op, хуки БД не ставятся —
+накладные расходы сводятся к одной проверке флага.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+from sqlalchemy import event
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов (секунды): от быстрых запросов к БД до долгих ответов LLM
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def enabled() -> bool:
+    return settings.metrics_enabled
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по бакетам (не кумулятивные), сумма, количество]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[labels] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+CHAT_STAGE_SECONDS = Histogram(
+    "carmatch_chat_stage_seconds",
+    "Длительность этапов хода чата (секунды)",
+    ("stage",),
+)
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "carmatch_provider_request_seconds",
+    "Длительность вызовов внешних AI-провайдеров (секунды)",
+    ("provider", "operation"),
+)
+PROVIDER_ERRORS = Counter(
+    "carmatch_provider_errors_total",
+    "Ошибки вызовов внешних AI-провайдеров",
+    ("provider", "operation"),
+)
+DB_QUERY_SECONDS = Histogram(
+    "carmatch_db_query_seconds",
+    "Длительность SQL-запросов (секунды)",
+    ("statement",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+_METRICS = (CHAT_STAGE_SECONDS, PROVIDER_REQUEST_SECONDS, PROVIDER_ERRORS, DB_QUERY_SECONDS)
+
+# Имена провайдеров (метка provider)
+YANDEX_GPT = "yandex_gpt"
+YANDEX_EMBEDDINGS = "yandex_embeddings"
+GIGACHAT = "gigachat"
+GENAPI = "genapi"
+
+_gauge_sources: list[Tuple[str, str, Callable[[], dict]]] = []
+
+
+def register_gauges(prefix: str, documentation: str, source: Callable[[], dict]) -> None:
+    """Источник gauge-значений: source() → {ключ: число}, экспортируется как {prefix}_{ключ}."""
+    _gauge_sources.append((prefix, documentation, source))
+
+
+def gauge_snapshot() -> Dict[str, dict]:
+    """Текущие значения всех источников gauge для админки: {prefix без «carmatch_»: source()}."""
+    snapshot: Dict[str, dict] = {}
+    for prefix, _, source in _gauge_sources:
+        try:
+            snapshot[prefix.removeprefix("carmatch_")] = source()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("metrics: источник %s недоступен: %s", prefix, e)
+    return snapshot
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_errors", "_started")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues, errors: Counter | None = None):
+        self._histogram = histogram
+        self._labels = labels
+        self._errors = errors
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._started, *self._labels)
+        # GeneratorExit — потребитель потока остановился сам (не ошибка провайдера)
+        if exc_type is not None and self._errors is not None and not issubclass(exc_type, GeneratorExit):
+            self._errors.inc(*self._labels)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def stage(name: str):
+    """Контекстный менеджер: время этапа хода чата в carmatch_chat_stage_seconds{stage=name}."""
+    if not settings.metrics_enabled:
+        return _NOOP
+    return _Timer(CHAT_STAGE_SECONDS, (name,))
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Явный замер этапа, когда он не укладывается в один блок with (например, время до первого токена)."""
+    if settings.metrics_enabled:
+        CHAT_STAGE_SECONDS.observe(seconds, name)
+
+
+def provider_call(provider: str, operation: str):
+    """Контекстный менеджер вызова провайдера: время + ошибка, если внутри выброшено исключение."""
+    if not settings.metrics_enabled:
+        return _NOOP
+    return _Timer(PROVIDER_REQUEST_SECONDS, (provider, operation), PROVIDER_ERRORS)
+
+
+def provider_error(provider: str, operation: str) -> None:
+    """Ошибка провайдера, которая не выбрасывается наружу (пустой ответ, неверный формат)."""
+    if settings.metrics_enabled:
+        PROVIDER_ERRORS.inc(provider, operation)
+
+
+def _statement_kind(statement: str) -> str:
+    word = (statement or "").lstrip().split(None, 1)
+    kind = word[0].upper() if word else ""
+    return kind if kind in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("_metrics_query_start")
+    if starts:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - starts.pop(), _statement_kind(statement))
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    starts = conn.info.get("_metrics_query_start") if conn is not None else None
+    if starts:
+        starts.pop()
+
+
+def install_db_hooks(engine) -> None:
+    """Замер SQL-запросов через события SQLAlchemy (sync Engine или AsyncEngine.sync_engine)."""
+    if not settings.metrics_enabled:
+        return
+    target = getattr(engine, "sync_engine", engine)
+    if event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    event.listen(target, "after_cursor_execute", _after_cursor_execute)
+    event.listen(target, "handle_error", _handle_error)
+
+
+def render() -> str:
+    """Все метрики в text exposition format Prometheus."""
+    lines: list[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for prefix, documentation, source in _gauge_sources:
+        try:
+            values = source()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("metrics: источник %s недоступен: %s", prefix, e)
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines.append(f"# HELP {name} {documentation}: {key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def clear() -> None:
+    """Сбрасывает накопленные значения (тесты)."""
+    for metric in _METRICS:
+        metric.clear()
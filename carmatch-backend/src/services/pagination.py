@@ -0,0 +1,173 @@
+"""
+Пагинация списков админки: keyset-курсор и дешёвый подсчёт строк.
+
+OFFSET (page-1)*per_page читает и отбрасывает все предыдущие строки, а count() на каждую страницу
+повторяет полный проход по отфильтрованной таблице — оба линейно дорожают на больших таблицах.
+  - курсор: значения колонок сортировки последней строки страницы (base64 JSON); следующая страница —
+    WHERE (sort, id) «после» курсора ORDER BY sort, id LIMIT per_page, по индексу без OFFSET;
+  - подсчёт: без фильтров — pg_class.reltuples, с фильтрами — оценка планировщика (EXPLAIN).
+    Если оценка меньше ADMIN_EXACT_COUNT_THRESHOLD, точный count() дешёв и выполняется всё равно;
+    exact_count=true в запросе — всегда точный count(). Вне PostgreSQL оценок нет — точный count().
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, literal, or_, text as sa_text, tuple_
+from sqlalchemy.orm import Query, Session
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursor(ValueError):
+    """Курсор не декодируется или не подходит к текущей сортировке."""
+
+
+# (колонка, по убыванию); последняя колонка — уникальный ключ (id).
+# NULL — как по умолчанию в PostgreSQL: в конце при asc, в начале при desc (индекс читается в обратную сторону)
+OrderSpec = Sequence[Tuple[Any, bool]]
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    return value
+
+
+def _from_json(value: Any, column) -> Any:
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type in (datetime, date):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([_to_json(v) for v in values], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, order: OrderSpec) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+        if not isinstance(values, list) or len(values) != len(order):
+            raise InvalidCursor("Курсор не соответствует сортировке")
+        return [_from_json(v, column) for v, (column, _) in zip(values, order)]
+    except InvalidCursor:
+        raise
+    except Exception as exc:
+        raise InvalidCursor("Некорректный курсор") from exc
+
+
+def order_by(query: Query, order: OrderSpec) -> Query:
+    """ORDER BY колонок курсора с явным порядком NULL (одинаково в PostgreSQL и SQLite)."""
+    return query.order_by(*[c.desc().nulls_first() if desc else c.asc().nulls_last() for c, desc in order])
+
+
+def _nullable(column) -> bool:
+    return getattr(getattr(column, "expression", column), "nullable", True)
+
+
+def _after(column, desc: bool, value: Any):
+    """Строки строго после value по одной колонке; None — таких нет."""
+    if desc:
+        return column.isnot(None) if value is None else column < value
+    return None if value is None else or_(column > value, column.is_(None))
+
+
+def _equal(column, value: Any):
+    return column.is_(None) if value is None else column == value
+
+
+def apply_cursor(query: Query, order: OrderSpec, values: Sequence[Any]) -> Query:
+    """WHERE (c1, c2, ..., id) «после» курсора в порядке сортировки."""
+    if len({desc for _, desc in order}) == 1 and not any(_nullable(c) for c, _ in order):
+        # NOT NULL и одно направление — сравнение строк (a, id) > (:a, :id): условие по индексу (a, id)
+        row, cursor_row = tuple_(*[c for c, _ in order]), tuple_(*[literal(v, c.type) for v, (c, _) in zip(values, order)])
+        return query.filter(row < cursor_row if order[0][1] else row > cursor_row)
+    branches = []
+    prefix = []
+    for (column, desc), value in zip(order, values):
+        after = _after(column, desc, value)
+        if after is not None:
+            branches.append(and_(*prefix, after))
+        prefix.append(_equal(column, value))
+    if not branches:
+        return query.filter(sa_text("1 = 0"))
+    return query.filter(or_(*branches))
+
+
+def fetch_page(
+    query: Query,
+    order: OrderSpec,
+    page: int,
+    per_page: int,
+    cursor: str | None,
+    row_values: Callable[[Any], Sequence[Any]],
+) -> Tuple[list, str | None]:
+    """
+    Строки страницы и курсор следующей (None — страница последняя).
+    С cursor — keyset от курсора (page не используется), без него — OFFSET по page, как раньше.
+    row_values(row) — значения колонок order для строки результата.
+    """
+    query = order_by(query, order)
+    if cursor:
+        query = apply_cursor(query, order, decode_cursor(cursor, order))
+    else:
+        query = query.offset((page - 1) * per_page)
+    rows = query.limit(per_page).all()
+    following = encode_cursor(row_values(rows[-1])) if len(rows) == per_page else None
+    return rows, following
+
+
+def estimate_count(db: Session, query: Query, table: str, filtered: bool) -> int | None:
+    """Оценка числа строк без прохода по таблице (только PostgreSQL); None — оценки нет."""
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+    try:
+        # SAVEPOINT: ошибка оценки не должна обрывать транзакцию запроса
+        with db.begin_nested():
+            if not filtered:
+                reltuples = db.execute(
+                    sa_text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table}
+                ).scalar()
+                # -1 — таблица ещё ни разу не анализировалась
+                if reltuples is not None and reltuples >= 0:
+                    return int(reltuples)
+            compiled = query.statement.compile(dialect=bind.dialect)
+            plan = db.connection().exec_driver_sql(
+                "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params
+            ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    except Exception as exc:
+        logger.warning("pagination: оценка числа строк %s не удалась: %s", table, exc)
+        return None
+
+
+def count_rows(db: Session, query: Query, table: str, filtered: bool, exact: bool) -> Tuple[int, bool]:
+    """(total, total_is_estimate): точный count() по запросу или для маленьких оценок, иначе оценка."""
+    if not exact:
+        estimate = estimate_count(db, query, table, filtered)
+        if estimate is not None and estimate >= settings.admin_exact_count_threshold:
+            return estimate, True
+    return query.order_by(None).count(), False
+
+
+def pages_for(total: int, per_page: int) -> int:
+    return (total + per_page - 1) // per_page if total else 0
@@ -0,0 +1,80 @@
+"""
+Кэш аутентифицированных пользователей (principal) для src/deps.py.
+
+Раньше get_current_user на каждый запрос с токеном (опрос чата, страницы админки) делал
+SELECT * FROM users WHERE id = ?. Теперь:
+  - состояние пользователя (is_active, is_admin) кэшируется в процессе на AUTH_PRINCIPAL_CACHE_TTL_SECONDS:
+    при попадании проверка токена и прав администратора обходится без БД;
+  - при изменении/удалении пользователя в админке запись сбрасывается (invalidate); на других воркерах
+    изменение вступает в силу не позже TTL.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.models import User
+from src.services import metrics
+from src.utils.ttl_cache import TTLCache
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """Текущий пользователь запроса: то, что нужно роутерам и проверкам доступа (без ORM-объекта)."""
+
+    id: int
+    email: str
+    is_active: bool
+    is_admin: bool
+
+
+# user_id → Principal; потокобезопасный (sync-зависимости FastAPI идут из пула потоков). TTL 0 — кэш выключен
+_cache: TTLCache[int, Principal] = TTLCache(
+    settings.auth_principal_cache_size if settings.auth_principal_cache_ttl_seconds > 0 else 0,
+    settings.auth_principal_cache_ttl_seconds,
+)
+
+
+def get(db: Session, user_id: int) -> Principal | None:
+    """Principal по id: из кэша или одним SELECT нужных колонок users. None — пользователя нет."""
+    principal = _cache.get(user_id)
+    if principal is not None:
+        _cache.record("hits")
+        return principal
+    _cache.record("misses")
+    row = (
+        db.query(User.id, User.email, User.is_active, User.is_admin)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if row is None:
+        return None
+    principal = Principal(
+        id=row.id,
+        email=row.email,
+        is_active=bool(row.is_active),
+        is_admin=bool(row.is_admin),
+    )
+    _cache.put(principal.id, principal)
+    return principal
+
+
+def invalidate(user_id: int) -> None:
+    """Сбросить запись пользователя (изменён или удалён в админке)."""
+    _cache.discard(user_id)
+
+
+def clear() -> None:
+    """Сброс кэша (тесты)."""
+    _cache.clear()
+
+
+def stats() -> dict:
+    """Счётчики: hits — проверка токена без БД, misses — чтение users, size."""
+    return _cache.stats()
+
+
+metrics.register_gauges("carmatch_principal_cache", "Кэш пользователей для проверки токена", stats)
@@ -1,22 +1,10 @@
-from sqlalchemy import distinct, or_
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from src.models import Car, CarBrand, CarModel, CarGeneration, CarModification, CarComplectation
-
-# Нормализация типа коробки из формулировок пользователя/LLM к подстроке для поиска в БД (MT, AT, AMT, CVT)
-TRANSMISSION_SEARCH_ALIASES = {
-    "автомат": "AT",
-    "автоматическая": "AT",
-    "акпп": "AT",
-    "механика": "MT",
-    "механическая": "MT",
-    "мкпп": "MT",
-    "ручная": "MT",
-    "вариатор": "CVT",
-    "робот": "AMT",
-    "роботизированная": "AMT",
-}
+from src.services.reference_data import reference_cache
+from src.utils import car_canonical
+from src.utils.car_canonical import BODY_TYPE_NORMALIZE, TRANSMISSION_SEARCH_ALIASES
 
 
 def _normalize_transmission_for_search(transmission: Optional[str]) -> Optional[str]:
@@ -81,60 +69,41 @@ def get_complectation_by_external_id(db: Session, external_id: str) -> Optional[
 
 
 def get_body_type_reference(db: Session) -> List[str]:
-    """Уникальные body_type из таблицы cars — чтобы LLM предлагал только то, что есть в базе авто."""
-    rows = (
-        db.query(distinct(Car.body_type))
-        .filter(Car.body_type.isnot(None), Car.body_type != "")
-        .all()
-    )
-    return [r[0].strip() for r in rows if r[0] and r[0].strip()]
-
-
-# Пары (кириллица, латиница) для поиска типа кузова: в БД может быть и то и другое
-BODY_TYPE_SEARCH_PAIRS = [
-    ("хэтчбек", "hatchback"),
-    ("седан", "sedan"),
-    ("универсал", "wagon"),
-    ("внедорожник", "suv"),
-    ("кроссовер", "crossover"),
-    ("купе", "coupe"),
-    ("минивэн", "minivan"),
-    ("лифтбек", "liftback"),
-    ("кабриолет", "cabriolet"),
-    ("пикап", "pickup"),
-]
-
-# Варианты написания (е/э и т.д.): как может прийти от пользователя/LLM -> каноническая подстрока для БД
-BODY_TYPE_NORMALIZE = {
-    "хетчбек": "хэтчбек",   # в БД: «Хэтчбек 3 дв.» — с «э»
-    "хэтчбек": "хэтчбек",
-    "седан": "седан",
-    "универсал": "универсал",
-    "внедорожник": "внедорожник",
-    "кроссовер": "кроссовер",
-    "купе": "купе",
-    "минивен": "минивэн",
-    "минивэн": "минивэн",
-    "лифтбек": "лифтбек",
-    "кабриолет": "кабриолет",
-    "пикап": "пикап",
-}
+    """Уникальные body_type из таблицы cars — чтобы LLM предлагал только то, что есть в базе авто (из кэша справочников)."""
+    return list(reference_cache.get(db).body_types)
 
 
 def _body_type_filter_condition(body_type: Optional[str]):
-    """Для поиска: «Хэтчбек»/«Hatchback»/«хетчбек» (е) -> OR по кириллице и латинице в Car.body_type."""
+    """Для поиска: «Хэтчбек»/«Hatchback»/«хетчбек» (е) -> равенство по Car.body_class (hatchback)."""
     if not body_type or not body_type.strip():
         return None
+    code = car_canonical.body_class(body_type)
+    if code is not None:
+        return Car.body_class == code
+    # Класс не распознан — подстрока в исходной колонке, как раньше
     s = body_type.strip().lower()
-    # Нормализуем е/э и др.: «хетчбек» -> «хэтчбек», чтобы совпало с БД
-    search_term = BODY_TYPE_NORMALIZE.get(s, s)
-    for cyr, lat in BODY_TYPE_SEARCH_PAIRS:
-        if search_term == cyr or s == lat or (cyr in search_term) or (cyr in s) or (lat in s):
-            return or_(
-                Car.body_type.ilike(f"%{cyr}%"),
-                Car.body_type.ilike(f"%{lat}%"),
-            )
-    return Car.body_type.ilike(f"%{search_term}%")
+    return Car.body_type.ilike(f"%{BODY_TYPE_NORMALIZE.get(s, s)}%")
+
+
+def _transmission_filter_condition(transmission: Optional[str]):
+    """«автомат» / «AT» / «акпп» -> Car.gearbox_code == 'AT'; нераспознанное — ILIKE по transmission."""
+    if not transmission or not transmission.strip():
+        return None
+    code = car_canonical.gearbox_code(transmission)
+    if code is not None:
+        return Car.gearbox_code == code
+    tr = _normalize_transmission_for_search(transmission) or transmission.strip()
+    return Car.transmission.ilike(f"%{tr}%")
+
+
+def _fuel_filter_condition(fuel_type: Optional[str]):
+    """«бензин» / «Petrol» -> Car.fuel_code == 'petrol'; нераспознанное — ILIKE по fuel_type."""
+    if not fuel_type or not fuel_type.strip():
+        return None
+    code = car_canonical.fuel_code(fuel_type)
+    if code is not None:
+        return Car.fuel_code == code
+    return Car.fuel_type.ilike(f"%{fuel_type.strip()}%")
 
 
 # Алиасы марки для поиска: как пользователь мог написать -> имя в БД
@@ -155,15 +124,16 @@ BRAND_SEARCH_ALIASES = {
 }
 
 
+def _canonical_brand_name(name: str) -> str:
+    search = name.strip()
+    return BRAND_SEARCH_ALIASES.get(search.lower()) or search
+
+
 def get_brand_by_name_ilike(db: Session, name: str) -> Optional[CarBrand]:
     """Find brand by name (case-insensitive, trimmed). Учитывает алиасы (рено -> Renault)."""
     if not name or not name.strip():
         return None
-    search = name.strip()
-    canonical = BRAND_SEARCH_ALIASES.get(search.lower())
-    if canonical:
-        search = canonical
-    return db.query(CarBrand).filter(CarBrand.name.ilike(search)).first()
+    return db.query(CarBrand).filter(CarBrand.name.ilike(_canonical_brand_name(name))).first()
 
 
 def get_model_by_name_ilike(db: Session, name: str, brand_id: Optional[int] = None) -> Optional[CarModel]:
@@ -191,9 +161,9 @@ def search_cars(
     limit: int = 10,
 ) -> List[Car]:
     """
-    Search cars via reference tables: brand/model by text lookup, body_type by exact match,
-    year by exact match, modification by substring (ILIKE), transmission (gearbox) by ILIKE,
-    fuel_type by ILIKE, engine_volume and horsepower by exact match.
+    Search cars via reference tables: brand/model by text lookup, body_type / transmission / fuel_type
+    by canonical code (body_class, gearbox_code, fuel_code; ILIKE if the value is not recognized),
+    year by exact match, modification by substring (ILIKE), engine_volume and horsepower by exact match.
     Returns active cars only, ordered by price (asc, nulls last).
     """
     q = db.query(Car).filter(Car.is_active.is_(True))
@@ -201,11 +171,13 @@ def search_cars(
     model_id: Optional[int] = None
     brand_name_for_fallback: Optional[str] = None
 
+    # Марка и модель — по снимку справочников в памяти (без запросов к car_brands / car_models)
+    reference = reference_cache.get(db)
     if brand and brand.strip():
-        b = get_brand_by_name_ilike(db, brand)
+        # Точное имя или ближайшее по триграммам («тоёта» → Toyota)
+        b = reference.match_brand(_canonical_brand_name(brand))
         if b:
-            brand_id = b.id
-            brand_name_for_fallback = b.name
+            brand_id, brand_name_for_fallback = b
             q = q.filter(Car.brand_id == brand_id)
         else:
             return []
@@ -214,9 +186,9 @@ def search_cars(
         if brand_name_for_fallback and model.strip().lower() == brand_name_for_fallback.strip().lower():
             pass  # не добавляем фильтр по модели
         else:
-            m = get_model_by_name_ilike(db, model, brand_id)
-            if m:
-                model_id = m.id
+            found_model = reference.match_model(model, brand_id)
+            if found_model is not None:
+                model_id, model = found_model
                 q = q.filter(Car.model_id == model_id)
             else:
                 # Модель не найдена в справочнике (напр. "Clio" при записях "Clio, V") — фильтр по подстроке model_name
@@ -230,12 +202,12 @@ def search_cars(
     if modification and modification.strip():
         mod = modification.strip()
         q = q.filter(Car.modification.ilike(f"%{mod}%"))
-    if transmission and transmission.strip():
-        tr = _normalize_transmission_for_search(transmission) or transmission.strip()
-        q = q.filter(Car.transmission.ilike(f"%{tr}%"))
-    if fuel_type and fuel_type.strip():
-        ft = fuel_type.strip()
-        q = q.filter(Car.fuel_type.ilike(f"%{ft}%"))
+    tr_cond = _transmission_filter_condition(transmission)
+    if tr_cond is not None:
+        q = q.filter(tr_cond)
+    fuel_cond = _fuel_filter_condition(fuel_type)
+    if fuel_cond is not None:
+        q = q.filter(fuel_cond)
     if engine_volume is not None:
         q = q.filter(Car.engine_volume == engine_volume)
     if horsepower is not None:
@@ -258,11 +230,10 @@ def search_cars(
             q2 = q2.filter(Car.year == year)
         if modification and modification.strip():
             q2 = q2.filter(Car.modification.ilike(f"%{modification.strip()}%"))
-        if transmission and transmission.strip():
-            tr = _normalize_transmission_for_search(transmission) or transmission.strip()
-            q2 = q2.filter(Car.transmission.ilike(f"%{tr}%"))
-        if fuel_type and fuel_type.strip():
-            q2 = q2.filter(Car.fuel_type.ilike(f"%{fuel_type.strip()}%"))
+        if tr_cond is not None:
+            q2 = q2.filter(tr_cond)
+        if fuel_cond is not None:
+            q2 = q2.filter(fuel_cond)
         if engine_volume is not None:
             q2 = q2.filter(Car.engine_volume == engine_volume)
         if horsepower is not None:
@@ -0,0 +1,115 @@
+"""
+Нечёткое сопоставление марок и моделей по триграммам (как pg_trgm, но по снимку справочников в памяти).
+
+Пользователь и LLM пишут «тоёта», «камри», «тойта» — точное сравнение с car_brands / car_models
+их не находит, а ILIKE '%тоёта%' по cars — полный проход без результата. Здесь:
+  - строка нормализуется фонетически: кириллица → латиница, ё → yo, c → k/s, y → i, удвоенные буквы,
+    диакритика («Škoda» → skoda); «тоёта» и «Toyota» дают одно и то же «toiota», «камри» и «Camry» — «kamri»;
+  - триграммы считаются по словам с отступами, как в pg_trgm; сходство — |A ∩ B| / |A ∪ B|;
+  - инвертированный индекс триграмма → записи: сравниваются только кандидаты с общими триграммами,
+    без перебора всего справочника;
+  - совпадение засчитывается при сходстве не ниже FUZZY_MATCH_THRESHOLD (0 — выключено).
+
+Индексы строятся один раз на снимок (reference_cache), поиск по ним не обращается к БД.
+Найденное каноническое имя дальше идёт в equality-фильтры и ILIKE, которые используют индексы
+(btree и GIN gin_trgm_ops, миграция 17).
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, FrozenSet, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "zh", "з": "z",
+    "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+
+# Фонетические замены в латинице (порядок важен): одинаково пишем то, что одинаково звучит
+_LATIN_FOLDS = (
+    (re.compile(r"c(?=[eiy])"), "s"),
+    (re.compile(r"ck|c|q"), "k"),
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"kh"), "h"),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"[yj]"), "i"),
+    (re.compile(r"(.)\1+"), r"\1"),
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def phonetic_key(text: str) -> str:
+    """Нормализованная латинская запись для сравнения: «Тоёта» → «toiota», «Camry» → «kamri»."""
+    s = unicodedata.normalize("NFC", (text or "").lower())
+    s = "".join(_CYRILLIC_TO_LATIN.get(ch, ch) for ch in s)
+    # Диакритика латиницы: «škoda» → «skoda» (кириллица уже транслитерирована — «ё»/«й» не пострадают)
+    s = "".join(ch for ch in unicodedata.normalize("NFKD", s) if not unicodedata.combining(ch))
+    for pattern, repl in _LATIN_FOLDS:
+        s = pattern.sub(repl, s)
+    return " ".join(_WORD.findall(s))
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    """Триграммы нормализованной строки по словам с отступами («  w», « wo», ... «rd »), как в pg_trgm."""
+    grams = set()
+    for word in phonetic_key(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+def similarity(a: str, b: str) -> float:
+    """Сходство двух строк по триграммам (0..1)."""
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class TrigramIndex(Generic[T]):
+    """Инвертированный индекс триграмма → записи; best() — самая похожая запись не ниже порога."""
+
+    def __init__(self, entries: Iterable[Tuple[str, T]]):
+        self._entries: List[Tuple[FrozenSet[str], T]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for text, value in entries:
+            grams = trigrams(text)
+            if not grams:
+                continue
+            idx = len(self._entries)
+            self._entries.append((grams, value))
+            for gram in grams:
+                self._postings[gram].append(idx)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def search(self, text: str, threshold: float, limit: int = 5) -> List[Tuple[float, T]]:
+        """Записи со сходством >= threshold по убыванию сходства (при равенстве — в порядке добавления)."""
+        query = trigrams(text)
+        if not query or threshold <= 0:
+            return []
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in query:
+            for idx in self._postings.get(gram, ()):
+                shared[idx] += 1
+        scored = []
+        for idx, common in shared.items():
+            grams = self._entries[idx][0]
+            score = common / (len(query) + len(grams) - common)
+            if score >= threshold:
+                scored.append((-score, idx))
+        scored.sort()
+        return [(-neg, self._entries[idx][1]) for neg, idx in scored[:limit]]
+
+    def best(self, text: str, threshold: float) -> Optional[T]:
+        found = self.search(text, threshold, limit=1)
+        return found[0][1] if found else None
@@ -0,0 +1,244 @@
+"""
+Кэш справочников каталога: типы кузова, коробки, марки и модели.
+
+Раньше каждый ход чата делал SELECT DISTINCT body_type FROM cars (полный проход по каталогу
+ради списка в промпте), а search_cars — по ILIKE-запросу к car_brands / car_models на марку и модель.
+Справочники меняются только при импорте и в админке, поэтому здесь они читаются одним снимком
+и хранятся в памяти процесса:
+  - снимок живёт REFERENCE_CACHE_TTL_SECONDS (0 — кэш выключен, каждый вызов читает БД);
+  - create/update/delete в admin_cars вызывают invalidate() — следующий запрос перечитает БД;
+  - другие воркеры (и импорт скриптами) увидят изменения по истечении TTL.
+
+Общий снимок используют extract_params (список кузовов в промпте), extract_params_fallback
+(кузова и марки) и search_cars (id марки/модели без запросов к справочным таблицам).
+Вместе со снимком строятся триграммные индексы марок и моделей для опечаток (fuzzy_match).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.config import settings
+from src.models import Car, CarBrand, CarModel
+from src.services import metrics
+from src.services.reference_data.fuzzy_match import TrigramIndex, phonetic_key
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReferenceSnapshot:
+    """Неизменяемый снимок справочников (можно отдавать нескольким потокам без копирования)."""
+
+    body_types: Tuple[str, ...] = ()
+    transmissions: Tuple[str, ...] = ()
+    # name.lower() -> (id, name)
+    brands: Dict[str, Tuple[int, str]] = field(default_factory=dict)
+    # (brand_id, name.lower()) -> id
+    models: Dict[Tuple[int, str], int] = field(default_factory=dict)
+    # name.lower() -> id (первая по id модель с таким именем — поиск без марки)
+    models_by_name: Dict[str, int] = field(default_factory=dict)
+    # Триграммные индексы для опечаток и кириллицы («тоёта», «камри») со значениями (id, name)
+    brand_index: TrigramIndex = field(default_factory=lambda: TrigramIndex(()))
+    model_index: TrigramIndex = field(default_factory=lambda: TrigramIndex(()))
+    # brand_id -> индекс моделей только этой марки: ранжирование среди её моделей, а не общий топ по каталогу
+    model_indexes: Dict[int, TrigramIndex] = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+    @property
+    def brand_names(self) -> Tuple[str, ...]:
+        return tuple(name for _, name in self.brands.values())
+
+    def brand(self, name: str) -> Optional[Tuple[int, str]]:
+        """(id, name) марки по имени без учёта регистра или None."""
+        return self.brands.get((name or "").strip().lower())
+
+    def model_id(self, name: str, brand_id: Optional[int] = None) -> Optional[int]:
+        """id модели по имени без учёта регистра; с brand_id — только среди моделей этой марки."""
+        key = (name or "").strip().lower()
+        if brand_id is not None:
+            return self.models.get((brand_id, key))
+        return self.models_by_name.get(key)
+
+    def match_brand(self, name: str) -> Optional[Tuple[int, str]]:
+        """(id, name) марки: точное совпадение, иначе ближайшая по триграммам (см. fuzzy_match)."""
+        exact = self.brand(name)
+        if exact is not None or not _fuzzy_enabled(name):
+            return exact
+        return self.brand_index.best(name, settings.fuzzy_match_threshold)
+
+    def match_model(self, name: str, brand_id: Optional[int] = None) -> Optional[Tuple[int, str]]:
+        """(id, name) модели: точное совпадение, иначе ближайшая по триграммам (с brand_id — среди моделей марки)."""
+        model_id = self.model_id(name, brand_id)
+        if model_id is not None:
+            return model_id, (name or "").strip()
+        if not _fuzzy_enabled(name):
+            return None
+        index = self.model_index if brand_id is None else self.model_indexes.get(brand_id)
+        if index is None:
+            return None
+        return index.best(name, settings.fuzzy_match_threshold)
+
+    def canonicalize(self, params: dict) -> dict:
+        """
+        Копия параметров поиска, где brand/model с опечатками заменены каноническими именами справочника
+        («тоёта» → «Toyota», «камри» → «Camry»). Неизвестные значения остаются как есть.
+        """
+        result = dict(params)
+        brand_id = None
+        brand = result.get("brand")
+        if isinstance(brand, str) and brand.strip():
+            found = self.match_brand(brand)
+            if found is not None:
+                brand_id, result["brand"] = found
+        model = result.get("model")
+        if isinstance(model, str) and model.strip() and self.model_id(model, brand_id) is None:
+            found = self.match_model(model, brand_id)
+            if found is not None:
+                result["model"] = found[1]
+        return result
+
+
+def _fuzzy_enabled(name: str) -> bool:
+    # Слишком короткие строки («ки», «ву») дают 2–3 триграммы — совпадение было бы случайным
+    return settings.fuzzy_match_threshold > 0 and len(phonetic_key(name).replace(" ", "")) >= 3
+
+
+def _distinct_values(db: Session, column) -> Tuple[str, ...]:
+    rows = db.query(column).filter(column.isnot(None), column != "").distinct().all()
+    return tuple(sorted({r[0].strip() for r in rows if r[0] and r[0].strip()}))
+
+
+def load_snapshot(db: Session) -> ReferenceSnapshot:
+    """Читает справочники из БД (4 запроса) — без обращения к кэшу."""
+    brands: Dict[str, Tuple[int, str]] = {}
+    for brand_id, name in db.query(CarBrand.id, CarBrand.name).order_by(CarBrand.id).all():
+        if name and name.strip():
+            brands.setdefault(name.strip().lower(), (brand_id, name))
+    models: Dict[Tuple[int, str], int] = {}
+    models_by_name: Dict[str, int] = {}
+    model_entries = []
+    brand_model_entries: Dict[int, list] = defaultdict(list)
+    for model_id, brand_id, name in (
+        db.query(CarModel.id, CarModel.brand_id, CarModel.name).order_by(CarModel.id).all()
+    ):
+        if not name or not name.strip():
+            continue
+        key = name.strip().lower()
+        models.setdefault((brand_id, key), model_id)
+        models_by_name.setdefault(key, model_id)
+        model_entries.append((name, (model_id, name.strip())))
+        brand_model_entries[brand_id].append((name, (model_id, name.strip())))
+    return ReferenceSnapshot(
+        body_types=_distinct_values(db, Car.body_type),
+        transmissions=_distinct_values(db, Car.transmission),
+        brands=brands,
+        models=models,
+        models_by_name=models_by_name,
+        brand_index=TrigramIndex((name, (brand_id, name)) for brand_id, name in brands.values()),
+        model_index=TrigramIndex(model_entries),
+        model_indexes={brand_id: TrigramIndex(entries) for brand_id, entries in brand_model_entries.items()},
+        loaded_at=time.monotonic(),
+    )
+
+
+class ReferenceCache:
+    """Один снимок на процесс с TTL; поколение защищает от записи устаревшего снимка после invalidate()."""
+
+    def __init__(self):
+        self._snapshot: ReferenceSnapshot | None = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def peek(self) -> ReferenceSnapshot | None:
+        """Свежий снимок или None (без обращения к БД)."""
+        ttl = settings.reference_cache_ttl_seconds
+        snapshot = self._snapshot
+        if snapshot is None or ttl <= 0 or time.monotonic() - snapshot.loaded_at > ttl:
+            return None
+        with self._lock:
+            self.hits += 1
+        return snapshot
+
+    def get(self, db: Session) -> ReferenceSnapshot:
+        snapshot = self.peek()
+        if snapshot is not None:
+            return snapshot
+        generation = self._generation
+        snapshot = load_snapshot(db)
+        with self._lock:
+            self.loads += 1
+            # Пока читали, админка могла изменить каталог — такой снимок не сохраняем
+            if generation == self._generation and settings.reference_cache_ttl_seconds > 0:
+                self._snapshot = snapshot
+        logger.info(
+            "reference_cache: загружено %d кузовов, %d марок, %d моделей",
+            len(snapshot.body_types), len(snapshot.brands), len(snapshot.models),
+        )
+        return snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshot = None
+            self._generation += 1
+            self.hits = self.loads = self.invalidations = 0
+
+
+_cache = ReferenceCache()
+
+
+def get(db: Session) -> ReferenceSnapshot:
+    """Снимок справочников: из памяти, если свежий, иначе читается из БД и запоминается."""
+    return _cache.get(db)
+
+
+async def aget(db: AsyncSession) -> ReferenceSnapshot:
+    """То же для async-пайплайна чата: при попадании в кэш к БД не обращается вовсе."""
+    snapshot = _cache.peek()
+    if snapshot is not None:
+        return snapshot
+    return await db.run_sync(_cache.get)
+
+
+def invalidate() -> None:
+    """Сбросить снимок (каталог изменён в админке); следующий запрос перечитает справочники."""
+    _cache.invalidate()
+
+
+def stats() -> dict:
+    """Счётчики: hits (из памяти), loads (чтения из БД), invalidations, размеры текущего снимка."""
+    snapshot = _cache._snapshot
+    return {
+        "hits": _cache.hits,
+        "loads": _cache.loads,
+        "invalidations": _cache.invalidations,
+        "body_types": len(snapshot.body_types) if snapshot else 0,
+        "brands": len(snapshot.brands) if snapshot else 0,
+        "models": len(snapshot.models) if snapshot else 0,
+        "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot else 0.0,
+    }
+
+
+def clear() -> None:
+    """Сбрасывает снимок и счётчики (тесты)."""
+    _cache.clear()
+
+
+metrics.register_gauges("carmatch_reference_cache", "Кэш справочников каталога", stats)
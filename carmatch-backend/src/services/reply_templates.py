@@ -0,0 +1,137 @@
+"""
+Шаблонные ответы чата без вызова LLM: чистое приветствие, благодарность, прощание.
+
+На «привет», «спасибо», «пока» чат раньше ходил в LLM (generate_response_small_talk) — секунды ожидания
+ради одной вежливой фразы. Теперь, если сообщение целиком состоит из таких слов (плюс обращения вроде
+«Тёма» и усилители «большое», «ещё раз»), ответ берётся из шаблонов от лица Моторчика Тёмы; шаблоны
+чередуются по номеру хода в сессии. Всё остальное (вопросы, «привет, как дела?») по-прежнему идёт в LLM.
+Сэкономленные вызовы LLM считаются по видам: stats(), gauge carmatch_template_replies_*.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+
+from src.services import metrics
+
+GREETING = "greeting"
+THANKS = "thanks"
+GOODBYE = "goodbye"
+
+# Фразы по видам (после _normalize_for_greeting: нижний регистр, без пунктуации, одиночные пробелы)
+_PHRASES = {
+    GREETING: (
+        "привет", "приветик", "приветствую", "прив", "здравствуй", "здравствуйте", "здрасьте", "здарова",
+        "добрый день", "добрый вечер", "доброе утро", "доброй ночи", "хай", "салют",
+        "hi", "hello", "hey",
+    ),
+    THANKS: (
+        "спасибо", "спасибочки", "спс", "благодарю", "пасиб", "мерси", "thanks", "thank you", "thx",
+    ),
+    GOODBYE: (
+        "пока", "до свидания", "до встречи", "до связи", "всего доброго", "всего хорошего", "хорошего дня",
+        "удачи", "bye", "goodbye",
+    ),
+}
+# Слова, которые не меняют смысла: обращение к ассистенту и усилители («спасибо большое, Тёма»)
+_FILLERS = (
+    "тёма", "тема", "моторчик", "бот", "большое", "огромное", "ещё", "еще", "раз", "вам", "тебе", "всем",
+    "и", "ок", "окей", "хорошо", "ладно", "ну", "всё", "все",
+)
+_WORDS = sorted({*_FILLERS, *(p for phrases in _PHRASES.values() for p in phrases)}, key=len, reverse=True)
+# Длинные фразы раньше коротких: «до свидания» не должно разбираться как «до» + ...
+_PHRASE_RE = re.compile(r"\s*(" + "|".join(re.escape(p) for p in _WORDS) + r")(?=\s|$)")
+_KINDS = {phrase: kind for kind, phrases in _PHRASES.items() for phrase in phrases}
+# Сообщение длиннее — почти наверняка не просто вежливая фраза
+_MAX_LENGTH = 60
+# Если в сообщении несколько видов («спасибо, пока») — отвечаем на завершающий диалог
+_PRIORITY = (GOODBYE, THANKS, GREETING)
+
+_REPLIES = {
+    GREETING: (
+        "Привет! Я Моторчик Тёма, помогаю подобрать машину. "
+        "Расскажи, какую ищешь — марку, тип кузова или для каких задач?",
+        "Привет-привет! Это Моторчик Тёма. С какой машиной помочь? "
+        "Подскажи бюджет, кузов или любимую марку — и начнём.",
+        "Здравствуй! Моторчик Тёма на связи. Для чего нужна машина — город, семья, путешествия? "
+        "Расскажи, и я подберу варианты.",
+    ),
+    THANKS: (
+        "Пожалуйста! Если захочешь посмотреть другие варианты — просто напиши, что поменять: марку, кузов или бюджет.",
+        "Всегда рад помочь! Моторчик Тёма на связи, если понадобится подобрать ещё что-нибудь.",
+        "Обращайся! Могу уточнить подбор — например, по году, коробке или типу топлива.",
+    ),
+    GOODBYE: (
+        "До встречи! Моторчик Тёма будет ждать — возвращайся, когда захочешь продолжить подбор машины.",
+        "Пока! Удачи с выбором машины — если появятся вопросы, я здесь.",
+        "Всего доброго! Хорошей дороги, и возвращайся, если понадобится помощь с подбором.",
+    ),
+}
+
+
+def classify(normalized: str) -> str | None:
+    """
+    Вид вежливой фразы (GREETING / THANKS / GOODBYE), если нормализованное сообщение состоит только из неё;
+    None — в сообщении есть что-то ещё, отвечает LLM.
+    """
+    if not normalized or len(normalized) > _MAX_LENGTH:
+        return None
+    kinds = set()
+    pos = 0
+    while pos < len(normalized):
+        m = _PHRASE_RE.match(normalized, pos)
+        if m is None:
+            return None
+        kind = _KINDS.get(m.group(1))
+        if kind is not None:
+            kinds.add(kind)
+        pos = m.end()
+    return next((kind for kind in _PRIORITY if kind in kinds), None)
+
+
+def reply(kind: str, turn_number: int) -> str:
+    """Шаблонный ответ: варианты чередуются по номеру хода, чтобы в одной сессии не повторяться подряд."""
+    replies = _REPLIES[kind]
+    return replies[turn_number % len(replies)]
+
+
+class TemplateReplyStats:
+    """Сколько ходов получили шаблонный ответ вместо вызова LLM (по видам)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(_PHRASES, 0)
+
+    def record(self, kind: str) -> None:
+        with self._lock:
+            self._counts[kind] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {"llm_calls_saved": sum(counts.values()), **counts}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts = dict.fromkeys(_PHRASES, 0)
+
+
+_stats = TemplateReplyStats()
+
+
+def record(kind: str) -> None:
+    _stats.record(kind)
+
+
+def stats() -> dict:
+    """llm_calls_saved — всего ходов без LLM; greeting / thanks / goodbye — по видам."""
+    return _stats.stats()
+
+
+def clear() -> None:
+    """Сброс счётчиков (тесты)."""
+    _stats.clear()
+
+
+metrics.register_gauges("carmatch_template_replies", "Шаблонные ответы чата вместо вызова LLM", stats)
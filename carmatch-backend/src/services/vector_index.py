@@ -0,0 +1,238 @@
+"""
+Управление ANN-индексом pgvector по cars.embedding (HNSW / IVFFlat, косинусное расстояние).
+
+- apply_search_params — параметры точности поиска (ef_search / probes) на время текущей транзакции;
+- create_index / drop_index / reindex / index_status — обслуживание индекса
+  (используется в scripts/rebuild_vector_index.py);
+- install_vector_adapters / query_vector — эмбеддинг запроса как бинарный параметр типа vector.
+
+Без индекса каждый запрос ORDER BY embedding <=> :qv — полный проход по cars.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Sequence
+
+from pgvector import Vector
+from pgvector.psycopg import register_vector, register_vector_async
+from sqlalchemy import event, text as sa_text
+
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("hnsw", "ivfflat")
+INDEX_NAMES = {
+    "hnsw": "idx_cars_embedding_hnsw",
+    "ivfflat": "idx_cars_embedding_ivfflat",
+}
+ITERATIVE_SCAN_MODES = ("relaxed_order", "strict_order")
+
+# Ключ в info соединения пула: на соединении зарегистрированы адаптеры pgvector
+_VECTOR_ADAPTERS = "pgvector_adapters"
+
+
+def _is_postgres(db) -> bool:
+    """True, если сессия/соединение работает с PostgreSQL (в тестах SQLite — параметры не применяем)."""
+    bind = getattr(db, "bind", None)
+    dialect = getattr(bind, "dialect", None) or getattr(db, "dialect", None)
+    return getattr(dialect, "name", None) == "postgresql"
+
+
+def _register_vector(dbapi_connection, connection_record) -> None:
+    """Событие connect: адаптеры pgvector на новом соединении psycopg (sync и async)."""
+    try:
+        if hasattr(dbapi_connection, "run_async"):
+            dbapi_connection.run_async(register_vector_async)
+        else:
+            register_vector(dbapi_connection)
+    except Exception as e:  # noqa: BLE001
+        # Нет расширения vector — запрос эмбеддинга уйдёт текстом, как раньше
+        logger.warning("vector_index: адаптеры pgvector не зарегистрированы: %s", e)
+        return
+    connection_record.info[_VECTOR_ADAPTERS] = True
+
+
+def install_vector_adapters(engine) -> None:
+    """
+    Регистрирует типы pgvector на каждом новом соединении движка (Engine или AsyncEngine), чтобы
+    эмбеддинг запроса передавался бинарным параметром vector (query_vector), а не строкой
+    '[0.1,0.2,...]' из 256 чисел, которую сервер разбирает на каждом запросе.
+    Только PostgreSQL + psycopg; соединения пула живут долго — поиск типов выполняется один раз на соединение.
+    """
+    target = getattr(engine, "sync_engine", engine)
+    if target.dialect.name != "postgresql" or target.dialect.driver != "psycopg":
+        return
+    if event.contains(target, "connect", _register_vector):
+        return
+    event.listen(target, "connect", _register_vector)
+
+
+def query_vector(db, embedding: Sequence[float]):
+    """
+    Эмбеддинг запроса как bind-параметр: pgvector.Vector (бинарный формат psycopg), если на соединении
+    сессии зарегистрированы адаптеры (install_vector_adapters), иначе текст '[...]' для CAST(... AS vector).
+    """
+    if _is_postgres(db):
+        try:
+            if db.connection().connection.info.get(_VECTOR_ADAPTERS):
+                return Vector(list(embedding))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("vector_index: бинарный параметр vector недоступен: %s", e)
+    return "[" + ",".join(str(x) for x in embedding) + "]"
+
+
+def _check_index_type(index_type: str) -> str:
+    kind = (index_type or "").strip().lower()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Неизвестный тип индекса: {index_type!r} (допустимо: {', '.join(INDEX_TYPES)})")
+    return kind
+
+
+def apply_search_params(
+    db,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    filtered: bool = False,
+    limit: int | None = None,
+) -> None:
+    """
+    Выставляет hnsw.ef_search и ivfflat.probes для текущей транзакции
+    (set_config(..., is_local=true) — то же, что SET LOCAL, но с bind-параметрами).
+    Вызывается перед каждым запросом ORDER BY embedding <=> ...; после COMMIT/ROLLBACK
+    значения сбрасываются, поэтому соединение из пула возвращается «чистым».
+
+    filtered=True — в запросе есть WHERE по атрибутам: индекс отдаёт ef_search кандидатов,
+    и фильтр может отбросить почти все. Тогда включаем итеративный скан (pgvector >= 0.8:
+    индекс продолжает обход, пока не наберётся limit строк) и поднимаем ef_search
+    до limit * vector_filter_overfetch (запас кандидатов для версий без итеративного скана).
+    """
+    if not _is_postgres(db):
+        return
+    ef = ef_search if ef_search is not None else settings.vector_hnsw_ef_search
+    pr = probes if probes is not None else settings.vector_ivfflat_probes
+    if filtered and limit:
+        ef = max(int(ef), int(limit) * max(1, int(settings.vector_filter_overfetch)))
+        # Предел hnsw.ef_search в pgvector
+        ef = min(ef, 1000)
+    # Каждый set_config — в своём SAVEPOINT: ошибка откатывает только его, а не транзакцию
+    # вызывающего кода (несохранённые изменения и загруженные объекты сессии не теряются)
+    try:
+        with db.begin_nested():
+            db.execute(
+                sa_text(
+                    "SELECT set_config('hnsw.ef_search', :ef, true), "
+                    "set_config('ivfflat.probes', :probes, true)"
+                ),
+                {"ef": str(int(ef)), "probes": str(int(pr))},
+            )
+    except Exception as e:  # noqa: BLE001
+        # Старый pgvector без HNSW и т.п. — ищем с параметрами по умолчанию
+        logger.warning("vector_index: не удалось применить ef_search/probes: %s", e)
+        return
+
+    mode = (settings.vector_iterative_scan or "").strip().lower()
+    if not filtered or mode not in ITERATIVE_SCAN_MODES:
+        return
+    try:
+        # ivfflat поддерживает только relaxed_order
+        with db.begin_nested():
+            db.execute(
+                sa_text(
+                    "SELECT set_config('hnsw.iterative_scan', :mode, true), "
+                    "set_config('ivfflat.iterative_scan', 'relaxed_order', true)"
+                ),
+                {"mode": mode},
+            )
+    except Exception as e:  # noqa: BLE001
+        # pgvector < 0.8: параметров нет. Откатился только SAVEPOINT — ef_search остаётся,
+        # запас кандидатов даёт увеличенный ef_search.
+        logger.warning("vector_index: итеративный скан недоступен: %s", e)
+
+
+def auto_ivfflat_lists(rows: int) -> int:
+    """Рекомендация pgvector: lists = rows / 1000 (до 1M строк), но не меньше 10."""
+    return max(10, int(rows) // 1000)
+
+
+def index_ddl(
+    index_type: str | None = None,
+    concurrently: bool = False,
+    lists: int | None = None,
+    table: str = "cars",
+    index_name: str | None = None,
+) -> str:
+    """SQL создания ANN-индекса по embedding с vector_cosine_ops (оператор <=>)."""
+    kind = _check_index_type(index_type or settings.vector_index_type)
+    name = index_name or INDEX_NAMES[kind]
+    conc = "CONCURRENTLY " if concurrently else ""
+    if kind == "hnsw":
+        with_clause = (
+            f"WITH (m = {int(settings.vector_hnsw_m)}, "
+            f"ef_construction = {int(settings.vector_hnsw_ef_construction)})"
+        )
+        method = "hnsw"
+    else:
+        n_lists = int(lists or settings.vector_ivfflat_lists or 100)
+        with_clause = f"WITH (lists = {n_lists})"
+        method = "ivfflat"
+    return (
+        f"CREATE INDEX {conc}IF NOT EXISTS {name} ON {table} "
+        f"USING {method} (embedding vector_cosine_ops) {with_clause}"
+    )
+
+
+def index_status(conn) -> list[dict]:
+    """Список ANN-индексов по cars.embedding: имя, метод, размер, валидность (после CONCURRENTLY)."""
+    rows = conn.execute(
+        sa_text(
+            """
+            SELECT c.relname AS name,
+                   am.amname AS method,
+                   pg_size_pretty(pg_relation_size(c.oid)) AS size,
+                   i.indisvalid AS is_valid,
+                   pg_get_indexdef(c.oid) AS definition
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE t.relname = 'cars' AND am.amname IN ('hnsw', 'ivfflat')
+            ORDER BY c.relname
+            """
+        )
+    ).fetchall()
+    return [dict(r._mapping) for r in rows]
+
+
+def _count_embeddings(conn) -> int:
+    return int(conn.execute(sa_text("SELECT COUNT(*) FROM cars WHERE embedding IS NOT NULL")).scalar() or 0)
+
+
+def create_index(conn, index_type: str | None = None, concurrently: bool = True) -> str:
+    """
+    Создаёт ANN-индекс. conn — соединение в режиме AUTOCOMMIT, если concurrently=True
+    (CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции).
+    Для IVFFlat lists считается по числу строк с эмбеддингом, если не задан в настройках.
+    """
+    kind = _check_index_type(index_type or settings.vector_index_type)
+    lists = None
+    if kind == "ivfflat" and not settings.vector_ivfflat_lists:
+        lists = auto_ivfflat_lists(_count_embeddings(conn))
+    ddl = index_ddl(kind, concurrently=concurrently, lists=lists)
+    logger.info("vector_index: %s", ddl)
+    conn.execute(sa_text(ddl))
+    return INDEX_NAMES[kind]
+
+
+def drop_index(conn, index_type: str, concurrently: bool = True) -> None:
+    kind = _check_index_type(index_type)
+    conc = "CONCURRENTLY " if concurrently else ""
+    conn.execute(sa_text(f"DROP INDEX {conc}IF EXISTS {INDEX_NAMES[kind]}"))
+
+
+def reindex(conn, index_type: str | None = None, concurrently: bool = True) -> None:
+    """REINDEX индекса (после массовой перезаписи эмбеддингов граф HNSW / центроиды IVFFlat устаревают)."""
+    kind = _check_index_type(index_type or settings.vector_index_type)
+    conc = "CONCURRENTLY " if concurrently else ""
+    conn.execute(sa_text(f"REINDEX INDEX {conc}{INDEX_NAMES[kind]}"))
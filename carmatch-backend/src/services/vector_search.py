@@ -1,7 +1,7 @@
 """
 Сервис векторного поиска автомобилей (RAG).
 Формирует поисковый запрос из параметров диалога, получает эмбеддинг через Yandex API,
-выполняет cosine similarity search по pgvector и возвращает топ-N релевантных Car.
+выполняет cosine similarity search по pgvector и возвращает топ-N релевантных машин (CarCard) одним запросом.
 """
 
 from __future__ import annotations
@@ -9,11 +9,17 @@ from __future__ import annotations
 import logging
 from typing import Dict, Iterable, List, Tuple
 
+import numpy as np
 from sqlalchemy import text as sa_text
 from sqlalchemy.orm import Session
 
 from src.models import Car
+from src.services.car_cards import CARD_COLUMN_NAMES, CARD_COLUMNS, CarCard
+from src.services.embedding_cache import normalize_text
+from src.services.reference_data import reference_cache
+from src.services.vector_index import apply_search_params, query_vector
 from src.services.yandex_embeddings import get_query_embedding
+from src.utils import car_canonical
 
 logger = logging.getLogger(__name__)
 
@@ -60,13 +66,13 @@ def vector_search_cars(
     db: Session,
     query_text: str,
     limit: int = 10,
-) -> list[Car]:
+) -> list[CarCard]:
     """
     Векторный поиск автомобилей по смыслу запроса (cosine distance, pgvector).
 
     1. Получает query embedding через Yandex API (text-search-query).
-    2. Выполняет SELECT ... ORDER BY embedding <=> query LIMIT N.
-    3. Возвращает список объектов Car (ORM) или пустой список при ошибке.
+    2. Выполняет SELECT <поля карточки> ... ORDER BY embedding <=> query LIMIT N — один запрос.
+    3. Возвращает список CarCard в порядке близости или пустой список при ошибке.
 
     При недоступности Yandex API или отсутствии embeddings — возвращает [],
     чтобы вызывающий код мог переключиться на SQL-fallback.
@@ -81,21 +87,20 @@ def vector_search_cars(
         logger.warning("vector_search_cars: не удалось получить эмбеддинг запроса (Yandex API), fallback на SQL")
         return []
 
-    # Шаг 2: строка вектора для PostgreSQL: '[0.1,0.2,...]'
-    vec_str = "[" + ",".join(str(x) for x in embedding) + "]"
-
-    # Шаг 3: cosine similarity search через pgvector
+    # Шаг 2: cosine similarity search через pgvector (ANN-индекс, ef_search/probes из настроек);
+    # эмбеддинг — бинарный параметр vector, поля карточки — в том же SELECT
     try:
+        apply_search_params(db)
         rows = db.execute(
-            sa_text("""
-                SELECT id
+            sa_text(f"""
+                SELECT {_CARD_SELECT}
                 FROM cars
                 WHERE is_active = true AND embedding IS NOT NULL
                 ORDER BY embedding <=> CAST(:qv AS vector)
                 LIMIT :lim
             """),
-            {"qv": vec_str, "lim": limit},
-        ).fetchall()
+            {"qv": query_vector(db, embedding), "lim": limit},
+        ).mappings().all()
     except Exception as e:
         logger.exception("vector_search_cars: ошибка pgvector запроса: %s", e)
         return []
@@ -104,15 +109,7 @@ def vector_search_cars(
         logger.info("vector_search_cars: нет машин с заполненным embedding")
         return []
 
-    # Шаг 4: загрузить полные ORM-объекты Car по найденным id (сохраняя порядок)
-    car_ids = [r[0] for r in rows]
-    cars_by_id = {
-        car.id: car
-        for car in db.query(Car).filter(Car.id.in_(car_ids)).all()
-    }
-    # Возвращаем в порядке cosine distance (порядок из pgvector запроса)
-    result = [cars_by_id[cid] for cid in car_ids if cid in cars_by_id]
-
+    result = [CarCard.from_row(row) for row in rows]
     logger.info(
         "vector_search_cars: query=%r, найдено=%d авто (limit=%d)",
         query_text[:100],
@@ -127,6 +124,8 @@ def _normalize_str(value: str | None) -> str:
 
 
 def _parse_int(value: object) -> int | None:
+    if type(value) is int:
+        return value
     try:
         if value is None:
             return None
@@ -136,6 +135,8 @@ def _parse_int(value: object) -> int | None:
 
 
 def _parse_float(value: object) -> float | None:
+    if type(value) in (int, float):
+        return float(value)
     try:
         if value is None:
             return None
@@ -148,113 +149,142 @@ def vector_search_cars_with_scores(
     db: Session,
     query_text: str,
     limit: int = 20,
-) -> List[Tuple[Car, float]]:
+    filters: dict | None = None,
+    embedding: List[float] | None = None,
+) -> List[Tuple[CarCard, float]]:
     """
     Векторный поиск автомобилей по смыслу запроса (cosine distance, pgvector)
     с возвращением нормализованной косинусной близости (0..1) для каждого авто.
+
+    Один запрос возвращает и distance, и поля карточки (CARD_COLUMNS → CarCard): без второго
+    round trip за ORM-объектами Car и без чтения embedding / служебных колонок. Эмбеддинг запроса
+    передаётся бинарным параметром vector (vector_index.query_vector), а не строкой из 256 чисел.
+
+    filters — параметры диалога (brand, body_type, fuel_type, year/year_min/year_max,
+    horsepower): переносятся в WHERE того же запроса, поэтому при строгих фильтрах
+    возвращается до limit подходящих соседей за один round trip (итеративный скан
+    pgvector / увеличенный ef_search), а не limit кандидатов, большая часть которых
+    потом отбрасывается.
+
+    embedding — уже полученный эмбеддинг запроса (async-пайплайн чата запрашивает его сам
+    через aget_query_embedding); если не передан — запрашивается get_query_embedding.
     """
     if not query_text or not query_text.strip():
         logger.warning("vector_search_cars_with_scores: пустой query_text, пропускаем")
         return []
 
-    embedding = get_query_embedding(query_text)
+    if embedding is None:
+        embedding = get_query_embedding(query_text)
     if embedding is None:
         logger.warning(
             "vector_search_cars_with_scores: не удалось получить эмбеддинг запроса (Yandex API)"
         )
         return []
 
-    vec_str = "[" + ",".join(str(x) for x in embedding) + "]"
+    filter_sql, filter_binds = _vector_filter_sql(filters or {})
 
     try:
+        apply_search_params(db, filtered=bool(filter_sql), limit=limit)
         rows = db.execute(
             sa_text(
-                """
-                SELECT id, (embedding <=> CAST(:qv AS vector)) AS distance
+                f"""
+                SELECT {_CARD_SELECT}, (embedding <=> CAST(:qv AS vector)) AS distance
                 FROM cars
-                WHERE is_active = true AND embedding IS NOT NULL
+                WHERE is_active = true AND embedding IS NOT NULL{filter_sql}
                 ORDER BY embedding <=> CAST(:qv AS vector)
                 LIMIT :lim
             """
             ),
-            {"qv": vec_str, "lim": limit},
-        ).fetchall()
+            {"qv": query_vector(db, embedding), "lim": limit, **filter_binds},
+        ).mappings().all()
     except Exception as e:  # noqa: BLE001
         logger.exception("vector_search_cars_with_scores: ошибка pgvector запроса: %s", e)
         return []
 
     if not rows:
-        logger.info("vector_search_cars_with_scores: нет машин с заполненным embedding")
+        logger.info(
+            "vector_search_cars_with_scores: нет подходящих машин с embedding (filters=%s)",
+            sorted(filter_binds),
+        )
         return []
 
-    car_ids = [int(r[0]) for r in rows]
-    id_to_distance: Dict[int, float] = {int(r[0]): float(r[1]) for r in rows}
+    # Итеративный скан в режиме relaxed_order может вернуть строки не строго по distance
+    rows = sorted(rows, key=lambda r: float(r["distance"]))
 
-    cars_by_id = {
-        car.id: car for car in db.query(Car).filter(Car.id.in_(car_ids)).all()
-    }
-
-    result: List[Tuple[Car, float]] = []
-    for cid in car_ids:
-        car = cars_by_id.get(cid)
-        if not car:
-            continue
-        distance = id_to_distance.get(cid, 1.0)
-        raw_sim = 1.0 - float(distance)
+    result: List[Tuple[CarCard, float]] = []
+    for row in rows:
+        raw_sim = 1.0 - float(row["distance"])
         norm_sim = (raw_sim + 1.0) / 2.0
         if norm_sim < 0.0:
             norm_sim = 0.0
         elif norm_sim > 1.0:
             norm_sim = 1.0
-        result.append((car, norm_sim))
+        result.append((CarCard.from_row(row), norm_sim))
 
     logger.info(
-        "vector_search_cars_with_scores: query=%r, найдено=%d авто (limit=%d)",
+        "vector_search_cars_with_scores: query=%r, filters=%s, найдено=%d авто (limit=%d)",
         query_text[:100],
+        sorted(filter_binds),
         len(result),
         limit,
     )
     return result
 
 
-def sql_search_cars(
-    db: Session,
-    params: dict,
-    limit: int = 50,
-) -> List[Car]:
+# Колонки карточки в SELECT векторного запроса (имена колонок cars совпадают с полями CarCard)
+_CARD_SELECT = ", ".join(CARD_COLUMN_NAMES)
+
+# Текстовые параметры поиска -> колонка cars (ILIKE '%value%')
+_TEXT_FILTERS = (
+    ("brand", "mark_name"),
+    ("model", "model_name"),
+    ("country", "country"),
+    ("body_type", "body_type"),
+    ("fuel_type", "fuel_type"),
+    ("transmission", "transmission"),
+)
+
+# Параметры с каноническим кодом -> (колонка кода в cars, нормализатор): распознанное значение
+# ищется равенством по индексу вместо ILIKE, нераспознанное — по-прежнему ILIKE по _TEXT_FILTERS
+_CODE_FILTERS = (
+    ("body_type", "body_class", car_canonical.body_class),
+    ("fuel_type", "fuel_code", car_canonical.fuel_code),
+    ("transmission", "gearbox_code", car_canonical.gearbox_code),
+)
+
+# Параметры, которые переносятся в WHERE векторного запроса (надёжно совпадают со значениями в БД).
+# model/transmission не переносим: LLM часто пишет «автомат» при MT/AT в БД — фильтр обнулил бы выдачу.
+VECTOR_FILTER_KEYS = (
+    "brand",
+    "body_type",
+    "fuel_type",
+    "year",
+    "year_min",
+    "year_max",
+    "horsepower",
+    "power_min",
+    "power_max",
+)
+
+
+def _search_constraints(params: dict) -> dict:
     """
-    Поиск автомобилей по параметрам в SQL с допуском для числовых полей.
-
-    - brand, model, country, body_type, fuel_type — ILIKE '%value%' (если указаны).
-    - year / year_min / year_max — допуск по году: year BETWEEN (min - 1) AND (max + 1).
-    - horsepower — допуск по мощности: ±10% (но не меньше ±5 л.с.).
-    - engine_volume — допуск по объёму: ±0.1 л.
+    Нормализует параметры диалога в ограничения поиска:
+    текстовые — в нижнем регистре, числовые — в диапазоны с допусками
+    (year_min/year_max, hp_min/hp_max, ev_min/ev_max).
+    Общая логика для sql_search_cars и фильтрованного векторного поиска.
     """
-    q = db.query(Car).filter(Car.is_active.is_(True))
-
-    brand = _normalize_str(params.get("brand"))
-    if brand:
-        q = q.filter(Car.mark_name.ilike(f"%{brand}%"))
-
-    model = _normalize_str(params.get("model"))
-    if model:
-        q = q.filter(Car.model_name.ilike(f"%{model}%"))
-
-    country = _normalize_str(params.get("country"))
-    if country:
-        q = q.filter(Car.country.ilike(f"%{country}%"))
-
-    body_type = _normalize_str(params.get("body_type"))
-    if body_type:
-        q = q.filter(Car.body_type.ilike(f"%{body_type}%"))
-
-    fuel_type = _normalize_str(params.get("fuel_type"))
-    if fuel_type:
-        q = q.filter(Car.fuel_type.ilike(f"%{fuel_type}%"))
-
-    transmission = _normalize_str(params.get("transmission"))
-    if transmission:
-        q = q.filter(Car.transmission.ilike(f"%{transmission}%"))
+    constraints: dict = {}
+    for key, _column in _TEXT_FILTERS:
+        value = _normalize_str(params.get(key))
+        if value:
+            constraints[key] = value
+    for key, column, to_code in _CODE_FILTERS:
+        code = to_code(constraints.get(key))
+        if code is not None:
+            # Код вместо подстроки: constraints["body_class"] = "sedan", без constraints["body_type"]
+            del constraints[key]
+            constraints[column] = code
 
     # Год выпуска: поддержка year, year_min, year_max
     year = _parse_int(params.get("year"))
@@ -265,11 +295,10 @@ def sql_search_cars(
     if year is not None and year_min is None and year_max is None:
         year_min = year
         year_max = year
-
     if year_min is not None:
-        q = q.filter(Car.year >= year_min)
+        constraints["year_min"] = year_min
     if year_max is not None:
-        q = q.filter(Car.year <= year_max)
+        constraints["year_max"] = year_max
 
     # Мощность (л.с.): поддержка horsepower, power_min, power_max
     horsepower = _parse_int(params.get("horsepower"))
@@ -283,18 +312,101 @@ def sql_search_cars(
         p_max = float(power_max or power_min)
         center = (p_min + p_max) / 2.0
         delta = max(5.0, center * 0.1)
-        hp_min = int(center - delta)
-        hp_max = int(center + delta)
-        q = q.filter(Car.horsepower >= hp_min, Car.horsepower <= hp_max)
+        constraints["hp_min"] = int(center - delta)
+        constraints["hp_max"] = int(center + delta)
 
     # Объём двигателя (л) с небольшим допуском
     engine_volume = _parse_float(params.get("engine_volume"))
     if engine_volume is not None:
-        ev_min = engine_volume - 0.1
-        ev_max = engine_volume + 0.1
-        q = q.filter(Car.engine_volume >= ev_min, Car.engine_volume <= ev_max)
+        constraints["ev_min"] = engine_volume - 0.1
+        constraints["ev_max"] = engine_volume + 0.1
+    return constraints
+
+
+def _vector_filter_sql(params: dict) -> Tuple[str, dict]:
+    """
+    Фрагмент WHERE (с bind-параметрами) для векторного запроса по параметрам VECTOR_FILTER_KEYS.
+    Возвращает ("", {}), если фильтровать нечего.
+    """
+    constraints = _search_constraints({k: params.get(k) for k in VECTOR_FILTER_KEYS})
+    clauses: list[str] = []
+    binds: dict = {}
+    for key, column in _TEXT_FILTERS:
+        if key in constraints:
+            clauses.append(f"{column} ILIKE :f_{key}")
+            binds[f"f_{key}"] = f"%{constraints[key]}%"
+    for _key, column, _to_code in _CODE_FILTERS:
+        if column in constraints:
+            clauses.append(f"{column} = :f_{column}")
+            binds[f"f_{column}"] = constraints[column]
+    for key, column, op in (
+        ("year_min", "year", ">="),
+        ("year_max", "year", "<="),
+        ("hp_min", "horsepower", ">="),
+        ("hp_max", "horsepower", "<="),
+    ):
+        if key in constraints:
+            clauses.append(f"{column} {op} :f_{key}")
+            binds[f"f_{key}"] = constraints[key]
+    if not clauses:
+        return "", {}
+    return " AND " + " AND ".join(clauses), binds
+
+
+def vector_search_signature(query_text: str, filters: dict | None) -> tuple:
+    """
+    Что определяет результат vector_search_cars_with_scores: нормализованный текст запроса
+    (по нему кэшируется эмбеддинг) и итоговые фильтры WHERE. Одинаковая сигнатура — одинаковая выдача.
+    """
+    filter_sql, binds = _vector_filter_sql(filters) if filters else ("", {})
+    return normalize_text(query_text), filter_sql, tuple(sorted(binds.items()))
+
+
+def _sql_search_query(db: Session, params: dict):
+    """Запрос cars по параметрам (фильтры sql_search_cars / sql_search_cards), без LIMIT."""
+    q = db.query(Car).filter(Car.is_active.is_(True))
+    constraints = _search_constraints(params)
+
+    if "brand" in constraints:
+        brand = reference_cache.get(db).match_brand(constraints["brand"])
+        if brand is not None:
+            q = q.filter(Car.brand_id == brand[0])
+            del constraints["brand"]
+    for key, column in _TEXT_FILTERS:
+        if key in constraints:
+            q = q.filter(getattr(Car, column).ilike(f"%{constraints[key]}%"))
+    for _key, column, _to_code in _CODE_FILTERS:
+        if column in constraints:
+            q = q.filter(getattr(Car, column) == constraints[column])
+
+    if "year_min" in constraints:
+        q = q.filter(Car.year >= constraints["year_min"])
+    if "year_max" in constraints:
+        q = q.filter(Car.year <= constraints["year_max"])
+    if "hp_min" in constraints:
+        q = q.filter(Car.horsepower >= constraints["hp_min"], Car.horsepower <= constraints["hp_max"])
+    if "ev_min" in constraints:
+        q = q.filter(Car.engine_volume >= constraints["ev_min"], Car.engine_volume <= constraints["ev_max"])
+    return q
+
+
+def sql_search_cars(
+    db: Session,
+    params: dict,
+    limit: int = 50,
+) -> List[Car]:
+    """
+    Поиск автомобилей по параметрам в SQL с допуском для числовых полей.
 
-    cars = q.limit(limit).all()
+    - brand — равенство по brand_id, если марка есть в справочнике (с учётом опечаток), иначе ILIKE.
+    - body_type, fuel_type, transmission — равенство по body_class / fuel_code / gearbox_code,
+      если значение распознано (src/utils/car_canonical.py), иначе ILIKE '%value%'.
+    - model, country — ILIKE '%value%' (GIN-индексы pg_trgm).
+    - year / year_min / year_max — допуск по году: year BETWEEN (min - 1) AND (max + 1).
+    - horsepower — допуск по мощности: ±10% (но не меньше ±5 л.с.).
+    - engine_volume — допуск по объёму: ±0.1 л.
+    """
+    cars = _sql_search_query(db, params).limit(limit).all()
     logger.info(
         "sql_search_cars: params_keys=%s, найдено=%d авто (limit=%d)",
         [k for k, v in params.items() if v],
@@ -304,100 +416,166 @@ def sql_search_cars(
     return cars
 
 
-def compute_param_match_fraction(car: Car, params: dict) -> float:
-    """
-    Вычисляет долю совпавших параметров из запроса для конкретного автомобиля.
+def sql_search_cards(
+    db: Session,
+    params: dict,
+    limit: int = 50,
+) -> List[CarCard]:
+    """То же, что sql_search_cars, но выбирает только колонки карточки (CarCard) — для чата."""
+    rows = _sql_search_query(db, params).with_entities(*CARD_COLUMNS).limit(limit).all()
+    cards = [CarCard.from_row(row._mapping) for row in rows]
+    logger.info(
+        "sql_search_cards: params_keys=%s, найдено=%d авто (limit=%d)",
+        [k for k, v in params.items() if v],
+        len(cards),
+        limit,
+    )
+    return cards
 
-    Учитываются только параметры, которые не равны null/пустой строке.
+
+# Текстовые параметры для доли совпадений: параметр -> поле Car (подстрока без учёта регистра)
+_MATCH_TEXT_FIELDS = (
+    ("brand", "mark_name"),
+    ("model", "model_name"),
+    ("country", "country"),
+)
+
+# Параметр -> (поле Car с кодом, исходное текстовое поле, нормализатор)
+_MATCH_CODE_FIELDS = (
+    ("body_type", "body_class", "body_type", car_canonical.body_class),
+    ("fuel_type", "fuel_code", "fuel_type", car_canonical.fuel_code),
+    ("transmission", "gearbox_code", "transmission", car_canonical.gearbox_code),
+)
+
+
+class _CandidateColumns:
+    """
+    Кандидаты hybrid_rank в колонках NumPy: каждое поле читается из CarCard / Car и разбирается
+    один раз на пул (а не на каждый параметр каждой машины), дальше — маски над массивами.
+    Колонки строятся лениво — только для полей, которые есть в параметрах запроса.
     """
-    if not params:
-        return 0.0
 
-    total = 0
-    matched = 0
-
-    brand = _normalize_str(params.get("brand"))
-    if brand:
-        total += 1
-        if brand in _normalize_str(getattr(car, "mark_name", None)):
-            matched += 1
-
-    model = _normalize_str(params.get("model"))
-    if model:
-        total += 1
-        if model in _normalize_str(getattr(car, "model_name", None)):
-            matched += 1
-
-    country = _normalize_str(params.get("country"))
-    if country:
-        total += 1
-        if country in _normalize_str(getattr(car, "country", None)):
-            matched += 1
-
-    body_type = _normalize_str(params.get("body_type"))
-    if body_type:
-        total += 1
-        if body_type in _normalize_str(getattr(car, "body_type", None)):
-            matched += 1
-
-    fuel_type = _normalize_str(params.get("fuel_type"))
-    if fuel_type:
-        total += 1
-        if fuel_type in _normalize_str(getattr(car, "fuel_type", None)):
-            matched += 1
-
-    transmission = _normalize_str(params.get("transmission"))
-    if transmission:
-        total += 1
-        if transmission in _normalize_str(getattr(car, "transmission", None)):
-            matched += 1
+    def __init__(self, cars: list):
+        self.cars = cars
+        self._orm = all(isinstance(car, Car) for car in cars)
+        self._cache: dict = {}
+
+    def _values(self, field: str) -> list:
+        if not self._orm:
+            return [getattr(car, field, None) for car in self.cars]
+        # Загруженные колонки ORM лежат в __dict__ объекта: чтение оттуда минует дескриптор;
+        # незагруженные (expired) — через getattr, с подгрузкой из БД как обычно
+        return [
+            car.__dict__[field] if field in car.__dict__ else getattr(car, field, None)
+            for car in self.cars
+        ]
+
+    def __len__(self) -> int:
+        return len(self.cars)
+
+    def text(self, field: str) -> np.ndarray:
+        """Поле в нижнем регистре («» вместо None)."""
+        key = ("text", field)
+        if key not in self._cache:
+            values = [_normalize_str(v) for v in self._values(field)]
+            self._cache[key] = np.array(values, dtype=np.str_)
+        return self._cache[key]
+
+    def code(self, code_field: str, text_field: str, to_code) -> np.ndarray:
+        """Канонический код: посчитанный при записи, у несохранённых объектов — из текста («» — нет кода)."""
+        key = ("code", code_field)
+        if key not in self._cache:
+            values = [
+                code or to_code(text) or ""
+                for code, text in zip(self._values(code_field), self._values(text_field))
+            ]
+            self._cache[key] = np.array(values, dtype=np.str_)
+        return self._cache[key]
+
+    def number(self, field: str, parse) -> np.ndarray:
+        """Числовое поле как float64; NaN — пусто или не разбирается (сравнения с NaN дают False)."""
+        key = ("number", field)
+        if key not in self._cache:
+            parsed = map(parse, self._values(field))
+            self._cache[key] = np.fromiter(
+                (np.nan if v is None else v for v in parsed), dtype=np.float64, count=len(self.cars)
+            )
+        return self._cache[key]
+
+
+def _match_masks(columns: _CandidateColumns, params: dict) -> List[np.ndarray]:
+    """Булева маска «параметр совпал» по всем кандидатам — одна на каждый заданный параметр."""
+    masks: List[np.ndarray] = []
+    for key, field in _MATCH_TEXT_FIELDS:
+        value = _normalize_str(params.get(key))
+        if value:
+            masks.append(np.char.find(columns.text(field), value) >= 0)
+
+    for key, code_field, text_field, to_code in _MATCH_CODE_FIELDS:
+        value = _normalize_str(params.get(key))
+        if not value:
+            continue
+        code = to_code(value)
+        if code is not None:
+            masks.append(columns.code(code_field, text_field, to_code) == code)
+        else:
+            masks.append(np.char.find(columns.text(text_field), value) >= 0)
 
     year = _parse_int(params.get("year"))
     if year is not None:
-        total += 1
-        car_year = _parse_int(getattr(car, "year", None))
-        if car_year is not None and abs(car_year - year) <= 1:
-            matched += 1
+        masks.append(np.abs(columns.number("year", _parse_int) - year) <= 1)
 
     horsepower = _parse_int(params.get("horsepower"))
     if horsepower is not None:
-        total += 1
-        car_hp = _parse_int(getattr(car, "horsepower", None))
-        if car_hp is not None:
-            delta = max(5, int(horsepower * 0.1))
-            if abs(car_hp - horsepower) <= delta:
-                matched += 1
+        delta = max(5, int(horsepower * 0.1))
+        masks.append(np.abs(columns.number("horsepower", _parse_int) - horsepower) <= delta)
 
     engine_volume = _parse_float(params.get("engine_volume"))
     if engine_volume is not None:
-        total += 1
-        car_ev = _parse_float(getattr(car, "engine_volume", None))
-        if car_ev is not None and abs(car_ev - engine_volume) <= 0.1:
-            matched += 1
+        masks.append(np.abs(columns.number("engine_volume", _parse_float) - engine_volume) <= 0.1)
+    return masks
+
+
+def param_match_fractions(cars: list, params: dict) -> np.ndarray:
+    """Доли совпавших параметров для списка машин одним проходом (float64, по порядку cars)."""
+    columns = _CandidateColumns(list(cars))
+    masks = _match_masks(columns, params or {}) if len(columns) else []
+    if not masks:
+        return np.zeros(len(columns), dtype=np.float64)
+    return np.count_nonzero(np.vstack(masks), axis=0) / len(masks)
 
-    if total == 0:
+
+def compute_param_match_fraction(car: Car, params: dict) -> float:
+    """
+    Вычисляет долю совпавших параметров из запроса для конкретного автомобиля.
+
+    Учитываются только параметры, которые не равны null/пустой строке.
+    Кузов, топливо и коробка сравниваются по каноническим кодам (body_class, fuel_code, gearbox_code).
+    """
+    if not params:
         return 0.0
-    return matched / total
+    return float(param_match_fractions([car], params)[0])
 
 
 def hybrid_rank(
-    semantic_results: Iterable[Tuple[Car, float]],
-    sql_cars: Iterable[Car],
+    semantic_results: Iterable[Tuple[CarCard | Car, float]],
+    sql_cars: Iterable[CarCard | Car],
     params: dict,
     w1: float = 0.6,
     w2: float = 0.4,
     threshold: float = 0.6,
-) -> List[Tuple[Car, float]]:
+) -> List[Tuple[CarCard | Car, float]]:
     """
     Гибридное ранжирование:
     score = w1 * (семантическая_близость) + w2 * (доля_совпавших_параметров).
+    Доли и score считаются по всему пулу кандидатов сразу (массивы NumPy, см. _CandidateColumns).
     """
     id_to_sem_sim: Dict[int, float] = {}
-    id_to_car: Dict[int, Car] = {}
+    id_to_car: Dict[int, CarCard | Car] = {}
 
     has_semantic = False
     for car, sim in semantic_results or []:
-        if not isinstance(car, Car) or car.id is None:
+        if not isinstance(car, (CarCard, Car)) or car.id is None:
             continue
         cid = int(car.id)
         id_to_sem_sim[cid] = float(sim)
@@ -406,7 +584,7 @@ def hybrid_rank(
 
     has_sql = False
     for car in sql_cars or []:
-        if not isinstance(car, Car) or car.id is None:
+        if not isinstance(car, (CarCard, Car)) or car.id is None:
             continue
         cid = int(car.id)
         if cid not in id_to_car:
@@ -416,23 +594,22 @@ def hybrid_rank(
     if not id_to_car:
         return []
 
-    ranked: List[Tuple[Car, float]] = []
+    cars = list(id_to_car.values())
+    fractions = param_match_fractions(cars, params or {})
     # Режим fallback: нет семантических кандидатов, но есть результаты SQL.
     # В этом случае используем чисто параметрический скор (без порога),
     # чтобы не «терять» машины, найденные по фильтрам.
     if not has_semantic and has_sql:
-        for cid, car in id_to_car.items():
-            param_fraction = compute_param_match_fraction(car, params)
-            if param_fraction <= 0.0:
-                continue
-            ranked.append((car, float(param_fraction)))
+        scores = fractions
+        keep = scores > 0.0
     else:
-        for cid, car in id_to_car.items():
-            sem_sim = id_to_sem_sim.get(cid, 0.0)
-            param_fraction = compute_param_match_fraction(car, params)
-            score = w1 * sem_sim + w2 * param_fraction
-            if score >= threshold:
-                ranked.append((car, score))
-
-    ranked.sort(key=lambda x: x[1], reverse=True)
-    return ranked
+        sem_sims = np.fromiter(
+            (id_to_sem_sim.get(cid, 0.0) for cid in id_to_car), dtype=np.float64, count=len(cars)
+        )
+        scores = w1 * sem_sims + w2 * fractions
+        keep = scores >= threshold
+
+    # Устойчивая сортировка по убыванию: при равном score — в порядке кандидатов, как раньше
+    kept = np.flatnonzero(keep)
+    order = kept[np.argsort(-scores[kept], kind="stable")]
+    return [(cars[i], float(scores[i])) for i in order]
@@ -1,13 +1,22 @@
 """
 Сервис эмбеддингов Yandex Cloud (Foundation Models API).
 Используется для заполнения cars.embedding и векторного поиска.
+
+- get_embedding / get_query_embedding — один текст (синхронно, для запросов чата и админки);
+- embed_batch / aembed_batch — пакет текстов: async httpx, ограниченная параллельность,
+  token bucket под квоту API, повторы с backoff на 429/5xx (scripts/populate_cars_embeddings.py).
 """
+import asyncio
 import logging
-from typing import List
+import random
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Sequence
 
 import httpx
 
 from src.config import settings
+from src.services import embedding_cache, http_clients, metrics
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +27,58 @@ EMBEDDING_DIMENSION = 256
 BASE_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/textEmbedding"
 
 
+def _parse_embedding_response(data: dict) -> List[float] | None:
+    """Вектор из ответа textEmbedding; None, если это не list длины EMBEDDING_DIMENSION."""
+    # Ответ: {"embedding": {"embedding": [ ... ]}} или {"embedding": [ ... ]}
+    emb = data.get("embedding")
+    if isinstance(emb, dict):
+        emb = emb.get("embedding")
+    if not isinstance(emb, list) or len(emb) != EMBEDDING_DIMENSION:
+        return None
+    return [float(x) for x in emb]
+
+
+class _EmbeddingCall:
+    """Запрос textEmbedding внутри _embedding_call: kwargs — для client.post, read — разбор ответа."""
+
+    def __init__(self, model_uri: str, text: str):
+        self.kwargs = {
+            "json": {"modelUri": model_uri, "text": text},
+            "headers": {"Authorization": f"Api-Key {settings.yandex_api_key}"},
+        }
+        self.embedding: List[float] | None = None
+
+    def read(self, resp: httpx.Response) -> None:
+        resp.raise_for_status()
+        self.embedding = _parse_embedding_response(resp.json())
+        if self.embedding is None:
+            logger.error("Yandex embeddings: неверный формат ответа (ожидается list длины %d)", EMBEDDING_DIMENSION)
+
+
+@contextmanager
+def _embedding_call(model_uri: str, text: str) -> Iterator[_EmbeddingCall]:
+    """
+    Один запрос textEmbedding — общий для синхронного и асинхронного клиента: в блоке вызывающий делает
+    call.read(client.post(BASE_URL, **call.kwargs)) своим клиентом. Метрики провайдера и ошибки — здесь:
+    ошибка HTTP логируется и гасится, call.embedding остаётся None.
+    """
+    call = _EmbeddingCall(model_uri, text)
+    try:
+        with metrics.provider_call(metrics.YANDEX_EMBEDDINGS, "embedding"):
+            yield call
+    except httpx.HTTPStatusError as e:
+        logger.error("Yandex embeddings HTTP error: %s %s", e.response.status_code, e.response.text)
+    except Exception as e:
+        logger.exception("Yandex embeddings request failed: %s", e)
+
+
+def _request_embedding(model_uri: str, text: str) -> List[float] | None:
+    """POST textEmbedding синхронным клиентом; None при ошибке HTTP или неверном формате ответа."""
+    with _embedding_call(model_uri, text) as call:
+        call.read(http_clients.get_client(http_clients.YANDEX).post(BASE_URL, **call.kwargs))
+    return call.embedding
+
+
 def get_embedding(text: str) -> List[float] | None:
     """
     Возвращает вектор эмбеддинга для текста (модель text-search-doc, размерность 256).
@@ -31,45 +92,14 @@ def get_embedding(text: str) -> List[float] | None:
         return None
 
     model_uri = TEXT_SEARCH_DOC_URI_TEMPLATE.format(folder_id=settings.yandex_folder_id)
-    payload = {"modelUri": model_uri, "text": text}
-
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(
-                BASE_URL,
-                json=payload,
-                headers={"Authorization": f"Api-Key {settings.yandex_api_key}"},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-    except httpx.HTTPStatusError as e:
-        logger.error("Yandex embeddings HTTP error: %s %s", e.response.status_code, e.response.text)
-        return None
-    except Exception as e:
-        logger.exception("Yandex embeddings request failed: %s", e)
-        return None
-
-    # Ответ: {"embedding": {"embedding": [ ... ]}} или {"embedding": [ ... ]}
-    emb = data.get("embedding")
-    if emb is None:
-        logger.error("Yandex embeddings: в ответе нет поля embedding")
-        return None
-    if isinstance(emb, dict):
-        emb = emb.get("embedding")
-    if not isinstance(emb, list) or len(emb) != EMBEDDING_DIMENSION:
-        logger.error(
-            "Yandex embeddings: неверный формат (ожидается list длины %d), получено %s",
-            EMBEDDING_DIMENSION,
-            type(emb).__name__ if emb is not None else None,
-        )
-        return None
-    return [float(x) for x in emb]
+    return _request_embedding(model_uri, text)
 
 
 def get_query_embedding(text: str) -> List[float] | None:
     """
     Возвращает вектор эмбеддинга для поискового запроса (модель text-search-query, размерность 256).
     Используется для векторного поиска: запрос пользователя → эмбеддинг → сравнение с cars.embedding.
+    Повторяющиеся запросы берутся из кэша (src/services/embedding_cache.py) без обращения к API.
     """
     if not (settings.yandex_folder_id and settings.yandex_api_key):
         logger.warning("Yandex embeddings: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
@@ -79,35 +109,173 @@ def get_query_embedding(text: str) -> List[float] | None:
         return None
 
     model_uri = TEXT_SEARCH_QUERY_URI_TEMPLATE.format(folder_id=settings.yandex_folder_id)
-    payload = {"modelUri": model_uri, "text": text}
+    cached = embedding_cache.get(model_uri, text)
+    if cached is not None:
+        return cached
+    emb = _request_embedding(model_uri, text)
+    if emb is not None:
+        embedding_cache.put(model_uri, text, emb)
+    return emb
 
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(
-                BASE_URL,
-                json=payload,
-                headers={"Authorization": f"Api-Key {settings.yandex_api_key}"},
-            )
-            resp.raise_for_status()
-            data = resp.json()
-    except httpx.HTTPStatusError as e:
-        logger.error("Yandex embeddings HTTP error: %s %s", e.response.status_code, e.response.text)
-        return None
-    except Exception as e:
-        logger.exception("Yandex embeddings request failed: %s", e)
-        return None
 
-    emb = data.get("embedding")
-    if emb is None:
-        logger.error("Yandex embeddings: в ответе нет поля embedding")
+async def aget_query_embedding(text: str) -> List[float] | None:
+    """
+    Асинхронный вариант get_query_embedding для async-пайплайна чата: запрос к API — через общий
+    httpx.AsyncClient, обращения к таблице кэша query_embeddings — в потоке (синхронная сессия БД).
+    """
+    if not (settings.yandex_folder_id and settings.yandex_api_key):
+        logger.warning("Yandex embeddings: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
         return None
-    if isinstance(emb, dict):
-        emb = emb.get("embedding")
-    if not isinstance(emb, list) or len(emb) != EMBEDDING_DIMENSION:
-        logger.error(
-            "Yandex embeddings: неверный формат (ожидается list длины %d), получено %s",
-            EMBEDDING_DIMENSION,
-            type(emb).__name__ if emb is not None else None,
-        )
+    text = (text or "").strip()
+    if not text:
         return None
-    return [float(x) for x in emb]
+
+    model_uri = TEXT_SEARCH_QUERY_URI_TEMPLATE.format(folder_id=settings.yandex_folder_id)
+    cached = embedding_cache.get_cached(model_uri, text)
+    if cached is None:
+        cached = await asyncio.to_thread(embedding_cache.get, model_uri, text)
+    if cached is not None:
+        return cached
+
+    with _embedding_call(model_uri, text) as call:
+        call.read(await http_clients.get_async_client(http_clients.YANDEX).post(BASE_URL, **call.kwargs))
+    if call.embedding is not None:
+        await asyncio.to_thread(embedding_cache.put, model_uri, text, call.embedding)
+    return call.embedding
+
+
+# --- Пакетный режим ---------------------------------------------------------------
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты запросов (token bucket): rate токенов в секунду, ёмкость capacity.
+    acquire() ждёт, пока не появится токен, — запросы не превышают квоту API даже при большой параллельности.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def penalize(self, seconds: float) -> None:
+        """После 429 забираем токены на seconds вперёд: все воркеры притормаживают, а не только получивший 429."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0) - max(0.0, seconds) * self.rate
+
+
+def _retry_delay(attempt: int, retry_after: str | None) -> float:
+    """Retry-After из ответа, иначе экспоненциальный backoff с джиттером (0.5, 1, 2, 4 ... до 30 с)."""
+    if retry_after:
+        try:
+            return min(60.0, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+
+async def _arequest_embedding(
+    client: httpx.AsyncClient,
+    model_uri: str,
+    text: str,
+    limiter: TokenBucket,
+    max_retries: int,
+) -> List[float] | None:
+    """Один запрос в пакетном режиме: ждёт токен, повторяет при 429/5xx/сетевых ошибках."""
+    payload = {"modelUri": model_uri, "text": text}
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            with metrics.provider_call(metrics.YANDEX_EMBEDDINGS, "embedding_batch"):
+                resp = await client.post(BASE_URL, json=payload)
+        except httpx.TransportError as e:
+            if attempt >= max_retries:
+                logger.error("Yandex embeddings (batch): сетевая ошибка после %d попыток: %s", attempt + 1, e)
+                return None
+            await asyncio.sleep(_retry_delay(attempt, None))
+            continue
+        if resp.status_code >= 400:
+            metrics.provider_error(metrics.YANDEX_EMBEDDINGS, "embedding_batch")
+        if resp.status_code in RETRY_STATUS_CODES and attempt < max_retries:
+            delay = _retry_delay(attempt, resp.headers.get("Retry-After"))
+            if resp.status_code == 429:
+                limiter.penalize(delay)
+            logger.info("Yandex embeddings (batch): HTTP %s, повтор через %.1f с", resp.status_code, delay)
+            await asyncio.sleep(delay)
+            continue
+        if resp.status_code >= 400:
+            logger.error("Yandex embeddings (batch) HTTP error: %s %s", resp.status_code, resp.text[:300])
+            return None
+        emb = _parse_embedding_response(resp.json())
+        if emb is None:
+            logger.error("Yandex embeddings (batch): неверный формат ответа")
+        return emb
+    return None
+
+
+async def aembed_batch(
+    texts: Sequence[str],
+    query: bool = False,
+    concurrency: int | None = None,
+    rps: float | None = None,
+    max_retries: int | None = None,
+    limiter: TokenBucket | None = None,
+    on_result: Callable[[int, List[float] | None], None] | None = None,
+) -> List[List[float] | None]:
+    """
+    Эмбеддинги для пакета текстов (модель text-search-doc, query=True — text-search-query).
+    Возвращает список той же длины; None — для пустых текстов и неудачных запросов.
+    limiter можно передать общий на несколько пакетов, чтобы квота соблюдалась между ними.
+    """
+    if not (settings.yandex_folder_id and settings.yandex_api_key):
+        logger.warning("Yandex embeddings: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
+        return [None] * len(texts)
+    template = TEXT_SEARCH_QUERY_URI_TEMPLATE if query else TEXT_SEARCH_DOC_URI_TEMPLATE
+    model_uri = template.format(folder_id=settings.yandex_folder_id)
+    workers = max(1, int(concurrency or settings.yandex_embeddings_concurrency))
+    retries = settings.yandex_embeddings_max_retries if max_retries is None else max_retries
+    bucket = limiter or TokenBucket(rps if rps is not None else settings.yandex_embeddings_rps)
+    semaphore = asyncio.Semaphore(workers)
+    results: List[List[float] | None] = [None] * len(texts)
+
+    async with httpx.AsyncClient(
+        timeout=30.0,
+        headers={"Authorization": f"Api-Key {settings.yandex_api_key}"},
+        limits=httpx.Limits(max_connections=workers, max_keepalive_connections=workers),
+    ) as client:
+
+        async def _one(i: int, text: str) -> None:
+            text = (text or "").strip()
+            if text:
+                async with semaphore:
+                    results[i] = await _arequest_embedding(client, model_uri, text, bucket, retries)
+            if on_result:
+                on_result(i, results[i])
+
+        await asyncio.gather(*(_one(i, t) for i, t in enumerate(texts)))
+    return results
+
+
+def embed_batch(texts: Sequence[str], **kwargs) -> List[List[float] | None]:
+    """Синхронная обёртка над aembed_batch (для скриптов)."""
+    return asyncio.run(aembed_batch(texts, **kwargs))
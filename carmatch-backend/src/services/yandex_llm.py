@@ -3,12 +3,14 @@
 Использует те же учётные данные, что и эмбеддинги: YANDEX_FOLDER_ID, YANDEX_API_KEY.
 """
 
+import json
 import logging
-from typing import Any
+from typing import Any, AsyncIterator
 
 import httpx
 
 from src.config import settings
+from src.services import http_clients, metrics
 
 logger = logging.getLogger(__name__)
 
@@ -18,16 +20,10 @@ DEFAULT_MODEL = "yandexgpt-lite/latest"
 REQUEST_TIMEOUT = 90.0
 
 
-def completion(messages: list[dict[str, str]], temperature: float = 0.6, max_tokens: int = 2000) -> str:
-    """
-    Синхронный вызов YandexGPT completion.
-    messages: список {"role": "user" | "assistant" | "system", "content": "..."}.
-    Возвращает текст ответа ассистента или пустую строку при ошибке.
-    """
-    if not (settings.yandex_folder_id and settings.yandex_api_key):
-        logger.warning("Yandex LLM: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
-        return ""
-
+def _build_request(
+    messages: list[dict[str, str]], temperature: float, max_tokens: int, stream: bool = False
+) -> tuple[dict[str, Any], dict[str, str]] | None:
+    """Тело и заголовки запроса completion; None, если нет ни одного непустого сообщения."""
     # Yandex API ожидает role + text (не content)
     yandex_messages: list[dict[str, str]] = []
     for m in messages:
@@ -40,13 +36,13 @@ def completion(messages: list[dict[str, str]], temperature: float = 0.6, max_tok
         yandex_messages.append({"role": role, "text": text})
 
     if not yandex_messages:
-        return ""
+        return None
 
     model_uri = f"gpt://{settings.yandex_folder_id}/{DEFAULT_MODEL}"
     payload: dict[str, Any] = {
         "modelUri": model_uri,
         "completionOptions": {
-            "stream": False,
+            "stream": stream,
             "temperature": temperature,
             "maxTokens": max_tokens,
         },
@@ -58,32 +54,21 @@ def completion(messages: list[dict[str, str]], temperature: float = 0.6, max_tok
         "Authorization": f"Api-Key {settings.yandex_api_key}",
         "x-folder-id": settings.yandex_folder_id,
     }
+    return payload, headers
 
-    try:
-        with httpx.Client(timeout=REQUEST_TIMEOUT) as client:
-            resp = client.post(COMPLETION_URL, headers=headers, json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(
-            "Yandex LLM HTTP error: %s %s",
-            e.response.status_code,
-            (e.response.text or "")[:500],
-        )
-        return ""
-    except Exception as e:
-        logger.exception("Yandex LLM request failed: %s", e)
-        return ""
 
+def _parse_response(data: dict[str, Any], log_errors: bool = True) -> str:
     # Синхронный ответ: result.alternatives[0].message.text
     result = data.get("result") or data.get("response")
     if not result:
-        logger.error("Yandex LLM: в ответе нет result/response, keys=%s", list(data.keys()))
+        if log_errors:
+            logger.error("Yandex LLM: в ответе нет result/response, keys=%s", list(data.keys()))
         return ""
 
     alternatives = result.get("alternatives")
     if not alternatives or not isinstance(alternatives, list):
-        logger.error("Yandex LLM: нет alternatives в result")
+        if log_errors:
+            logger.error("Yandex LLM: нет alternatives в result")
         return ""
 
     first = alternatives[0]
@@ -96,3 +81,121 @@ def completion(messages: list[dict[str, str]], temperature: float = 0.6, max_tok
     if text is None:
         return ""
     return str(text).strip()
+
+
+def completion(messages: list[dict[str, str]], temperature: float = 0.6, max_tokens: int = 2000) -> str:
+    """
+    Синхронный вызов YandexGPT completion.
+    messages: список {"role": "user" | "assistant" | "system", "content": "..."}.
+    Возвращает текст ответа ассистента или пустую строку при ошибке.
+    """
+    if not (settings.yandex_folder_id and settings.yandex_api_key):
+        logger.warning("Yandex LLM: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
+        return ""
+    request = _build_request(messages, temperature, max_tokens)
+    if request is None:
+        return ""
+    payload, headers = request
+
+    try:
+        with metrics.provider_call(metrics.YANDEX_GPT, "completion"):
+            resp = http_clients.get_client(http_clients.YANDEX).post(
+                COMPLETION_URL,
+                headers=headers,
+                json=payload,
+                timeout=http_clients.request_timeout(REQUEST_TIMEOUT),
+            )
+            resp.raise_for_status()
+            data = resp.json()
+    except httpx.HTTPStatusError as e:
+        logger.error(
+            "Yandex LLM HTTP error: %s %s",
+            e.response.status_code,
+            (e.response.text or "")[:500],
+        )
+        return ""
+    except Exception as e:
+        logger.exception("Yandex LLM request failed: %s", e)
+        return ""
+    return _parse_response(data)
+
+
+async def acompletion(
+    messages: list[dict[str, str]], temperature: float = 0.6, max_tokens: int = 2000
+) -> str:
+    """Асинхронный вариант completion (общий httpx.AsyncClient, не занимает поток на время ответа LLM)."""
+    if not (settings.yandex_folder_id and settings.yandex_api_key):
+        logger.warning("Yandex LLM: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
+        return ""
+    request = _build_request(messages, temperature, max_tokens)
+    if request is None:
+        return ""
+    payload, headers = request
+
+    try:
+        with metrics.provider_call(metrics.YANDEX_GPT, "completion"):
+            resp = await http_clients.get_async_client(http_clients.YANDEX).post(
+                COMPLETION_URL,
+                headers=headers,
+                json=payload,
+                timeout=http_clients.request_timeout(REQUEST_TIMEOUT),
+            )
+            resp.raise_for_status()
+            data = resp.json()
+    except httpx.HTTPStatusError as e:
+        logger.error(
+            "Yandex LLM HTTP error: %s %s",
+            e.response.status_code,
+            (e.response.text or "")[:500],
+        )
+        return ""
+    except Exception as e:
+        logger.exception("Yandex LLM request failed: %s", e)
+        return ""
+    return _parse_response(data)
+
+
+async def astream_completion(
+    messages: list[dict[str, str]], temperature: float = 0.6, max_tokens: int = 2000
+) -> AsyncIterator[str]:
+    """
+    Потоковый completion (completionOptions.stream=true): отдаёт новые фрагменты текста по мере генерации.
+    Yandex присылает по строке JSON на чанк, и в каждом чанке — весь текст с начала ответа,
+    поэтому здесь отдаётся только прирост относительно предыдущего чанка.
+    Ошибки HTTP/сети пробрасываются вызывающему (для fallback на другого провайдера).
+    """
+    if not (settings.yandex_folder_id and settings.yandex_api_key):
+        logger.warning("Yandex LLM: не заданы YANDEX_FOLDER_ID или YANDEX_API_KEY")
+        return
+    request = _build_request(messages, temperature, max_tokens, stream=True)
+    if request is None:
+        return
+    payload, headers = request
+
+    sent = ""
+    # Время — до конца потока (включая генерацию всех токенов)
+    with metrics.provider_call(metrics.YANDEX_GPT, "stream"):
+        async with http_clients.get_async_client(http_clients.YANDEX).stream(
+            "POST",
+            COMPLETION_URL,
+            headers=headers,
+            json=payload,
+            timeout=http_clients.request_timeout(REQUEST_TIMEOUT),
+        ) as resp:
+            if resp.status_code >= 400:
+                body = (await resp.aread()).decode("utf-8", errors="replace")
+                logger.error("Yandex LLM stream HTTP error: %s %s", resp.status_code, body[:500])
+                resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    logger.warning("Yandex LLM stream: не удалось разобрать чанк: %s", line[:200])
+                    continue
+                text = _parse_response(data, log_errors=False)
+                if len(text) > len(sent) and text.startswith(sent):
+                    delta, sent = text[len(sent):], text
+                    yield delta
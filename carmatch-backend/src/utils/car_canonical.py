@@ -0,0 +1,132 @@
+"""
+Канонические коды для поиска по cars: класс кузова, тип топлива, тип коробки.
+
+В cars эти поля — свободный текст из разных источников («Хэтчбек 5 дв.», «Hatchback», «бензин»,
+«1.6 AT»), а пользователь и LLM пишут «хетчбек», «автомат», «на дизеле». Раньше всё это
+сопоставлялось на каждом запросе: алиасы, пары кириллица/латиница и OR из нескольких ILIKE.
+Теперь одна и та же функция считает код и для строки cars (при вставке/обновлении, см. models.py,
+и в миграции 18 для существующих строк), и для параметра поиска — в SQL остаётся равенство
+по индексируемой колонке:
+  body_class   — sedan, hatchback, wagon, suv, crossover, coupe, minivan, liftback, cabriolet, pickup;
+  fuel_code    — petrol, diesel, hybrid, electric, gas;
+  gearbox_code — MT, AT, AMT, CVT.
+None — значение не распознано (поиск тогда падает обратно на ILIKE по исходной колонке).
+"""
+
+import re
+from typing import Optional
+
+# Пары (кириллица, латиница) для поиска типа кузова: в БД может быть и то и другое; латиница — код класса
+BODY_TYPE_SEARCH_PAIRS = [
+    ("хэтчбек", "hatchback"),
+    ("седан", "sedan"),
+    ("универсал", "wagon"),
+    ("внедорожник", "suv"),
+    ("кроссовер", "crossover"),
+    ("купе", "coupe"),
+    ("минивэн", "minivan"),
+    ("лифтбек", "liftback"),
+    ("кабриолет", "cabriolet"),
+    ("пикап", "pickup"),
+]
+
+# Варианты написания (е/э и т.д.): как может прийти от пользователя/LLM -> каноническая подстрока для БД
+BODY_TYPE_NORMALIZE = {
+    "хетчбек": "хэтчбек",   # в БД: «Хэтчбек 3 дв.» — с «э»
+    "хэтчбек": "хэтчбек",
+    "седан": "седан",
+    "универсал": "универсал",
+    "внедорожник": "внедорожник",
+    "кроссовер": "кроссовер",
+    "купе": "купе",
+    "минивен": "минивэн",
+    "минивэн": "минивэн",
+    "лифтбек": "лифтбек",
+    "кабриолет": "кабриолет",
+    "пикап": "пикап",
+}
+
+# Нормализация типа коробки из формулировок пользователя/LLM к подстроке для поиска в БД (MT, AT, AMT, CVT)
+TRANSMISSION_SEARCH_ALIASES = {
+    "автомат": "AT",
+    "автоматическая": "AT",
+    "акпп": "AT",
+    "механика": "MT",
+    "механическая": "MT",
+    "мкпп": "MT",
+    "ручная": "MT",
+    "вариатор": "CVT",
+    "робот": "AMT",
+    "роботизированная": "AMT",
+}
+
+# Обозначения коробки в строках cars (см. modification_parser.TRANSMISSION_PATTERN) -> код
+_GEARBOX_TOKENS = {
+    "mt": "MT",
+    "mkp": "MT",
+    "at": "AT",
+    "akp": "AT",
+    "amt": "AMT",
+    "ркпп": "AMT",
+    "dsg": "AMT",
+    "dct": "AMT",
+    "cvt": "CVT",
+    "manual": "MT",
+    "automatic": "AT",
+}
+_GEARBOX_WORD = re.compile(r"[a-zа-яё]+")
+
+# Подстрока (в нижнем регистре) -> код топлива; порядок важен: «gasoline» — бензин, а не газ
+_FUEL_STEMS = (
+    ("гибрид", "hybrid"),
+    ("hybrid", "hybrid"),
+    ("hyb", "hybrid"),
+    ("бенз", "petrol"),
+    ("petrol", "petrol"),
+    ("gasoline", "petrol"),
+    ("диз", "diesel"),
+    ("diesel", "diesel"),
+    ("элект", "electric"),
+    ("electr", "electric"),
+    ("газ", "gas"),
+    ("lpg", "gas"),
+    ("cng", "gas"),
+)
+
+
+def body_class(value: Optional[str]) -> Optional[str]:
+    """«Хэтчбек 5 дв.», «hatchback», «хетчбек» -> hatchback."""
+    s = (value or "").strip().lower()
+    if not s:
+        return None
+    # е/э внутри строки («Хетчбек 5 дв.»), а не только целым словом, как в BODY_TYPE_NORMALIZE
+    search_term = s.replace("хетчбек", "хэтчбек").replace("минивен", "минивэн")
+    for cyr, lat in BODY_TYPE_SEARCH_PAIRS:
+        if cyr in search_term or lat in search_term:
+            return lat
+    return None
+
+
+def fuel_code(value: Optional[str]) -> Optional[str]:
+    """«бензин», «Petrol», «на дизеле» -> petrol / diesel / ..."""
+    s = (value or "").strip().lower()
+    if not s:
+        return None
+    for stem, code in _FUEL_STEMS:
+        if stem in s:
+            return code
+    return None
+
+
+def gearbox_code(value: Optional[str]) -> Optional[str]:
+    """«AT», «1.6 MT», «автомат», «Вариатор», «DSG» -> AT / MT / CVT / AMT."""
+    s = (value or "").strip().lower()
+    if not s:
+        return None
+    for word in _GEARBOX_WORD.findall(s):
+        code = _GEARBOX_TOKENS.get(word)
+        if code is None and word in TRANSMISSION_SEARCH_ALIASES:
+            code = TRANSMISSION_SEARCH_ALIASES[word]
+        if code is not None:
+            return code
+    return None
@@ -0,0 +1,137 @@
+"""
+Поиск набора ключевых слов в тексте за один проход.
+
+Определение намерения и параметров в чате (_message_mentions_car_or_params, _override_params_from_last_message,
+extract_params_fallback) проверяло сотни ключевых слов по очереди — `"седан" in text`, re.search(r"\b(bmw|бмв)\b")
+и т.д. KeywordMatcher собирает все слова в один регэксп-префиксное дерево, скомпилированное один раз
+(«(?=(элект(?:ро(?:мобиль)?|рический)|...))»), и за один проход по тексту находит все вхождения, в том числе
+перекрывающиеся. Проверки после этого — поиск в словаре:
+  - KeywordHits.has(word)      — то же, что `word in text`;
+  - KeywordHits.has_word(word) — то же, что re.search(r"\b" + re.escape(word) + r"\b", text);
+  - KeywordGroups.first/last   — первая/последняя по порядку группа [(слова, значение), ...] с вхождением:
+    перебираются только найденные слова, а не все группы.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Iterable
+
+
+def _is_word_char(ch: str) -> bool:
+    # Как \w в re (Unicode): буква/цифра или подчёркивание
+    return ch.isalnum() or ch == "_"
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Регэксп-дерево по общим префиксам: на каждой позиции жадно берётся самое длинное слово."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            return (body if len(branches) > 1 else "(?:" + body + ")") + "?"
+        return body
+
+    return build(trie)
+
+
+class KeywordHits:
+    """Вхождения ключевых слов в одном тексте: слово → позиции начала."""
+
+    __slots__ = ("text", "positions")
+
+    def __init__(self, text: str, positions: dict[str, list[int]]):
+        self.text = text
+        self.positions = positions
+
+    def has(self, word: str) -> bool:
+        return word in self.positions
+
+    def has_any(self, words: frozenset[str]) -> bool:
+        return not words.isdisjoint(self.positions)
+
+    def has_word(self, word: str) -> bool:
+        """Есть вхождение с границами слова с обеих сторон (как \\b...\\b в re)."""
+        starts = self.positions.get(word)
+        if not starts:
+            return False
+        text = self.text
+        for start in starts:
+            end = start + len(word)
+            before = start > 0 and _is_word_char(text[start - 1])
+            after = end < len(text) and _is_word_char(text[end])
+            if before != _is_word_char(word[0]) and after != _is_word_char(word[-1]):
+                return True
+        return False
+
+
+class KeywordMatcher:
+    """Набор ключевых слов (нижний регистр), скомпилированный в один регэксп; scan() — все вхождения за проход."""
+
+    def __init__(self, words: Iterable[str]):
+        unique = sorted({w for w in words if w})
+        self.words = tuple(unique)
+        # Совпадение на позиции — самое длинное слово; все более короткие слова с той же позиции — его префиксы
+        word_set = set(unique)
+        self._prefixes = {
+            w: tuple(w[:i] for i in range(1, len(w) + 1) if w[:i] in word_set) for w in unique
+        }
+        self._regex = re.compile("(?=(" + _trie_pattern(unique) + "))") if unique else None
+
+    def scan(self, text: str) -> KeywordHits:
+        positions: dict[str, list[int]] = {}
+        if self._regex is not None and text:
+            prefixes = self._prefixes
+            for m in self._regex.finditer(text):
+                start = m.start()
+                for word in prefixes[m.group(1)]:
+                    positions.setdefault(word, []).append(start)
+        return KeywordHits(text, positions)
+
+
+class KeywordGroups:
+    """
+    Упорядоченные группы ключевых слов [(слова, значение), ...] — как цепочка if/elif по группам.
+    whole_word=True — вхождение считается только целым словом (has_word), иначе подстрокой (has).
+    """
+
+    def __init__(self, groups: Iterable[tuple[Iterable[str], object]], whole_word: bool = False):
+        self.values: list = []
+        self._index: dict[str, list[int]] = {}
+        for i, (words, value) in enumerate(groups):
+            self.values.append(value)
+            for word in words:
+                if word:
+                    self._index.setdefault(word, []).append(i)
+        self.whole_word = whole_word
+
+    @property
+    def words(self) -> tuple[str, ...]:
+        return tuple(self._index)
+
+    def _matched(self, hits: KeywordHits) -> list[int]:
+        matched = []
+        for word in hits.positions:
+            groups = self._index.get(word)
+            if groups and (not self.whole_word or hits.has_word(word)):
+                matched.extend(groups)
+        return matched
+
+    def first(self, hits: KeywordHits):
+        """Значение первой по порядку группы, слово которой есть в тексте; None — ни одной."""
+        matched = self._matched(hits)
+        return self.values[min(matched)] if matched else None
+
+    def last(self, hits: KeywordHits):
+        """Значение последней по порядку группы с вхождением — когда более позднее правило перекрывает раннее."""
+        matched = self._matched(hits)
+        return self.values[max(matched)] if matched else None
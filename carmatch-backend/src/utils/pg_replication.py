@@ -0,0 +1,269 @@
+"""
+Репликация таблиц PostgreSQL → PostgreSQL через COPY (FORMAT binary) на psycopg3.
+
+Раньше скрипты переноса на Render читали cars страницами OFFSET/LIMIT (каждая следующая страница
+дороже предыдущей) и собирали ORM-объекты построчно, включая эмбеддинг на 256 чисел.
+Здесь строки идут потоком без разбора в Python:
+  COPY (SELECT ... WHERE key > :last AND key <= :upper) TO STDOUT (FORMAT binary)  — источник
+  COPY table (...) FROM STDIN (FORMAT binary)                                      — приёмник
+  - keyset-пагинация по первичному ключу: каждая пачка — отдельная транзакция на приёмнике,
+    прерванный перенос продолжается с max(key) приёмника (resume);
+  - источник таблицы читается в одной транзакции REPEATABLE READ READ ONLY: пачки согласованы между собой;
+  - таблицы одной «волны» (без FK друг на друга) копируются параллельно, волны — по порядку FK;
+  - в конце — сверка: число строк и сумма md5 строк на обеих сторонах.
+
+Используется в scripts/copy_cars_to_render.py, copy_full_db_to_render.py, update_render_db.py.
+Схема на приёмнике должна совпадать (alembic upgrade head): binary COPY требует тех же типов колонок.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import psycopg
+from psycopg import IsolationLevel, sql
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 20000
+
+
+def libpq_url(url: str) -> str:
+    """URL SQLAlchemy (postgresql+psycopg://) → строка подключения libpq для psycopg.connect."""
+    url = (url or "").strip()
+    for prefix in ("postgresql+psycopg://", "postgresql+psycopg2://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql://" + url[len(prefix):]
+    return url
+
+
+@dataclass
+class TableSpec:
+    name: str
+    key: Tuple[str, ...] = ("id",)
+    # Колонка -> SQL-выражение на источнике вместо значения (напр. NULL::integer для FK, которых нет на приёмнике)
+    overrides: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class TableResult:
+    name: str
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    resumed: bool = False
+    source_count: int | None = None
+    target_count: int | None = None
+    checksum_ok: bool | None = None
+
+
+def table_waves(tables: Sequence) -> List[List[str]]:
+    """
+    Волны таблиц SQLAlchemy по внешним ключам: в волне N — таблицы, ссылающиеся только на волны < N.
+    Таблицы одной волны можно копировать параллельно.
+    """
+    names = {t.name for t in tables}
+    deps = {
+        t.name: {fk.column.table.name for fk in t.foreign_keys if fk.column.table.name in names} - {t.name}
+        for t in tables
+    }
+    waves: List[List[str]] = []
+    placed: set = set()
+    while len(placed) < len(deps):
+        wave = sorted(name for name, refs in deps.items() if name not in placed and refs <= placed)
+        if not wave:
+            raise ValueError(f"Циклические внешние ключи: {sorted(set(deps) - placed)}")
+        waves.append(wave)
+        placed.update(wave)
+    return waves
+
+
+def _columns(conn: psycopg.Connection, table: str) -> List[str]:
+    rows = conn.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+        (table,),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def _expressions(columns: Sequence[str], spec: TableSpec, aliased: bool) -> sql.Composable:
+    parts = []
+    for c in columns:
+        if c in spec.overrides:
+            expr = sql.SQL(spec.overrides[c])
+            parts.append(sql.SQL("{} AS {}").format(expr, sql.Identifier(c)) if aliased else expr)
+        else:
+            parts.append(sql.Identifier(c))
+    return sql.SQL(", ").join(parts)
+
+
+def _key(spec: TableSpec) -> sql.Composable:
+    return sql.SQL("({})").format(sql.SQL(", ").join(sql.Identifier(k) for k in spec.key))
+
+
+def _key_literal(value: tuple) -> sql.Composable:
+    return sql.SQL("({})").format(sql.SQL(", ").join(sql.Literal(v) for v in value))
+
+
+def _source_connection(source_url: str) -> psycopg.Connection:
+    """
+    Соединение с источником: только чтение, REPEATABLE READ. Транзакция открывается первым запросом
+    и держится до закрытия соединения — все запросы к источнику видят один снимок.
+    """
+    conn = psycopg.connect(libpq_url(source_url))
+    conn.isolation_level = IsolationLevel.REPEATABLE_READ
+    conn.read_only = True
+    return conn
+
+
+def _shared_columns(src: psycopg.Connection, dst: psycopg.Connection, table: str) -> List[str]:
+    target = set(_columns(dst, table))
+    columns = [c for c in _columns(src, table) if c in target]
+    if not columns:
+        raise ValueError(f"Таблица {table} отсутствует на источнике или приёмнике")
+    return columns
+
+
+def copy_table(
+    source_url: str,
+    target_url: str,
+    spec: TableSpec,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    resume: bool = True,
+    progress: Callable[[str], None] = print,
+) -> TableResult:
+    """Копирует таблицу пачками по ключу; при resume=True начинает после max(key) на приёмнике."""
+    result = TableResult(spec.name)
+    started = time.perf_counter()
+    table = sql.Identifier(spec.name)
+    key = _key(spec)
+    key_columns = sql.SQL(", ").join(sql.Identifier(k) for k in spec.key)
+    # Источник — одна транзакция REPEATABLE READ на таблицу: все пачки читаются из одного снимка
+    # (в READ COMMITTED каждый COPY брал бы новый снимок и при параллельной записи пачки расходились бы)
+    with _source_connection(source_url) as src, psycopg.connect(libpq_url(target_url)) as dst:
+        columns = _shared_columns(src, dst, spec.name)
+        select_list = _expressions(columns, spec, aliased=True)
+        column_list = sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+
+        last: tuple | None = None
+        if resume:
+            row = dst.execute(
+                sql.SQL("SELECT {k} FROM {t} ORDER BY {k} DESC LIMIT 1").format(k=key_columns, t=table)
+            ).fetchone()
+            dst.commit()
+            if row is not None:
+                last = tuple(row)
+                result.resumed = True
+                progress(f"  {spec.name}: продолжение после ключа {last if len(last) > 1 else last[0]}")
+
+        while True:
+            after = sql.SQL("WHERE {} > {}").format(key, _key_literal(last)) if last is not None else sql.SQL("")
+            upper_row = src.execute(
+                sql.SQL(
+                    "SELECT {k} FROM (SELECT {k} FROM {t} {after} ORDER BY {k} LIMIT {n}) AS page "
+                    "ORDER BY {k} DESC LIMIT 1"
+                ).format(k=key_columns, t=table, after=after, n=sql.Literal(batch_rows))
+            ).fetchone()
+            if upper_row is None:
+                break
+            upper = tuple(upper_row)
+            bounds = sql.SQL("{} <= {}").format(key, _key_literal(upper))
+            if last is not None:
+                bounds = sql.SQL("{} > {} AND ").format(key, _key_literal(last)) + bounds
+            copy_out = sql.SQL("COPY (SELECT {cols} FROM {t} WHERE {bounds}) TO STDOUT (FORMAT BINARY)").format(
+                cols=select_list, t=table, bounds=bounds
+            )
+            copy_in = sql.SQL("COPY {t} ({cols}) FROM STDIN (FORMAT BINARY)").format(t=table, cols=column_list)
+            with src.cursor() as src_cur, dst.cursor() as dst_cur:
+                with src_cur.copy(copy_out) as out, dst_cur.copy(copy_in) as into:
+                    for chunk in out:
+                        into.write(chunk)
+                copied = dst_cur.rowcount
+            dst.commit()
+            result.rows += max(copied, 0)
+            result.batches += 1
+            last = upper
+            progress(f"  {spec.name}: {result.rows} строк")
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _checksum(conn: psycopg.Connection, spec: TableSpec, columns: Sequence[str], source: bool) -> Tuple[int, int]:
+    """(число строк, сумма первых 60 бит md5 текстового представления строк) — не зависит от порядка."""
+    row_expr = _expressions(columns, spec if source else TableSpec(spec.name, spec.key), aliased=False)
+    query = sql.SQL(
+        "SELECT count(*), COALESCE(sum(('x' || substr(md5(ROW({row})::text), 1, 15))::bit(60)::bigint), 0) FROM {t}"
+    ).format(row=row_expr, t=sql.Identifier(spec.name))
+    count, total = conn.execute(query).fetchone()
+    return int(count), int(total)
+
+
+def verify_table(source_url: str, target_url: str, spec: TableSpec, result: TableResult | None = None) -> TableResult:
+    """Сверка таблицы после копирования: число строк и контрольная сумма совпадают на обеих сторонах."""
+    result = result or TableResult(spec.name)
+    with _source_connection(source_url) as src, psycopg.connect(libpq_url(target_url)) as dst:
+        columns = _shared_columns(src, dst, spec.name)
+        src_count, src_sum = _checksum(src, spec, columns, source=True)
+        dst_count, dst_sum = _checksum(dst, spec, columns, source=False)
+    result.source_count, result.target_count = src_count, dst_count
+    result.checksum_ok = src_count == dst_count and src_sum == dst_sum
+    return result
+
+
+def reset_sequences(target_url: str, tables: Sequence[TableSpec]) -> None:
+    """Последовательности serial-ключей на приёмнике — на max(id), чтобы новые вставки не конфликтовали."""
+    with psycopg.connect(libpq_url(target_url)) as dst:
+        for spec in tables:
+            if len(spec.key) != 1:
+                continue
+            seq = dst.execute("SELECT pg_get_serial_sequence(%s, %s)", (spec.name, spec.key[0])).fetchone()[0]
+            if not seq:
+                continue
+            dst.execute(
+                sql.SQL("SELECT setval(%s, COALESCE((SELECT max({k}) FROM {t}), 0) + 1, false)").format(
+                    k=sql.Identifier(spec.key[0]), t=sql.Identifier(spec.name)
+                ),
+                (seq,),
+            )
+
+
+def replicate(
+    source_url: str,
+    target_url: str,
+    waves: Sequence[Sequence[TableSpec]],
+    workers: int = 4,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    resume: bool = True,
+    verify: bool = True,
+    progress: Callable[[str], None] = print,
+) -> List[TableResult]:
+    """
+    Копирует волны таблиц по порядку, таблицы внутри волны — параллельно (workers соединений на сторону).
+    После копирования — сверка (verify) и сдвиг последовательностей. Ошибка в таблице прерывает перенос;
+    уже закоммиченные пачки остаются, повторный запуск с resume=True продолжит с места остановки.
+    """
+    results: List[TableResult] = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for wave in waves:
+            futures = [
+                pool.submit(copy_table, source_url, target_url, spec, batch_rows, resume, progress) for spec in wave
+            ]
+            wave_results = [f.result() for f in futures]
+            for r in wave_results:
+                progress(f"{r.name}: {r.rows} строк за {r.seconds:.1f} с ({r.batches} пачек)")
+            results.extend(wave_results)
+        specs = [spec for wave in waves for spec in wave]
+        if verify:
+            by_name = {r.name: r for r in results}
+            list(pool.map(lambda s: verify_table(source_url, target_url, s, by_name[s.name]), specs))
+    reset_sequences(target_url, specs)
+    if verify:
+        for r in results:
+            status = "OK" if r.checksum_ok else "РАСХОЖДЕНИЕ"
+            progress(f"Сверка {r.name}: источник {r.source_count}, приёмник {r.target_count} — {status}")
+    return results
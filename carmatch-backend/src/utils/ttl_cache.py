@@ -0,0 +1,81 @@
+"""
+Потокобезопасный LRU с TTL и счётчиками обращений — общая основа кэшей процесса
+(эмбеддинги запросов, контекст диалога, principal для проверки токена).
+
+get/put/discard не трогают счётчики: что считать попаданием, решает модуль кэша (record),
+например попадание в память и в БД у кэша эмбеддингов учитываются раздельно.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Sequence, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    max_size=0 — кэш выключен (get всегда None, put ничего не хранит); ttl_seconds <= 0 — без срока.
+    counters — имена счётчиков для record/stats; «misses» обязателен, остальные считаются попаданиями.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, counters: Sequence[str] = ("hits", "misses")):
+        self.max_size = max(0, int(max_size))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[K, tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(counters, 0)
+
+    def get(self, key: K) -> V | None:
+        if not self.max_size:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if self.ttl_seconds > 0 and now - stored_at > self.ttl_seconds:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        if not self.max_size:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def record(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def clear(self) -> None:
+        """Сброс записей и счётчиков."""
+        with self._lock:
+            self._data.clear()
+            self._counters = dict.fromkeys(self._counters, 0)
+
+    def stats(self) -> dict:
+        """Счётчики, size и hit_rate — доля обращений, не ставших промахом."""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._data)
+        lookups = sum(counters.values())
+        hits = lookups - counters["misses"]
+        return {**counters, "size": size, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+
+    def __len__(self) -> int:
+        return len(self._data)
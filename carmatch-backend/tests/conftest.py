@@ -7,6 +7,8 @@ from fastapi.testclient import TestClient
 
 from src.database import Base, get_db
 import src.models  # noqa: F401 - register models with Base
+from src.services import principal_cache
+from src.services.reference_data import reference_cache
 from main import app
 
 
@@ -22,6 +24,9 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 def db():
     """Create fresh DB and session for each test."""
     Base.metadata.create_all(bind=engine)
+    # Кэши справочников и пользователей — на процесс; у каждого теста своя БД
+    reference_cache.clear()
+    principal_cache.clear()
     session = TestingSessionLocal()
     try:
         yield session
@@ -0,0 +1,77 @@
+"""Keyset-пагинация списков админки (src/services/pagination.py)."""
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from src.deps import get_current_admin
+from src.models import Car, Session as SessionModel, User
+
+
+@pytest.fixture
+def admin_client(client: TestClient, db):
+    admin = User(email="admin@example.com", password_hash="x", is_admin=True)
+    db.add(admin)
+    db.commit()
+    app.dependency_overrides[get_current_admin] = lambda: admin
+    return client
+
+
+def _walk(client: TestClient, url: str, params: dict) -> list[dict]:
+    """Все страницы по next_cursor."""
+    items, cursor = [], None
+    while True:
+        data = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}).json()
+        items.extend(data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_cars_cursor_matches_offset_order_with_nulls(admin_client: TestClient, db):
+    years = [2015, None, 2018, 2015, None, 2020, 2018]
+    db.add_all(Car(mark_name=f"M{i % 3}", model_name=f"X{i}", year=y) for i, y in enumerate(years))
+    db.commit()
+
+    for sort_dir in ("asc", "desc"):
+        params = {"per_page": 2, "sort_by": "year", "sort_dir": sort_dir}
+        by_cursor = [c["id"] for c in _walk(admin_client, "/api/v1/admin/cars", params)]
+        by_offset = [
+            c["id"]
+            for page in range(1, 5)
+            for c in admin_client.get("/api/v1/admin/cars", params={**params, "page": page}).json()["items"]
+        ]
+        assert by_cursor == by_offset
+        assert sorted(by_cursor) == sorted(c.id for c in db.query(Car).all())
+
+    first = admin_client.get("/api/v1/admin/cars", params={"per_page": 2, "sort_by": "year"}).json()
+    assert first["total"] == len(years) and first["total_is_estimate"] is False
+    assert [c["year"] for c in _walk(admin_client, "/api/v1/admin/cars", {"per_page": 3, "sort_by": "year"})] == [
+        2015, 2015, 2018, 2018, 2020, None, None
+    ]
+
+
+def test_sessions_cursor_walks_newest_first(admin_client: TestClient, db):
+    user = db.query(User).first()
+    base = datetime(2026, 1, 1)
+    for i in range(5):
+        db.add(SessionModel(user_id=user.id, created_at=base + timedelta(minutes=i // 2)))
+    db.commit()
+
+    items = _walk(admin_client, "/api/v1/admin/sessions", {"per_page": 2})
+    created = [i["created_at"] for i in items]
+    assert len({i["id"] for i in items}) == 5
+    assert created == sorted(created, reverse=True)
+
+
+def test_invalid_cursor_is_400(admin_client: TestClient):
+    response = admin_client.get("/api/v1/admin/users", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_admin_stats_aggregates_registered_gauge_sources(admin_client: TestClient):
+    stats = admin_client.get("/api/v1/admin/stats").json()
+    for name in ("embedding_cache", "context_cache", "principal_cache", "speculative_search", "template_replies"):
+        assert name in stats
+    assert "llm_calls_saved" in stats["template_replies"] and "hit_rate" in stats["principal_cache"]
@@ -82,3 +82,46 @@ def test_login_unknown_email(client: TestClient):
         json={"email": "unknown@example.com", "password": "password123"},
     )
     assert response.status_code == 401
+
+
+def test_authenticated_requests_use_principal_cache_and_token_claims(client: TestClient, db):
+    """Повторные запросы с токеном (и в админку) не читают users; права — по текущему состоянию пользователя."""
+    from sqlalchemy import event
+
+    from src.models import User
+    from src.services import principal_cache
+
+    token = client.post(
+        "/api/v1/auth/register",
+        json={"email": "cached@example.com", "password": "password123"},
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    users_selects = []
+
+    def log_statement(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            users_selects.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", log_statement)
+    try:
+        for _ in range(3):
+            assert client.get("/api/v1/chat/sessions", headers=headers).status_code == 200
+        assert client.get("/api/v1/admin/users", headers=headers).status_code == 403
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", log_statement)
+    assert len(users_selects) == 1
+    assert principal_cache.stats()["hits"] >= 2
+
+    # Назначен администратором после входа: тот же токен пускает в админку сразу после сброса записи в кэше
+    user = db.query(User).filter(User.email == "cached@example.com").one()
+    user.is_admin = True
+    db.commit()
+    principal_cache.invalidate(user.id)
+    assert client.get("/api/v1/admin/users", headers=headers).status_code == 200
+
+    # Заблокирован — токен больше не действует
+    user.is_active = False
+    db.commit()
+    principal_cache.invalidate(user.id)
+    assert client.get("/api/v1/chat/sessions", headers=headers).status_code == 401
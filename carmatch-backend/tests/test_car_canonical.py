@@ -0,0 +1,50 @@
+"""Канонические коды поиска cars (src/utils/car_canonical.py) и их заполнение при записи."""
+from sqlalchemy.orm import Session
+
+from src.models import Car, CarBrand
+from src.services import vector_search
+from src.services.reference_data.car_reference_service import search_cars
+from src.utils.car_canonical import body_class, fuel_code, gearbox_code
+
+
+def test_codes_from_catalog_text_and_user_words():
+    assert body_class("Хэтчбек 5 дв.") == body_class("хетчбек") == body_class("Hatchback") == "hatchback"
+    assert body_class("Внедорожник 5 дв.") == "suv"
+    assert body_class("что-то") is None
+    assert fuel_code("бензин") == fuel_code("Petrol") == fuel_code("gasoline") == "petrol"
+    assert fuel_code("на дизеле") == "diesel"
+    assert gearbox_code("1.6 MT 90 л.с.") == gearbox_code("механика") == "MT"
+    assert gearbox_code("автомат") == gearbox_code("АКПП") == "AT"
+    assert gearbox_code("DSG") == gearbox_code("робот") == "AMT"
+    assert gearbox_code("Вариатор") == "CVT"
+
+
+def test_codes_and_brand_id_filled_on_write(db: Session):
+    brand = CarBrand(name="Toyota")
+    db.add(brand)
+    db.commit()
+    car = Car(mark_name="toyota", model_name="Camry", body_type="Седан", fuel_type="Бензин",
+              modification="2.5 AT (181 л.с.)", specs={})
+    db.add(car)
+    db.commit()
+    assert (car.body_class, car.fuel_code, car.gearbox_code, car.brand_id) == ("sedan", "petrol", "AT", brand.id)
+
+    car.body_type = "Универсал"
+    car.transmission = "MT"
+    db.commit()
+    assert (car.body_class, car.gearbox_code) == ("wagon", "MT")
+
+
+def test_search_uses_codes_instead_of_patterns(db: Session):
+    brand = CarBrand(name="Kia")
+    db.add(brand)
+    db.commit()
+    hatch = Car(mark_name="Kia", model_name="Rio", body_type="Hatchback", fuel_type="Petrol",
+                transmission="AT", specs={})
+    sedan = Car(mark_name="Kia", model_name="Rio", body_type="Седан", fuel_type="бензин",
+                transmission="MT", specs={})
+    db.add_all([hatch, sedan])
+    db.commit()
+
+    assert search_cars(db, brand="Kia", body_type="хетчбек", transmission="автомат") == [hatch]
+    assert vector_search.sql_search_cars(db, {"brand": "Kia", "body_type": "седан", "fuel_type": "бензин"}) == [sedan]
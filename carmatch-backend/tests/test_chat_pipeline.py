@@ -0,0 +1,334 @@
+"""Tests for the chat turn pipeline (src/services/chat.py)."""
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models import ChatMessage, SearchParameter, Session as SessionModel, User
+from src.services import chat, conversation_context, reply_templates
+from src.services import deepseek as deepseek_service
+from src.services.car_cards import CarCard
+
+
+class SyncBackedAsyncDb:
+    """Минимальный AsyncSession поверх синхронной тестовой сессии (SQLite)."""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.commits = 0
+
+    async def run_sync(self, fn):
+        return fn(self.db)
+
+    async def execute(self, stmt):
+        return self.db.execute(stmt)
+
+    def add_all(self, objects):
+        self.db.add_all(objects)
+
+    async def flush(self):
+        self.db.flush()
+
+    def in_transaction(self) -> bool:
+        return self.db.in_transaction()
+
+    async def commit(self):
+        self.commits += 1
+        self.db.commit()
+
+    async def rollback(self):
+        self.db.rollback()
+
+
+class CheckpointAsyncDb(SyncBackedAsyncDb):
+    """Как AsyncSession: каждое обращение к БД — точка отмены (await), после отмены задачи запрос не дойдёт."""
+
+    closed = False
+
+    async def execute(self, stmt):
+        await asyncio.sleep(0)
+        return await super().execute(stmt)
+
+    async def commit(self):
+        await asyncio.sleep(0)
+        await super().commit()
+
+    async def rollback(self):
+        await asyncio.sleep(0)
+        await super().rollback()
+
+    async def close(self):
+        await asyncio.sleep(0)
+        self.closed = True
+
+
+def _turn(extracted_params: dict, last_user_msg: str) -> chat.ChatTurn:
+    return chat.ChatTurn(
+        session=SimpleNamespace(extracted_params=dict(extracted_params), parameters_count=0),
+        session_id=uuid4(),
+        user_msg=SimpleNamespace(extra_metadata=None),
+        messages=[{"role": "user", "content": last_user_msg}],
+        max_order=2,
+        last_user_msg=last_user_msg,
+        merged=dict(extracted_params),
+    )
+
+
+def _run_turn(db: Session, monkeypatch: pytest.MonkeyPatch, llm_params: list[dict], message: str):
+    searches: list[tuple] = []
+
+    async def fake_vector_search(_db, query_text, filters, stage="vector_search"):
+        searches.append((query_text, dict(filters or {})))
+        await asyncio.sleep(0)
+        return [(SimpleNamespace(id=1, year=2020), 0.9)]
+
+    async def fake_extract(messages, current_params, body_type_reference):
+        await asyncio.sleep(0)
+        return llm_params
+
+    monkeypatch.setattr(chat, "_vector_search", fake_vector_search)
+    monkeypatch.setattr(chat, "hybrid_rank", lambda semantic, sql, merged: list(semantic))
+    monkeypatch.setattr(deepseek_service, "aextract_params", fake_extract)
+
+    turn = _turn({"brand": "Toyota"}, message)
+    adb = SyncBackedAsyncDb(db)
+
+    async def _run():
+        await chat._extract_turn_params(adb, turn)
+        await chat._search_turn(adb, turn)
+
+    asyncio.run(_run())
+    return turn, searches
+
+
+def test_speculative_search_reused_when_llm_adds_nothing_new(db: Session, monkeypatch: pytest.MonkeyPatch):
+    """LLM подтвердил то, что уже знал резервный парсер, — поиск выполняется один раз (спекулятивный)."""
+    before = chat.speculation_stats()
+    turn, searches = _run_turn(db, monkeypatch, [{"type": "brand", "value": "Toyota", "confidence": 0.9}], "седан")
+
+    assert len(searches) == 1
+    assert searches[0][1]["body_type"] == "седан"
+    assert [c.id for c in turn.search_results] == [1]
+    after = chat.speculation_stats()
+    assert after["hits"] == before["hits"] + 1
+    assert after["misses"] == before["misses"]
+
+
+def test_speculative_search_discarded_when_llm_changes_query(db: Session, monkeypatch: pytest.MonkeyPatch):
+    """LLM извлёк модель, которой не было в догадке, — спекулятивный результат отбрасывается."""
+    before = chat.speculation_stats()
+    turn, searches = _run_turn(
+        db, monkeypatch, [{"type": "model", "value": "Camry", "confidence": 0.9}], "седан"
+    )
+
+    assert len(searches) == 2
+    assert "Camry" in searches[1][0]
+    assert turn.merged["model"] == "Camry"
+    after = chat.speculation_stats()
+    assert after["misses"] == before["misses"] + 1
+    assert after["hits"] == before["hits"]
+
+
+def test_add_message_claims_turn_then_writes_it_in_one_transaction(db: Session, monkeypatch: pytest.MonkeyPatch):
+    """
+    Ход чата: захват номеров (UPDATE ... RETURNING) — короткая транзакция, LLM ждём без открытой
+    транзакции, сообщения, параметры и сессия — один пишущий коммит в конце.
+    """
+    conversation_context.clear()
+    user = User(email="uow@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    session = SessionModel(user_id=user.id, extracted_params={"brand": "Toyota"}, parameters_count=1)
+    db.add(session)
+    db.commit()
+
+    statements: list[str] = []
+    adb = SyncBackedAsyncDb(db)
+    original_commit = adb.commit
+
+    async def logged_commit():
+        await original_commit()
+        statements.append("COMMIT")
+
+    def log_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split(None, 1)[0].upper())
+
+    async def fake_vector_search(_db, query_text, filters, stage="vector_search"):
+        return [(CarCard(id=1, mark_name="Toyota", model_name="Camry", year=2020), 0.9)]
+
+    async def fake_extract(messages, current_params, body_type_reference):
+        return [{"type": "body_type", "value": "седан", "confidence": 0.9}]
+
+    in_transaction_during_llm = []
+
+    async def fake_generate(messages, params, search_results, criteria_fulfilled, parameters_count):
+        in_transaction_during_llm.append(adb.in_transaction())
+        return "Вот Toyota Camry."
+
+    monkeypatch.setattr(adb, "commit", logged_commit)
+    monkeypatch.setattr(chat, "_vector_search", fake_vector_search)
+    monkeypatch.setattr(chat, "hybrid_rank", lambda semantic, sql, merged: list(semantic))
+    monkeypatch.setattr(deepseek_service, "aextract_params", fake_extract)
+    monkeypatch.setattr(deepseek_service, "agenerate_response", fake_generate)
+    event.listen(db.get_bind(), "before_cursor_execute", log_statement)
+    try:
+        assistant_msg, merged, ready, results = asyncio.run(
+            chat.add_message(adb, session.id, user.id, "хочу седан тойота")
+        )
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", log_statement)
+
+    assert in_transaction_during_llm == [False]
+    transactions = " ".join(statements).split("COMMIT")
+    writes = [t.split() for t in transactions if "INSERT" in t or "UPDATE" in t]
+    assert writes[0].count("UPDATE") == 1 and "INSERT" not in writes[0]
+    assert len(writes) == 2 and not transactions[-1].strip()
+
+    db.expire_all()
+    stored = db.get(SessionModel, session.id)
+    assert stored.message_count == 2 and stored.parameters_count == 2 and stored.turn_started_at is None
+    assert stored.title == "хочу седан тойота"
+    messages = db.query(ChatMessage).order_by(ChatMessage.sequence_order).all()
+    assert [(m.role, m.sequence_order) for m in messages] == [("user", 1), ("assistant", 2)]
+    assert messages[0].extra_metadata["extracted_params"]
+    assert db.query(SearchParameter).one().message_id == assistant_msg.id
+    assert merged["body_type"] == "седан" and [c.id for c in results] == [1] and ready
+
+
+def test_concurrent_turn_in_same_session_is_rejected_and_abort_releases_it(db: Session):
+    """Пока ход в сессии не завершён, второй получает turn_in_progress; abort_message возвращает номера."""
+    conversation_context.clear()
+    user = User(email="lease@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    session = SessionModel(user_id=user.id, message_count=4)
+    db.add(session)
+    db.commit()
+    adb = SyncBackedAsyncDb(db)
+
+    turn = asyncio.run(chat.start_message(adb, session.id, user.id, "привет"))
+    assert (turn.max_order, turn.user_msg.sequence_order) == (4, 5)
+    with pytest.raises(ValueError, match="turn_in_progress"):
+        asyncio.run(chat.start_message(adb, session.id, user.id, "привет ещё раз"))
+    with pytest.raises(ValueError, match="session_not_found"):
+        asyncio.run(chat.start_message(adb, uuid4(), user.id, "привет"))
+
+    asyncio.run(chat.abort_message(adb, turn))
+    db.expire_all()
+    assert db.get(SessionModel, session.id).message_count == 4
+    retry = asyncio.run(chat.start_message(adb, session.id, user.id, "привет"))
+    assert retry.user_msg.sequence_order == 5
+
+
+def test_cancelled_add_message_still_releases_turn(db: Session, monkeypatch: pytest.MonkeyPatch):
+    """Ход отменён посреди ответа (таймаут, остановка воркера): откат в add_message всё равно снимает аренду."""
+    import anyio
+
+    conversation_context.clear()
+    user = User(email="cancel@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    session = SessionModel(user_id=user.id, message_count=4)
+    db.add(session)
+    db.commit()
+    adb = CheckpointAsyncDb(db)
+
+    async def hanging_prepare_reply(db, turn):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(chat, "prepare_reply", hanging_prepare_reply)
+
+    async def _run():
+        with anyio.move_on_after(0.05) as scope:
+            await chat.add_message(adb, session.id, user.id, "хочу седан")
+        return scope.cancelled_caught
+
+    assert asyncio.run(_run())
+    db.expire_all()
+    released = db.get(SessionModel, session.id)
+    assert (released.message_count, released.turn_started_at) == (4, None)
+
+
+def test_greeting_thanks_goodbye_get_template_reply_without_llm(db: Session, monkeypatch: pytest.MonkeyPatch):
+    """Чистые приветствие / спасибо / пока — шаблон без LLM (ответы чередуются); остальной small talk — в LLM."""
+    conversation_context.clear()
+    reply_templates.clear()
+    user = User(email="templates@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    session = SessionModel(user_id=user.id)
+    db.add(session)
+    db.commit()
+    adb = SyncBackedAsyncDb(db)
+    llm_calls: list[str] = []
+
+    async def fake_small_talk(messages):
+        llm_calls.append(messages[-1]["content"])
+        return "Всё отлично, спасибо!"
+
+    monkeypatch.setattr(deepseek_service, "agenerate_response_small_talk", fake_small_talk)
+
+    replies = [
+        asyncio.run(chat.add_message(adb, session.id, user.id, text))[0].content
+        for text in ["Привет!", "привет, как дела?", "Спасибо большое, Тёма!", "ну всё, спасибо, пока", "Привет)"]
+    ]
+    assert llm_calls == ["привет, как дела?"]
+    assert replies[1] == "Всё отлично, спасибо!"
+    assert replies[0] in reply_templates._REPLIES["greeting"] and replies[4] in reply_templates._REPLIES["greeting"]
+    assert replies[0] != replies[4]
+    assert replies[2] in reply_templates._REPLIES["thanks"] and replies[3] in reply_templates._REPLIES["goodbye"]
+    assert reply_templates.stats() == {"llm_calls_saved": 4, "greeting": 2, "thanks": 1, "goodbye": 1}
+    assert reply_templates.classify("привет хочу седан") is None and reply_templates.classify("ок") is None
+
+
+def test_metrics_endpoint_exports_stages_providers_and_db_timings(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+):
+    """/metrics: гистограммы этапов и провайдеров, ошибки провайдеров, время SQL, gauge кэша эмбеддингов."""
+    from src.services import metrics
+
+    metrics.clear()
+    monkeypatch.setattr(metrics.settings, "metrics_token", "scrape-secret")
+    metrics.install_db_hooks(db.get_bind())
+    with metrics.stage("extract_params"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.provider_call(metrics.GIGACHAT, "completion"):
+            raise RuntimeError("boom")
+    client.post("/api/v1/auth/register", json={"email": "metrics@example.com", "password": "password123"})
+
+    # Без токена или с чужим (в т.ч. JWT пользователя) — 401
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    body = response.text
+    assert 'carmatch_chat_stage_seconds_count{stage="extract_params"} 1' in body
+    assert 'carmatch_chat_stage_seconds_bucket{stage="extract_params",le="+Inf"} 1' in body
+    assert 'carmatch_provider_errors_total{provider="gigachat",operation="completion"} 1' in body
+    assert 'carmatch_provider_request_seconds_count{provider="gigachat",operation="completion"} 1' in body
+    assert 'carmatch_db_query_seconds_count{statement="INSERT"}' in body
+    assert "carmatch_embedding_cache_hit_rate" in body
+    assert "carmatch_speculative_search_hits" in body
+
+
+def test_metrics_disabled_is_noop(client: TestClient, monkeypatch: pytest.MonkeyPatch):
+    from src.services import metrics
+
+    metrics.clear()
+    monkeypatch.setattr(metrics.settings, "metrics_enabled", False)
+    with metrics.stage("extract_params"):
+        pass
+    assert metrics.CHAT_STAGE_SECONDS.count("extract_params") == 0
+    monkeypatch.setattr(metrics.settings, "metrics_token", "scrape-secret")
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 404
+
+
+def test_metrics_endpoint_off_without_token(client: TestClient):
+    """METRICS_TOKEN не задан (по умолчанию) — /metrics не отдаётся никому."""
+    assert client.get("/metrics").status_code == 404
+    assert client.get("/metrics", headers={"Authorization": "Bearer anything"}).status_code == 404
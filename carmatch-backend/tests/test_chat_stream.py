@@ -0,0 +1,179 @@
+"""Tests for streaming chat responses (SSE endpoint and LLM stream parsing)."""
+import asyncio
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from src.models import Session as SessionModel, User
+from src.services.car_cards import CarCard
+from tests.test_chat_pipeline import CheckpointAsyncDb
+
+
+def _parse_sse(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_yandex_stream_yields_only_new_text(monkeypatch: pytest.MonkeyPatch):
+    """Yandex присылает в каждом чанке весь текст с начала — наружу уходят только приросты."""
+    from src.services import http_clients, yandex_llm
+
+    chunks = ["Привет", "Привет, я", "Привет, я Тёма", "Привет, я Тёма!"]
+    body = "\n".join(
+        json.dumps({"result": {"alternatives": [{"message": {"role": "assistant", "text": t}}]}})
+        for t in chunks
+    )
+    seen_payloads: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_payloads.append(json.loads(request.content))
+        return httpx.Response(200, text=body)
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(yandex_llm.settings, "yandex_folder_id", "folder")
+    monkeypatch.setattr(yandex_llm.settings, "yandex_api_key", "key")
+    monkeypatch.setattr(http_clients, "get_async_client", lambda name: client)
+
+    async def _run():
+        try:
+            return [d async for d in yandex_llm.astream_completion([{"role": "user", "content": "привет"}])]
+        finally:
+            await client.aclose()
+
+    deltas = asyncio.run(_run())
+    assert "".join(deltas) == "Привет, я Тёма!"
+    assert deltas[0] == "Привет"
+    assert seen_payloads[0]["completionOptions"]["stream"] is True
+
+
+def test_post_message_stream_sends_params_cards_tokens_done(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+):
+    """SSE: params → cards → token… → done с сохранённым сообщением; неизвестная сессия — 404."""
+    from src.routers import chat_sessions
+
+    token = client.post(
+        "/api/v1/auth/register",
+        json={"email": "stream@example.com", "password": "password123"},
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    session_id = uuid4()
+    car = CarCard(
+        id=7, mark_name="Toyota", model_name="Camry", year=2020, body_type="Седан",
+        fuel_type="бензин", engine_volume=2.5, horsepower=181, transmission="AT",
+    )
+
+    class FakeDb:
+        closed = False
+
+        async def close(self):
+            FakeDb.closed = True
+
+    async def fake_start_message(db, sid, user_id, content):
+        if sid != session_id:
+            raise ValueError("session_not_found")
+        return SimpleNamespace(content=content)
+
+    async def fake_stream(db, turn):
+        merged = {"brand": "Toyota", "body_type": "седан"}
+        yield "params", (merged, False)
+        yield "cards", [car]
+        yield "token", "Я подобрал "
+        yield "token", "Camry."
+        msg = SimpleNamespace(
+            id=2, session_id=session_id, role="assistant", content="Я подобрал Camry.",
+            sequence_order=2, created_at=datetime.now(timezone.utc),
+        )
+        yield "done", (msg, merged, True, [car])
+
+    monkeypatch.setattr(chat_sessions, "AsyncSessionLocal", FakeDb)
+    monkeypatch.setattr(chat_sessions, "start_message", fake_start_message)
+    monkeypatch.setattr(chat_sessions, "stream_message_reply", fake_stream)
+
+    response = client.post(
+        f"/api/v1/chat/sessions/{session_id}/messages/stream",
+        json={"content": "хочу тойоту седан"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    assert [e for e, _ in events] == ["params", "cards", "token", "token", "done"]
+    assert {p["type"] for p in events[0][1]["extracted_params"]} == {"brand", "body_type"}
+    assert events[1][1]["search_results"][0]["model_name"] == "Camry"
+    assert "".join(d["text"] for e, d in events if e == "token") == "Я подобрал Camry."
+    assert events[-1][1]["content"] == "Я подобрал Camry."
+    assert events[-1][1]["ready_for_search"] is True
+    assert FakeDb.closed
+
+    missing = client.post(
+        f"/api/v1/chat/sessions/{uuid4()}/messages/stream",
+        json={"content": "привет"},
+        headers=headers,
+    )
+    assert missing.status_code == 404
+
+
+def test_post_message_stream_disconnect_releases_turn(client: TestClient, db, monkeypatch: pytest.MonkeyPatch):
+    """Клиент закрыл поток посреди ответа: Starlette отменяет генератор, но откат хода и закрытие сессии проходят."""
+    from main import app
+    from src.routers import chat_sessions
+
+    token = client.post(
+        "/api/v1/auth/register",
+        json={"email": "disconnect@example.com", "password": "password123"},
+    ).json()["access_token"]
+    user = db.query(User).filter_by(email="disconnect@example.com").one()
+    session = SessionModel(user_id=user.id, message_count=4)
+    db.add(session)
+    db.commit()
+    adb = CheckpointAsyncDb(db)
+
+    async def fake_stream(db, turn):
+        yield "token", "Я подбираю "
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(chat_sessions, "AsyncSessionLocal", lambda: adb)
+    monkeypatch.setattr(chat_sessions, "stream_message_reply", fake_stream)
+
+    async def _run():
+        first_chunk = asyncio.Event()
+        request_sent = False
+        chunks: list[bytes] = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": json.dumps({"content": "хочу седан"}).encode()}
+            await first_chunk.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                chunks.append(message["body"])
+                first_chunk.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": f"/api/v1/chat/sessions/{session.id}/messages/stream",
+            "raw_path": b"", "query_string": b"", "root_path": "", "server": ("test", 80), "client": ("test", 1),
+            "headers": [(b"authorization", f"Bearer {token}".encode()), (b"content-type", b"application/json")],
+        }
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+        return chunks
+
+    chunks = asyncio.run(_run())
+    assert [e for e, _ in _parse_sse(b"".join(chunks).decode())] == ["token"]
+    db.expire_all()
+    released = db.get(SessionModel, session.id)
+    assert (released.message_count, released.turn_started_at) == (4, None)
+    assert adb.closed
@@ -0,0 +1,82 @@
+"""Tests for the LLM conversation context: latest-messages window, summary and per-session cache."""
+import asyncio
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from src.services import conversation_context
+from src.services.conversation_context import ConversationContext
+from src.services.deepseek import _api_messages
+
+
+@pytest.fixture(autouse=True)
+def _clear_context_cache():
+    conversation_context.clear()
+    yield
+    conversation_context.clear()
+
+
+def test_window_keeps_latest_messages_and_folds_older_into_bounded_summary():
+    """В окне — последние сообщения; вытесненные — строки сводки, сводка не длиннее лимита."""
+    ctx = ConversationContext(session_id=uuid4(), window_size=4, summary_chars=200)
+    cars = [{"mark_name": "Toyota", "model_name": "Camry", "year": 2020}, {"mark_name": "Kia", "model_name": "Rio"}]
+    for order in range(1, 11):
+        if order % 2:
+            ctx.append(order, "user", f"сообщение {order}")
+        else:
+            ctx.append(order, "assistant", f"ответ {order}", cars if order == 2 else None)
+
+    messages = ctx.messages()
+    assert [m["content"] for m in messages[1:]] == ["сообщение 7", "ответ 8", "сообщение 9", "ответ 10"]
+    assert messages[0]["role"] == "system"
+    assert ctx.summary_upto == 6 and ctx.last_order == 10
+    assert ctx.summary[:2] == ["- Пользователь: «сообщение 1»", "- Ассистент показал: Toyota Camry 2020, Kia Rio"]
+
+    for order in range(11, 41):
+        ctx.append(order, "user", "очень длинное сообщение про подбор машины " * 3)
+    assert len(ctx.summary_text) <= 200
+    assert ctx.summary[0] == "…"
+    assert len(ctx.messages()) == 5
+
+
+def test_aload_reuses_cached_context_until_session_moves_on():
+    """Повторный ход сессии берёт контекст из кэша; после чужого хода — читает только сообщения после сводки."""
+    session = SimpleNamespace(id=uuid4(), context_summary=None, context_summary_upto=0)
+    rows = [(1, "user", "хочу седан", None), (2, "assistant", "вот седаны", {"search_results": []})]
+
+    class FakeDb:
+        calls = 0
+
+        async def execute(self, stmt):
+            FakeDb.calls += 1
+            return SimpleNamespace(all=lambda: list(rows))
+
+    db = FakeDb()
+    ctx = asyncio.run(conversation_context.aload(db, session, 2))
+    assert [m["content"] for m in ctx.messages()] == ["хочу седан", "вот седаны"]
+    ctx.append(3, "user", "до 2 млн")
+    ctx.append(4, "assistant", "подобрал")
+    assert conversation_context.store(ctx) == {}
+
+    assert asyncio.run(conversation_context.aload(db, session, 4)) is ctx
+    assert FakeDb.calls == 1
+
+    # Сессию продолжил другой воркер: кэш устарел, контекст собирается из сводки сессии и БД
+    session.context_summary, session.context_summary_upto = "- Пользователь: «хочу седан»", 1
+    rows[:] = [(2, "assistant", "вот седаны", None), (5, "user", "а универсал?", None), (6, "assistant", "есть", None)]
+    rebuilt = asyncio.run(conversation_context.aload(db, session, 6))
+    assert FakeDb.calls == 2
+    assert rebuilt.last_order == 6 and rebuilt.summary == ["- Пользователь: «хочу седан»"]
+    assert conversation_context.stats()["hits"] == 1
+
+
+def test_api_messages_moves_history_summary_into_system_prompt():
+    messages = [
+        {"role": "system", "content": "Краткое содержание: седан"},
+        {"role": "user", "content": "привет"},
+        {"role": "assistant", "content": "здравствуйте"},
+    ]
+    api = _api_messages("PROMPT", messages)
+    assert api[0] == {"role": "system", "content": "PROMPT\n\nКраткое содержание: седан"}
+    assert [m["role"] for m in api[1:]] == ["user", "assistant"]
@@ -0,0 +1,66 @@
+"""Нечёткое сопоставление марок и моделей (src/services/reference_data/fuzzy_match.py)."""
+from sqlalchemy.orm import Session
+
+from src.models import Car, CarBrand, CarModel
+from src.services.reference_data import reference_cache
+from src.services.reference_data.car_reference_service import search_cars
+from src.services.reference_data.fuzzy_match import TrigramIndex, phonetic_key, similarity
+
+
+def test_phonetic_key_folds_cyrillic_and_spelling():
+    assert phonetic_key("тоёта") == phonetic_key("Toyota")
+    assert phonetic_key("камри") == phonetic_key("Camry")
+    assert phonetic_key("Škoda") == "skoda"
+    assert similarity("тойта", "Toyota") >= 0.4
+    assert similarity("Kia", "Lada") == 0.0
+
+
+def test_trigram_index_ranks_by_similarity():
+    index = TrigramIndex([("Corolla", 1), ("Camry", 2), ("Corona", 3)])
+    assert index.best("королла", 0.4) == 1
+    assert [v for _, v in index.search("корола", 0.2)][:2] == [1, 3]
+    assert index.best("Land Cruiser", 0.4) is None
+
+
+def test_search_cars_resolves_misspelled_brand_and_model(db: Session):
+    toyota = CarBrand(name="Toyota")
+    kia = CarBrand(name="Kia")
+    db.add_all([toyota, kia])
+    db.flush()
+    camry = CarModel(brand_id=toyota.id, name="Camry")
+    rio = CarModel(brand_id=kia.id, name="Rio")
+    db.add_all([camry, rio])
+    db.flush()
+    db.add_all([
+        Car(mark_name="Toyota", model_name="Camry", brand_id=toyota.id, model_id=camry.id, specs={}),
+        Car(mark_name="Kia", model_name="Rio", brand_id=kia.id, model_id=rio.id, specs={}),
+    ])
+    db.commit()
+
+    cars = search_cars(db, brand="тоёта", model="камри")
+    assert [(c.mark_name, c.model_name) for c in cars] == [("Toyota", "Camry")]
+
+    reference = reference_cache.get(db)
+    assert reference.canonicalize({"brand": "тоёта", "model": "камри", "year": 2018}) == {
+        "brand": "Toyota", "model": "Camry", "year": 2018,
+    }
+    # Модель другой марки не подставляется; неизвестное значение остаётся как есть
+    assert reference.canonicalize({"brand": "Kia", "model": "камри"})["model"] == "камри"
+    assert reference.canonicalize({"brand": "Ауди"})["brand"] == "Ауди"
+
+
+def test_match_model_ranks_only_within_brand(db: Session):
+    """Модель марки находится, даже если у других марок десятки более похожих моделей."""
+    brands = [CarBrand(name=f"Brand {i}") for i in range(60)]
+    lada = CarBrand(name="Lada")
+    db.add_all([*brands, lada])
+    db.flush()
+    db.add_all([CarModel(brand_id=b.id, name="Camry") for b in brands])
+    kamri = CarModel(brand_id=lada.id, name="Kamria")
+    db.add(kamri)
+    db.commit()
+
+    reference = reference_cache.load_snapshot(db)
+    assert reference.match_model("камри", lada.id) == (kamri.id, "Kamria")
+    assert reference.match_model("камри")[1] == "Camry"
+    assert reference.match_model("камри", 10**6) is None
@@ -0,0 +1,63 @@
+"""Tests for the single-pass keyword matcher used by intent and parameter detection."""
+import re
+
+from src.services.chat import (
+    _is_greeting_only,
+    _message_mentions_car_or_params,
+    _override_params_from_last_message,
+)
+from src.services.deepseek import extract_params_fallback
+from src.utils.keyword_matcher import KeywordGroups, KeywordMatcher
+
+
+def test_scan_matches_substring_and_word_boundary_semantics():
+    """Все вхождения за проход, в т.ч. перекрывающиеся; has — как `in`, has_word — как \\b...\\b."""
+    words = ["бэх", "бэху", "ву", " авто ", "л.с.", "электро", "электромобиль"]
+    matcher = KeywordMatcher(words)
+    for text in [" хочу бэху на 150 л.с. ", "вуаля, электромобиль", " авто  авто ", "ву-ву", "", "бэхаву"]:
+        hits = matcher.scan(text)
+        for word in words:
+            assert hits.has(word) == (word in text), (text, word)
+            expected = bool(re.search(r"\b" + re.escape(word) + r"\b", text))
+            assert hits.has_word(word) == expected, (text, word)
+
+
+def test_groups_keep_if_elif_and_last_wins_order():
+    groups = KeywordGroups([(("автомат", "акпп"), "автомат"), (("робот",), "робот")], whole_word=True)
+    matcher = KeywordMatcher(groups.words)
+    assert groups.first(matcher.scan("робот или акпп")) == "автомат"
+    assert groups.last(matcher.scan("робот или акпп")) == "робот"
+    assert groups.first(matcher.scan("роботизированная")) is None
+
+
+def test_chat_intent_and_override_from_one_scan():
+    assert _is_greeting_only("Привет!") and not _is_greeting_only("привет, хочу бэху")
+    assert _message_mentions_car_or_params("хочу бэху")
+    assert _message_mentions_car_or_params("что-нибудь 2015 г.")
+    assert not _message_mentions_car_or_params("как дела?")
+
+    params = {"body_type": "седан", "fuel_type": "дизель", "year_min": "2010"}
+    params = _override_params_from_last_message("а лучше кроссовер toyota на бензине, автомат, 2019", params)
+    assert params == {
+        "body_type": "кроссовер",
+        "fuel_type": "бензин",
+        "transmission": "автомат",
+        "brand": "Toyota",
+        "year": "2019",
+    }
+
+
+def test_fallback_takes_first_group_and_reference_order():
+    found = extract_params_fallback(
+        ["бэху или тойоту, дизельный, вариатор", "внедорожник 2.0 л"],
+        ["Седан", "Внедорожник 5 дв.", "Внедорожник 3 дв."],
+    )
+    assert found == {
+        "brand": "BMW",
+        "fuel_type": "дизель",
+        "transmission": "вариатор",
+        "engine_volume": "2.0",
+        "body_type": "Внедорожник 5 дв.",
+    }
+    # «ву» — Volkswagen только как отдельное слово
+    assert "brand" not in extract_params_fallback(["вуаля"], [])
@@ -0,0 +1,35 @@
+"""Порядок таблиц для параллельного переноса (src/utils/pg_replication.py) — без PostgreSQL."""
+import pytest
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table
+
+import src.models  # noqa: F401
+from src.database import Base
+from src.utils.pg_replication import libpq_url, table_waves
+
+
+def test_table_waves_put_parents_before_children():
+    names = [
+        "users", "sessions", "car_brands", "car_models", "car_generations", "car_modifications",
+        "car_complectations", "cars", "chat_messages", "search_parameters",
+    ]
+    waves = table_waves([Base.metadata.tables[n] for n in names])
+    level = {name: i for i, wave in enumerate(waves) for name in wave}
+
+    assert sorted(level) == sorted(names)
+    assert waves[0] == ["car_brands", "users"]
+    for table in (Base.metadata.tables[n] for n in names):
+        for fk in table.foreign_keys:
+            assert level[fk.column.table.name] < level[table.name]
+
+
+def test_table_waves_detect_cycles():
+    metadata = MetaData()
+    a = Table("a", metadata, Column("id", Integer, primary_key=True), Column("b_id", Integer, ForeignKey("b.id")))
+    b = Table("b", metadata, Column("id", Integer, primary_key=True), Column("a_id", Integer, ForeignKey("a.id")))
+    with pytest.raises(ValueError):
+        table_waves([a, b])
+
+
+def test_libpq_url_strips_driver():
+    assert libpq_url("postgresql+psycopg://u:p@h:5433/db") == "postgresql://u:p@h:5433/db"
+    assert libpq_url("postgres://u:p@h/db?sslmode=require") == "postgresql://u:p@h/db?sslmode=require"
@@ -0,0 +1,73 @@
+"""Tests for the reference-data cache (body types, brands, models) and its use in search_cars."""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.models import Car, CarBrand, CarModel
+from src.services import deepseek as deepseek_service
+from src.services.reference_data import reference_cache
+from src.services.reference_data.car_reference_service import get_body_type_reference, search_cars
+
+
+def _seed(db: Session) -> None:
+    brand = CarBrand(name="Toyota")
+    db.add(brand)
+    db.flush()
+    model = CarModel(brand_id=brand.id, name="Camry")
+    db.add(model)
+    db.flush()
+    db.add_all([
+        Car(mark_name="Toyota", model_name="Camry", body_type="Седан", transmission="AT",
+            brand_id=brand.id, model_id=model.id, specs={}),
+        Car(mark_name="Toyota", model_name="Camry", body_type="Универсал", transmission="MT",
+            brand_id=brand.id, model_id=model.id, specs={}),
+    ])
+    db.commit()
+
+
+def _count_selects(db: Session):
+    statements: list[str] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", _before)
+    return statements, lambda: event.remove(db.get_bind(), "before_cursor_execute", _before)
+
+
+def test_reference_loaded_once_and_reused_by_search(db: Session):
+    """Справочники читаются один раз; search_cars и список кузовов дальше берут их из памяти."""
+    _seed(db)
+    assert get_body_type_reference(db) == ["Седан", "Универсал"]
+    assert reference_cache.get(db).transmissions == ("AT", "MT")
+
+    statements, stop = _count_selects(db)
+    try:
+        assert get_body_type_reference(db) == ["Седан", "Универсал"]
+        cars = search_cars(db, brand="тойота", model="camry", transmission="механика")
+    finally:
+        stop()
+    assert [c.body_type for c in cars] == ["Универсал"]
+    # Только запрос к cars — ни DISTINCT body_type, ни car_brands / car_models
+    assert len(statements) == 1
+    assert "car_brands" not in statements[0] and "car_models" not in statements[0]
+    assert reference_cache.stats()["loads"] == 1
+    assert search_cars(db, brand="Lada") == []
+
+
+def test_invalidate_reloads_changed_catalog(db: Session):
+    _seed(db)
+    assert "Хэтчбек" not in get_body_type_reference(db)
+    db.add(Car(mark_name="Toyota", model_name="Yaris", body_type="Хэтчбек", specs={}))
+    db.commit()
+    assert "Хэтчбек" not in get_body_type_reference(db)  # до сброса — прежний снимок
+
+    reference_cache.invalidate()
+    assert "Хэтчбек" in get_body_type_reference(db)
+    assert reference_cache.stats()["loads"] == 2
+
+
+def test_fallback_finds_brand_from_reference():
+    """Марки нет среди ключевых слов резервного парсера, но она есть в справочнике."""
+    found = deepseek_service.extract_params_fallback(["хочу geely седан"], [], ["Geely", "Toyota"])
+    assert found["brand"] == "Geely"
+    assert found["body_type"] == "седан"
@@ -2,6 +2,8 @@
 
 from __future__ import annotations
 
+import time
+from contextlib import contextmanager
 from typing import Any, Iterable, List, Tuple
 
 import pytest
@@ -9,6 +11,7 @@ from sqlalchemy.orm import Session
 
 from src.models import Car
 from src.services import vector_search
+from src.services.car_cards import CARD_COLUMN_NAMES, CarCard
 
 
 def create_car(db: Session, **overrides: Any) -> Car:
@@ -113,6 +116,22 @@ def test_sql_search_cars_applies_year_range_and_engine_volume(db: Session):
     assert out_of_volume not in cars
 
 
+def test_sql_search_cards_loads_card_projection(db: Session):
+    create_car(db, year=2020, price_rub=2500000, engine_volume=2.5, body_type="Седан")
+    car = db.query(Car).one()
+    car.description = "Надёжный седан. Выпускается в Японии."
+    db.commit()
+
+    (card,) = vector_search.sql_search_cards(db, {"brand": "toyota", "body_type": "седан"})
+    assert isinstance(card, CarCard)
+    assert (card.id, card.body_class, card.country) == (car.id, "sedan", "Японии")
+    assert card.to_dict()["price_rub"] == 2500000.0 and card.to_dict()["engine_volume"] == 2.5
+    assert "specs" not in card.to_dict() and "body_class" not in card.to_dict()
+    # hybrid_rank ранжирует карточки так же, как ORM-объекты Car
+    ranked = vector_search.hybrid_rank([], [card], {"brand": "Toyota", "year": 2020})
+    assert ranked == [(card, 1.0)]
+
+
 def test_compute_param_match_fraction_full_match():
     car = Car(
         mark_name="Toyota",
@@ -225,6 +244,24 @@ def test_hybrid_rank_combines_semantic_and_param_scores(db: Session):
     assert score == pytest.approx(0.6 * 0.5 + 0.4 * 1.0)
 
 
+def test_hybrid_rank_batch_scores_keep_order_and_tolerances(db: Session):
+    exact = create_car(db, body_type="Седан", year=2019, horsepower=150, engine_volume=2.0)
+    near = create_car(db, body_type="седан", year=2020, horsepower=160, engine_volume=2.05)
+    empty = create_car(db, mark_name="Kia", model_name="Rio")
+    tie = create_car(db, body_type="Седан", year=2019, horsepower=150, engine_volume=2.0)
+    db.expire(near)  # незагруженные колонки читаются через ORM, как раньше
+    params = {"brand": "toyota", "body_type": "седан", "year": "2019", "horsepower": 150, "engine_volume": 2.0}
+
+    fractions = vector_search.param_match_fractions([exact, near, empty], params)
+    assert fractions.tolist() == [1.0, 1.0, 0.0]
+    assert vector_search.compute_param_match_fraction(empty, params) == 0.0
+
+    ranked = vector_search.hybrid_rank([(tie, 0.5), (exact, 0.5), (empty, 0.9)], [near], params, threshold=0.5)
+    # При равном score — порядок кандидатов; empty: 0.6 * 0.9 = 0.54
+    assert [car.id for car, _ in ranked] == [tie.id, exact.id, empty.id]
+    assert ranked[0][1] == pytest.approx(0.6 * 0.5 + 0.4)
+
+
 def test_vector_search_cars_empty_query_returns_empty_list(db: Session):
     results = vector_search.vector_search_cars(db, query_text="  ")
     assert results == []
@@ -241,69 +278,48 @@ def test_vector_search_cars_get_embedding_none_returns_empty_list(
     assert results == []
 
 
-def test_vector_search_cars_success_path_uses_db_execute_and_returns_cars(
-    monkeypatch: pytest.MonkeyPatch,
-):
-    car1 = Car(
-        id=1,
-        mark_name="Toyota",
-        model_name="Camry",
-        specs={},
-        source="yandex",
-        is_active=True,
-    )
-    car2 = Car(
-        id=2,
-        mark_name="Toyota",
-        model_name="RAV4",
-        specs={},
-        source="yandex",
-        is_active=True,
-    )
+def _card_row(car_id: int, mark_name: str, model_name: str, distance: float) -> dict:
+    """Строка векторного запроса: колонки карточки + distance."""
+    row = {name: None for name in CARD_COLUMN_NAMES}
+    row.update(id=car_id, mark_name=mark_name, model_name=model_name, specs={}, images=[], distance=distance)
+    return row
 
-    def fake_get_query_embedding(_: str):
-        return [0.1, 0.2, 0.3]
 
-    class FakeResult:
-        def __init__(self, rows: list[tuple[int]]):
-            self._rows = rows
+class FakeMappingsResult:
+    def __init__(self, rows: list[dict]):
+        self._rows = rows
 
-        def fetchall(self):
-            return self._rows
+    def mappings(self):
+        return self
 
-    class FakeQuery:
-        def __init__(self, cars_by_id: dict[int, Car]):
-            self._cars_by_id = cars_by_id
+    def all(self):
+        return self._rows
 
-        def filter(self, *_, **__):
-            return self
 
-        def all(self):
-            return list(self._cars_by_id.values())
+def test_vector_search_cars_success_path_uses_db_execute_and_returns_cars(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    def fake_get_query_embedding(_: str):
+        return [0.1, 0.2, 0.3]
 
     class FakeSession:
-        def __init__(self, cars: list[Car]):
-            self._cars_by_id = {c.id: c for c in cars}
-
         def execute(self, statement, params=None, **kwargs):
             assert "FROM cars" in str(statement)
             assert "ORDER BY embedding <=>" in str(statement)
             assert "LIMIT" in str(statement)
             assert "qv" in params
             assert "lim" in params
-            # Имитация того, что pgvector вернул id в нужном порядке
-            return FakeResult([(1,), (2,)])
+            # Имитация того, что pgvector вернул строки карточек в нужном порядке
+            return FakeMappingsResult([_card_row(1, "Toyota", "Camry", 0.1), _card_row(2, "Toyota", "RAV4", 0.3)])
 
         def query(self, model):
-            assert model is Car
-            return FakeQuery(self._cars_by_id)
-
-    fake_db = FakeSession([car1, car2])
+            raise AssertionError("карточки загружаются тем же запросом")
 
     monkeypatch.setattr(vector_search, "get_query_embedding", fake_get_query_embedding)
 
-    results = vector_search.vector_search_cars(fake_db, query_text="Toyota")
+    results = vector_search.vector_search_cars(FakeSession(), query_text="Toyota")
     assert [c.id for c in results] == [1, 2]
+    assert all(isinstance(c, CarCard) for c in results)
 
 
 def test_vector_search_cars_pgvector_error_returns_empty_list(
@@ -327,71 +343,34 @@ def test_vector_search_cars_pgvector_error_returns_empty_list(
 def test_vector_search_cars_with_scores_returns_normalized_scores(
     monkeypatch: pytest.MonkeyPatch,
 ):
-    car1 = Car(
-        id=1,
-        mark_name="Toyota",
-        model_name="Camry",
-        specs={},
-        source="yandex",
-        is_active=True,
-    )
-    car2 = Car(
-        id=2,
-        mark_name="Toyota",
-        model_name="RAV4",
-        specs={},
-        source="yandex",
-        is_active=True,
-    )
-
     def fake_get_query_embedding(_: str):
         return [0.1, 0.2, 0.3]
 
-    class FakeResult:
-        def __init__(self, rows: list[tuple[int, float]]):
-            self._rows = rows
-
-        def fetchall(self):
-            return self._rows
-
-    class FakeQuery:
-        def __init__(self, cars_by_id: dict[int, Car]):
-            self._cars_by_id = cars_by_id
-
-        def filter(self, *_, **__):
-            return self
-
-        def all(self):
-            return list(self._cars_by_id.values())
-
     class FakeSession:
-        def __init__(self, cars: list[Car]):
-            self._cars_by_id = {c.id: c for c in cars}
-
         def execute(self, statement, params=None, **kwargs):
-            assert "SELECT id, (embedding <=>" in str(statement)
-            return FakeResult(
+            assert "(embedding <=>" in str(statement) and "AS distance" in str(statement)
+            # Поля карточки — в том же запросе; embedding не выбирается
+            assert "description" in str(statement) and "SELECT embedding" not in str(statement)
+            return FakeMappingsResult(
                 [
-                    (1, 0.2),  # ближе (distance меньше)
-                    (2, 0.8),
+                    _card_row(1, "Toyota", "Camry", 0.2),  # ближе (distance меньше)
+                    _card_row(2, "Toyota", "RAV4", 0.8),
                 ]
             )
 
         def query(self, model):
-            assert model is Car
-            return FakeQuery(self._cars_by_id)
-
-    fake_db = FakeSession([car1, car2])
+            raise AssertionError("карточки загружаются тем же запросом")
 
     monkeypatch.setattr(vector_search, "get_query_embedding", fake_get_query_embedding)
 
     results = vector_search.vector_search_cars_with_scores(
-        fake_db, query_text="Toyota", limit=2
+        FakeSession(), query_text="Toyota", limit=2
     )
     assert len(results) == 2
     (r1, score1), (r2, score2) = results
-    assert r1.id == car1.id
-    assert r2.id == car2.id
+    assert isinstance(r1, CarCard)
+    assert (r1.id, r1.model_name) == (1, "Camry")
+    assert r2.id == 2
     assert 0.0 <= score1 <= 1.0
     assert 0.0 <= score2 <= 1.0
     assert score1 > score2
@@ -414,3 +393,265 @@ def test_vector_search_cars_with_scores_pgvector_error_returns_empty_list(
     results = vector_search.vector_search_cars_with_scores(db, query_text="Toyota")
     assert results == []
 
+
+
+def test_vector_index_ddl_uses_cosine_ops_and_settings():
+    from src.services import vector_index
+
+    hnsw = vector_index.index_ddl("hnsw", concurrently=True)
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_cars_embedding_hnsw" in hnsw
+    assert "USING hnsw (embedding vector_cosine_ops)" in hnsw
+    assert "ef_construction" in hnsw
+
+    ivf = vector_index.index_ddl("ivfflat", lists=200)
+    assert "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 200)" in ivf
+
+    with pytest.raises(ValueError):
+        vector_index.index_ddl("flat")
+
+
+def test_apply_search_params_sets_local_gucs_only_on_postgres(db: Session):
+    from src.services import vector_index
+
+    executed: list[tuple[str, dict]] = []
+
+    class FakeDialect:
+        name = "postgresql"
+
+    class FakeBind:
+        dialect = FakeDialect()
+
+    class FakePgSession:
+        bind = FakeBind()
+        fail_on: str | None = None
+        savepoints_rolled_back = 0
+
+        def execute(self, statement, params=None, **kwargs):
+            executed.append((str(statement), params))
+            if self.fail_on and self.fail_on in str(statement):
+                raise RuntimeError("unrecognized configuration parameter")
+
+        @contextmanager
+        def begin_nested(self):
+            try:
+                yield
+            except Exception:
+                self.savepoints_rolled_back += 1
+                raise
+
+        def rollback(self):
+            raise AssertionError("apply_search_params не должен откатывать транзакцию вызывающего кода")
+
+    vector_index.apply_search_params(FakePgSession(), ef_search=80, probes=7)
+    assert len(executed) == 1
+    sql, params = executed[0]
+    assert "set_config('hnsw.ef_search'" in sql
+    assert "set_config('ivfflat.probes'" in sql
+    assert params == {"ef": "80", "probes": "7"}
+
+    # SQLite (тесты) — ничего не выполняется
+    vector_index.apply_search_params(db)
+
+    # С фильтрами: ef_search поднимается до limit * overfetch и включается итеративный скан
+    executed.clear()
+    vector_index.apply_search_params(FakePgSession(), ef_search=40, filtered=True, limit=12)
+    assert executed[0][1]["ef"] == "120"
+    assert "set_config('hnsw.iterative_scan'" in executed[1][0]
+    assert executed[1][1] == {"mode": "relaxed_order"}
+
+    # pgvector < 0.8: откатывается только SAVEPOINT итеративного скана, ef_search не выставляется заново
+    executed.clear()
+    session = FakePgSession()
+    session.fail_on = "iterative_scan"
+    vector_index.apply_search_params(session, ef_search=40, filtered=True, limit=12)
+    assert len(executed) == 2 and session.savepoints_rolled_back == 1
+
+
+def test_query_vector_binary_only_with_registered_adapters(db: Session):
+    from types import SimpleNamespace
+
+    from pgvector import Vector
+
+    from src.services import vector_index
+
+    # SQLite: адаптеров нет — строка для CAST(:qv AS vector), install_vector_adapters ничего не делает
+    assert vector_index.query_vector(db, [0.5, 0.25]) == "[0.5,0.25]"
+    vector_index.install_vector_adapters(db.get_bind())
+
+    info: dict = {}
+
+    class FakePgSession:
+        bind = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+        def connection(self):
+            return SimpleNamespace(connection=SimpleNamespace(info=info))
+
+    assert vector_index.query_vector(FakePgSession(), [0.5, 0.25]) == "[0.5,0.25]"
+    info[vector_index._VECTOR_ADAPTERS] = True
+    param = vector_index.query_vector(FakePgSession(), [0.5, 0.25])
+    assert isinstance(param, Vector) and param.to_list() == [0.5, 0.25]
+
+
+def test_vector_filter_sql_pushes_only_reliable_params():
+    sql, binds = vector_search._vector_filter_sql(
+        {
+            "brand": " Toyota ",
+            "body_type": "Седан",
+            "year_min": 2018,
+            "horsepower": 150,
+            "model": "Camry",
+            "transmission": "автомат",
+        }
+    )
+    assert sql.startswith(" AND ")
+    assert "mark_name ILIKE :f_brand" in sql
+    # Распознанный кузов — равенство по канонической колонке body_class
+    assert "body_class = :f_body_class" in sql and "body_type ILIKE" not in sql
+    assert "year >= :f_year_min" in sql
+    assert "horsepower >= :f_hp_min" in sql and "horsepower <= :f_hp_max" in sql
+    # model / transmission в WHERE векторного запроса не переносятся
+    assert "model_name" not in sql and "transmission" not in sql
+    assert binds["f_brand"] == "%toyota%"
+    assert binds["f_body_class"] == "sedan"
+    assert (binds["f_hp_min"], binds["f_hp_max"]) == (135, 165)
+
+    assert vector_search._vector_filter_sql({}) == ("", {})
+
+
+def test_vector_search_cars_with_scores_puts_filters_into_single_query(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    executed: list[tuple[str, dict]] = []
+
+    class FakeSession:
+        def execute(self, statement, params=None, **kwargs):
+            executed.append((str(statement), params))
+            # relaxed_order: строки могут прийти не по порядку distance
+            return FakeMappingsResult([_card_row(3, "BMW", "X5", 0.4), _card_row(4, "BMW", "X3", 0.1)])
+
+    monkeypatch.setattr(vector_search, "get_query_embedding", lambda _: [0.1, 0.2])
+
+    results = vector_search.vector_search_cars_with_scores(
+        FakeSession(), "BMW кроссовер", limit=5, filters={"brand": "BMW", "year_max": 2020}
+    )
+    assert len(executed) == 1
+    sql, params = executed[0]
+    assert "mark_name ILIKE :f_brand" in sql
+    assert "year <= :f_year_max" in sql
+    assert sql.index("WHERE") < sql.index("ORDER BY embedding <=>")
+    assert params["f_brand"] == "%bmw%" and params["f_year_max"] == 2020
+    assert [c.id for c, _ in results] == [4, 3]
+
+
+def test_embedding_cache_lru_ttl_and_counters(monkeypatch: pytest.MonkeyPatch):
+    from src.services import embedding_cache, yandex_embeddings
+    from src.utils.ttl_cache import TTLCache
+
+    calls: list[str] = []
+
+    def fake_request(model_uri: str, text: str):
+        calls.append(text)
+        return [0.5] * yandex_embeddings.EMBEDDING_DIMENSION
+
+    monkeypatch.setattr(yandex_embeddings.settings, "yandex_folder_id", "folder")
+    monkeypatch.setattr(yandex_embeddings.settings, "yandex_api_key", "key")
+    monkeypatch.setattr(yandex_embeddings, "_request_embedding", fake_request)
+    embedding_cache.clear()
+
+    first = yandex_embeddings.get_query_embedding("Toyota Camry,  седан")
+    # Тот же запрос с другим регистром/пробелами — из кэша, без обращения к API
+    second = yandex_embeddings.get_query_embedding("  toyota camry, седан ")
+    assert first == second
+    assert len(calls) == 1
+    stats = embedding_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+    # LRU: при переполнении вытесняется самый старый ключ; TTL: протухшая запись — промах
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    for name in ("a", "b", "c"):
+        cache.put(("m", name), [1.0])
+    assert cache.get(("m", "a")) is None
+    assert cache.get(("m", "c")) == [1.0]
+    cache.ttl_seconds = 1e-9
+    time.sleep(0.001)
+    assert cache.get(("m", "b")) is None
+    embedding_cache.clear()
+
+
+def test_batch_embedding_retries_on_429_and_5xx(monkeypatch: pytest.MonkeyPatch):
+    import asyncio
+
+    import httpx
+
+    from src.services import yandex_embeddings
+
+    responses = iter(
+        [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(503),
+            httpx.Response(200, json={"embedding": [0.25] * yandex_embeddings.EMBEDDING_DIMENSION}),
+        ]
+    )
+    seen: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        return next(responses)
+
+    monkeypatch.setattr(yandex_embeddings, "_retry_delay", lambda attempt, retry_after: 0.0)
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await yandex_embeddings._arequest_embedding(
+                client, "emb://f/text-search-doc/latest", "Toyota", yandex_embeddings.TokenBucket(0), 3
+            )
+
+    emb = asyncio.run(_run())
+    assert emb == [0.25] * yandex_embeddings.EMBEDDING_DIMENSION
+    assert len(seen) == 3
+
+
+def test_single_embedding_sync_and_async_share_request_helper(monkeypatch: pytest.MonkeyPatch):
+    import asyncio
+
+    import httpx
+
+    from src.services import embedding_cache, http_clients, yandex_embeddings
+
+    vector = [0.5] * yandex_embeddings.EMBEDDING_DIMENSION
+    statuses = iter([200, 200, 500])
+    seen: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append({"auth": request.headers["Authorization"], "body": request.content})
+        status = next(statuses)
+        return httpx.Response(status, json={"embedding": {"embedding": vector}} if status == 200 else {})
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(yandex_embeddings.settings, "yandex_folder_id", "folder")
+    monkeypatch.setattr(yandex_embeddings.settings, "yandex_api_key", "key")
+    monkeypatch.setattr(http_clients, "get_client", lambda name: httpx.Client(transport=transport))
+    monkeypatch.setattr(http_clients, "get_async_client", lambda name: httpx.AsyncClient(transport=transport))
+    embedding_cache.clear()
+
+    assert yandex_embeddings.get_embedding("Toyota") == vector
+    assert asyncio.run(yandex_embeddings.aget_query_embedding("Camry")) == vector
+    # Ошибка HTTP в async-пути гасится так же, как в синхронном
+    assert asyncio.run(yandex_embeddings.aget_query_embedding("Corolla")) is None
+    assert {s["auth"] for s in seen} == {"Api-Key key"}
+    assert b"text-search-doc" in seen[0]["body"] and b"text-search-query" in seen[1]["body"]
+    embedding_cache.clear()
+
+
+def test_http_clients_are_shared_until_closed():
+    from src.services import http_clients
+
+    http_clients.close_all()
+    first = http_clients.get_client(http_clients.YANDEX)
+    assert http_clients.get_client(http_clients.YANDEX) is first
+    assert http_clients.get_client(http_clients.GENAPI) is not first
+
+    http_clients.close_all()
+    assert first.is_closed
+    assert http_clients.get_client(http_clients.YANDEX) is not first
+    http_clients.close_all()
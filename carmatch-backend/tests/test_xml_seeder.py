@@ -0,0 +1,115 @@
+"""Tests for the bulk XML reference-data seeder (src/utils/xml_seeder.py)."""
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from src.models import CarBrand, CarComplectation, CarGeneration, CarModel, CarModification
+from src.utils import xml_seeder
+
+CATALOG = """<?xml version="1.0" encoding="UTF-8"?>
+<catalog>
+  <mark name="Toyota">
+    <code>TOYOTA</code>
+    <folder name="Camry, VIII" id="f1">
+      <model>Camry</model>
+      <generation id="g1">VIII (XV70)</generation>
+      <modification id="m1" name="2.5 AT (181 л.с.)">
+        <body_type>Седан</body_type>
+        <years>2017 - 2021</years>
+        <complectations>
+          <complectation id="c1">Комфорт</complectation>
+          <complectation id="c2">Престиж</complectation>
+        </complectations>
+      </modification>
+      <modification id="m2" name="3.5 AT (249 л.с.)"><body_type>Седан</body_type></modification>
+    </folder>
+    <folder name="Corolla" id="f2">
+      <modification id="m3" name="1.6 CVT"/>
+    </folder>
+  </mark>
+  <mark name="Lada">
+    <folder name="Vesta" id="f3">
+      <generation id="g2">I</generation>
+      <modification id="m4" name="1.6 MT"><body_type>Седан</body_type></modification>
+    </folder>
+  </mark>
+</catalog>
+"""
+
+
+def _seed(db: Session, path: Path, batch_size: int = xml_seeder.DEFAULT_BATCH_SIZE) -> xml_seeder.SeedStats:
+    stats = xml_seeder.seed_reference_data(db.connection(), str(path), batch_size=batch_size)
+    db.commit()
+    return stats
+
+
+def test_seed_loads_all_levels_and_rerun_is_idempotent(db: Session, tmp_path: Path):
+    path = tmp_path / "cars.xml"
+    path.write_text(CATALOG, encoding="utf-8")
+
+    # batch_size=1 — каждая марка отдельной пачкой (потоковый разбор)
+    first = _seed(db, path, batch_size=1)
+    assert first.inserted == {
+        "brands": 2, "models": 3, "generations": 2, "modifications": 3, "complectations": 2,
+    }
+    # У Corolla нет <generation> — модификацию не к чему привязать
+    assert first.skipped_modifications == 1
+
+    camry = db.query(CarModel).filter(CarModel.name == "Camry, VIII").one()
+    assert camry.external_id == "f1"
+    assert db.query(CarBrand).filter(CarBrand.id == camry.brand_id).one().code == "TOYOTA"
+    mod = db.query(CarModification).filter(CarModification.external_id == "m1").one()
+    assert mod.body_type == "Седан"
+    assert db.query(CarGeneration).filter(CarGeneration.id == mod.generation_id).one().years == {}
+    assert {c.name for c in db.query(CarComplectation).filter(CarComplectation.modification_id == mod.id)} == {
+        "Комфорт", "Престиж",
+    }
+
+    second = _seed(db, path)
+    assert sum(second.inserted.values()) == 0
+    assert second.existing["modifications"] == 3
+    assert db.query(CarModification).count() == 3
+    assert db.query(CarComplectation).count() == 2
+
+
+def test_incremental_sync_touches_only_changed_subtrees(db: Session, tmp_path: Path):
+    """Повторный sync без изменений ничего не пишет; переименование по external_id, удаления — точечно."""
+    path = tmp_path / "cars.xml"
+    path.write_text(CATALOG, encoding="utf-8")
+
+    first = xml_seeder.sync_reference_data(db.connection(), str(path))
+    db.commit()
+    assert first.inserted["complectations"] == 2
+    camry_id = db.query(CarModel).filter(CarModel.external_id == "f1").one().id
+
+    again = xml_seeder.sync_reference_data(db.connection(), str(path))
+    db.commit()
+    assert again.unchanged_marks == 2
+    assert sum(again.inserted.values()) + sum(again.updated.values()) + sum(again.deleted.values()) == 0
+
+    changed = (
+        CATALOG.replace('name="Camry, VIII"', 'name="Camry, VIII рестайлинг"')
+        .replace('<complectation id="c2">Престиж</complectation>', "")
+        .replace('<modification id="m2" name="3.5 AT (249 л.с.)"><body_type>Седан</body_type>',
+                 '<modification id="m2" name="3.5 AT (249 л.с.)"><body_type>Лифтбек</body_type>')
+    )
+    lada_start = changed.index('<mark name="Lada">')
+    changed = changed[:lada_start] + changed[changed.index("</mark>", lada_start) + len("</mark>"):]
+    path.write_text(changed, encoding="utf-8")
+
+    diff = xml_seeder.sync_reference_data(db.connection(), str(path))
+    db.commit()
+    db.expire_all()
+    assert diff.updated["models"] == 1 and diff.updated["modifications"] == 1
+    assert diff.deleted["brands"] == 1 and diff.deleted["complectations"] == 1
+    assert sum(diff.inserted.values()) == 0
+
+    camry = db.query(CarModel).filter(CarModel.external_id == "f1").one()
+    assert (camry.id, camry.name) == (camry_id, "Camry, VIII рестайлинг")
+    assert db.query(CarModification).filter(CarModification.external_id == "m2").one().body_type == "Лифтбек"
+    assert [c.external_id for c in db.query(CarComplectation)] == ["c1"]
+    assert db.query(CarBrand).filter(CarBrand.name == "Lada").count() == 0
+
+    final = xml_seeder.sync_reference_data(db.connection(), str(path))
+    db.commit()
+    assert final.unchanged_marks == 1 and sum(final.deleted.values()) == 0
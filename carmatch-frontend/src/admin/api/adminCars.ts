@@ -28,6 +28,8 @@ export interface AdminCarListResponse {
   page: number;
   per_page: number;
   pages: number;
+  total_is_estimate?: boolean;
+  next_cursor?: string | null;
 }
 
 export interface AdminCarCreate {
@@ -63,6 +65,8 @@ export interface AdminCarListParams {
   is_active?: boolean;
   sort_by?: "mark_name" | "model_name" | "year";
   sort_dir?: "asc" | "desc";
+  cursor?: string;
+  exact_count?: boolean;
 }
 
 export async function adminListCars(
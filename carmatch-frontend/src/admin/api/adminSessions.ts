@@ -18,6 +18,8 @@ export interface AdminSessionListResponse {
   page: number;
   per_page: number;
   pages: number;
+  total_is_estimate?: boolean;
+  next_cursor?: string | null;
 }
 
 export interface AdminSessionListParams {
@@ -27,6 +29,8 @@ export interface AdminSessionListParams {
   status?: string;
   date_from?: string;
   date_to?: string;
+  cursor?: string;
+  exact_count?: boolean;
 }
 
 export interface AdminSessionMessage {
@@ -17,6 +17,8 @@ export interface AdminUserListResponse {
   page: number;
   per_page: number;
   pages: number;
+  total_is_estimate?: boolean;
+  next_cursor?: string | null;
 }
 
 export interface AdminUserListParams {
@@ -24,6 +26,8 @@ export interface AdminUserListParams {
   per_page?: number;
   email?: string;
   is_active?: boolean;
+  cursor?: string;
+  exact_count?: boolean;
 }
 
 export async function adminListUsers(
@@ -444,7 +444,7 @@ function AdminCarsInner() {
             </table>
             <div className={styles.pagination}>
               <div className={styles.paginationInfo}>
-                Всего: {data.total} • Стр. {data.page} из {data.pages || 1} • по {perPage} на стр.
+                Всего: {data.total_is_estimate ? "≈" : ""}{data.total} • Стр. {data.page} из {data.pages || 1} • по {perPage} на стр.
               </div>
               <div className={styles.pageControls}>
                 <button
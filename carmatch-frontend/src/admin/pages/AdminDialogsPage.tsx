@@ -94,7 +94,7 @@ function AdminDialogsInner() {
             </table>
             <div className={styles.pagination}>
               <div>
-                Всего: {data.total} • Стр. {data.page} из {data.pages || 1}
+                Всего: {data.total_is_estimate ? "≈" : ""}{data.total} • Стр. {data.page} из {data.pages || 1}
               </div>
               <div className={styles.pageControls}>
                 <button
@@ -209,7 +209,7 @@ function AdminUserDialogsInner() {
                 </table>
                 <div className={styles.pagination}>
                   <div>
-                    Всего: {sessionsData.total} • Стр. {sessionsData.page} из{" "}
+                    Всего: {sessionsData.total_is_estimate ? "≈" : ""}{sessionsData.total} • Стр. {sessionsData.page} из{" "}
                     {sessionsData.pages || 1}
                   </div>
                   <div className={styles.pageControls}>
@@ -152,7 +152,7 @@ function AdminUsersInner() {
             </table>
             <div className={styles.pagination}>
               <div>
-                Всего: {data.total} • Стр. {data.page} из {data.pages || 1}
+                Всего: {data.total_is_estimate ? "≈" : ""}{data.total} • Стр. {data.page} из {data.pages || 1}
               </div>
               <div className={styles.pageControls}>
                 <button